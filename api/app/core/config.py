@@ -22,6 +22,7 @@ class Settings(BaseSettings):
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     refresh_token_expire_days: int = 7
+    calendar_token_expire_days: int = 365
     
     # CORS
     cors_origins: list = ["*"]  # In production, replace with specific domains
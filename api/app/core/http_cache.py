@@ -0,0 +1,143 @@
+"""
+Conditional GET support (ETag / If-None-Match / Cache-Control)
+
+Every watched table has a change counter in table_versions, bumped by a
+statement-level trigger on INSERT/UPDATE/DELETE (see the
+add_table_versions migration). An endpoint's ETag is a hash of the
+counters of the tables it reads plus the request path and query, so it
+changes exactly when the underlying data may have changed.
+
+The bump locks a counter row until the writing transaction ends, so
+writers to one table would queue behind each other on a single row. Each
+table's counter is therefore split into 16 shards picked by backend pid
+(shard_table_versions migration); the version is the sum of the shards,
+which grows with every write. Two transactions only wait on each other
+when their connections share a shard.
+
+Usage:
+
+    @router.get("/", dependencies=[Depends(conditional_get(T_LEVEL, max_age=60))])
+
+When the client's If-None-Match matches, the dependency answers 304
+before the endpoint body runs; otherwise it sets ETag and Cache-Control
+on the normal response.
+"""
+
+import hashlib
+from datetime import date
+from typing import Iterable, Dict
+
+from fastapi import Depends, HTTPException, Request, Response, status
+from prisma import Prisma
+
+from app.db.prisma_client import get_prisma
+from app.core.deps import get_current_user
+
+
+# Database table names (as mapped in schema.prisma) with a version trigger
+T_DEPARTMENT = "Department"
+T_SPECIALTY = "Specialty"
+T_LEVEL = "Level"
+T_GROUP = "Group"
+T_ROOM = "Room"
+T_SUBJECT = "Subject"
+T_TEACHER = "Teacher"
+T_STUDENT = "Student"
+T_SCHEDULE = "Schedule"
+T_ABSENCE = "Absence"
+T_SCHEDULE_SERIES = "schedule_series"
+T_SCHEDULE_SERIES_EXCEPTION = "schedule_series_exceptions"
+
+# Everything a weekly timetable payload is built from
+TIMETABLE_TABLES = (
+    T_SCHEDULE, T_SCHEDULE_SERIES, T_SCHEDULE_SERIES_EXCEPTION,
+    T_SUBJECT, T_TEACHER, T_ROOM, T_GROUP, T_LEVEL, T_SPECIALTY
+)
+
+TABLE_VERSIONS_SQL = """
+SELECT "table_name", SUM("version")::int AS "version"
+FROM "table_versions"
+WHERE "table_name" = ANY($1::text[])
+GROUP BY "table_name"
+"""
+
+
+async def get_table_versions(prisma: Prisma, tables: Iterable[str]) -> Dict[str, int]:
+    """Current change counter of each table, summed over its shards (0 if never written)"""
+    tables = sorted(set(tables))
+    rows = await prisma.query_raw(TABLE_VERSIONS_SQL, tables)
+    versions = {table: 0 for table in tables}
+    for row in rows:
+        versions[row["table_name"]] = row["version"]
+    return versions
+
+
+def compute_etag(request: Request, versions: Dict[str, int], user_id: str = "", daily: bool = False) -> str:
+    """Weak ETag over path, query, table versions and (optionally) caller/day"""
+    parts = [request.url.path, str(request.url.query)]
+    parts.extend(f"{table}:{version}" for table, version in sorted(versions.items()))
+    if user_id:
+        # Per-user payloads: never share a validator across callers
+        parts.append(user_id)
+    if daily:
+        # Default ranges such as "current week" move with the calendar
+        parts.append(date.today().isoformat())
+    digest = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison as required for If-None-Match"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    if "*" in candidates:
+        return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return any((c[2:] if c.startswith("W/") else c) == bare for c in candidates)
+
+
+def conditional_get(*tables: str, max_age: int = 0, private: bool = False, daily: bool = False):
+    """
+    Dependency factory for cacheable GET endpoints
+
+    tables: table names the response is derived from
+    max_age: seconds the client may reuse the response without revalidating
+    private: response depends on the authenticated caller (requires auth)
+    daily: response depends on today's date (e.g. current week defaults)
+    """
+    cache_control = f"{'private' if private else 'public'}, max-age={max_age}, must-revalidate"
+
+    async def check_etag(request: Request, response: Response, prisma: Prisma, user_id: str = ""):
+        versions = await get_table_versions(prisma, tables)
+        etag = compute_etag(request, versions, user_id, daily)
+
+        headers = {"ETag": etag, "Cache-Control": cache_control}
+        if private:
+            headers["Vary"] = "Authorization"
+
+        if etag_matches(request.headers.get("if-none-match", ""), etag):
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        response.headers.update(headers)
+
+    if private:
+        # Authenticate first so a 304 is never served to an anonymous caller
+        async def private_dependency(
+            request: Request,
+            response: Response,
+            prisma: Prisma = Depends(get_prisma),
+            current_user = Depends(get_current_user)
+        ):
+            await check_etag(request, response, prisma, current_user.id)
+
+        return private_dependency
+
+    async def public_dependency(
+        request: Request,
+        response: Response,
+        prisma: Prisma = Depends(get_prisma)
+    ):
+        await check_etag(request, response, prisma)
+
+    return public_dependency
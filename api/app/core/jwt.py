@@ -36,4 +36,11 @@ def decode_token(token: str) -> Optional[Dict[str, Any]]:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
         return payload
     except jwt.PyJWTError:
-        return None
\ No newline at end of file
+        return None
+
+
+def create_calendar_token(scope: str, owner_id: str, version: int) -> str:
+    """Create a long-lived token for an iCalendar subscription URL (version: the feed's token version)"""
+    expire = datetime.utcnow() + timedelta(days=settings.calendar_token_expire_days)
+    to_encode = {"sub": owner_id, "scope": scope, "ver": version, "exp": expire, "type": "calendar"}
+    return jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
@@ -16,6 +16,7 @@ import logging
 from app.db.prisma_client import get_prisma
 from app.core.deps import get_current_user, require_role
 from app.routers.notifications import create_notification
+from app.services.schedule_series import find_schedule, teaching_assignments
 from app.models.absence_models import (
     AbsenceCreate, AbsenceUpdate, AbsenceJustification, AbsenceReview,
     AbsenceQuery, AbsenceResponse, AbsenceStatistics, NotificationHistory,
@@ -40,8 +41,11 @@ async def create_absence(
         
         # If scheduleId is provided, validate it (session-based absence)
         if absence_data.scheduleId:
-            schedule = await prisma.emploitemps.find_unique(
-                where={"id": absence_data.scheduleId},
+            # Absences reference a stored row, so a series occurrence gets one
+            schedule = await find_schedule(
+                prisma,
+                absence_data.scheduleId,
+                materialize=True,
                 include={
                     "matiere": {
                         "include": {
@@ -146,7 +150,7 @@ async def create_absence(
             existing_absence = await prisma.absence.find_first(
                 where={
                     "id_etudiant": absence_data.studentId,
-                    "id_emploitemps": absence_data.scheduleId
+                    "id_emploitemps": schedule.id
                 }
             )
             
@@ -170,7 +174,7 @@ async def create_absence(
         absence = await prisma.absence.create(
             data={
                 "id_etudiant": absence_data.studentId,
-                "id_emploitemps": absence_data.scheduleId,
+                "id_emploitemps": schedule.id if schedule else None,
                 "id_enseignant": teacher_id,
                 "id_matiere": absence_data.subjectId,
                 "date_absence": absence_date,
@@ -841,21 +845,10 @@ async def get_teacher_students(
         
         # Get all students from groups where this teacher teaches
         # Find all groups from the teacher's schedules
-        schedules = await prisma.emploitemps.find_many(
-            where={"id_enseignant": teacher.id},
-            include={
-                "groupe": {
-                    "include": {
-                        "niveau": {
-                            "include": {"specialite": True}
-                        }
-                    }
-                }
-            }
-        )
+        assignments = await teaching_assignments(prisma, teacher_id=teacher.id)
         
         # Get unique group IDs
-        group_ids = list(set([schedule.id_groupe for schedule in schedules]))
+        group_ids = list(set([a["id_groupe"] for a in assignments]))
         
         # If no groups found from schedules, get all students from teacher's department
         if not group_ids:
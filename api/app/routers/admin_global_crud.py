@@ -14,6 +14,7 @@ from pydantic import BaseModel, EmailStr, Field, validator
 from app.db.prisma_client import get_prisma
 from app.core.deps import require_admin
 from app.core.security import hash_password
+from app.services.schedule_series import count_schedules
 
 router = APIRouter(prefix="/admin/global", tags=["Admin - Global CRUD"])
 
@@ -624,7 +625,7 @@ async def delete_room(
     
     # Check for related data
     if not force:
-        sessions_count = await prisma.emploitemps.count(where={"id_salle": room_id})
+        sessions_count = await count_schedules(prisma, {"id_salle": room_id})
         
         if sessions_count > 0:
             raise HTTPException(
@@ -845,7 +846,7 @@ async def delete_teacher(
     # Check for related data
     if not force:
         subjects_count = await prisma.matiere.count(where={"id_enseignant": teacher_id})
-        sessions_count = await prisma.emploitemps.count(where={"id_enseignant": teacher_id})
+        sessions_count = await count_schedules(prisma, {"id_enseignant": teacher_id})
         
         if subjects_count > 0 or sessions_count > 0:
             raise HTTPException(
@@ -1308,7 +1309,7 @@ async def delete_subject(
         raise HTTPException(status_code=404, detail="Subject not found")
     
     if not force:
-        emploi_temps_count = await prisma.emploitemps.count(where={"id_matiere": subject_id})
+        emploi_temps_count = await count_schedules(prisma, {"id_matiere": subject_id})
         notes_count = await prisma.note.count(where={"id_matiere": subject_id})
         if emploi_temps_count > 0 or notes_count > 0:
             raise HTTPException(
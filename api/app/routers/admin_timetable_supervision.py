@@ -9,12 +9,21 @@ Includes: Automatic conflict detection, Alternative suggestions, Bulk operations
 from fastapi import APIRouter, HTTPException, Depends, status, Query, Body
 from typing import List, Optional, Dict, Any
 from prisma import Prisma
-from datetime import datetime, timedelta, time as dt_time
+from datetime import datetime, timedelta
 from pydantic import BaseModel, Field, validator
 from enum import Enum
+from uuid import uuid4
 
 from app.db.prisma_client import get_prisma
 from app.core.deps import require_admin
+from app.services.timetable_cache import invalidate_schedule_cache
+from app.services.notification_fanout import ScheduleNotificationFanout, CREATED
+from app.services.schedule_availability import DayAvailability, ROOM, TEACHER, GROUP
+from app.services.room_utilization_service import room_building
+from app.services.schedule_series import (
+    find_occurrences, find_occurrence_page, find_schedule, parse_occurrence_id,
+    prepare_update, release_occurrence, delete_schedule
+)
 
 router = APIRouter(prefix="/admin/timetable", tags=["Admin - Timetable Supervision"])
 
@@ -88,12 +97,59 @@ class TimetableFilter(BaseModel):
 # CONFLICT DETECTION ENGINE
 # ============================================================================
 
+def time_validity_conflicts(start_dt: datetime, end_dt: datetime) -> List[Dict[str, Any]]:
+    """Warnings for sessions outside opening hours or of unusual length"""
+    conflicts = []
+    
+    # Check if times are within university hours (e.g., 8:00 - 18:00)
+    if start_dt.hour < 8 or end_dt.hour > 18:
+        conflicts.append({
+            "type": ConflictType.TIME,
+            "severity": "warning",
+            "message": "Session time outside university operating hours (8:00 - 18:00)",
+            "details": {
+                "start_time": start_dt.strftime("%H:%M"),
+                "end_time": end_dt.strftime("%H:%M")
+            },
+            "suggestions": [
+                {
+                    "type": "adjust_time",
+                    "message": "Consider scheduling within 8:00 - 18:00"
+                }
+            ]
+        })
+    
+    # Check session duration (min 30 min, max 3 hours)
+    duration = (end_dt - start_dt).total_seconds() / 3600
+    if duration < 0.5:
+        conflicts.append({
+            "type": ConflictType.TIME,
+            "severity": "warning",
+            "message": "Session duration too short (minimum 30 minutes recommended)",
+            "details": {"duration_hours": duration},
+            "suggestions": []
+        })
+    elif duration > 3:
+        conflicts.append({
+            "type": ConflictType.TIME,
+            "severity": "warning",
+            "message": "Session duration too long (maximum 3 hours recommended)",
+            "details": {"duration_hours": duration},
+            "suggestions": []
+        })
+    
+    return conflicts
+
+
 class ConflictDetector:
     """Intelligent conflict detection engine"""
     
     def __init__(self, prisma: Prisma):
         self.prisma = prisma
         self.conflicts: List[Dict[str, Any]] = []
+        self.availability: Optional[DayAvailability] = None
+        self._rooms: Optional[List] = None
+        self._group_sizes: Dict[str, int] = {}
     
     async def detect_all_conflicts(
         self,
@@ -113,10 +169,15 @@ class ConflictDetector:
         start_datetime = datetime.combine(session_date, start_time)
         end_datetime = datetime.combine(session_date, end_time)
         
+        # Busy intervals of every room/teacher/group that day, in one query
+        self.availability = await DayAvailability.load(
+            self.prisma, session_date, exclude_ids=[session_id]
+        )
+        
         # Run all conflict checks
-        await self._check_room_conflict(session_data, start_datetime, end_datetime, session_id)
-        await self._check_teacher_conflict(session_data, start_datetime, end_datetime, session_id)
-        await self._check_group_conflict(session_data, start_datetime, end_datetime, session_id)
+        await self._check_room_conflict(session_data, start_datetime, end_datetime)
+        await self._check_teacher_conflict(session_data, start_datetime, end_datetime)
+        await self._check_group_conflict(session_data, start_datetime, end_datetime)
         await self._check_time_validity(start_datetime, end_datetime)
         await self._check_logic_conflict(session_data)
         await self._check_capacity_conflict(session_data)
@@ -127,31 +188,11 @@ class ConflictDetector:
         self,
         session_data: SessionCreate,
         start_dt: datetime,
-        end_dt: datetime,
-        exclude_session_id: Optional[str] = None
+        end_dt: datetime
     ):
         """Detect if room is already occupied at this time"""
-        where_clause = {
-            "id_salle": session_data.room_id,
-            "date": start_dt.replace(hour=0, minute=0, second=0),
-            "status": {"not": "CANCELED"},
-            "AND": [
-                {"heure_debut": {"lt": end_dt}},
-                {"heure_fin": {"gt": start_dt}}
-            ]
-        }
-        
-        if exclude_session_id:
-            where_clause["id"] = {"not": exclude_session_id}
-        
-        conflicting_sessions = await self.prisma.emploitemps.find_many(
-            where=where_clause,
-            include={
-                "matiere": True,
-                "groupe": True,
-                "enseignant": True,
-                "salle": True
-            }
+        conflicting_sessions = self.availability.overlapping(
+            ROOM, session_data.room_id, start_dt, end_dt
         )
         
         if conflicting_sessions:
@@ -184,30 +225,11 @@ class ConflictDetector:
         self,
         session_data: SessionCreate,
         start_dt: datetime,
-        end_dt: datetime,
-        exclude_session_id: Optional[str] = None
+        end_dt: datetime
     ):
         """Detect if teacher is already assigned elsewhere"""
-        where_clause = {
-            "id_enseignant": session_data.teacher_id,
-            "date": start_dt.replace(hour=0, minute=0, second=0),
-            "status": {"not": "CANCELED"},
-            "AND": [
-                {"heure_debut": {"lt": end_dt}},
-                {"heure_fin": {"gt": start_dt}}
-            ]
-        }
-        
-        if exclude_session_id:
-            where_clause["id"] = {"not": exclude_session_id}
-        
-        conflicting_sessions = await self.prisma.emploitemps.find_many(
-            where=where_clause,
-            include={
-                "matiere": True,
-                "groupe": True,
-                "salle": True
-            }
+        conflicting_sessions = self.availability.overlapping(
+            TEACHER, session_data.teacher_id, start_dt, end_dt
         )
         
         if conflicting_sessions:
@@ -240,30 +262,11 @@ class ConflictDetector:
         self,
         session_data: SessionCreate,
         start_dt: datetime,
-        end_dt: datetime,
-        exclude_session_id: Optional[str] = None
+        end_dt: datetime
     ):
         """Detect if group already has another session"""
-        where_clause = {
-            "id_groupe": session_data.group_id,
-            "date": start_dt.replace(hour=0, minute=0, second=0),
-            "status": {"not": "CANCELED"},
-            "AND": [
-                {"heure_debut": {"lt": end_dt}},
-                {"heure_fin": {"gt": start_dt}}
-            ]
-        }
-        
-        if exclude_session_id:
-            where_clause["id"] = {"not": exclude_session_id}
-        
-        conflicting_sessions = await self.prisma.emploitemps.find_many(
-            where=where_clause,
-            include={
-                "matiere": True,
-                "enseignant": True,
-                "salle": True
-            }
+        conflicting_sessions = self.availability.overlapping(
+            GROUP, session_data.group_id, start_dt, end_dt
         )
         
         if conflicting_sessions:
@@ -294,42 +297,7 @@ class ConflictDetector:
     
     async def _check_time_validity(self, start_dt: datetime, end_dt: datetime):
         """Check if time range is valid"""
-        # Check if times are within university hours (e.g., 8:00 - 18:00)
-        if start_dt.hour < 8 or end_dt.hour > 18:
-            self.conflicts.append({
-                "type": ConflictType.TIME,
-                "severity": "warning",
-                "message": "Session time outside university operating hours (8:00 - 18:00)",
-                "details": {
-                    "start_time": start_dt.strftime("%H:%M"),
-                    "end_time": end_dt.strftime("%H:%M")
-                },
-                "suggestions": [
-                    {
-                        "type": "adjust_time",
-                        "message": "Consider scheduling within 8:00 - 18:00"
-                    }
-                ]
-            })
-        
-        # Check session duration (min 30 min, max 3 hours)
-        duration = (end_dt - start_dt).total_seconds() / 3600
-        if duration < 0.5:
-            self.conflicts.append({
-                "type": ConflictType.TIME,
-                "severity": "warning",
-                "message": "Session duration too short (minimum 30 minutes recommended)",
-                "details": {"duration_hours": duration},
-                "suggestions": []
-            })
-        elif duration > 3:
-            self.conflicts.append({
-                "type": ConflictType.TIME,
-                "severity": "warning",
-                "message": "Session duration too long (maximum 3 hours recommended)",
-                "details": {"duration_hours": duration},
-                "suggestions": []
-            })
+        self.conflicts.extend(time_validity_conflicts(start_dt, end_dt))
     
     async def _check_logic_conflict(self, session_data: SessionCreate):
         """Check if teacher is authorized to teach this subject"""
@@ -370,12 +338,23 @@ class ConflictDetector:
                 ]
             })
     
+    async def _get_rooms(self) -> List:
+        """All rooms, loaded once per detector"""
+        if self._rooms is None:
+            self._rooms = await self.prisma.salle.find_many(order={"code": "asc"})
+        return self._rooms
+    
+    async def _get_group_size(self, group_id: str) -> int:
+        if group_id not in self._group_sizes:
+            self._group_sizes[group_id] = await self.prisma.etudiant.count(
+                where={"id_groupe": group_id}
+            )
+        return self._group_sizes[group_id]
+    
     async def _check_capacity_conflict(self, session_data: SessionCreate):
         """Check if room capacity is sufficient for group size"""
-        # Get room capacity
-        room = await self.prisma.salle.find_unique(
-            where={"id": session_data.room_id}
-        )
+        rooms = await self._get_rooms()
+        room = next((r for r in rooms if r.id == session_data.room_id), None)
         
         if not room:
             return
@@ -388,20 +367,14 @@ class ConflictDetector:
         if not group:
             return
         
-        group_size = await self.prisma.etudiant.count(
-            where={"id_groupe": session_data.group_id}
-        )
+        group_size = await self._get_group_size(session_data.group_id)
         
         if group_size > room.capacite:
-            # Suggest larger rooms
-            larger_rooms = await self.prisma.salle.find_many(
-                where={
-                    "capacite": {"gte": group_size},
-                    "type": room.type  # Same room type
-                },
-                take=5,
-                order={"capacite": "asc"}
-            )
+            # Suggest larger rooms of the same type, smallest first
+            larger_rooms = sorted(
+                (r for r in rooms if r.type == room.type and r.capacite >= group_size),
+                key=lambda r: r.capacite
+            )[:5]
             
             self.conflicts.append({
                 "type": ConflictType.CAPACITY,
@@ -430,49 +403,48 @@ class ConflictDetector:
         end_dt: datetime,
         session_data: SessionCreate
     ) -> List[Dict[str, Any]]:
-        """Find available rooms at this time"""
-        # Get current room type
-        current_room = await self.prisma.salle.find_unique(
-            where={"id": session_data.room_id}
-        )
+        """
+        Find available rooms at this time
+        
+        Free rooms of the same type are ranked by capacity fit (big enough
+        for the group with the least spare seats), then same building.
+        """
+        rooms = await self._get_rooms()
+        current_room = next((r for r in rooms if r.id == session_data.room_id), None)
         
         if not current_room:
             return []
         
-        # Find all rooms of same type
-        all_rooms = await self.prisma.salle.find_many(
-            where={"type": current_room.type}
-        )
+        group_size = await self._get_group_size(session_data.group_id)
+        busy_rooms = self.availability.busy_owners(ROOM, start_dt, end_dt)
+        current_building = room_building(current_room.code)
         
-        suggestions = []
-        for room in all_rooms:
-            if room.id == session_data.room_id:
-                continue
-            
-            # Check if room is free
-            conflicts = await self.prisma.emploitemps.find_first(
-                where={
-                    "id_salle": room.id,
-                    "date": start_dt.replace(hour=0, minute=0, second=0),
-                    "status": {"not": "CANCELED"},
-                    "AND": [
-                        {"heure_debut": {"lt": end_dt}},
-                        {"heure_fin": {"gt": start_dt}}
-                    ]
-                }
-            )
-            
-            if not conflicts:
-                suggestions.append({
-                    "type": "alternative_room",
-                    "room_id": room.id,
-                    "room_code": room.code,
-                    "capacity": room.capacite,
-                    "room_type": room.type,
-                    "availability": "free"
-                })
+        candidates = [
+            r for r in rooms
+            if r.type == current_room.type
+            and r.id != session_data.room_id
+            and r.id not in busy_rooms
+        ]
+        candidates.sort(key=lambda r: (
+            r.capacite < group_size,
+            room_building(r.code) != current_building,
+            abs(r.capacite - group_size),
+            r.code
+        ))
         
-        return suggestions[:5]  # Top 5 suggestions
+        return [
+            {
+                "type": "alternative_room",
+                "room_id": room.id,
+                "room_code": room.code,
+                "capacity": room.capacite,
+                "room_type": room.type,
+                "building": room_building(room.code),
+                "fits_group": room.capacite >= group_size,
+                "availability": "free"
+            }
+            for room in candidates[:5]  # Top 5 suggestions
+        ]
     
     async def _suggest_alternative_teachers(
         self,
@@ -480,15 +452,22 @@ class ConflictDetector:
         end_dt: datetime,
         session_data: SessionCreate
     ) -> List[Dict[str, Any]]:
-        """Find available teachers for this subject"""
-        # Get subject to find qualified teachers
+        """
+        Find available teachers for this subject
+        
+        Free teachers of the subject's department are ranked: the teacher
+        assigned to the subject, then teachers of other subjects in the
+        same specialty, then the least loaded that day.
+        """
         subject = await self.prisma.matiere.find_unique(
             where={"id": session_data.subject_id},
             include={
                 "specialite": {
                     "include": {
                         "departement": {
-                            "include": {"enseignants": True}
+                            "include": {
+                                "enseignants": {"include": {"matieres": True}}
+                            }
                         }
                     }
                 }
@@ -498,41 +477,44 @@ class ConflictDetector:
         if not subject:
             return []
         
-        suggestions = []
-        # Check teachers from same department
-        for teacher in subject.specialite.departement.enseignants:
-            if teacher.id == session_data.teacher_id:
-                continue
-            
-            # Check if teacher is free
-            conflicts = await self.prisma.emploitemps.find_first(
-                where={
-                    "id_enseignant": teacher.id,
-                    "date": start_dt.replace(hour=0, minute=0, second=0),
-                    "status": {"not": "CANCELED"},
-                    "AND": [
-                        {"heure_debut": {"lt": end_dt}},
-                        {"heure_fin": {"gt": start_dt}}
-                    ]
-                }
-            )
-            
-            if not conflicts:
-                suggestions.append({
-                    "type": "alternative_teacher",
-                    "teacher_id": teacher.id,
-                    "teacher_name": f"{teacher.prenom} {teacher.nom}",
-                    "availability": "free"
-                })
+        busy_teachers = self.availability.busy_owners(TEACHER, start_dt, end_dt)
+        
+        def subject_match(teacher) -> int:
+            if teacher.id == subject.id_enseignant:
+                return 0
+            if any(m.id_specialite == subject.id_specialite for m in (teacher.matieres or [])):
+                return 1
+            return 2
         
-        return suggestions[:5]
+        candidates = [
+            t for t in subject.specialite.departement.enseignants
+            if t.id != session_data.teacher_id and t.id not in busy_teachers
+        ]
+        candidates.sort(key=lambda t: (
+            subject_match(t),
+            self.availability.load_of(TEACHER, t.id),
+            t.nom,
+            t.prenom
+        ))
+        
+        return [
+            {
+                "type": "alternative_teacher",
+                "teacher_id": teacher.id,
+                "teacher_name": f"{teacher.prenom} {teacher.nom}",
+                "subject_match": ["assigned", "same_specialty", "same_department"][subject_match(teacher)],
+                "sessions_that_day": self.availability.load_of(TEACHER, teacher.id),
+                "availability": "free"
+            }
+            for teacher in candidates[:5]
+        ]
     
     async def _suggest_alternative_times(
         self,
         date: datetime.date,
         session_data: SessionCreate
     ) -> List[Dict[str, Any]]:
-        """Suggest alternative time slots on the same day"""
+        """Suggest alternative time slots on the same day, closest first"""
         # Standard time slots
         time_slots = [
             ("08:00", "09:30"),
@@ -542,40 +524,258 @@ class ConflictDetector:
             ("15:40", "17:10")
         ]
         
+        requested_start = datetime.combine(
+            date, datetime.strptime(session_data.start_time, "%H:%M").time()
+        )
+        
         suggestions = []
         for start_time_str, end_time_str in time_slots:
-            start_time = datetime.strptime(start_time_str, "%H:%M").time()
-            end_time = datetime.strptime(end_time_str, "%H:%M").time()
-            
-            start_dt = datetime.combine(date, start_time)
-            end_dt = datetime.combine(date, end_time)
+            start_dt = datetime.combine(date, datetime.strptime(start_time_str, "%H:%M").time())
+            end_dt = datetime.combine(date, datetime.strptime(end_time_str, "%H:%M").time())
             
-            # Check if slot is free for teacher, room, and group
-            conflicts = await self.prisma.emploitemps.find_first(
-                where={
-                    "date": datetime.combine(date, dt_time(0, 0)),
-                    "status": {"not": "CANCELED"},
-                    "AND": [
-                        {"heure_debut": {"lt": end_dt}},
-                        {"heure_fin": {"gt": start_dt}}
-                    ],
-                    "OR": [
-                        {"id_enseignant": session_data.teacher_id},
-                        {"id_salle": session_data.room_id},
-                        {"id_groupe": session_data.group_id}
-                    ]
-                }
-            )
-            
-            if not conflicts:
-                suggestions.append({
+            # Slot must be free for teacher, room, and group
+            if (
+                self.availability.is_free(TEACHER, session_data.teacher_id, start_dt, end_dt)
+                and self.availability.is_free(ROOM, session_data.room_id, start_dt, end_dt)
+                and self.availability.is_free(GROUP, session_data.group_id, start_dt, end_dt)
+            ):
+                distance = abs((start_dt - requested_start).total_seconds())
+                suggestions.append((distance, {
                     "type": "alternative_time",
                     "start_time": start_time_str,
                     "end_time": end_time_str,
                     "availability": "all_free"
+                }))
+        
+        suggestions.sort(key=lambda item: item[0])
+        return [suggestion for _, suggestion in suggestions]
+
+
+def expand_occurrences(session_data: SessionCreate) -> List[Dict[str, Any]]:
+    """
+    EmploiTemps rows for a session request (one per week when recurring)
+    
+    Ids are generated here so a whole batch can be written with one
+    create_many and still be reported back to the caller.
+    """
+    session_date = datetime.strptime(session_data.date, "%Y-%m-%d")
+    start_time = datetime.strptime(session_data.start_time, "%H:%M").time()
+    end_time = datetime.strptime(session_data.end_time, "%H:%M").time()
+    
+    weeks = session_data.recurrence_weeks if session_data.is_recurring else 1
+    rows = []
+    for week in range(weeks):
+        current_date = session_date + timedelta(weeks=week)
+        rows.append({
+            "id": uuid4().hex,
+            "date": current_date,
+            "heure_debut": datetime.combine(current_date, start_time),
+            "heure_fin": datetime.combine(current_date, end_time),
+            "id_salle": session_data.room_id,
+            "id_matiere": session_data.subject_id,
+            "id_groupe": session_data.group_id,
+            "id_enseignant": session_data.teacher_id,
+            "status": "PLANNED",
+            "semester": session_data.semester,
+            "week_day": current_date.isoweekday(),
+            "is_recurring": session_data.is_recurring
+        })
+    return rows
+
+
+async def write_sessions(prisma: Prisma, rows: List[Dict[str, Any]]):
+    """Insert prepared rows in one transaction and drop affected cached weeks"""
+    if not rows:
+        return
+    async with prisma.tx() as tx:
+        await tx.emploitemps.create_many(data=rows)
+    await invalidate_schedule_cache(prisma, sessions=rows)
+
+
+async def notify_created_sessions(prisma: Prisma, rows: List[Dict[str, Any]]):
+    """One digest per teacher and student of the groups the new sessions concern"""
+    if not rows:
+        return
+    fanout = ScheduleNotificationFanout(prisma)
+    await fanout.notify(
+        await fanout.session_changes(rows, CREATED),
+        title="Nouvelles séances",
+        intro="Des séances ont été ajoutées à votre emploi du temps :",
+        notification_type="SCHEDULE_CREATED"
+    )
+
+
+class BatchConflictValidator:
+    """
+    Validate a batch of sessions against one preloaded snapshot
+    
+    Existing sessions of every day touched by the batch are loaded in one
+    query; subjects, rooms and group sizes in one query each. Accepted
+    sessions are added to the snapshot, so later entries of the batch are
+    checked against earlier ones too. Suggestions are not computed here
+    (use /sessions/check-conflicts for a single session).
+    """
+    
+    RESOURCE_CONFLICTS = [
+        (ROOM, ConflictType.ROOM, "Room already occupied during this time slot", "room_id"),
+        (TEACHER, ConflictType.TEACHER, "Teacher already assigned to another session", "teacher_id"),
+        (GROUP, ConflictType.STUDENT_GROUP, "Group already has another session at this time", "group_id"),
+    ]
+    
+    def __init__(self, prisma: Prisma):
+        self.prisma = prisma
+    
+    async def validate(self, sessions: List[SessionCreate]):
+        """
+        Returns (accepted, rejected): accepted is a list of
+        (index, rows, warnings), rejected a list of (index, conflicts)
+        """
+        expanded = [expand_occurrences(s) for s in sessions]
+        all_rows = [row for rows in expanded for row in rows]
+        
+        snapshot = await DayAvailability.load_many(
+            self.prisma, [row["date"] for row in all_rows], include=None
+        )
+        
+        subject_ids = list({s.subject_id for s in sessions})
+        room_ids = list({s.room_id for s in sessions})
+        group_ids = list({s.group_id for s in sessions})
+        
+        subjects = {
+            m.id: m for m in await self.prisma.matiere.find_many(where={"id": {"in": subject_ids}})
+        }
+        teacher_ids = list({s.teacher_id for s in sessions})
+        
+        rooms = {
+            r.id: r for r in await self.prisma.salle.find_many(where={"id": {"in": room_ids}})
+        }
+        existing = {
+            ROOM: set(rooms),
+            GROUP: {g.id for g in await self.prisma.groupe.find_many(where={"id": {"in": group_ids}})},
+            TEACHER: {t.id for t in await self.prisma.enseignant.find_many(where={"id": {"in": teacher_ids}})}
+        }
+        group_counts = await self.prisma.etudiant.group_by(
+            by=["id_groupe"],
+            where={"id_groupe": {"in": group_ids}},
+            count={"_all": True}
+        )
+        group_sizes = {g["id_groupe"]: g["_count"]["_all"] for g in group_counts}
+        
+        accepted, rejected = [], []
+        for index, (session_data, rows) in enumerate(zip(sessions, expanded)):
+            conflicts = self._missing_references(session_data, existing)
+            if conflicts:
+                rejected.append((index, conflicts))
+                continue
+            
+            conflicts = self._resource_conflicts(snapshot, session_data, rows)
+            conflicts.extend(self._logic_conflicts(session_data, subjects))
+            conflicts.extend(self._capacity_conflicts(session_data, rooms, group_sizes))
+            conflicts.extend(time_validity_conflicts(rows[0]["heure_debut"], rows[0]["heure_fin"]))
+            
+            if any(c["severity"] == "critical" for c in conflicts):
+                rejected.append((index, conflicts))
+                continue
+            
+            for row in rows:
+                snapshot[row["date"].date()].add({**row, "batch_index": index})
+            accepted.append((index, rows, conflicts))
+        
+        return accepted, rejected
+    
+    def _missing_references(self, session_data: SessionCreate, existing: Dict) -> List[Dict[str, Any]]:
+        """Unknown room/teacher/group would abort the whole batch insert"""
+        conflicts = []
+        for field, _, _, detail_key in self.RESOURCE_CONFLICTS:
+            owner_id = getattr(session_data, detail_key)
+            if owner_id not in existing[field]:
+                conflicts.append({
+                    "type": ConflictType.LOGIC,
+                    "severity": "critical",
+                    "message": f"Unknown {detail_key}",
+                    "details": {detail_key: owner_id},
+                    "suggestions": []
                 })
+        return conflicts
+    
+    def _resource_conflicts(self, snapshot, session_data: SessionCreate, rows) -> List[Dict[str, Any]]:
+        conflicts = []
+        for field, conflict_type, message, detail_key in self.RESOURCE_CONFLICTS:
+            clashes = []
+            for row in rows:
+                day = snapshot[row["date"].date()]
+                for other in day.overlapping(field, row[field], row["heure_debut"], row["heure_fin"]):
+                    clash = {
+                        "date": row["date"].strftime("%Y-%m-%d"),
+                        "time": f"{_clock(other, 'heure_debut')} - {_clock(other, 'heure_fin')}"
+                    }
+                    if isinstance(other, dict):
+                        clash["batch_index"] = other["batch_index"]
+                    else:
+                        clash["id"] = other.id
+                    clashes.append(clash)
+            
+            if clashes:
+                conflicts.append({
+                    "type": conflict_type,
+                    "severity": "critical",
+                    "message": message,
+                    "details": {
+                        detail_key: getattr(session_data, detail_key),
+                        "conflicting_sessions": clashes
+                    },
+                    "suggestions": []
+                })
+        return conflicts
+    
+    def _logic_conflicts(self, session_data: SessionCreate, subjects: Dict) -> List[Dict[str, Any]]:
+        subject = subjects.get(session_data.subject_id)
+        if not subject:
+            return [{
+                "type": ConflictType.LOGIC,
+                "severity": "critical",
+                "message": "Subject not found",
+                "details": {"subject_id": session_data.subject_id},
+                "suggestions": []
+            }]
+        
+        if subject.id_enseignant and subject.id_enseignant != session_data.teacher_id:
+            return [{
+                "type": ConflictType.LOGIC,
+                "severity": "warning",
+                "message": "Teacher not assigned to this subject",
+                "details": {
+                    "subject": subject.nom,
+                    "assigned_teacher_id": subject.id_enseignant
+                },
+                "suggestions": [
+                    {"type": "use_assigned_teacher", "teacher_id": subject.id_enseignant}
+                ]
+            }]
+        return []
+    
+    def _capacity_conflicts(self, session_data: SessionCreate, rooms: Dict, group_sizes: Dict) -> List[Dict[str, Any]]:
+        room = rooms.get(session_data.room_id)
+        group_size = group_sizes.get(session_data.group_id, 0)
+        if not room or group_size <= room.capacite:
+            return []
         
-        return suggestions
+        return [{
+            "type": ConflictType.CAPACITY,
+            "severity": "critical",
+            "message": f"Room capacity ({room.capacite}) insufficient for group size ({group_size})",
+            "details": {
+                "room_capacity": room.capacite,
+                "group_size": group_size,
+                "deficit": group_size - room.capacite
+            },
+            "suggestions": []
+        }]
+
+
+def _clock(session, field: str) -> str:
+    value = session[field] if isinstance(session, dict) else getattr(session, field)
+    return value.strftime("%H:%M")
 
 
 # ============================================================================
@@ -609,61 +809,11 @@ async def create_session(
             "session_data": session_data.dict()
         }
     
-    # Parse datetime
-    session_date = datetime.strptime(session_data.date, "%Y-%m-%d")
-    start_time = datetime.strptime(session_data.start_time, "%H:%M").time()
-    end_time = datetime.strptime(session_data.end_time, "%H:%M").time()
-    
-    start_datetime = datetime.combine(session_date, start_time)
-    end_datetime = datetime.combine(session_date, end_time)
-    
-    # Determine day of week (1=Monday)
-    day_of_week = session_date.isoweekday()
-    
-    # Create session(s)
-    created_sessions = []
-    
-    if session_data.is_recurring:
-        # Create recurring sessions
-        for week in range(session_data.recurrence_weeks):
-            current_date = session_date + timedelta(weeks=week)
-            current_start = datetime.combine(current_date, start_time)
-            current_end = datetime.combine(current_date, end_time)
-            
-            session = await prisma.emploitemps.create(
-                data={
-                    "date": current_date,
-                    "heure_debut": current_start,
-                    "heure_fin": current_end,
-                    "id_salle": session_data.room_id,
-                    "id_matiere": session_data.subject_id,
-                    "id_groupe": session_data.group_id,
-                    "id_enseignant": session_data.teacher_id,
-                    "status": "PLANNED",
-                    "semester": session_data.semester,
-                    "week_day": day_of_week,
-                    "is_recurring": True
-                }
-            )
-            created_sessions.append(session.id)
-    else:
-        # Create single session
-        session = await prisma.emploitemps.create(
-            data={
-                "date": session_date,
-                "heure_debut": start_datetime,
-                "heure_fin": end_datetime,
-                "id_salle": session_data.room_id,
-                "id_matiere": session_data.subject_id,
-                "id_groupe": session_data.group_id,
-                "id_enseignant": session_data.teacher_id,
-                "status": "PLANNED",
-                "semester": session_data.semester,
-                "week_day": day_of_week,
-                "is_recurring": False
-            }
-        )
-        created_sessions.append(session.id)
+    # Create session(s): one row per week when recurring, in one transaction
+    rows = expand_occurrences(session_data)
+    await write_sessions(prisma, rows)
+    await notify_created_sessions(prisma, rows)
+    created_sessions = [row["id"] for row in rows]
     
     return {
         "status": "success",
@@ -679,57 +829,49 @@ async def create_bulk_sessions(
     prisma: Prisma = Depends(get_prisma),
     current_user = Depends(require_admin)
 ):
-    """Create multiple sessions at once with conflict checking"""
+    """
+    Create multiple sessions at once with conflict checking
+    
+    The whole batch (recurring sessions expanded week by week) is checked
+    in memory against the existing timetable and against itself, then all
+    accepted sessions are written in one transaction.
+    """
     results = {
         "created": [],
         "conflicts": [],
+        "warnings": [],
         "errors": []
     }
     
-    for idx, session_data in enumerate(bulk_data.sessions):
-        try:
-            # Check conflicts
-            if bulk_data.check_conflicts:
-                detector = ConflictDetector(prisma)
-                conflicts = await detector.detect_all_conflicts(session_data)
-                
-                critical = [c for c in conflicts if c["severity"] == "critical"]
-                if critical:
-                    results["conflicts"].append({
-                        "index": idx,
-                        "session": session_data.dict(),
-                        "conflicts": conflicts
-                    })
-                    continue
-            
-            # Create session
-            session_date = datetime.strptime(session_data.date, "%Y-%m-%d")
-            start_time = datetime.strptime(session_data.start_time, "%H:%M").time()
-            end_time = datetime.strptime(session_data.end_time, "%H:%M").time()
-            
-            session = await prisma.emploitemps.create(
-                data={
-                    "date": session_date,
-                    "heure_debut": datetime.combine(session_date, start_time),
-                    "heure_fin": datetime.combine(session_date, end_time),
-                    "id_salle": session_data.room_id,
-                    "id_matiere": session_data.subject_id,
-                    "id_groupe": session_data.group_id,
-                    "id_enseignant": session_data.teacher_id,
-                    "status": "PLANNED",
-                    "semester": session_data.semester,
-                    "is_recurring": session_data.is_recurring
-                }
-            )
-            
-            results["created"].append(session.id)
-            
-        except Exception as e:
-            results["errors"].append({
-                "index": idx,
-                "session": session_data.dict(),
-                "error": str(e)
-            })
+    try:
+        if bulk_data.check_conflicts:
+            accepted, rejected = await BatchConflictValidator(prisma).validate(bulk_data.sessions)
+        else:
+            accepted = [(idx, expand_occurrences(s), []) for idx, s in enumerate(bulk_data.sessions)]
+            rejected = []
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    for idx, conflicts in rejected:
+        results["conflicts"].append({
+            "index": idx,
+            "session": bulk_data.sessions[idx].dict(),
+            "conflicts": conflicts
+        })
+    
+    rows = [row for _, session_rows, _ in accepted for row in session_rows]
+    try:
+        await write_sessions(prisma, rows)
+    except Exception as e:
+        # Transaction rolled back: nothing from this batch was created
+        results["errors"].append({"error": str(e), "sessions": len(accepted)})
+        return results
+    
+    results["created"] = [row["id"] for row in rows]
+    await notify_created_sessions(prisma, rows)
+    for idx, _, warnings in accepted:
+        if warnings:
+            results["warnings"].append({"index": idx, "warnings": warnings})
     
     return results
 
@@ -752,39 +894,20 @@ async def get_all_sessions(
     Get all timetable sessions with advanced filtering.
     Supports viewing by: Department, Teacher, Room, Group, Specialty
     """
-    where_clause = {}
-    
-    # Date range filter
-    if start_date:
-        where_clause["date"] = {"gte": datetime.strptime(start_date, "%Y-%m-%d")}
-    if end_date:
-        if "date" in where_clause:
-            where_clause["date"]["lte"] = datetime.strptime(end_date, "%Y-%m-%d")
-        else:
-            where_clause["date"] = {"lte": datetime.strptime(end_date, "%Y-%m-%d")}
-    
-    # Entity filters
-    if teacher_id:
-        where_clause["id_enseignant"] = teacher_id
-    if room_id:
-        where_clause["id_salle"] = room_id
-    if group_id:
-        where_clause["id_groupe"] = group_id
-    if status:
-        where_clause["status"] = status
-    
-    # Department filter (through teacher)
-    if department_id:
-        where_clause["enseignant"] = {"id_departement": department_id}
-    
-    # Specialty filter (through subject)
-    if specialty_id:
-        where_clause["matiere"] = {"id_specialite": specialty_id}
-    
-    sessions = await prisma.emploitemps.find_many(
-        where=where_clause,
-        skip=skip,
-        take=limit,
+    # Stored sessions and series occurrences, paginated in the database;
+    # department through the teacher, specialty through the subject
+    sessions, total = await find_occurrence_page(
+        prisma,
+        skip,
+        limit,
+        start=datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None,
+        end=datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None,
+        teacher_id=teacher_id,
+        room_id=room_id,
+        group_id=group_id,
+        status=status,
+        teacher_department_id=department_id,
+        specialty_id=specialty_id,
         include={
             "salle": True,
             "matiere": {
@@ -805,12 +928,9 @@ async def get_all_sessions(
                     "utilisateur": True
                 }
             }
-        },
-        order={"date": "asc"}
+        }
     )
     
-    total = await prisma.emploitemps.count(where=where_clause)
-    
     # Format response
     formatted_sessions = []
     for s in sessions:
@@ -874,8 +994,9 @@ async def get_session(
     current_user = Depends(require_admin)
 ):
     """Get a single session with full details"""
-    session = await prisma.emploitemps.find_unique(
-        where={"id": session_id},
+    session = await find_schedule(
+        prisma,
+        session_id,
         include={
             "salle": True,
             "matiere": {"include": {"specialite": {"include": {"departement": True}}}},
@@ -896,7 +1017,7 @@ async def get_session(
         raise HTTPException(status_code=404, detail="Session not found")
     
     # Get counts separately
-    absences_count = await prisma.absence.count(where={"id_seance": session_id})
+    absences_count = await prisma.absence.count(where={"id_seance": session.id})
     group_size = 0
     if session.groupe:
         group_size = await prisma.etudiant.count(where={"id_groupe": session.groupe.id})
@@ -929,8 +1050,8 @@ async def update_session(
     current_user = Depends(require_admin)
 ):
     """Update a timetable session with conflict checking"""
-    # Get existing session
-    existing = await prisma.emploitemps.find_unique(where={"id": session_id})
+    # Get existing session (a series occurrence is only stored once the update goes ahead)
+    existing = await find_schedule(prisma, session_id)
     if not existing:
         raise HTTPException(status_code=404, detail="Session not found")
     
@@ -951,7 +1072,7 @@ async def update_session(
         )
         
         detector = ConflictDetector(prisma)
-        conflicts = await detector.detect_all_conflicts(temp_session, session_id)
+        conflicts = await detector.detect_all_conflicts(temp_session, existing.id)
         
         critical = [c for c in conflicts if c["severity"] == "critical"]
         if critical and not force:
@@ -973,9 +1094,12 @@ async def update_session(
         update_dict.pop("start_time", None)
         update_dict.pop("end_time", None)
     
-    # Update session
+    # Update session (a session of a series is stored on first edit)
+    if parse_occurrence_id(existing.id):
+        existing = await find_schedule(prisma, existing.id, materialize=True)
+    update_dict = prepare_update(existing, update_dict)
     session = await prisma.emploitemps.update(
-        where={"id": session_id},
+        where={"id": existing.id},
         data=update_dict,
         include={
             "salle": True,
@@ -985,6 +1109,9 @@ async def update_session(
         }
     )
     
+    await release_occurrence(prisma, existing, update_dict)
+    await invalidate_schedule_cache(prisma, sessions=[existing, session])
+    
     return {
         "status": "success",
         "message": "Session updated successfully",
@@ -999,15 +1126,13 @@ async def delete_session(
     current_user = Depends(require_admin)
 ):
     """Delete a timetable session"""
-    session = await prisma.emploitemps.find_unique(
-        where={"id": session_id}
-    )
+    session = await find_schedule(prisma, session_id)
     
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
     absences_count = await prisma.absence.count(
-        where={"id_seance": session_id}
+        where={"id_seance": session.id}
     )
     
     if absences_count > 0 and not cascade:
@@ -1017,7 +1142,8 @@ async def delete_session(
         )
     
     # Delete session (absences will cascade if configured in schema)
-    await prisma.emploitemps.delete(where={"id": session_id})
+    await delete_schedule(prisma, session)
+    await invalidate_schedule_cache(prisma, sessions=[session])
     
     return {"message": "Session deleted successfully"}
 
@@ -1061,33 +1187,19 @@ async def get_timetable_analytics(
     current_user = Depends(require_admin)
 ):
     """Get timetable analytics and statistics"""
-    where_clause = {}
-    
-    if start_date:
-        where_clause["date"] = {"gte": datetime.strptime(start_date, "%Y-%m-%d")}
-    if end_date:
-        if "date" in where_clause:
-            where_clause["date"]["lte"] = datetime.strptime(end_date, "%Y-%m-%d")
-        else:
-            where_clause["date"] = {"lte": datetime.strptime(end_date, "%Y-%m-%d")}
+    sessions = await find_occurrences(
+        prisma,
+        start=datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None,
+        end=datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+    )
     
     # Count sessions by status
-    total_sessions = await prisma.emploitemps.count(where=where_clause)
-    planned = await prisma.emploitemps.count(where={**where_clause, "status": "PLANNED"})
-    canceled = await prisma.emploitemps.count(where={**where_clause, "status": "CANCELED"})
-    makeup = await prisma.emploitemps.count(where={**where_clause, "status": "MAKEUP"})
+    total_sessions = len(sessions)
+    planned = sum(1 for s in sessions if s.status == "PLANNED")
+    canceled = sum(1 for s in sessions if s.status == "CANCELED")
+    makeup = sum(1 for s in sessions if s.status == "MAKEUP")
     
     # Count unique entities
-    sessions = await prisma.emploitemps.find_many(
-        where=where_clause,
-        select={
-            "id_enseignant": True,
-            "id_salle": True,
-            "id_groupe": True,
-            "id_matiere": True
-        }
-    )
-    
     unique_teachers = len(set(s.id_enseignant for s in sessions))
     unique_rooms = len(set(s.id_salle for s in sessions))
     unique_groups = len(set(s.id_groupe for s in sessions))
@@ -10,6 +10,7 @@ from app.schemas.user import UserCreate, UserResponse, UserLogin, Token
 from app.core.security import hash_password, verify_password
 from app.core.jwt import create_access_token, create_refresh_token
 from app.core.deps import get_current_user
+from app.core.http_cache import conditional_get, T_DEPARTMENT, T_SPECIALTY, T_LEVEL, T_GROUP
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
@@ -379,7 +380,7 @@ async def get_available_departments(prisma: Prisma = Depends(get_prisma)):
         )
 
 
-@router.get("/departments") 
+@router.get("/departments", dependencies=[Depends(conditional_get(T_DEPARTMENT, max_age=60))])
 async def get_all_departments(prisma: Prisma = Depends(get_prisma)):
     """Get all departments for teacher registration"""
     try:
@@ -400,7 +401,7 @@ async def get_all_departments(prisma: Prisma = Depends(get_prisma)):
         )
 
 
-@router.get("/specialties")
+@router.get("/specialties", dependencies=[Depends(conditional_get(T_SPECIALTY, T_DEPARTMENT, max_age=60))])
 async def get_specialties(department_id: Optional[str] = Query(None), prisma: Prisma = Depends(get_prisma)):
     """Get specialties, optionally filtered by department"""
     try:
@@ -423,7 +424,7 @@ async def get_specialties(department_id: Optional[str] = Query(None), prisma: Pr
         )
 
 
-@router.get("/groups")
+@router.get("/groups", dependencies=[Depends(conditional_get(T_GROUP, T_LEVEL, T_SPECIALTY, max_age=60))])
 async def get_groups(specialty_id: Optional[str] = Query(None), prisma: Prisma = Depends(get_prisma)):
     """Get groups, optionally filtered by specialty"""
     try:
@@ -0,0 +1,206 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, status
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Tuple
+from prisma import Prisma
+
+from app.db.prisma_client import get_prisma
+from app.core.deps import get_current_user
+from app.core.jwt import create_calendar_token, decode_token
+from app.core.http_cache import conditional_get, TIMETABLE_TABLES
+from app.routers.department_head_timetable import get_dept_head_department
+from app.services.timetable_cache import SCOPE_GROUP, SCOPE_TEACHER
+from app.services.ical_service import CalendarFeedService, iter_chunks
+
+router = APIRouter(prefix="/calendar", tags=["Calendar Feeds"])
+
+
+def _token_key(scope: str, owner_id: str) -> dict:
+    return {"scope_owner_id": {"scope": scope, "owner_id": owner_id}}
+
+
+async def token_version(prisma: Prisma, scope: str, owner_id: str) -> int:
+    """Current token version of a feed (1 until its links are first revoked)"""
+    row = await prisma.calendartoken.find_unique(where=_token_key(scope, owner_id))
+    return row.version if row else 1
+
+
+def require_feed_token(scope: str, path_param: str):
+    """Check the subscription token against the feed in the URL and its current version"""
+    async def check_token(
+        request: Request,
+        token: str = Query(..., description="Subscription token"),
+        prisma: Prisma = Depends(get_prisma)
+    ):
+        payload = decode_token(token)
+        owner_id = request.path_params.get(path_param)
+        if (
+            not payload
+            or payload.get("type") != "calendar"
+            or payload.get("scope") != scope
+            or payload.get("sub") != owner_id
+            or payload.get("ver") != await token_version(prisma, scope, owner_id)
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Lien d'abonnement invalide"
+            )
+
+    return check_token
+
+
+feed_cache = conditional_get(*TIMETABLE_TABLES, max_age=900, daily=True)
+
+
+async def _stream_feed(prisma: Prisma, scope: str, owner_id: str, filename: str):
+    service = CalendarFeedService(prisma)
+
+    name = await service.get_owner_name(scope, owner_id)
+    if not name:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Calendrier introuvable"
+        )
+
+    content = await service.get_calendar(scope, owner_id, name)
+    return StreamingResponse(
+        iter_chunks(content),
+        media_type="text/calendar; charset=utf-8",
+        headers={"Content-Disposition": f'inline; filename="{filename}.ics"'}
+    )
+
+
+@router.get(
+    "/groups/{group_id}.ics",
+    dependencies=[Depends(require_feed_token(SCOPE_GROUP, "group_id")), Depends(feed_cache)]
+)
+async def get_group_calendar(
+    group_id: str,
+    prisma: Prisma = Depends(get_prisma)
+):
+    """iCalendar feed of a group's timetable (subscribe via /calendar/subscriptions)"""
+    return await _stream_feed(prisma, SCOPE_GROUP, group_id, f"groupe-{group_id}")
+
+
+@router.get(
+    "/teachers/{teacher_id}.ics",
+    dependencies=[Depends(require_feed_token(SCOPE_TEACHER, "teacher_id")), Depends(feed_cache)]
+)
+async def get_teacher_calendar(
+    teacher_id: str,
+    prisma: Prisma = Depends(get_prisma)
+):
+    """iCalendar feed of a teacher's timetable (subscribe via /calendar/subscriptions)"""
+    return await _stream_feed(prisma, SCOPE_TEACHER, teacher_id, f"enseignant-{teacher_id}")
+
+
+async def _check_department_feeds(prisma: Prisma, current_user, group_id: Optional[str], teacher_id: Optional[str]):
+    """A department head may only follow the groups and teachers of their department"""
+    department = await get_dept_head_department(current_user, prisma)
+    if group_id:
+        group = await prisma.groupe.find_first(
+            where={"id": group_id, "niveau": {"specialite": {"id_departement": department.id}}}
+        )
+        if not group:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Group does not belong to your department"
+            )
+    if teacher_id:
+        teacher = await prisma.enseignant.find_unique(where={"id": teacher_id})
+        if not teacher or teacher.id_departement != department.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Teacher does not belong to your department"
+            )
+
+
+async def _user_feeds(prisma: Prisma, current_user, group_id: Optional[str], teacher_id: Optional[str]) -> List[Tuple[str, str]]:
+    """(scope, owner_id) of the feeds the user asked for and may follow"""
+    feeds = []
+
+    if current_user.role == "DEPARTMENT_HEAD" and (group_id or teacher_id):
+        await _check_department_feeds(prisma, current_user, group_id, teacher_id)
+
+    if current_user.role in ("DEPARTMENT_HEAD", "ADMIN"):
+        if group_id:
+            feeds.append((SCOPE_GROUP, group_id))
+        if teacher_id:
+            feeds.append((SCOPE_TEACHER, teacher_id))
+
+    if not group_id and not teacher_id:
+        if current_user.etudiant_id:
+            etudiant = await prisma.etudiant.find_unique(where={"id": current_user.etudiant_id})
+            if etudiant and etudiant.id_groupe:
+                feeds.append((SCOPE_GROUP, etudiant.id_groupe))
+        if current_user.enseignant_id:
+            feeds.append((SCOPE_TEACHER, current_user.enseignant_id))
+
+    if not feeds:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Aucun calendrier disponible pour cet utilisateur"
+        )
+    return feeds
+
+
+async def _subscription_urls(request: Request, prisma: Prisma, feeds: List[Tuple[str, str]]) -> dict:
+    result = []
+    for scope, owner_id in feeds:
+        if scope == SCOPE_GROUP:
+            url = request.url_for("get_group_calendar", group_id=owner_id)
+        else:
+            url = request.url_for("get_teacher_calendar", teacher_id=owner_id)
+        token = create_calendar_token(scope, owner_id, await token_version(prisma, scope, owner_id))
+        result.append({
+            "scope": scope,
+            "ownerId": owner_id,
+            "url": str(url.include_query_params(token=token))
+        })
+
+    return {"feeds": result}
+
+
+@router.get("/subscriptions")
+async def get_calendar_subscriptions(
+    request: Request,
+    group_id: Optional[str] = Query(None, description="Group feed (department heads and admins)"),
+    teacher_id: Optional[str] = Query(None, description="Teacher feed (department heads and admins)"),
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(get_current_user)
+):
+    """Subscription URLs of the feeds the current user may follow"""
+    feeds = await _user_feeds(prisma, current_user, group_id, teacher_id)
+    return await _subscription_urls(request, prisma, feeds)
+
+
+@router.post("/subscriptions/revoke")
+async def revoke_calendar_subscriptions(
+    request: Request,
+    group_id: Optional[str] = Query(None, description="Group feed (department heads and admins)"),
+    teacher_id: Optional[str] = Query(None, description="Teacher feed (department heads and admins)"),
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(get_current_user)
+):
+    """
+    Invalidate every existing subscription URL of these feeds and return new ones
+
+    A group feed is shared by the whole group, so only department heads and
+    admins may revoke it.
+    """
+    feeds = await _user_feeds(prisma, current_user, group_id, teacher_id)
+    if current_user.role not in ("DEPARTMENT_HEAD", "ADMIN"):
+        feeds = [(scope, owner_id) for scope, owner_id in feeds if scope != SCOPE_GROUP]
+        if not feeds:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Seul le chef de département peut révoquer le calendrier d'un groupe"
+            )
+    for scope, owner_id in feeds:
+        await prisma.calendartoken.upsert(
+            where=_token_key(scope, owner_id),
+            data={
+                "create": {"scope": scope, "owner_id": owner_id, "version": 2},
+                "update": {"version": {"increment": 1}}
+            }
+        )
+    return await _subscription_urls(request, prisma, feeds)
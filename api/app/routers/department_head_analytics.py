@@ -8,6 +8,8 @@ from fastapi.responses import StreamingResponse
 from prisma import Prisma
 from app.db.prisma_client import get_prisma
 from app.core.deps import require_department_head
+from app.services.schedule_series import find_occurrences
+from app.services.grade_analytics import GradeAnalyticsService
 from typing import Optional, List, Dict
 from datetime import datetime, timedelta, timezone
 from collections import defaultdict
@@ -82,12 +84,11 @@ async def get_analytics_overview(
     )
     
     # Get all schedules in date range
-    schedules = await prisma.emploitemps.find_many(
+    schedules = await find_occurrences(
+        prisma,
+        start=start_dt,
+        end=end_dt,
         where={
-            "date": {
-                "gte": start_dt,
-                "lte": end_dt
-            },
             "enseignant": {
                 "id_departement": department.id
             }
@@ -111,17 +112,8 @@ async def get_analytics_overview(
         }
     )
     
-    # Get grades
-    grades = await prisma.note.find_many(
-        where={
-            "id_etudiant": {"in": student_ids},
-            "createdAt": {
-                "gte": start_dt,
-                "lte": end_dt
-            }
-        },
-        include={"matiere": True}
-    )
+    # Grade distribution (counts per value, not individual grades)
+    grades = await GradeAnalyticsService(prisma).load(department.id, start_dt, end_dt)
     
     # Calculate KPIs
     total_schedules = len(schedules)
@@ -233,13 +225,6 @@ async def get_analytics_overview(
             "date": week_start.strftime("%Y-%m-%d")
         })
     
-    # Grade statistics
-    average_grade = sum([g.valeur for g in grades]) / len(grades) if grades else 0
-    excellent_grades = len([g for g in grades if g.valeur >= 16])
-    good_grades = len([g for g in grades if 14 <= g.valeur < 16])
-    average_grades = len([g for g in grades if 10 <= g.valeur < 14])
-    poor_grades = len([g for g in grades if g.valeur < 10])
-    
     return {
         "period": {
             "start_date": start_dt.isoformat(),
@@ -260,14 +245,7 @@ async def get_analytics_overview(
         "top_teachers": top_teachers,
         "room_efficiency": room_efficiency[:5],  # Top 5 rooms
         "weekly_attendance": weekly_attendance,
-        "grade_statistics": {
-            "average_grade": round(average_grade, 2),
-            "total_grades": len(grades),
-            "excellent": excellent_grades,
-            "good": good_grades,
-            "average": average_grades,
-            "poor": poor_grades
-        },
+        "grade_statistics": grades.summary(),
         "department": {
             "id": department.id,
             "name": department.nom
@@ -275,6 +253,47 @@ async def get_analytics_overview(
     }
 
 
+@router.get("/grades")
+async def get_grade_analytics(
+    annee_scolaire: Optional[str] = Query(None),
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None),
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(require_department_head)
+):
+    """
+    Grade distribution of the department: histogram and percentiles, mean
+    and spread per subject, teacher and group, and year-over-year comparison
+    
+    Without filters every school year is included.
+    """
+    department = await get_dept_head_department(current_user, prisma)
+    
+    try:
+        start_dt = datetime.fromisoformat(start_date) if start_date else None
+        end_dt = datetime.fromisoformat(end_date) if end_date else None
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid date format. Use ISO 8601 (YYYY-MM-DD)"
+        )
+    
+    grades = await GradeAnalyticsService(prisma).load(department.id, start_dt, end_dt, annee_scolaire)
+    
+    return {
+        "filters": {
+            "annee_scolaire": annee_scolaire,
+            "start_date": start_date,
+            "end_date": end_date
+        },
+        "distribution": grades.summary(),
+        "by_subject": grades.by("subject"),
+        "by_teacher": grades.by("teacher"),
+        "by_group": grades.by("group"),
+        "year_over_year": grades.year_over_year()
+    }
+
+
 @router.get("/recent-activity")
 async def get_recent_activity(
     limit: int = Query(10, ge=1, le=50),
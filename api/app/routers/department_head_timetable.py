@@ -1,13 +1,23 @@
 from fastapi import APIRouter, HTTPException, Depends, status, Query
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from prisma import Prisma
 from datetime import datetime, time, timezone, timedelta
 from pydantic import BaseModel
+import json
 
 from app.db.prisma_client import get_prisma
 from app.core.deps import require_department_head, get_current_user
 from app.schemas.user import UserResponse
 from app.routers.notifications import create_notification
+from app.services.timetable_cache import invalidate_schedule_cache
+from app.core.http_cache import conditional_get, T_ROOM
+from app.services.conflict_scanner import DepartmentConflictScanner, scan_conflicts
+from app.services.schedule_availability import DayAvailability, ROOM, TEACHER, GROUP
+from app.services.schedule_series import (
+    count_schedules, create_series, find_occurrences, find_schedule, occurrence_id,
+    prepare_update, release_occurrence, delete_schedule as delete_occurrence
+)
 
 router = APIRouter(prefix="/department-head/timetable", tags=["Department Head - Timetable Management"])
 
@@ -33,6 +43,7 @@ class ScheduleCreate(BaseModel):
     recurrence: Optional[str] = "WEEKLY"  # WEEKLY, NONE
     semester_start: Optional[str] = None  # Format: "YYYY-MM-DD"
     semester_end: Optional[str] = None    # Format: "YYYY-MM-DD"
+    semester: Optional[str] = None        # e.g. "S1" (default: the subject's semester)
 
 class ScheduleUpdate(BaseModel):
     date: Optional[str] = None
@@ -273,7 +284,7 @@ async def get_department_specialities(
     
     return specialities_with_counts
 
-@router.get("/rooms")
+@router.get("/rooms", dependencies=[Depends(conditional_get(T_ROOM, private=True))])
 async def get_available_rooms(
     prisma: Prisma = Depends(get_prisma),
     current_user = Depends(require_department_head)
@@ -458,9 +469,7 @@ async def delete_subject(
         )
     
     # Check if subject is used in any schedules
-    schedule_count = await prisma.emploitemps.count(
-        where={"id_matiere": subject_id}
-    )
+    schedule_count = await count_schedules(prisma, {"id_matiere": subject_id})
     
     if schedule_count > 0:
         raise HTTPException(
@@ -484,40 +493,13 @@ async def get_department_schedules(
     """Get schedules for the department head's department"""
     department = await get_dept_head_department(current_user, prisma)
     
-    # Build where clause
-    where_clause = {
-        "groupe": {
-            "niveau": {
-                "specialite": {
-                    "id_departement": department.id
-                }
-            }
-        }
-    }
-    
-    if group_id:
-        where_clause["id_groupe"] = group_id
-    
-    if teacher_id:
-        where_clause["id_enseignant"] = teacher_id
-    
-    if date_from:
-        # Convert to datetime at start of day
-        date_from_obj = datetime.strptime(date_from, "%Y-%m-%d")
-        date_from_dt = datetime.combine(date_from_obj.date(), datetime.min.time())
-        where_clause["date"] = {"gte": date_from_dt}
-    
-    if date_to:
-        # Convert to datetime at end of day
-        date_to_obj = datetime.strptime(date_to, "%Y-%m-%d")
-        date_to_dt = datetime.combine(date_to_obj.date(), datetime.max.time())
-        if "date" in where_clause:
-            where_clause["date"]["lte"] = date_to_dt
-        else:
-            where_clause["date"] = {"lte": date_to_dt}
-    
-    schedules = await prisma.emploitemps.find_many(
-        where=where_clause,
+    schedules = await find_occurrences(
+        prisma,
+        start=datetime.strptime(date_from, "%Y-%m-%d").date() if date_from else None,
+        end=datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else None,
+        group_id=group_id,
+        teacher_id=teacher_id,
+        department_id=department.id,
         include={
             "salle": True,
             "matiere": True,
@@ -531,11 +513,7 @@ async def get_department_schedules(
             "enseignant": {
                 "include": {"utilisateur": True}
             }
-        },
-        order=[
-            {"date": "asc"},
-            {"heure_debut": "asc"}
-        ]
+        }
     )
     
     return schedules
@@ -609,183 +587,101 @@ async def create_schedule(
     
     # Create the schedule(s)
     try:
-        created_schedules = []
         conflicts = []  # Initialize conflicts list
         
         # Determine if we should create recurring schedules
         if schedule_data.recurrence == "WEEKLY" and schedule_data.semester_end:
-            # Create recurring weekly schedules
+            # One series for the semester; weeks with a conflict become exceptions
             semester_end_date = datetime.strptime(schedule_data.semester_end, "%Y-%m-%d").date()
+            week_dates = []
             current_date = schedule_date
-            week_day = current_date.weekday()  # 0=Monday, 6=Sunday
+            while current_date <= semester_end_date:
+                week_dates.append(current_date)
+                current_date += timedelta(days=7)
             
             print(f"🔁 Creating WEEKLY recurring schedule from {schedule_date} to {semester_end_date}")
             
-            while current_date <= semester_end_date:
-                # Create datetime objects for this occurrence
+            # Every week checked against one range snapshot
+            availability = await DayAvailability.load_many(
+                prisma,
+                week_dates,
+                include={"matiere": True, "groupe": True, "enseignant": True}
+            )
+            
+            skipped_dates = []
+            for current_date in week_dates:
                 occurrence_start = create_local_datetime(current_date, start_time_obj)
                 occurrence_end = create_local_datetime(current_date, end_time_obj)
+                day = availability[current_date]
                 
-                # Check for conflicts
-                day_start = create_local_datetime(current_date, datetime.min.time())
-                day_end = create_local_datetime(current_date, datetime.max.time())
+                room_conflict = next(iter(day.overlapping(ROOM, schedule_data.room_id, occurrence_start, occurrence_end)), None)
+                # Teacher teaching 2 classes at same time
+                teacher_conflict = next(iter(day.overlapping(TEACHER, schedule_data.teacher_id, occurrence_start, occurrence_end)), None)
+                # Group with 2 different teachers at same time
+                group_conflict = next(iter(day.overlapping(GROUP, schedule_data.group_id, occurrence_start, occurrence_end)), None)
                 
-                # Check for room conflict
-                room_conflict = await prisma.emploitemps.find_first(
-                    where={
-                        "date": {"gte": day_start, "lte": day_end},
-                        "id_salle": schedule_data.room_id,
-                        "OR": [
-                            {
-                                "AND": [
-                                    {"heure_debut": {"lte": occurrence_start}},
-                                    {"heure_fin": {"gt": occurrence_start}}
-                                ]
-                            },
-                            {
-                                "AND": [
-                                    {"heure_debut": {"lt": occurrence_end}},
-                                    {"heure_fin": {"gte": occurrence_end}}
-                                ]
-                            },
-                            {
-                                "AND": [
-                                    {"heure_debut": {"gte": occurrence_start}},
-                                    {"heure_fin": {"lte": occurrence_end}}
-                                ]
-                            }
-                        ]
-                    },
-                    include={
-                        "matiere": True,
-                        "groupe": True,
-                        "enseignant": True
+                if not room_conflict and not teacher_conflict and not group_conflict:
+                    continue
+                
+                skipped_dates.append(current_date)
+                # Track conflict details
+                if room_conflict:
+                    conflict_info = {
+                        "date": current_date.strftime("%Y-%m-%d"),
+                        "reason": "room_occupied",
+                        "conflicting_subject": room_conflict.matiere.nom if room_conflict.matiere else "Unknown",
+                        "conflicting_group": room_conflict.groupe.nom if room_conflict.groupe else "Unknown",
+                        "time": f"{room_conflict.heure_debut.strftime('%H:%M')}-{room_conflict.heure_fin.strftime('%H:%M')}"
                     }
-                )
+                    conflicts.append(conflict_info)
+                    print(f"  ⚠️ Skipping {current_date} - room conflict detected")
                 
-                # Check for teacher conflict (teacher teaching 2 classes at same time)
-                teacher_conflict = await prisma.emploitemps.find_first(
-                    where={
-                        "date": {"gte": day_start, "lte": day_end},
-                        "id_enseignant": schedule_data.teacher_id,
-                        "OR": [
-                            {
-                                "AND": [
-                                    {"heure_debut": {"lte": occurrence_start}},
-                                    {"heure_fin": {"gt": occurrence_start}}
-                                ]
-                            },
-                            {
-                                "AND": [
-                                    {"heure_debut": {"lt": occurrence_end}},
-                                    {"heure_fin": {"gte": occurrence_end}}
-                                ]
-                            },
-                            {
-                                "AND": [
-                                    {"heure_debut": {"gte": occurrence_start}},
-                                    {"heure_fin": {"lte": occurrence_end}}
-                                ]
-                            }
-                        ]
-                    },
-                    include={
-                        "matiere": True,
-                        "groupe": True,
-                        "enseignant": True
+                if teacher_conflict:
+                    conflict_info = {
+                        "date": current_date.strftime("%Y-%m-%d"),
+                        "reason": "teacher_occupied",
+                        "conflicting_subject": teacher_conflict.matiere.nom if teacher_conflict.matiere else "Unknown",
+                        "conflicting_group": teacher_conflict.groupe.nom if teacher_conflict.groupe else "Unknown",
+                        "conflicting_teacher": teacher_conflict.enseignant.nom if teacher_conflict.enseignant else "Unknown",
+                        "time": f"{teacher_conflict.heure_debut.strftime('%H:%M')}-{teacher_conflict.heure_fin.strftime('%H:%M')}"
                     }
-                )
+                    conflicts.append(conflict_info)
+                    print(f"  ⚠️ Skipping {current_date} - teacher conflict detected")
                 
-                # Check for group conflict (group with 2 different teachers at same time)
-                group_conflict = await prisma.emploitemps.find_first(
-                    where={
-                        "date": {"gte": day_start, "lte": day_end},
+                if group_conflict:
+                    conflict_info = {
+                        "date": current_date.strftime("%Y-%m-%d"),
+                        "reason": "group_occupied",
+                        "conflicting_subject": group_conflict.matiere.nom if group_conflict.matiere else "Unknown",
+                        "conflicting_teacher": group_conflict.enseignant.nom if group_conflict.enseignant else "Unknown",
+                        "time": f"{group_conflict.heure_debut.strftime('%H:%M')}-{group_conflict.heure_fin.strftime('%H:%M')}"
+                    }
+                    conflicts.append(conflict_info)
+                    print(f"  ⚠️ Skipping {current_date} - group conflict detected")
+            
+            occurrence_count = len(week_dates) - len(skipped_dates)
+            if occurrence_count:
+                series = await create_series(
+                    prisma,
+                    {
+                        "id_salle": schedule_data.room_id,
+                        "id_matiere": schedule_data.subject_id,
                         "id_groupe": schedule_data.group_id,
-                        "OR": [
-                            {
-                                "AND": [
-                                    {"heure_debut": {"lte": occurrence_start}},
-                                    {"heure_fin": {"gt": occurrence_start}}
-                                ]
-                            },
-                            {
-                                "AND": [
-                                    {"heure_debut": {"lt": occurrence_end}},
-                                    {"heure_fin": {"gte": occurrence_end}}
-                                ]
-                            },
-                            {
-                                "AND": [
-                                    {"heure_debut": {"gte": occurrence_start}},
-                                    {"heure_fin": {"lte": occurrence_end}}
-                                ]
-                            }
-                        ]
+                        "id_enseignant": schedule_data.teacher_id,
+                        "week_day": schedule_date.isoweekday(),
+                        "start_time": schedule_data.start_time,
+                        "end_time": schedule_data.end_time,
+                        "start_date": create_local_datetime(schedule_date, datetime.min.time()),
+                        "end_date": create_local_datetime(semester_end_date, datetime.min.time()),
+                        "semester": schedule_data.semester or subject.semester
                     },
-                    include={
-                        "matiere": True,
-                        "groupe": True,
-                        "enseignant": True
-                    }
+                    skip_dates=skipped_dates,
+                    reason="Conflit"
                 )
-                
-                if not room_conflict and not teacher_conflict and not group_conflict:
-                    # Create schedule for this week
-                    new_schedule = await prisma.emploitemps.create(
-                        data={
-                            "date": occurrence_start,
-                            "heure_debut": occurrence_start,
-                            "heure_fin": occurrence_end,
-                            "id_salle": schedule_data.room_id,
-                            "id_matiere": schedule_data.subject_id,
-                            "id_groupe": schedule_data.group_id,
-                            "id_enseignant": schedule_data.teacher_id,
-                            "is_recurring": True,
-                            "week_day": week_day + 1  # Store as 1-7 instead of 0-6
-                        }
-                    )
-                    created_schedules.append(new_schedule)
-                    print(f"  ✅ Created schedule for {current_date}")
-                else:
-                    # Track conflict details
-                    if room_conflict:
-                        conflict_info = {
-                            "date": current_date.strftime("%Y-%m-%d"),
-                            "reason": "room_occupied",
-                            "conflicting_subject": room_conflict.matiere.nom if room_conflict.matiere else "Unknown",
-                            "conflicting_group": room_conflict.groupe.nom if room_conflict.groupe else "Unknown",
-                            "time": f"{room_conflict.heure_debut.strftime('%H:%M')}-{room_conflict.heure_fin.strftime('%H:%M')}"
-                        }
-                        conflicts.append(conflict_info)
-                        print(f"  ⚠️ Skipping {current_date} - room conflict detected")
-                    
-                    if teacher_conflict:
-                        conflict_info = {
-                            "date": current_date.strftime("%Y-%m-%d"),
-                            "reason": "teacher_occupied",
-                            "conflicting_subject": teacher_conflict.matiere.nom if teacher_conflict.matiere else "Unknown",
-                            "conflicting_group": teacher_conflict.groupe.nom if teacher_conflict.groupe else "Unknown",
-                            "conflicting_teacher": teacher_conflict.enseignant.nom if teacher_conflict.enseignant else "Unknown",
-                            "time": f"{teacher_conflict.heure_debut.strftime('%H:%M')}-{teacher_conflict.heure_fin.strftime('%H:%M')}"
-                        }
-                        conflicts.append(conflict_info)
-                        print(f"  ⚠️ Skipping {current_date} - teacher conflict detected")
-                    
-                    if group_conflict:
-                        conflict_info = {
-                            "date": current_date.strftime("%Y-%m-%d"),
-                            "reason": "group_occupied",
-                            "conflicting_subject": group_conflict.matiere.nom if group_conflict.matiere else "Unknown",
-                            "conflicting_teacher": group_conflict.enseignant.nom if group_conflict.enseignant else "Unknown",
-                            "time": f"{group_conflict.heure_debut.strftime('%H:%M')}-{group_conflict.heure_fin.strftime('%H:%M')}"
-                        }
-                        conflicts.append(conflict_info)
-                        print(f"  ⚠️ Skipping {current_date} - group conflict detected")
-                
-                # Move to next week
-                current_date += timedelta(days=7)
+                first_date = next(d for d in week_dates if d not in skipped_dates)
+                first_schedule_id = occurrence_id(series.id, first_date)
             
-            print(f"✅ Created {len(created_schedules)} recurring schedules")
+            print(f"✅ Created {occurrence_count} recurring schedules")
             
         else:
             # Create single non-recurring schedule
@@ -803,7 +699,14 @@ async def create_schedule(
                     "is_recurring": False
                 }
             )
-            created_schedules.append(new_schedule)
+            occurrence_count = 1
+            first_schedule_id = new_schedule.id
+        
+        await invalidate_schedule_cache(
+            prisma,
+            group_ids=[schedule_data.group_id] if occurrence_count else [],
+            teacher_ids=[schedule_data.teacher_id] if occurrence_count else []
+        )
         
         # Send notification to teacher
         teacher_user = await prisma.utilisateur.find_first(
@@ -811,21 +714,22 @@ async def create_schedule(
         )
         
         if teacher_user:
-            recurrence_msg = f"pour tout le semestre ({len(created_schedules)} séances)" if len(created_schedules) > 1 else ""
+            recurrence_msg = f"pour tout le semestre ({occurrence_count} séances)" if occurrence_count > 1 else ""
             await create_notification(
                 prisma=prisma,
                 user_id=teacher_user.id,
                 notification_type="SCHEDULE_CREATED",
                 title="Nouvel emploi du temps",
                 message=f"Un emploi du temps a été créé pour {subject.nom} le {schedule_date.strftime('%A')} de {start_time_obj.strftime('%H:%M')} à {end_time_obj.strftime('%H:%M')} - Salle {room.code} {recurrence_msg}",
-                related_id=created_schedules[0].id if created_schedules else None
+                related_id=first_schedule_id if occurrence_count else None
             )
             print(f"✅ Notification sent to teacher {teacher_user.email}")
         
         # Return the first schedule with relations
-        if created_schedules:
-            first_schedule = await prisma.emploitemps.find_unique(
-                where={"id": created_schedules[0].id},
+        if occurrence_count:
+            first_schedule = await find_schedule(
+                prisma,
+                first_schedule_id,
                 include={
                     "salle": True,
                     "matiere": True,
@@ -838,9 +742,9 @@ async def create_schedule(
             return {
                 "success": True,
                 "schedule": first_schedule,
-                "created_count": len(created_schedules),
+                "created_count": occurrence_count,
                 "conflicts": conflicts,
-                "message": f"Created {len(created_schedules)} schedule(s) successfully" + 
+                "message": f"Created {occurrence_count} schedule(s) successfully" + 
                           (f" with {len(conflicts)} conflicts skipped" if conflicts else "")
             }
         
@@ -931,8 +835,10 @@ async def update_schedule(
     department = await get_dept_head_department(current_user, prisma)
     
     # Find the schedule and verify it belongs to the department
-    schedule = await prisma.emploitemps.find_unique(
-        where={"id": schedule_id},
+    schedule = await find_schedule(
+        prisma,
+        schedule_id,
+        materialize=True,
         include={
             "groupe": {
                 "include": {
@@ -994,9 +900,10 @@ async def update_schedule(
     if schedule_update.group_id:
         update_data["id_groupe"] = schedule_update.group_id
     
-    # Update the schedule
+    # Update the schedule (a session of a series is stored on first edit)
+    update_data = prepare_update(schedule, update_data)
     updated_schedule = await prisma.emploitemps.update(
-        where={"id": schedule_id},
+        where={"id": schedule.id},
         data=update_data,
         include={
             "salle": True,
@@ -1008,6 +915,9 @@ async def update_schedule(
         }
     )
     
+    await release_occurrence(prisma, schedule, update_data)
+    await invalidate_schedule_cache(prisma, sessions=[schedule, updated_schedule])
+    
     return updated_schedule
 
 @router.delete("/schedules/{schedule_id}")
@@ -1020,8 +930,9 @@ async def delete_schedule(
     department = await get_dept_head_department(current_user, prisma)
     
     # Find the schedule and verify it belongs to the department
-    schedule = await prisma.emploitemps.find_unique(
-        where={"id": schedule_id},
+    schedule = await find_schedule(
+        prisma,
+        schedule_id,
         include={
             "groupe": {
                 "include": {
@@ -1045,8 +956,9 @@ async def delete_schedule(
             detail="Schedule does not belong to your department"
         )
     
-    # Delete the schedule
-    await prisma.emploitemps.delete(where={"id": schedule_id})
+    # Delete the schedule (or drop the occurrence from its series)
+    await delete_occurrence(prisma, schedule)
+    await invalidate_schedule_cache(prisma, sessions=[schedule])
     
     return {"message": "Schedule deleted successfully"}
 
@@ -1054,109 +966,34 @@ async def delete_schedule(
 async def check_schedule_conflicts(
     date_from: Optional[str] = Query(None, description="Check conflicts from date (YYYY-MM-DD)"),
     date_to: Optional[str] = Query(None, description="Check conflicts to date (YYYY-MM-DD)"),
+    stream: bool = Query(False, description="Stream conflicts as NDJSON while scanning"),
     prisma: Prisma = Depends(get_prisma),
     current_user = Depends(require_department_head)
 ):
-    """Check for scheduling conflicts in the department"""
+    """Check for room, teacher and group conflicts in the department"""
     department = await get_dept_head_department(current_user, prisma)
     
-    # Build date filter
-    date_filter = {}
-    if date_from:
-        date_filter["gte"] = datetime.strptime(date_from, "%Y-%m-%d").date()
-    if date_to:
-        date_filter["lte"] = datetime.strptime(date_to, "%Y-%m-%d").date()
-    
-    where_clause = {
-        "groupe": {
-            "niveau": {
-                "specialite": {
-                    "id_departement": department.id
-                }
-            }
-        }
-    }
-    
-    if date_filter:
-        where_clause["date"] = date_filter
-    
-    schedules = await prisma.emploitemps.find_many(
-        where=where_clause,
-        include={
-            "salle": True,
-            "enseignant": {"include": {"utilisateur": True}},
-            "groupe": True
-        },
-        order=[
-            {"date": "asc"},
-            {"heure_debut": "asc"}
-        ]
-    )
-    
-    conflicts = []
+    # Validate date filters
+    for value in (date_from, date_to):
+        if value:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid date format. Use YYYY-MM-DD"
+                )
     
-    # Check for room conflicts
-    room_schedules = {}
-    teacher_schedules = {}
+    rows = await DepartmentConflictScanner(prisma).load_sessions(department.id, date_from, date_to)
+    conflicts = scan_conflicts(rows)
     
-    for schedule in schedules:
-        schedule_key = f"{schedule.date}_{schedule.id_salle}"
-        teacher_key = f"{schedule.date}_{schedule.id_enseignant}"
-        
-        # Check room conflicts
-        if schedule_key in room_schedules:
-            for existing in room_schedules[schedule_key]:
-                if (schedule.heure_debut < existing.heure_fin and 
-                    schedule.heure_fin > existing.heure_debut):
-                    conflicts.append({
-                        "type": "room_conflict",
-                        "room": schedule.salle.code,
-                        "date": schedule.date.isoformat(),
-                        "schedules": [
-                            {
-                                "id": schedule.id,
-                                "time": f"{schedule.heure_debut.strftime('%H:%M')}-{schedule.heure_fin.strftime('%H:%M')}",
-                                "group": schedule.groupe.nom
-                            },
-                            {
-                                "id": existing.id,
-                                "time": f"{existing.heure_debut.strftime('%H:%M')}-{existing.heure_fin.strftime('%H:%M')}",
-                                "group": existing.groupe.nom
-                            }
-                        ]
-                    })
-        else:
-            room_schedules[schedule_key] = []
-        
-        room_schedules[schedule_key].append(schedule)
-        
-        # Check teacher conflicts
-        if teacher_key in teacher_schedules:
-            for existing in teacher_schedules[teacher_key]:
-                if (schedule.heure_debut < existing.heure_fin and 
-                    schedule.heure_fin > existing.heure_debut):
-                    conflicts.append({
-                        "type": "teacher_conflict",
-                        "teacher": f"{schedule.enseignant.utilisateur.prenom} {schedule.enseignant.utilisateur.nom}",
-                        "date": schedule.date.isoformat(),
-                        "schedules": [
-                            {
-                                "id": schedule.id,
-                                "time": f"{schedule.heure_debut.strftime('%H:%M')}-{schedule.heure_fin.strftime('%H:%M')}",
-                                "group": schedule.groupe.nom
-                            },
-                            {
-                                "id": existing.id,
-                                "time": f"{existing.heure_debut.strftime('%H:%M')}-{existing.heure_fin.strftime('%H:%M')}",
-                                "group": existing.groupe.nom
-                            }
-                        ]
-                    })
-        else:
-            teacher_schedules[teacher_key] = []
-        
-        teacher_schedules[teacher_key].append(schedule)
+    if stream:
+        return StreamingResponse(
+            (json.dumps(conflict) + "\n" for conflict in conflicts),
+            media_type="application/x-ndjson"
+        )
     
+    conflicts = list(conflicts)
     return {
         "conflicts_found": len(conflicts),
         "conflicts": conflicts
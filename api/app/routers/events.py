@@ -8,6 +8,11 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query
 from prisma import Prisma
 from app.db.prisma_client import get_prisma
 from app.core.deps import get_current_user, require_department_head
+from app.services.event_feed_service import (
+    EventFeedService,
+    DEFAULT_FEED_COMMENTS,
+    format_user_info,
+)
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
@@ -76,73 +81,12 @@ class ReactionCreate(BaseModel):
 # HELPER FUNCTIONS
 # ===========================
 
-def format_user_info(user) -> dict:
-    """Format user data for API response"""
-    return {
-        "id": user.id,
-        "nom": user.nom,
-        "prenom": user.prenom,
-        "role": user.role
-    }
-
-
 async def get_event_with_details(event, prisma: Prisma, current_user_id: str):
     """Get event with comments, reactions, and stats"""
-    
-    # Get comments
-    comments = await prisma.eventcomment.find_many(
-        where={"id_evenement": event.id},
-        include={"utilisateur": True}
-    )
-    
-    # Get reactions
-    reactions = await prisma.eventreaction.find_many(
-        where={"id_evenement": event.id},
-        include={"utilisateur": True}
+    payloads = await EventFeedService(prisma).build_payloads(
+        [event], current_user_id, comments_limit=None
     )
-    
-    # Check if current user reacted
-    user_reaction = next((r for r in reactions if r.id_utilisateur == current_user_id), None)
-    
-    # Get creator info
-    creator = await prisma.utilisateur.find_unique(
-        where={"id": event.id_createur}
-    )
-    
-    # Count reaction types
-    reaction_counts = {}
-    for reaction in reactions:
-        reaction_counts[reaction.type] = reaction_counts.get(reaction.type, 0) + 1
-    
-    return {
-        "id": event.id,
-        "titre": event.titre,
-        "type": event.type,
-        "description": event.description,
-        "date": event.date.isoformat() if event.date else None,
-        "lieu": event.lieu,
-        "createdAt": event.createdAt.isoformat(),
-        "updatedAt": event.updatedAt.isoformat(),
-        "creator": format_user_info(creator) if creator else None,
-        "comments": [
-            {
-                "id": c.id,
-                "contenu": c.contenu,
-                "createdAt": c.createdAt.isoformat(),
-                "user": format_user_info(c.utilisateur)
-            }
-            for c in sorted(comments, key=lambda x: x.createdAt, reverse=True)
-        ],
-        "reactions": {
-            "counts": reaction_counts,
-            "total": len(reactions),
-            "userReaction": user_reaction.type if user_reaction else None
-        },
-        "stats": {
-            "commentsCount": len(comments),
-            "reactionsCount": len(reactions)
-        }
-    }
+    return payloads[0]
 
 
 # ===========================
@@ -188,6 +132,8 @@ async def get_events(
     type: Optional[str] = Query(None, description="Filter by event type"),
     upcoming: Optional[bool] = Query(None, description="Show only upcoming events"),
     limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Id of the last event of the previous page"),
+    comments_limit: Optional[int] = Query(None, ge=0, le=50, description="Latest comments per event (all if omitted)"),
     prisma: Prisma = Depends(get_prisma),
     current_user = Depends(get_current_user)
 ):
@@ -197,31 +143,47 @@ async def get_events(
     - Students can see all events
     - Teachers can see all events
     - Department heads can see all events
-    """
-    
-    where_clause = {}
-    
-    if type:
-        where_clause["type"] = type
     
-    if upcoming:
-        where_clause["date"] = {"gte": datetime.now()}
+    Each event embeds all its comments unless comments_limit is given.
+    """
     
-    events = await prisma.evenement.find_many(
-        where=where_clause,
-        take=limit
+    feed = await EventFeedService(prisma).get_feed(
+        current_user.id,
+        type=type,
+        upcoming=upcoming,
+        limit=limit,
+        cursor=cursor,
+        comments_limit=comments_limit
     )
     
-    # Sort in Python
-    events.sort(key=lambda e: e.date if e.date else datetime.min, reverse=True)
+    return feed["items"]
+
+
+@router.get("/feed")
+async def get_events_feed(
+    type: Optional[str] = Query(None, description="Filter by event type"),
+    upcoming: Optional[bool] = Query(None, description="Show only upcoming events"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Id of the last event of the previous page"),
+    comments_limit: int = Query(DEFAULT_FEED_COMMENTS, ge=0, le=50),
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(get_current_user)
+):
+    """
+    Paginated events feed
     
-    # Get details for each event
-    result = []
-    for event in events:
-        event_details = await get_event_with_details(event, prisma, current_user.id)
-        result.append(event_details)
+    Returns {items, nextCursor, hasMore}. Pass nextCursor back as `cursor`
+    to get the next page. The query count does not depend on the page size.
+    """
     
-    return result
+    return await EventFeedService(prisma).get_feed(
+        current_user.id,
+        type=type,
+        upcoming=upcoming,
+        limit=limit,
+        cursor=cursor,
+        comments_limit=comments_limit
+    )
 
 
 @router.get("/{event_id}")
@@ -232,9 +194,7 @@ async def get_event(
 ):
     """Get a single event with all details"""
     
-    event = await prisma.evenement.find_unique(
-        where={"id": event_id}
-    )
+    event = await EventFeedService(prisma).get_event(event_id, current_user.id)
     
     if not event:
         raise HTTPException(
@@ -242,7 +202,7 @@ async def get_event(
             detail="Event not found"
         )
     
-    return await get_event_with_details(event, prisma, current_user.id)
+    return event
 
 
 @router.put("/{event_id}")
@@ -317,9 +277,10 @@ async def delete_event(
             detail="Only event creator can delete this event"
         )
     
-    # Delete related comments and reactions first
+    # Delete related comments, reactions and counters first
     await prisma.eventcomment.delete_many(where={"id_evenement": event_id})
     await prisma.eventreaction.delete_many(where={"id_evenement": event_id})
+    await prisma.eventreactioncount.delete_many(where={"id_evenement": event_id})
     
     await prisma.evenement.delete(where={"id": event_id})
     
@@ -347,13 +308,8 @@ async def add_comment(
             detail="Event not found"
         )
     
-    comment = await prisma.eventcomment.create(
-        data={
-            "id_evenement": event_id,
-            "id_utilisateur": current_user.id,
-            "contenu": comment_data.contenu
-        },
-        include={"utilisateur": True}
+    comment = await EventFeedService(prisma).add_comment(
+        event_id, current_user.id, comment_data.contenu
     )
     
     return {
@@ -390,7 +346,7 @@ async def delete_comment(
             detail="You can only delete your own comments"
         )
     
-    await prisma.eventcomment.delete(where={"id": comment_id})
+    await EventFeedService(prisma).delete_comment(comment)
     
     return {"message": "Comment deleted successfully"}
 
@@ -425,44 +381,19 @@ async def add_reaction(
             detail="Event not found"
         )
     
-    # Check if user already reacted
-    existing_reaction = await prisma.eventreaction.find_first(
-        where={
-            "id_evenement": event_id,
-            "id_utilisateur": current_user.id
-        }
-    )
-    
-    if existing_reaction:
-        # Update existing reaction
-        reaction = await prisma.eventreaction.update(
-            where={"id": existing_reaction.id},
-            data={"type": reaction_data.type}
-        )
-    else:
-        # Create new reaction
-        reaction = await prisma.eventreaction.create(
-            data={
-                "id_evenement": event_id,
-                "id_utilisateur": current_user.id,
-                "type": reaction_data.type
-            }
-        )
-    
-    # Get updated reaction counts
-    all_reactions = await prisma.eventreaction.find_many(
-        where={"id_evenement": event_id}
+    feed_service = EventFeedService(prisma)
+    reaction = await feed_service.set_reaction(
+        event_id, current_user.id, reaction_data.type
     )
     
-    reaction_counts = {}
-    for r in all_reactions:
-        reaction_counts[r.type] = reaction_counts.get(r.type, 0) + 1
+    # Read the maintained counters (one row per reaction type)
+    reaction_counts = await feed_service.get_reaction_counts(event_id)
     
     return {
         "message": "Reaction updated",
         "userReaction": reaction.type,
         "counts": reaction_counts,
-        "total": len(all_reactions)
+        "total": sum(reaction_counts.values())
     }
 
 
@@ -487,9 +418,16 @@ async def remove_reaction(
             detail="Reaction not found"
         )
     
-    await prisma.eventreaction.delete(where={"id": reaction.id})
+    feed_service = EventFeedService(prisma)
+    await feed_service.remove_reaction(reaction)
+    
+    counts = await feed_service.get_reaction_counts(event_id)
     
-    return {"message": "Reaction removed"}
+    return {
+        "message": "Reaction removed",
+        "counts": counts,
+        "total": sum(counts.values())
+    }
 
 
 # ===========================
@@ -513,10 +451,11 @@ async def get_events_stats(
     total_reactions = await prisma.eventreaction.count()
     
     # Get events by type
-    events = await prisma.evenement.find_many()
-    events_by_type = {}
-    for event in events:
-        events_by_type[event.type] = events_by_type.get(event.type, 0) + 1
+    groups = await prisma.evenement.group_by(
+        by=["type"],
+        count={"_all": True}
+    )
+    events_by_type = {g["type"]: g["_count"]["_all"] for g in groups}
     
     return {
         "totalEvents": total_events,
@@ -3,11 +3,12 @@ from typing import List, Optional
 from prisma import Prisma
 
 from app.db.prisma_client import get_prisma
+from app.core.http_cache import conditional_get, T_LEVEL
 
 router = APIRouter(prefix="/levels", tags=["Levels - Public"])
 
 
-@router.get("/")
+@router.get("/", dependencies=[Depends(conditional_get(T_LEVEL, max_age=60))])
 async def get_levels_public(
     specialty_id: Optional[str] = Query(None, description="Filter by specialty ID"),
     prisma: Prisma = Depends(get_prisma),
@@ -12,6 +12,8 @@ from pydantic import BaseModel
 from app.db.prisma_client import get_prisma
 from app.core.deps import get_current_user
 from app.schemas.user import UserResponse
+from app.services.session_replanner import SessionReplanner, DEFAULT_RADIUS_DAYS, MAX_RADIUS_DAYS
+from app.services.schedule_series import find_schedule
 
 router = APIRouter(prefix="/makeup-sessions", tags=["Makeup Sessions"])
 
@@ -214,6 +216,34 @@ async def get_makeup_sessions(
     return result
 
 
+@router.get("/suggestions/{schedule_id}", response_model=dict)
+async def suggest_makeup_slots(
+    schedule_id: str,
+    radius_days: int = Query(DEFAULT_RADIUS_DAYS, ge=1, le=MAX_RADIUS_DAYS),
+    limit: int = Query(10, ge=1, le=50),
+    prisma: Prisma = Depends(get_prisma),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """
+    Ranked replacement slots for a cancelled or moved session
+    Each option's "makeup" payload can be posted to create the makeup session
+    """
+    
+    if current_user.role not in ["TEACHER", "DEPARTMENT_HEAD", "ADMIN"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only teachers, department heads, and admins can plan makeup sessions"
+        )
+    
+    try:
+        return await SessionReplanner(prisma).propose(schedule_id, radius_days, limit)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Original schedule not found"
+        )
+
+
 @router.get("/{session_id}", response_model=dict)
 async def get_makeup_session(
     session_id: str,
@@ -264,9 +294,9 @@ async def create_makeup_session(
             detail="Only teachers, department heads, and admins can create makeup sessions"
         )
     
-    # Verify the original schedule exists
-    original_schedule = await prisma.emploitemps.find_unique(
-        where={"id": session_data.id_emploitemps_origin}
+    # Verify the original schedule exists (a series occurrence gets a row to reference)
+    original_schedule = await find_schedule(
+        prisma, session_data.id_emploitemps_origin, materialize=True
     )
     if not original_schedule:
         raise HTTPException(
@@ -287,7 +317,7 @@ async def create_makeup_session(
     # Create the makeup session
     new_session = await prisma.sessionrattrapage.create(
         data={
-            "id_emploitemps_origin": session_data.id_emploitemps_origin,
+            "id_emploitemps_origin": original_schedule.id,
             "id_matiere": session_data.id_matiere,
             "id_enseignant": session_data.id_enseignant,
             "id_groupe": session_data.id_groupe,
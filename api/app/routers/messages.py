@@ -9,6 +9,7 @@ from prisma import Prisma
 from app.db.prisma_client import get_prisma
 from app.core.deps import get_current_user
 from app.core.encryption import encrypt_message, decrypt_message
+from app.services.schedule_series import teaching_assignments
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
@@ -302,11 +303,9 @@ async def get_available_contacts(
             return []
         
         # Strategy 1: Find students through schedules
-        schedules = await prisma.emploitemps.find_many(
-            where={"id_enseignant": teacher.id}
-        )
+        assignments = await teaching_assignments(prisma, teacher_id=teacher.id)
         
-        group_ids = list(set([s.id_groupe for s in schedules if s.id_groupe]))
+        group_ids = list(set([a["id_groupe"] for a in assignments if a["id_groupe"]]))
         
         # Strategy 2: If no schedules, get ALL students from same department
         if not group_ids:
@@ -354,11 +353,11 @@ async def get_available_contacts(
         # Strategy 1: Find teachers through schedules if student has a group
         teacher_emails = []
         if student.id_groupe:
-            schedules = await prisma.emploitemps.find_many(
-                where={"id_groupe": student.id_groupe},
-                include={"enseignant": True}
-            )
-            teacher_emails = list(set([s.enseignant.email for s in schedules if s.enseignant]))
+            assignments = await teaching_assignments(prisma, group_id=student.id_groupe)
+            teacher_ids = list({a["id_enseignant"] for a in assignments})
+            if teacher_ids:
+                teachers = await prisma.enseignant.find_many(where={"id": {"in": teacher_ids}})
+                teacher_emails = list(set([t.email for t in teachers]))
         
         # Strategy 2: If no schedules or no group, get ALL teachers from same department
         if not teacher_emails and student.specialite:
@@ -450,12 +449,10 @@ async def search_users(
             return []
         
         # Find all groups taught by this teacher through schedules
-        schedules = await prisma.emploitemps.find_many(
-            where={"id_enseignant": teacher.id}
-        )
+        assignments = await teaching_assignments(prisma, teacher_id=teacher.id)
         
         # Extract unique group IDs
-        group_ids = list(set([s.id_groupe for s in schedules]))
+        group_ids = list(set([a["id_groupe"] for a in assignments]))
         
         if not group_ids:
             return []
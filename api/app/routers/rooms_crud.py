@@ -6,6 +6,7 @@ import logging
 
 from app.db.prisma_client import get_prisma
 from app.core.deps import get_current_user, require_role
+from app.services.schedule_series import count_schedules
 
 router = APIRouter(prefix="/rooms", tags=["Rooms"])
 logger = logging.getLogger(__name__)
@@ -183,9 +184,7 @@ async def delete_room(
             raise HTTPException(status_code=404, detail="Room not found")
         
         # Check if room is being used in schedules
-        schedules_count = await prisma.emploitemps.count(
-            where={"id_salle": room_id}
-        )
+        schedules_count = await count_schedules(prisma, {"id_salle": room_id})
         
         if schedules_count > 0:
             raise HTTPException(
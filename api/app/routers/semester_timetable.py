@@ -4,13 +4,21 @@ Chef de Département creates complete semester schedules
 """
 from fastapi import APIRouter, HTTPException, Depends, status
 from typing import List, Optional
-from prisma import Prisma
-from datetime import datetime, time, timedelta
+from prisma import Prisma, Json
+from datetime import datetime
 from pydantic import BaseModel
 
 from app.db.prisma_client import get_prisma
 from app.core.deps import require_department_head
 from app.routers.department_head_timetable import get_dept_head_department
+from app.services.timetable_cache import invalidate_schedule_cache
+from app.services.notification_fanout import ScheduleNotificationFanout
+from app.services.timetable_publisher import (
+    TimetablePublisher, StaleDraftError, DRAFT_STATUS
+)
+from app.services.schedule_series import (
+    find_occurrences, find_schedule, prepare_update, release_occurrence
+)
 
 router = APIRouter(prefix="/department-head/semester-timetable", tags=["Department Head - Semester Timetable"])
 
@@ -38,6 +46,99 @@ class SemesterInfo(BaseModel):
     end_date: str
     is_active: bool
 
+def department_semester_where(department_id: str, semester: str) -> dict:
+    return {
+        "semester": semester,
+        "groupe": {
+            "niveau": {
+                "specialite": {
+                    "id_departement": department_id
+                }
+            }
+        }
+    }
+
+
+async def semester_owners(prisma: Prisma, semester_where: dict):
+    """Groups and teachers with sessions or series in the semester"""
+    group_ids, teacher_ids = set(), set()
+    for model in (prisma.emploitemps, prisma.scheduleseries):
+        for owner in await model.group_by(by=["id_groupe", "id_enseignant"], where=semester_where):
+            group_ids.add(owner["id_groupe"])
+            teacher_ids.add(owner["id_enseignant"])
+    return group_ids, teacher_ids
+
+
+async def get_department_draft(prisma: Prisma, draft_id: str, department_id: str):
+    draft = await prisma.timetabledraft.find_unique(where={"id": draft_id})
+    if not draft or draft.id_departement != department_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Brouillon non trouvé"
+        )
+    return draft
+
+
+async def notify_timetable_change(prisma: Prisma, result: dict, semester: str):
+    """Send each teacher and student whose sessions a publish changed one digest"""
+    fanout = ScheduleNotificationFanout(prisma)
+    changes = await fanout.slot_changes(result["changes"])
+    if not changes:
+        return
+    effective = datetime.strptime(result["effective_date"], "%Y-%m-%d").strftime("%d/%m/%Y")
+    await fanout.notify(
+        changes,
+        title="Emploi du temps modifié",
+        intro=f"Votre emploi du temps du semestre {semester} change à partir du {effective} :",
+        related_id=result["draft_id"]
+    )
+
+
+async def write_semester_timetable(
+    prisma: Prisma,
+    department,
+    timetable_data: SemesterTimetableCreate,
+    draft=None,
+    published_by: Optional[str] = None
+) -> dict:
+    """
+    Publish the given recurring slots as the department's semester timetable
+    
+    Groups are validated in one query, then the slots are diffed against
+    the live series: only inserted, updated or cancelled series are
+    written, and only their groups, teachers and caches are touched.
+    Returns the publish summary (version and diff counts).
+    """
+    group_ids = {slot.group_id for slot in timetable_data.schedules}
+    department_groups = await prisma.groupe.find_many(
+        where={
+            "id": {"in": list(group_ids)},
+            "niveau": {"specialite": {"id_departement": department.id}}
+        }
+    )
+    foreign = group_ids - {g.id for g in department_groups}
+    if foreign:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Group {sorted(foreign)[0]} does not belong to your department"
+        )
+    
+    try:
+        result = await TimetablePublisher(prisma).publish(
+            department.id,
+            timetable_data.dict(),
+            draft=draft,
+            published_by=published_by
+        )
+    except StaleDraftError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    await notify_timetable_change(prisma, result, timetable_data.semester)
+    return result
+
+
 @router.post("/create-semester")
 async def create_semester_timetable(
     timetable_data: SemesterTimetableCreate,
@@ -48,90 +149,20 @@ async def create_semester_timetable(
     Create complete semester timetable
     
     This creates recurring schedules for the entire semester.
-    Chef de Département creates this once per semester.
+    Chef de Département creates this once per semester; sending it again
+    publishes a new version that only changes the differing slots.
     """
     try:
         department = await get_dept_head_department(current_user, prisma)
-        
-        # Parse dates
-        start_date = datetime.strptime(timetable_data.start_date, "%Y-%m-%d").date()
-        end_date = datetime.strptime(timetable_data.end_date, "%Y-%m-%d").date()
-        exclude_dates = [datetime.strptime(d, "%Y-%m-%d").date() for d in timetable_data.exclude_dates]
-        
-        # Delete existing schedules for this semester (if updating)
-        await prisma.emploitemps.delete_many(
-            where={
-                "semester": timetable_data.semester,
-                "groupe": {
-                    "niveau": {
-                        "specialite": {
-                            "id_departement": department.id
-                        }
-                    }
-                }
-            }
-        )
-        
-        created_schedules = []
-        
-        # Create schedules for each recurring slot
-        for slot in timetable_data.schedules:
-            # Validate that group belongs to department
-            group = await prisma.groupe.find_unique(
-                where={"id": slot.group_id},
-                include={
-                    "niveau": {
-                        "include": {
-                            "specialite": True
-                        }
-                    }
-                }
-            )
-            
-            if not group or group.niveau.specialite.id_departement != department.id:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail=f"Group {slot.group_id} does not belong to your department"
-                )
-            
-            # Generate all dates for this day of week in the semester
-            current_date = start_date
-            while current_date <= end_date:
-                # Check if this is the right day of week
-                if current_date.weekday() + 1 == slot.week_day:  # Python weekday: 0=Monday
-                    # Skip if in exclude dates
-                    if current_date not in exclude_dates:
-                        # Parse times
-                        start_time = datetime.strptime(slot.start_time, "%H:%M").time()
-                        end_time = datetime.strptime(slot.end_time, "%H:%M").time()
-                        
-                        # Create schedule entry
-                        schedule = await prisma.emploitemps.create(
-                            data={
-                                "date": datetime.combine(current_date, time(0, 0)),
-                                "heure_debut": datetime.combine(current_date, start_time),
-                                "heure_fin": datetime.combine(current_date, end_time),
-                                "id_salle": slot.room_id,
-                                "id_matiere": slot.subject_id,
-                                "id_groupe": slot.group_id,
-                                "id_enseignant": slot.teacher_id,
-                                "semester": timetable_data.semester,
-                                "week_day": slot.week_day,
-                                "is_recurring": True,
-                                "status": "PLANNED"
-                            }
-                        )
-                        created_schedules.append(schedule.id)
-                
-                current_date += timedelta(days=1)
+        result = await write_semester_timetable(prisma, department, timetable_data, published_by=current_user.id)
         
         return {
-            "message": f"Emploi du temps semestriel créé avec succès",
+            "message": f"Emploi du temps semestriel publié avec succès",
             "semester": timetable_data.semester,
-            "total_schedules": len(created_schedules),
+            "total_schedules": len(timetable_data.schedules),
             "start_date": timetable_data.start_date,
             "end_date": timetable_data.end_date,
-            "schedules_created": len(created_schedules)
+            **result
         }
         
     except HTTPException:
@@ -166,18 +197,9 @@ async def get_current_semester_info(
     # Check if timetable exists for this semester
     department = await get_dept_head_department(current_user, prisma)
     
-    schedule_count = await prisma.emploitemps.count(
-        where={
-            "semester": semester,
-            "groupe": {
-                "niveau": {
-                    "specialite": {
-                        "id_departement": department.id
-                    }
-                }
-            }
-        }
-    )
+    schedule_count = len(await find_occurrences(
+        prisma, semester=semester, department_id=department.id
+    ))
     
     return {
         "semester": semester,
@@ -197,22 +219,11 @@ async def get_semester_schedules(
     """Get all schedules for a semester"""
     department = await get_dept_head_department(current_user, prisma)
     
-    where_clause = {
-        "semester": semester,
-        "groupe": {
-            "niveau": {
-                "specialite": {
-                    "id_departement": department.id
-                }
-            }
-        }
-    }
-    
-    if group_id:
-        where_clause["id_groupe"] = group_id
-    
-    schedules = await prisma.emploitemps.find_many(
-        where=where_clause,
+    schedules = await find_occurrences(
+        prisma,
+        semester=semester,
+        department_id=department.id,
+        group_id=group_id,
         include={
             "salle": True,
             "matiere": True,
@@ -222,11 +233,7 @@ async def get_semester_schedules(
                     "utilisateur": True
                 }
             }
-        },
-        order_by=[
-            {"date": "asc"},
-            {"heure_debut": "asc"}
-        ]
+        }
     )
     
     return {
@@ -244,22 +251,20 @@ async def delete_semester_timetable(
     """Delete entire semester timetable"""
     department = await get_dept_head_department(current_user, prisma)
     
-    result = await prisma.emploitemps.delete_many(
-        where={
-            "semester": semester,
-            "groupe": {
-                "niveau": {
-                    "specialite": {
-                        "id_departement": department.id
-                    }
-                }
-            }
-        }
-    )
+    semester_where = department_semester_where(department.id, semester)
+    
+    group_ids, teacher_ids = await semester_owners(prisma, semester_where)
+    
+    async with prisma.tx() as tx:
+        deleted_rows = await tx.emploitemps.delete_many(where=semester_where)
+        deleted_series = await tx.scheduleseries.delete_many(where=semester_where)
+    
+    await invalidate_schedule_cache(prisma, group_ids=group_ids, teacher_ids=teacher_ids)
     
     return {
         "message": f"Emploi du temps du semestre {semester} supprimé",
-        "deleted_count": result
+        "deleted_count": deleted_rows,
+        "deleted_series": deleted_series
     }
 
 @router.put("/schedule/{schedule_id}")
@@ -273,8 +278,10 @@ async def update_single_schedule(
     department = await get_dept_head_department(current_user, prisma)
     
     # Verify schedule belongs to department
-    schedule = await prisma.emploitemps.find_unique(
-        where={"id": schedule_id},
+    schedule = await find_schedule(
+        prisma,
+        schedule_id,
+        materialize=True,
         include={
             "groupe": {
                 "include": {
@@ -300,13 +307,159 @@ async def update_single_schedule(
             detail="Cet emploi du temps n'appartient pas à votre département"
         )
     
-    # Update the schedule
+    # Update the schedule (a session of a series is stored on first edit)
+    update_data = prepare_update(schedule, update_data)
     updated_schedule = await prisma.emploitemps.update(
-        where={"id": schedule_id},
+        where={"id": schedule.id},
         data=update_data
     )
+    await release_occurrence(prisma, schedule, update_data)
+    
+    await invalidate_schedule_cache(prisma, sessions=[schedule, updated_schedule])
     
     return {
         "message": "Emploi du temps mis à jour avec succès",
         "schedule": updated_schedule
     }
+
+
+# ============================================================================
+# VERSIONED DRAFTS
+# ============================================================================
+
+def _version_summary(draft) -> dict:
+    payload = draft.payload
+    return {
+        "id": draft.id,
+        "version": draft.version,
+        "base_version": draft.base_version,
+        "status": draft.status,
+        "start_date": payload.get("start_date"),
+        "end_date": payload.get("end_date"),
+        "slots": len(payload.get("schedules", [])),
+        "published_diff": {
+            k: v for k, v in (payload.get("published_diff") or {}).items() if k != "changes"
+        } or None,
+        "createdAt": draft.createdAt,
+        "publishedAt": draft.publishedAt
+    }
+
+
+async def _editable_draft(prisma: Prisma, draft_id: str, department_id: str):
+    draft = await get_department_draft(prisma, draft_id, department_id)
+    if draft.status != DRAFT_STATUS:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Cette version est déjà publiée"
+        )
+    return draft
+
+
+def _require_dates(draft):
+    if not draft.payload.get("start_date") or not draft.payload.get("end_date"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Brouillon incomplet : dates du semestre manquantes"
+        )
+
+
+@router.get("/semester/{semester}/versions")
+async def list_semester_versions(
+    semester: str,
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(require_department_head)
+):
+    """Published versions and pending drafts of a semester, newest first"""
+    department = await get_dept_head_department(current_user, prisma)
+    publisher = TimetablePublisher(prisma)
+    
+    drafts = await prisma.timetabledraft.find_many(
+        where={"id_departement": department.id, "semester": semester},
+        order={"version": "desc"}
+    )
+    return {
+        "semester": semester,
+        "live_version": await publisher.live_version(department.id, semester),
+        "versions": [_version_summary(d) for d in drafts]
+    }
+
+
+@router.post("/semester/{semester}/drafts", status_code=status.HTTP_201_CREATED)
+async def create_semester_draft(
+    semester: str,
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(require_department_head)
+):
+    """Start a new draft from the live timetable"""
+    department = await get_dept_head_department(current_user, prisma)
+    publisher = TimetablePublisher(prisma)
+    
+    payload = await publisher.snapshot(department.id, semester)
+    draft = await publisher.create_draft(department.id, payload, created_by=current_user.id)
+    return {"id": draft.id, "version": draft.version, "base_version": draft.base_version, **payload}
+
+
+@router.put("/drafts/{draft_id}")
+async def update_semester_draft(
+    draft_id: str,
+    timetable_data: SemesterTimetableCreate,
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(require_department_head)
+):
+    """Replace the slots and dates of a draft (nothing live changes)"""
+    department = await get_dept_head_department(current_user, prisma)
+    draft = await _editable_draft(prisma, draft_id, department.id)
+    
+    if timetable_data.semester != draft.semester:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Le semestre d'un brouillon ne peut pas changer"
+        )
+    
+    draft = await prisma.timetabledraft.update(
+        where={"id": draft.id},
+        data={"payload": Json({**draft.payload, **timetable_data.dict()})}
+    )
+    return _version_summary(draft)
+
+
+@router.get("/drafts/{draft_id}/diff")
+async def preview_semester_draft(
+    draft_id: str,
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(require_department_head)
+):
+    """What publishing the draft would insert, update and cancel"""
+    department = await get_dept_head_department(current_user, prisma)
+    draft = await _editable_draft(prisma, draft_id, department.id)
+    _require_dates(draft)
+    
+    publisher = TimetablePublisher(prisma)
+    diff = await publisher.diff(department.id, draft.payload)
+    return {
+        "id": draft.id,
+        "version": draft.version,
+        "base_version": draft.base_version,
+        "live_version": await publisher.live_version(department.id, draft.semester),
+        **diff.summary()
+    }
+
+
+@router.post("/drafts/{draft_id}/publish")
+async def publish_semester_draft(
+    draft_id: str,
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(require_department_head)
+):
+    """Publish a draft: only the sessions that differ from the live timetable change"""
+    department = await get_dept_head_department(current_user, prisma)
+    draft = await _editable_draft(prisma, draft_id, department.id)
+    _require_dates(draft)
+    
+    timetable_data = SemesterTimetableCreate(**{
+        k: v for k, v in draft.payload.items() if k in SemesterTimetableCreate.__fields__
+    })
+    result = await write_semester_timetable(
+        prisma, department, timetable_data, draft=draft, published_by=current_user.id
+    )
+    return {"message": f"Version {result['version']} publiée", "semester": draft.semester, **result}
@@ -4,10 +4,16 @@ Handles grade calculations, averages, and grade reports (Relevé de Notes)
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from prisma import Prisma
 import prisma
+import re
 from app.db.prisma_client import get_prisma
 from app.core.deps import require_department_head, get_current_user
+from app.services.averages_summary import AveragesSummaryService
+from app.services.grade_reports import GradeReportBatch, stream_archive
+from app.services.grade_book import invalidate_grade_books
+from app.services.cohort_ranking import calculate_ranks, refresh_stale_ranks
 from typing import List, Optional, Dict
 from pydantic import BaseModel, Field
 from datetime import datetime
@@ -138,18 +144,6 @@ def calculate_general_average(subject_averages: List[Dict]) -> float:
     return round(total_weighted / total_coefficients, 2)
 
 
-def get_status_from_average(average: float) -> str:
-    """Determine student status based on average"""
-    if average >= 16:
-        return "excellent"
-    elif average >= 14:
-        return "good"
-    elif average >= 10:
-        return "average"
-    else:
-        return "needs_improvement"
-
-
 # ============================================================================
 # DASHBOARD & STATISTICS
 # ============================================================================
@@ -173,122 +167,19 @@ async def get_averages_dashboard(
         current_year = datetime.now().year
         annee_scolaire = f"{current_year}-{current_year + 1}"
     
-    # Build filter for students in department
-    where_student = {
-        "specialite": {
-            "id_departement": department.id
-        }
-    }
-    
-    if groupe_id:
-        where_student["id_groupe"] = groupe_id
-    
-    if specialite_id:
-        where_student["id_specialite"] = specialite_id
-    
-    # Get all students in department
-    students = await prisma.etudiant.find_many(
-        where=where_student,
-        include={
-            "utilisateur": True,
-            "groupe": True,
-            "specialite": True,
-            "niveau": True
-        }
-    )
-    
-    # Get averages for each student
-    students_summary = []
-    total_students = len(students)
-    excellent_count = 0
-    good_count = 0
-    average_count = 0
-    needs_improvement_count = 0
-    
-    for student in students:
-        # Get general average for this student
-        where_moyenne = {
-            "id_etudiant": student.id,
-            "id_matiere": None,  # General average
-            "annee_scolaire": annee_scolaire
-        }
-        
-        if semestre:
-            where_moyenne["semestre"] = semestre
-        
-        # Get general average (should be unique per student/semester/year)
-        moyenne_record = await prisma.moyenne.find_first(
-            where=where_moyenne
-        )
-        
-        # Count validated subject averages
-        subject_averages = await prisma.moyenne.count(
-            where={
-                "id_etudiant": student.id,
-                "id_matiere": {"not": None},
-                "annee_scolaire": annee_scolaire,
-                **({"semestre": semestre} if semestre else {})
-            }
-        )
-        
-        validated_averages = await prisma.moyenne.count(
-            where={
-                "id_etudiant": student.id,
-                "id_matiere": {"not": None},
-                "annee_scolaire": annee_scolaire,
-                "validee": True,
-                **({"semestre": semestre} if semestre else {})
-            }
-        )
-        
-        moyenne_generale = moyenne_record.moyenne_generale if moyenne_record else None
-        status = get_status_from_average(moyenne_generale) if moyenne_generale else "no_grades"
-        
-        # Count status
-        if moyenne_generale:
-            if status == "excellent":
-                excellent_count += 1
-            elif status == "good":
-                good_count += 1
-            elif status == "average":
-                average_count += 1
-            else:
-                needs_improvement_count += 1
-        
-        students_summary.append({
-            "student_id": student.id,
-            "student_name": f"{student.utilisateur.prenom} {student.utilisateur.nom}",
-            "student_email": student.utilisateur.email,
-            "groupe": student.groupe.nom if student.groupe else "N/A",
-            "niveau": student.niveau.nom if student.niveau else "N/A",
-            "specialite": student.specialite.nom,
-            "moyenne_generale": moyenne_generale,
-            "rang": moyenne_record.rang if moyenne_record else None,
-            "total_matieres": subject_averages,
-            "matieres_validees": validated_averages,
-            "status": status
-        })
+    for ranked_semester in ([semestre] if semestre else list(SemesterType)):
+        await refresh_stale_ranks(prisma, ranked_semester, annee_scolaire, department.id)
     
-    # Sort by moyenne_generale descending
-    students_summary.sort(
-        key=lambda x: (x['moyenne_generale'] is not None, x['moyenne_generale'] or 0),
-        reverse=True
+    # Students, their averages and counts in one query; statistics with NumPy
+    summary = await AveragesSummaryService(prisma).get_summary(
+        department.id,
+        annee_scolaire,
+        semestre=semestre.value if semestre else None,
+        groupe_id=groupe_id,
+        specialite_id=specialite_id
     )
-    
-    # Calculate statistics
-    averages_list = [s['moyenne_generale'] for s in students_summary if s['moyenne_generale'] is not None]
-    
-    statistics = {
-        "total_students": total_students,
-        "students_with_grades": len(averages_list),
-        "average_generale": round(sum(averages_list) / len(averages_list), 2) if averages_list else 0,
-        "highest_average": max(averages_list) if averages_list else 0,
-        "lowest_average": min(averages_list) if averages_list else 0,
-        "excellent_count": excellent_count,
-        "good_count": good_count,
-        "average_count": average_count,
-        "needs_improvement_count": needs_improvement_count
-    }
+    statistics = summary["statistics"]
+    students_summary = summary["students"]
     
     return {
         "statistics": statistics,
@@ -370,6 +261,10 @@ async def calculate_averages(
                     for g in grades
                 ]
                 subject_avg = calculate_subject_average(grades_data)
+                subject_sums = {
+                    "somme_ponderee": sum(g['valeur'] * g['coefficient'] for g in grades_data),
+                    "somme_coefficients": sum(g['coefficient'] for g in grades_data)
+                }
                 
                 # Store or update subject average
                 await prisma.moyenne.upsert(
@@ -387,10 +282,12 @@ async def calculate_averages(
                             "id_matiere": subject['id'],
                             "semestre": semestre,
                             "annee_scolaire": annee_scolaire,
-                            "moyenne_matiere": subject_avg
+                            "moyenne_matiere": subject_avg,
+                            **subject_sums
                         },
                         "update": {
                             "moyenne_matiere": subject_avg,
+                            **subject_sums,
                             "updatedAt": datetime.now()
                         }
                     }
@@ -404,6 +301,10 @@ async def calculate_averages(
             # Calculate general average
             if subject_averages:
                 general_avg = calculate_general_average(subject_averages)
+                general_sums = {
+                    "somme_ponderee": sum(a['moyenne'] * a['coefficient'] for a in subject_averages),
+                    "somme_coefficients": sum(a['coefficient'] for a in subject_averages)
+                }
                 
                 # Store or update general average
                 await prisma.moyenne.upsert(
@@ -421,10 +322,12 @@ async def calculate_averages(
                             "id_matiere": None,
                             "semestre": semestre,
                             "annee_scolaire": annee_scolaire,
-                            "moyenne_generale": general_avg
+                            "moyenne_generale": general_avg,
+                            **general_sums
                         },
                         "update": {
                             "moyenne_generale": general_avg,
+                            **general_sums,
                             "updatedAt": datetime.now()
                         }
                     }
@@ -441,6 +344,8 @@ async def calculate_averages(
     
     # Calculate ranks
     await calculate_ranks(prisma, semestre, annee_scolaire, department.id)
+    # Averages may change without any rank changing: drop every recalculated page
+    await invalidate_grade_books(prisma, [s.id for s in students], semestre, annee_scolaire)
     
     return {
         "success": True,
@@ -450,34 +355,6 @@ async def calculate_averages(
     }
 
 
-async def calculate_ranks(prisma: Prisma, semestre: SemesterType, annee_scolaire: str, department_id: str):
-    """Calculate ranks for all students"""
-    # Get all general averages and sort by moyenne_generale
-    averages = await prisma.moyenne.find_many(
-        where={
-            "id_matiere": None,
-            "semestre": semestre,
-            "annee_scolaire": annee_scolaire,
-            "etudiant": {
-                "specialite": {
-                    "id_departement": department_id
-                }
-            }
-        },
-        include={"etudiant": True}
-    )
-    
-    # Sort in Python since Prisma doesn't support order_by
-    averages.sort(key=lambda x: x.moyenne_generale if x.moyenne_generale else 0, reverse=True)
-    
-    # Assign ranks
-    for rank, avg in enumerate(averages, start=1):
-        await prisma.moyenne.update(
-            where={"id": avg.id},
-            data={"rang": rank}
-        )
-
-
 # ============================================================================
 # STUDENT DETAILS
 # ============================================================================
@@ -517,6 +394,8 @@ async def get_student_averages_detail(
             detail="Student not found or not in your department"
         )
     
+    await refresh_stale_ranks(prisma, semestre, annee_scolaire, department.id)
+    
     # Get subject averages
     subject_averages = await prisma.moyenne.find_many(
         where={
@@ -585,6 +464,9 @@ async def get_student_averages_detail(
         },
         "moyenne_generale": general_average.moyenne_generale if general_average else None,
         "rang": general_average.rang if general_average else None,
+        "rang_specialite": general_average.rang_specialite if general_average else None,
+        "rang_niveau": general_average.rang_niveau if general_average else None,
+        "rang_groupe": general_average.rang_groupe if general_average else None,
         "validee": general_average.validee if general_average else False,
         "observation": general_average.observation if general_average else None,
         "subjects": subjects_detail,
@@ -611,7 +493,7 @@ async def validate_averages(
     """
     department = await get_dept_head_department(current_user, prisma)
     
-    validated_count = 0
+    validated_ids = []
     
     for student_id in student_ids:
         # Verify student belongs to department
@@ -642,11 +524,13 @@ async def validate_averages(
             }
         )
         
-        validated_count += 1
+        validated_ids.append(student_id)
+    
+    await invalidate_grade_books(prisma, validated_ids, semestre, annee_scolaire)
     
     return {
         "success": True,
-        "validated_count": validated_count
+        "validated_count": len(validated_ids)
     }
 
 
@@ -663,153 +547,84 @@ async def generate_grade_reports(
 ):
     """
     Generate Relevé de Notes (grade reports) for students
+    
+    Reports are upserted for the whole batch at once; the documents are
+    rendered in the background (process pool) and the students notified
+    when they are ready.
     """
     department = await get_dept_head_department(current_user, prisma)
     
-    generated_reports = []
-    errors = []
+    await refresh_stale_ranks(prisma, request.semestre, request.annee_scolaire, department.id)
     
-    for student_id in request.student_ids:
-        try:
-            # Verify student belongs to department
-            student = await prisma.etudiant.find_first(
-                where={
-                    "id": student_id,
-                    "specialite": {
-                        "id_departement": department.id
-                    }
-                },
-                include={"utilisateur": True}
-            )
-            
-            if not student:
-                errors.append({
-                    "student_id": student_id,
-                    "error": "Student not found or not in your department"
-                })
-                continue
-            
-            # Get general average
-            moyenne = await prisma.moyenne.find_first(
-                where={
-                    "id_etudiant": student_id,
-                    "id_matiere": None,
-                    "semestre": request.semestre,
-                    "annee_scolaire": request.annee_scolaire
-                }
-            )
-            
-            if not moyenne or not moyenne.moyenne_generale:
-                errors.append({
-                    "student_id": student_id,
-                    "student_name": f"{student.utilisateur.prenom} {student.utilisateur.nom}",
-                    "error": "No average calculated"
-                })
-                continue
-            
-            # Count total students for rank context
-            total_students = await prisma.etudiant.count(
-                where={
-                    "specialite": {
-                        "id_departement": department.id
-                    }
-                }
-            )
-            
-            # Create or update grade report
-            report = await prisma.relevenotes.upsert(
-                where={
-                    "id_etudiant_semestre_annee_scolaire": {
-                        "id_etudiant": student_id,
-                        "semestre": request.semestre,
-                        "annee_scolaire": request.annee_scolaire
-                    }
-                },
-                data={
-                    "create": {
-                        "id_etudiant": student_id,
-                        "semestre": request.semestre,
-                        "annee_scolaire": request.annee_scolaire,
-                        "moyenne_generale": moyenne.moyenne_generale,
-                        "rang": moyenne.rang,
-                        "total_etudiants": total_students,
-                        "appreciation": get_appreciation(moyenne.moyenne_generale),
-                        "genere_par": current_user.id,
-                        "envoye": False
-                    },
-                    "update": {
-                        "moyenne_generale": moyenne.moyenne_generale,
-                        "rang": moyenne.rang,
-                        "total_etudiants": total_students,
-                        "appreciation": get_appreciation(moyenne.moyenne_generale),
-                        "genere_par": current_user.id,
-                        "date_generation": datetime.now()
-                    }
-                }
-            )
-            
-            generated_reports.append({
-                "report_id": report.id,
-                "student_id": student_id,
-                "student_name": f"{student.utilisateur.prenom} {student.utilisateur.nom}",
-                "moyenne": moyenne.moyenne_generale,
-                "rang": moyenne.rang
-            })
-            
-            # Send notification if requested
-            if request.send_notification:
-                background_tasks.add_task(
-                    send_report_notification,
-                    prisma,
-                    student.utilisateur.id,
-                    report.id,
-                    request.semestre,
-                    request.annee_scolaire
-                )
-        
-        except Exception as e:
-            errors.append({
-                "student_id": student_id,
-                "error": str(e)
-            })
+    batch = GradeReportBatch(prisma)
+    reports, errors = await batch.prepare(
+        department,
+        request.student_ids,
+        request.semestre.value,
+        request.annee_scolaire,
+        current_user.id
+    )
+    
+    background_tasks.add_task(batch.render, reports, request.send_notification)
     
     return {
         "success": True,
-        "generated_count": len(generated_reports),
-        "reports": generated_reports,
+        "generated_count": len(reports),
+        "reports": [
+            {
+                "report_id": report.report_id,
+                "student_id": report.student_id,
+                "student_name": f"{report.prenom} {report.nom}",
+                "moyenne": report.moyenne_generale,
+                "rang": report.rang
+            }
+            for report in reports
+        ],
         "errors": errors
     }
 
 
-def get_appreciation(moyenne: float) -> str:
-    """Get appreciation text based on average"""
-    if moyenne >= 16:
-        return "Très bien"
-    elif moyenne >= 14:
-        return "Bien"
-    elif moyenne >= 12:
-        return "Assez bien"
-    elif moyenne >= 10:
-        return "Passable"
-    else:
-        return "Insuffisant"
-
-
-async def send_report_notification(
-    prisma: Prisma,
-    user_id: str,
-    report_id: str,
+@router.get("/group/{group_id}/transcripts")
+async def download_group_transcripts(
+    group_id: str,
     semestre: SemesterType,
-    annee_scolaire: str
+    annee_scolaire: str,
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(require_department_head)
 ):
-    """Send notification to student about grade report"""
-    from app.routers.notifications import create_notification
-    
-    await create_notification(
-        prisma=prisma,
-        user_id=user_id,
-        notification_type="GRADE_REPORT_AVAILABLE",
-        title="Relevé de Notes Disponible",
-        message=f"Votre relevé de notes pour le {semestre} ({annee_scolaire}) est maintenant disponible.",
-        related_id=report_id
+    """
+    Download the PDF transcripts of a group as a ZIP archive
+    
+    Students without a general average for the period, or whose transcript
+    cannot be printed, are left out and listed in the archive. The archive
+    is rendered and streamed as it is written.
+    """
+    department = await get_dept_head_department(current_user, prisma)
+    
+    group = await prisma.groupe.find_first(
+        where={
+            "id": group_id,
+            "niveau": {"is": {"specialite": {"is": {"id_departement": department.id}}}}
+        }
+    )
+    if not group:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Group not found or not in your department"
+        )
+    
+    await refresh_stale_ranks(prisma, semestre, annee_scolaire, department.id)
+    
+    reports, errors = await GradeReportBatch(prisma).collect_group(department, group_id, semestre.value, annee_scolaire)
+    if not reports:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No averages calculated for this group and period"
+        )
+    
+    filename = re.sub(r"[^\w.-]+", "_", f"releves_{group.nom}_{semestre.value}_{annee_scolaire}")
+    return StreamingResponse(
+        stream_archive(reports, errors),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}.zip"'}
     )
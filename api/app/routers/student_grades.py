@@ -4,9 +4,13 @@ Allows students to view their own grades and averages
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import FileResponse
 from prisma import Prisma
 from app.db.prisma_client import get_prisma
 from app.core.deps import get_current_user
+from app.services.cohort_ranking import refresh_stale_ranks
+from app.services.grade_book import StudentGradeBook
+from app.services.grade_reports import document_filename, report_document
 from typing import Optional
 from enum import Enum
 
@@ -36,105 +40,70 @@ async def get_student_grades(
             detail="Student access required"
         )
     
-    # Get student record by email (since there's no direct userId field)
-    student = await prisma.etudiant.find_first(
-        where={"email": current_user.email},
-        include={
-            "groupe": True,
-            "niveau": True,
-            "specialite": True
-        }
+    # Student record by email (since there's no direct userId field)
+    grade_book = await StudentGradeBook(prisma).get(
+        current_user.email,
+        semestre.value,
+        annee_scolaire,
+        refresh_ranks=lambda department_id: refresh_stale_ranks(prisma, semestre, annee_scolaire, department_id)
     )
     
-    if not student:
+    if not grade_book:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Student record not found"
         )
     
-    # Get all subjects for this student's specialty
-    subjects = await prisma.matiere.find_many(
-        where={"id_specialite": student.id_specialite}
-    )
+    return grade_book
+
+
+@router.get("/grade-reports/{report_id}/pdf")
+async def download_grade_report(
+    report_id: str,
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(get_current_user)
+):
+    """
+    Download a Relevé de Notes as PDF
     
-    # Get subject averages
-    subject_averages = await prisma.moyenne.find_many(
-        where={
-            "id_etudiant": student.id,
-            "id_matiere": {"not": None},
-            "semestre": semestre,
-            "annee_scolaire": annee_scolaire
-        },
-        include={"matiere": True}
+    Only the student it belongs to and the head of their department may
+    download it.
+    """
+    report = await prisma.relevenotes.find_unique(
+        where={"id": report_id},
+        include={"etudiant": {"include": {"specialite": True}}}
     )
     
-    # Get general average
-    general_average = await prisma.moyenne.find_first(
-        where={
-            "id_etudiant": student.id,
-            "id_matiere": None,
-            "semestre": semestre,
-            "annee_scolaire": annee_scolaire
-        }
-    )
+    if not report:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Grade report not found"
+        )
+    
+    student = report.etudiant
+    if current_user.role == "STUDENT":
+        allowed = student.email == current_user.email
+    elif current_user.role == "DEPARTMENT_HEAD":
+        dept_head = await prisma.chefdepartement.find_unique(where={"id_utilisateur": current_user.id})
+        allowed = dept_head is not None and dept_head.id_departement == student.specialite.id_departement
+    else:
+        allowed = False
+    
+    if not allowed:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not allowed to access this grade report"
+        )
     
-    # Build subjects with grades
-    subjects_detail = []
-    for subject in subjects:
-        # Find average for this subject
-        avg = next((a for a in subject_averages if a.id_matiere == subject.id), None)
-        
-        # Get all grades for this subject
-        grades = await prisma.note.find_many(
-            where={
-                "id_etudiant": student.id,
-                "id_matiere": subject.id,
-                "semestre": semestre,
-                "annee_scolaire": annee_scolaire
-            },
-            include={
-                "enseignant": {
-                    "include": {"utilisateur": True}
-                }
-            }
+    path = report_document(student.id, report.semestre, report.annee_scolaire)
+    if not path.exists():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Grade report document not generated yet"
         )
-        
-        # Only include subjects that have grades
-        if grades:
-            subjects_detail.append({
-                "matiere_id": subject.id,
-                "matiere_nom": subject.nom,
-                "coefficient": subject.coefficient,
-                "moyenne": avg.moyenne_matiere if avg else None,
-                "validee": avg.validee if avg else False,
-                "grades": [
-                    {
-                        "id": g.id,
-                        "valeur": g.valeur,
-                        "type": g.type,
-                        "coefficient": g.coefficient,
-                        "date_examen": g.date_examen.isoformat() if g.date_examen else None,
-                        "enseignant": f"{g.enseignant.utilisateur.prenom} {g.enseignant.utilisateur.nom}",
-                        "observation": g.observation
-                    }
-                    for g in grades
-                ]
-            })
     
-    return {
-        "student": {
-            "id": student.id,
-            "nom": student.nom,
-            "prenom": student.prenom,
-            "email": student.email,
-            "groupe": student.groupe.nom if student.groupe else "N/A",
-            "niveau": student.niveau.nom if student.niveau else "N/A",
-            "specialite": student.specialite.nom
-        },
-        "moyenne_generale": general_average.moyenne_generale if general_average else None,
-        "rang": general_average.rang if general_average else None,
-        "validee": general_average.validee if general_average else False,
-        "subjects": subjects_detail,
-        "semestre": semestre,
-        "annee_scolaire": annee_scolaire
-    }
+    return FileResponse(
+        path=path,
+        filename=document_filename(student.nom, student.prenom, path),
+        media_type="application/pdf"
+    )
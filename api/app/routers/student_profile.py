@@ -4,10 +4,20 @@ from datetime import datetime, date, timedelta
 from prisma import Prisma
 from app.db.prisma_client import get_prisma
 from app.core.deps import get_current_user, require_student
+from app.core.http_cache import conditional_get, TIMETABLE_TABLES, T_STUDENT, T_ABSENCE
+from app.services.schedule_series import find_occurrences
+from app.services.timetable_cache import (
+    WeeklyTimetableCache,
+    SCOPE_GROUP,
+    DAY_KEYS,
+    UNIVERSITY_TIME_SLOTS,
+    iter_sessions,
+    invalidate_schedule_cache,
+)
 
 router = APIRouter(prefix="/student", tags=["Student"])
 
-@router.get("/schedule")
+@router.get("/schedule", dependencies=[Depends(conditional_get(*TIMETABLE_TABLES, T_STUDENT, T_ABSENCE, private=True, daily=True))])
 async def get_student_schedule(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -68,34 +78,13 @@ async def get_student_schedule(
     start_datetime = datetime.combine(start_dt, datetime.min.time())
     end_datetime = datetime.combine(end_dt, datetime.max.time())
     
-    # Get schedule for student's group
-    schedules = await prisma.emploitemps.find_many(
-        where={
-            "id_groupe": student.id_groupe,
-            "date": {
-                "gte": start_datetime,
-                "lte": end_datetime
-            }
-        },
-        include={
-            "matiere": True,
-            "enseignant": True,
-            "salle": True,
-            "groupe": {
-                "include": {
-                    "niveau": {
-                        "include": {
-                            "specialite": True
-                        }
-                    }
-                }
-            }
-        },
-        order=[{"date": "asc"}, {"heure_debut": "asc"}]
+    # Get schedule for student's group from the materialized weekly views
+    schedules = await WeeklyTimetableCache(prisma).get_range(
+        SCOPE_GROUP, student.id_groupe, start_datetime, end_datetime
     )
 
     # Check if student has absences for each schedule
-    schedule_ids = [schedule.id for schedule in schedules]
+    schedule_ids = [schedule["id"] for schedule in schedules]
     
     # Only query absences if there are schedules
     absences = []
@@ -116,30 +105,6 @@ async def get_student_schedule(
     
     target_sunday = target_monday + timedelta(days=6)
     
-    # Calculate week offset (0 = current week)
-    today = date.today()
-    today_monday = today - timedelta(days=today.weekday())
-    week_offset = (target_monday - today_monday).days // 7
-    
-    # Define standard university time slots (like your example)
-    time_slots = [
-        {"id": "slot1", "start": "08:30", "end": "10:00", "label": "8h30 à 10h00"},
-        {"id": "slot2", "start": "10:10", "end": "11:40", "label": "10h10 à 11h40"},
-        {"id": "slot3", "start": "11:50", "end": "13:20", "label": "11h50 à 13h20"},
-        {"id": "slot4", "start": "14:30", "end": "16:00", "label": "14h30 à 16h00"},
-        {"id": "slot5", "start": "16:10", "end": "17:40", "label": "16h10 à 17h40"}
-    ]
-    
-    # Days of the week
-    days = [
-        {"id": "monday", "name": "Lundi", "date": target_monday},
-        {"id": "tuesday", "name": "Mardi", "date": target_monday + timedelta(days=1)},
-        {"id": "wednesday", "name": "Mercredi", "date": target_monday + timedelta(days=2)},
-        {"id": "thursday", "name": "Jeudi", "date": target_monday + timedelta(days=3)},
-        {"id": "friday", "name": "Vendredi", "date": target_monday + timedelta(days=4)},
-        {"id": "saturday", "name": "Samedi", "date": target_monday + timedelta(days=5)}
-    ]
-    
     # Create timetable structure organized by day (for frontend compatibility)
     timetable_by_day = {
         "lundi": [],
@@ -152,41 +117,28 @@ async def get_student_schedule(
     
     # Fill timetable with schedule data
     for schedule in schedules:
-        if not schedule.heure_debut or not schedule.date:
+        if schedule["day"] > 5:  # Skip Sunday
             continue
             
-        # Get day of week (0=Monday, 1=Tuesday, etc.)
-        schedule_date = schedule.date.date() if hasattr(schedule.date, 'date') else schedule.date
-        day_of_week = schedule_date.weekday()
-        
-        if day_of_week > 5:  # Skip Sunday
-            continue
-            
-        day_name_fr = ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi"][day_of_week]
-        
-        # Get time
-        schedule_start_time = schedule.heure_debut.time() if hasattr(schedule.heure_debut, 'time') else schedule.heure_debut
-        schedule_end_time = schedule.heure_fin.time() if hasattr(schedule.heure_fin, 'time') else schedule.heure_fin
-        start_time_str = schedule_start_time.strftime("%H:%M")
-        end_time_str = schedule_end_time.strftime("%H:%M")
+        day_name_fr = DAY_KEYS[schedule["day"]]
         
         # Get absence status
-        absence = absence_map.get(schedule.id)
+        absence = absence_map.get(schedule["id"])
         
         # Create course info
         course_info = {
-            "id": schedule.id,
-            "subject": schedule.matiere.nom if schedule.matiere else "Matière inconnue",
-            "teacher": f"{schedule.enseignant.prenom} {schedule.enseignant.nom}" if schedule.enseignant else "Enseignant inconnu",
-            "room": schedule.salle.code if schedule.salle else "Salle inconnue",
-            "start_time": start_time_str,
-            "end_time": end_time_str,
+            "id": schedule["id"],
+            "subject": schedule["matiere"]["nom"] if schedule["matiere"] else "Matière inconnue",
+            "teacher": f"{schedule['enseignant']['prenom']} {schedule['enseignant']['nom']}" if schedule["enseignant"] else "Enseignant inconnu",
+            "room": schedule["salle"]["code"] if schedule["salle"] else "Salle inconnue",
+            "start_time": schedule["start_time"],
+            "end_time": schedule["end_time"],
             "absence": {
                 "is_absent": bool(absence),
                 "status": absence.statut if absence else None,
                 "reason": absence.motif if absence else None
             } if absence else None,
-            "status": getattr(schedule, 'status', 'PLANNED')
+            "status": schedule["status"] or "PLANNED"
         }
         
         timetable_by_day[day_name_fr].append(course_info)
@@ -250,26 +202,18 @@ async def get_student_today_schedule(
                 detail="Student profile not found"
             )
     
-    # Get today's date range
-    today = date.today()
-    start_of_day = datetime.combine(today, datetime.min.time())
-    end_of_day = datetime.combine(today, datetime.max.time())
-    
     # Get today's schedule
-    schedules = await prisma.emploitemps.find_many(
-        where={
-            "id_groupe": student.id_groupe,
-            "date": {
-                "gte": start_of_day,
-                "lte": end_of_day
-            }
-        },
+    today = date.today()
+    schedules = await find_occurrences(
+        prisma,
+        start=today,
+        end=today,
+        group_id=student.id_groupe,
         include={
             "matiere": True,
             "enseignant": True,
             "salle": True
-        },
-        order={"heure_debut": "asc"}
+        }
     )
     
     # Check absences for today's classes
@@ -664,6 +608,7 @@ async def create_sample_schedule_for_group(
         ]
         
         created_schedules = []
+        touched_schedules = []
         
         for schedule_info in schedule_template:
             try:
@@ -692,6 +637,7 @@ async def create_sample_schedule_for_group(
                     }
                 )
                 
+                touched_schedules.append(new_schedule)
                 created_schedules.append({
                     "id": new_schedule.id,
                     "date": schedule_date.strftime("%Y-%m-%d"),
@@ -704,6 +650,8 @@ async def create_sample_schedule_for_group(
             except Exception as e:
                 print(f"Failed to create schedule entry: {e}")
         
+        await invalidate_schedule_cache(prisma, sessions=touched_schedules)
+        
         return {
             "success": True,
             "message": f"Created {len(created_schedules)} schedule entries for group: {group_name}",
@@ -716,7 +664,7 @@ async def create_sample_schedule_for_group(
         return {"error": f"Failed to create sample schedules: {str(e)}"}
 
 
-@router.get("/timetable")
+@router.get("/timetable", dependencies=[Depends(conditional_get(*TIMETABLE_TABLES, T_STUDENT, private=True, daily=True))])
 async def get_student_timetable(
     week_offset: Optional[int] = 0,
     prisma: Prisma = Depends(get_prisma),
@@ -748,34 +696,13 @@ async def get_student_timetable(
         target_monday = monday_of_current_week + timedelta(weeks=week_offset)
         target_sunday = target_monday + timedelta(days=6)
         
-        # Get schedules for the week
-        start_datetime = datetime.combine(target_monday, datetime.min.time())
-        end_datetime = datetime.combine(target_sunday, datetime.max.time())
-        
-        schedules = await prisma.emploitemps.find_many(
-            where={
-                "id_groupe": student.id_groupe,
-                "date": {
-                    "gte": start_datetime,
-                    "lte": end_datetime
-                }
-            },
-            include={
-                "matiere": True,
-                "enseignant": True,
-                "salle": True
-            },
-            order=[{"date": "asc"}, {"heure_debut": "asc"}]
+        # One cache lookup: the week's slot grid is precomputed
+        week = await WeeklyTimetableCache(prisma).get_week(
+            SCOPE_GROUP, student.id_groupe, target_monday
         )
+        sessions_by_id = {session["id"]: session for session in iter_sessions(week)}
         
-        # Define standard time slots (based on your university example)
-        time_slots = [
-            {"id": "slot1", "start": "08:30", "end": "10:00", "label": "8h30 à 10h00"},
-            {"id": "slot2", "start": "10:10", "end": "11:40", "label": "10h10 à 11h40"},
-            {"id": "slot3", "start": "11:50", "end": "13:20", "label": "11h50 à 13h20"},
-            {"id": "slot4", "start": "14:30", "end": "16:00", "label": "14h30 à 16h00"},
-            {"id": "slot5", "start": "16:10", "end": "17:40", "label": "16h10 à 17h40"}
-        ]
+        time_slots = UNIVERSITY_TIME_SLOTS
         
         # Days of the week
         days = [
@@ -787,7 +714,7 @@ async def get_student_timetable(
             {"id": "samedi", "name": "Samedi", "date": target_monday + timedelta(days=5)}
         ]
         
-        # Initialize timetable structure
+        # Fill timetable from the cached slot grid
         timetable = {}
         for slot in time_slots:
             timetable[slot["id"]] = {
@@ -795,52 +722,17 @@ async def get_student_timetable(
                 "courses": {}
             }
             for day in days:
-                timetable[slot["id"]]["courses"][day["id"]] = None
-        
-        # Fill timetable with actual schedule data
-        for schedule in schedules:
-            if not schedule.heure_debut or not schedule.date:
-                continue
-                
-            # Get day of week
-            schedule_date = schedule.date.date() if hasattr(schedule.date, 'date') else schedule.date
-            day_of_week = schedule_date.weekday()  # 0=Monday, 1=Tuesday, etc.
-            
-            if day_of_week > 5:  # Skip Sunday
-                continue
-                
-            day_keys = ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi"]
-            day_key = day_keys[day_of_week]
-            
-            # Get schedule time
-            start_time = schedule.heure_debut.time() if hasattr(schedule.heure_debut, 'time') else schedule.heure_debut
-            end_time = schedule.heure_fin.time() if hasattr(schedule.heure_fin, 'time') else schedule.heure_fin
-            
-            # Find matching time slot
-            matching_slot = None
-            for slot in time_slots:
-                slot_start = datetime.strptime(slot["start"], "%H:%M").time()
-                slot_end = datetime.strptime(slot["end"], "%H:%M").time()
-                
-                # Check if schedule overlaps with this time slot
-                if (slot_start <= start_time < slot_end) or (slot_start < end_time <= slot_end):
-                    matching_slot = slot["id"]
-                    break
-            
-            if matching_slot:
-                # Create course entry (like your university example)
-                course_entry = {
-                    "subject": schedule.matiere.nom if schedule.matiere else "Matière inconnue",
-                    "teacher": f"{schedule.enseignant.prenom} {schedule.enseignant.nom}" if schedule.enseignant else "Enseignant inconnu",
-                    "room": schedule.salle.code if schedule.salle else "TI 11",  # Default room format
+                session = sessions_by_id.get(week["slots"][slot["id"]][day["id"]])
+                timetable[slot["id"]]["courses"][day["id"]] = {
+                    "subject": session["matiere"]["nom"] if session["matiere"] else "Matière inconnue",
+                    "teacher": f"{session['enseignant']['prenom']} {session['enseignant']['nom']}" if session["enseignant"] else "Enseignant inconnu",
+                    "room": session["salle"]["code"] if session["salle"] else "TI 11",  # Default room format
                     "time": {
-                        "start": start_time.strftime("%H:%M"),
-                        "end": end_time.strftime("%H:%M") if end_time else None
+                        "start": session["start_time"],
+                        "end": session["end_time"]
                     },
-                    "schedule_id": schedule.id
-                }
-                
-                timetable[matching_slot]["courses"][day_key] = course_entry
+                    "schedule_id": session["id"]
+                } if session else None
         
         return {
             "success": True,
@@ -947,6 +839,7 @@ async def create_university_schedule_template(
         next_monday = today + timedelta(days=(7 - today.weekday()))
         
         created_schedules = []
+        touched_schedules = []
         
         for template_entry in timetable_template:
             try:
@@ -1015,6 +908,7 @@ async def create_university_schedule_template(
                 )
                 
                 if existing_schedule:
+                    touched_schedules.append(existing_schedule)
                     # Update existing schedule instead of creating new one
                     schedule = await prisma.emploitemps.update(
                         where={"id": existing_schedule.id},
@@ -1040,6 +934,7 @@ async def create_university_schedule_template(
                         }
                     )
                 
+                touched_schedules.append(schedule)
                 created_schedules.append({
                     "day": ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi"][template_entry["day"]],
                     "time": time_slot,
@@ -1051,6 +946,8 @@ async def create_university_schedule_template(
             except Exception as e:
                 print(f"Failed to create schedule entry: {e}")
         
+        await invalidate_schedule_cache(prisma, sessions=touched_schedules)
+        
         return {
             "success": True,
             "message": f"Created university timetable with {len(created_schedules)} courses",
@@ -3,6 +3,7 @@ from typing import List, Optional
 from prisma import Prisma
 from app.db.prisma_client import get_prisma
 from app.core.deps import require_admin, require_department_head
+from app.services.schedule_series import count_schedules, find_occurrence_page
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/department-head/subjects", tags=["Department Head - Subjects"])
@@ -420,7 +421,7 @@ async def delete_subject(
         )
     
     # Check if subject has associated schedules
-    schedule_count = await prisma.emploitemps.count(where={"id_matiere": subject_id})
+    schedule_count = await count_schedules(prisma, {"id_matiere": subject_id})
     if schedule_count > 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -463,26 +464,22 @@ async def get_subject_schedules(
             detail="You can only view schedules for subjects from your department"
         )
     
-    # Get total count
-    total = await prisma.emploitemps.count(where={"id_matiere": subject_id})
-    
-    # Calculate pagination
+    # Stored sessions and series occurrences, newest first
     skip = (page - 1) * page_size
-    total_pages = (total + page_size - 1) // page_size
-    
-    # Get schedules
-    schedules = await prisma.emploitemps.find_many(
-        where={"id_matiere": subject_id},
+    schedules, total = await find_occurrence_page(
+        prisma,
+        skip,
+        page_size,
+        subject_id=subject_id,
+        newest_first=True,
         include={
             "salle": True,
             "groupe": True,
             "enseignant": {"include": {"utilisateur": True}},
             "absences": {"include": {"etudiant": {"include": {"utilisateur": True}}}}
-        },
-        skip=skip,
-        take=page_size,
-        order={"date": "desc"}
+        }
     )
+    total_pages = (total + page_size - 1) // page_size
     
     return {
         "schedules": schedules,
@@ -3,7 +3,8 @@ Teacher Grade Submission System
 Allows teachers to enter and manage grades for their students
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, Query, BackgroundTasks, UploadFile, File
+from fastapi.responses import StreamingResponse
 from prisma import Prisma
 from app.db.prisma_client import get_prisma
 from app.core.deps import require_teacher
@@ -12,6 +13,13 @@ from pydantic import BaseModel, Field
 from datetime import datetime
 from enum import Enum
 from app.routers.notifications import create_notification
+from app.services.schedule_series import teaching_assignments
+from app.services.grade_averages import AverageMaintainer
+from app.services.grade_submission import GradeSubmissionService
+from app.services.grade_io import (
+    GradeFileError, GradeImporter, iter_upload_rows, iter_export_rows, stream_csv, stream_xlsx
+)
+from app.services.grading_sheet import GradingSheet, column_name, read_sheet
 
 
 router = APIRouter(
@@ -126,34 +134,28 @@ async def get_teacher_subjects(
             detail="Teacher record not found"
         )
     
-    # Get unique subjects from teacher's schedule (emploitemps)
-    schedules = await prisma.emploitemps.find_many(
-        where={"id_enseignant": current_user.enseignant_id},
+    # Get unique subjects from teacher's schedule (sessions and series)
+    assignments = await teaching_assignments(prisma, teacher_id=current_user.enseignant_id)
+    subjects = await prisma.matiere.find_many(
+        where={"id": {"in": list({a["id_matiere"] for a in assignments})}},
         include={
-            "matiere": {
+            "specialite": {
                 "include": {
-                    "specialite": {
-                        "include": {
-                            "departement": True
-                        }
-                    }
+                    "departement": True
                 }
             }
-        },
-        distinct=["id_matiere"]  # Get unique subjects
-    )
+        }
+    ) if assignments else []
     
-    # Extract unique subjects from schedules
     subjects_dict = {}
-    for schedule in schedules:
-        if schedule.matiere and schedule.matiere.id not in subjects_dict:
-            subjects_dict[schedule.matiere.id] = {
-                "id": schedule.matiere.id,
-                "nom": schedule.matiere.nom,
-                "coefficient": schedule.matiere.coefficient,
-                "specialite": schedule.matiere.specialite.nom if schedule.matiere.specialite else "",
-                "departement": schedule.matiere.specialite.departement.nom if schedule.matiere.specialite and schedule.matiere.specialite.departement else ""
-            }
+    for subject in subjects:
+        subjects_dict[subject.id] = {
+            "id": subject.id,
+            "nom": subject.nom,
+            "coefficient": subject.coefficient,
+            "specialite": subject.specialite.nom if subject.specialite else "",
+            "departement": subject.specialite.departement.nom if subject.specialite and subject.specialite.departement else ""
+        }
     
     return {
         "subjects": list(subjects_dict.values())
@@ -186,32 +188,24 @@ async def get_subject_groups(
         )
     
     # Get unique groups from teacher's schedule for this subject
-    schedules = await prisma.emploitemps.find_many(
-        where={
-            "id_enseignant": current_user.enseignant_id,
-            "id_matiere": subject_id
-        },
-        include={
-            "groupe": True
-        },
-        distinct=["id_groupe"]  # Get unique groups
+    assignments = await teaching_assignments(
+        prisma, teacher_id=current_user.enseignant_id, subject_id=subject_id
     )
+    groups = await prisma.groupe.find_many(
+        where={"id": {"in": list({a["id_groupe"] for a in assignments})}}
+    ) if assignments else []
     
-    # Extract unique groups and count students
+    # Count students per group
     groups_with_count = []
-    seen_groups = set()
-    
-    for schedule in schedules:
-        if schedule.groupe and schedule.groupe.id not in seen_groups:
-            seen_groups.add(schedule.groupe.id)
-            student_count = await prisma.etudiant.count(
-                where={"id_groupe": schedule.groupe.id}
-            )
-            groups_with_count.append({
-                "id": schedule.groupe.id,
-                "nom": schedule.groupe.nom,
-                "student_count": student_count
-            })
+    for group in groups:
+        student_count = await prisma.etudiant.count(
+            where={"id_groupe": group.id}
+        )
+        groups_with_count.append({
+            "id": group.id,
+            "nom": group.nom,
+            "student_count": student_count
+        })
     
     return {
         "subject": {
@@ -223,6 +217,28 @@ async def get_subject_groups(
     }
 
 
+async def verify_teacher_group_access(current_user, subject_id: str, group_id: str, prisma: Prisma):
+    """Raise unless the teacher has this subject-group combination in their schedule"""
+    if not current_user.enseignant_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Teacher record not found"
+        )
+    
+    schedule_exists = await teaching_assignments(
+        prisma,
+        teacher_id=current_user.enseignant_id,
+        group_id=group_id,
+        subject_id=subject_id
+    )
+    
+    if not schedule_exists:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't teach this subject to this group"
+        )
+
+
 @router.get("/subject/{subject_id}/group/{group_id}/students")
 async def get_group_students_for_grading(
     subject_id: str,
@@ -233,72 +249,232 @@ async def get_group_students_for_grading(
     current_user = Depends(require_teacher)
 ):
     """Get all students in a group with their existing grades for this subject"""
-    if not current_user.enseignant_id:
+    await verify_teacher_group_access(current_user, subject_id, group_id, prisma)
+    
+    # Students and all their grades in one query, grouped by student and type
+    sheet = await GradingSheet.load(prisma, subject_id, group_id, semestre.value, annee_scolaire)
+    
+    return {
+        "students": sheet.students,
+        "total_students": len(sheet.students),
+        "grade_columns": [column_name(t, n) for t, n in sheet.grade_columns]
+    }
+
+
+@router.get("/subject/{subject_id}/group/{group_id}/sheet/export")
+async def export_grading_sheet(
+    subject_id: str,
+    group_id: str,
+    semestre: SemesterType,
+    annee_scolaire: str,
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(require_teacher)
+):
+    """Download the grading sheet as an Excel file (one row per student, one column per grade)"""
+    await verify_teacher_group_access(current_user, subject_id, group_id, prisma)
+    
+    sheet = await GradingSheet.load(prisma, subject_id, group_id, semestre.value, annee_scolaire)
+    
+    return StreamingResponse(
+        sheet.to_excel(),
+        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        headers={'Content-Disposition': f'attachment; filename=notes_{semestre.value}_{annee_scolaire}.xlsx'}
+    )
+
+
+@router.post("/subject/{subject_id}/group/{group_id}/sheet/import")
+async def import_grading_sheet(
+    subject_id: str,
+    group_id: str,
+    semestre: SemesterType,
+    annee_scolaire: str,
+    file: UploadFile = File(...),
+    dry_run: bool = Query(False, description="Only report what would change"),
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(require_teacher)
+):
+    """
+    Upload an edited grading sheet (.xlsx or .csv, as exported)
+    
+    New cells create grades and changed cells update them; empty cells
+    are ignored. Nothing is written if any cell is invalid.
+    """
+    await verify_teacher_group_access(current_user, subject_id, group_id, prisma)
+    
+    if not file.filename or not file.filename.lower().endswith(('.xlsx', '.xls', '.csv')):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File must be an Excel (.xlsx, .xls) or CSV file"
+        )
+    
+    subject = await prisma.matiere.find_unique(where={"id": subject_id})
+    if not subject:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Teacher record not found"
+            detail="Subject not found"
         )
     
-    # Verify teacher has this subject-group combination in their schedule
-    schedule_exists = await prisma.emploitemps.find_first(
-        where={
-            "id_enseignant": current_user.enseignant_id,
+    try:
+        df = read_sheet(file.filename, await file.read())
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to read file: {str(e)}"
+        )
+    
+    sheet = await GradingSheet.load(prisma, subject_id, group_id, semestre.value, annee_scolaire)
+    changes = sheet.changes_from_frame(df)
+    summary = {
+        "created_count": len(changes.created),
+        "updated_count": len(changes.updated),
+        "errors": changes.errors
+    }
+    if changes.errors or dry_run:
+        return {"success": not changes.errors, "dry_run": dry_run, **summary}
+    
+    created = [
+        {
+            **row,
+            "coefficient": subject.coefficient,  # Use coefficient from subject
             "id_matiere": subject_id,
-            "id_groupe": group_id
+            "id_enseignant": current_user.enseignant_id
         }
+        for row in changes.created
+    ]
+    own_grades = {g.id for g in await prisma.note.find_many(
+        where={"id": {"in": [grade["id"] for grade, _ in changes.updated]}, "id_enseignant": current_user.enseignant_id}
+    )} if changes.updated else set()
+    updated = [(grade, value) for grade, value in changes.updated if grade["id"] in own_grades]
+    
+    async with prisma.tx() as tx:
+        if created:
+            await tx.note.create_many(data=created)
+        for grade, value in updated:
+            await tx.note.update(where={"id": grade["id"]}, data={"valeur": value})
+        await AverageMaintainer(prisma).grades_changed(
+            before=[grade for grade, _ in updated],
+            after=created + [{**grade, "valeur": value} for grade, value in updated],
+            tx=tx
+        )
+    
+    return {
+        "success": True,
+        "dry_run": False,
+        **summary,
+        "updated_count": len(updated),
+        "skipped_not_owned": len(changes.updated) - len(updated)
+    }
+
+
+@router.get("/subject/{subject_id}/export")
+async def export_subject_grades(
+    subject_id: str,
+    semestre: SemesterType,
+    annee_scolaire: str,
+    group_id: Optional[str] = Query(None),
+    format: str = Query("xlsx", pattern="^(xlsx|csv)$"),
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(require_teacher)
+):
+    """
+    Download the grades of a subject, one grade per row (streamed)
+    
+    Covers the groups the teacher teaches this subject to, or only
+    group_id. The file can be edited and uploaded back to /import.
+    """
+    if not current_user.enseignant_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Teacher record not found"
+        )
+    
+    assignments = await teaching_assignments(
+        prisma,
+        teacher_id=current_user.enseignant_id,
+        group_id=group_id,
+        subject_id=subject_id
     )
     
-    if not schedule_exists:
+    if not assignments:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't teach this subject to this group"
+            detail="You don't teach this subject"
         )
     
-    # Get all students in the group
-    students = await prisma.etudiant.find_many(
-        where={"id_groupe": group_id},
-        include={
-            "utilisateur": True
-        }
+    group_ids = sorted({a["id_groupe"] for a in assignments})
+    rows = iter_export_rows(prisma, subject_id, semestre.value, annee_scolaire, group_ids)
+    filename = f"notes_{semestre.value}_{annee_scolaire}.{format}"
+    
+    if format == "csv":
+        return StreamingResponse(
+            stream_csv(rows),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        )
+    return StreamingResponse(
+        stream_xlsx(rows),
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
+
+
+@router.post("/subject/{subject_id}/import")
+async def import_subject_grades(
+    subject_id: str,
+    semestre: SemesterType,
+    annee_scolaire: str,
+    file: UploadFile = File(...),
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(require_teacher)
+):
+    """
+    Upload grades from an Excel (.xlsx) or CSV file, one grade per row
+    
+    Required columns: type, valeur, and id_etudiant or email. Optional:
+    coefficient (the subject's by default), date_examen, observation and
+    id_note (updates that grade instead of creating one). Invalid rows are
+    reported by line and the others are written.
+    """
+    if not current_user.enseignant_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Teacher record not found"
+        )
     
-    # Sort students by name in Python
-    students.sort(key=lambda s: s.utilisateur.nom)
+    schedule_exists = await teaching_assignments(
+        prisma,
+        teacher_id=current_user.enseignant_id,
+        subject_id=subject_id
+    )
     
-    # Get existing grades for each student
-    students_with_grades = []
-    for student in students:
-        grades = await prisma.note.find_many(
-            where={
-                "id_etudiant": student.id,
-                "id_matiere": subject_id,
-                "semestre": semestre,
-                "annee_scolaire": annee_scolaire
-            }
+    if not schedule_exists:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't teach this subject"
+        )
+    
+    subject = await prisma.matiere.find_unique(where={"id": subject_id})
+    
+    if not subject:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Subject not found"
         )
-        
-        students_with_grades.append({
-            "id": student.id,
-            "nom": student.utilisateur.nom,
-            "prenom": student.utilisateur.prenom,
-            "email": student.utilisateur.email,
-            "grades": [
-                {
-                    "id": grade.id,
-                    "valeur": grade.valeur,
-                    "coefficient": grade.coefficient,
-                    "type": grade.type,
-                    "date_examen": grade.date_examen.isoformat() if grade.date_examen else None,
-                    "observation": grade.observation,
-                    "createdAt": grade.createdAt.isoformat()
-                }
-                for grade in grades
-            ]
-        })
+    
+    try:
+        rows = iter_upload_rows(file.filename or "", file.file)
+    except GradeFileError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    importer = GradeImporter(prisma, subject, current_user.enseignant_id, semestre.value, annee_scolaire)
+    summary = await importer.run(rows)
     
     return {
-        "students": students_with_grades,
-        "total_students": len(students_with_grades)
+        "success": True,
+        **summary
     }
 
 
@@ -321,11 +497,10 @@ async def submit_single_grade(
         )
     
     # Verify teacher has this subject in their schedule
-    schedule_exists = await prisma.emploitemps.find_first(
-        where={
-            "id_enseignant": current_user.enseignant_id,
-            "id_matiere": grade_data.id_matiere
-        }
+    schedule_exists = await teaching_assignments(
+        prisma,
+        teacher_id=current_user.enseignant_id,
+        subject_id=grade_data.id_matiere
     )
     
     if not schedule_exists:
@@ -359,20 +534,22 @@ async def submit_single_grade(
         )
     
     # Create the grade with coefficient from subject
-    grade = await prisma.note.create(
-        data={
-            "valeur": grade_data.valeur,
-            "coefficient": subject.coefficient,  # Use coefficient from subject
-            "type": grade_data.type,
-            "semestre": grade_data.semestre,
-            "annee_scolaire": grade_data.annee_scolaire,
-            "date_examen": grade_data.date_examen,
-            "observation": grade_data.observation,
-            "id_etudiant": grade_data.id_etudiant,
-            "id_matiere": grade_data.id_matiere,
-            "id_enseignant": current_user.enseignant_id
-        }
-    )
+    async with prisma.tx() as tx:
+        grade = await tx.note.create(
+            data={
+                "valeur": grade_data.valeur,
+                "coefficient": subject.coefficient,  # Use coefficient from subject
+                "type": grade_data.type,
+                "semestre": grade_data.semestre,
+                "annee_scolaire": grade_data.annee_scolaire,
+                "date_examen": grade_data.date_examen,
+                "observation": grade_data.observation,
+                "id_etudiant": grade_data.id_etudiant,
+                "id_matiere": grade_data.id_matiere,
+                "id_enseignant": current_user.enseignant_id
+            }
+        )
+        await AverageMaintainer(prisma).grades_changed(after=[grade], tx=tx)
     
     # Notify department head(s) in background
     try:
@@ -434,7 +611,12 @@ async def submit_bulk_grades(
     current_user = Depends(require_teacher),
     background_tasks: BackgroundTasks = None
 ):
-    """Submit multiple grades at once for a subject"""
+    """
+    Submit multiple grades at once for a subject
+    
+    Enrollment is checked for the whole batch at once and accepted grades
+    are written in one transaction; each entry gets its own result.
+    """
     if not current_user.enseignant_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -442,11 +624,10 @@ async def submit_bulk_grades(
         )
     
     # Verify teacher has this subject in their schedule
-    schedule_exists = await prisma.emploitemps.find_first(
-        where={
-            "id_enseignant": current_user.enseignant_id,
-            "id_matiere": bulk_data.id_matiere
-        }
+    schedule_exists = await teaching_assignments(
+        prisma,
+        teacher_id=current_user.enseignant_id,
+        subject_id=bulk_data.id_matiere
     )
     
     if not schedule_exists:
@@ -466,96 +647,39 @@ async def submit_bulk_grades(
             detail="Subject not found"
         )
     
-    created_grades = []
-    errors = []
+    service = GradeSubmissionService(prisma)
+    batch = await service.submit(
+        subject,
+        current_user.enseignant_id,
+        bulk_data.semestre.value,
+        bulk_data.annee_scolaire,
+        [grade.dict() for grade in bulk_data.grades]
+    )
     
-    for grade_submission in bulk_data.grades:
-        try:
-            # Verify student is enrolled
-            student_enrolled = await verify_student_in_subject(
-                grade_submission.id_etudiant,
-                bulk_data.id_matiere,
-                prisma
-            )
-            
-            if not student_enrolled:
-                errors.append({
-                    "student_id": grade_submission.id_etudiant,
-                    "error": "Student not enrolled in this subject"
-                })
-                continue
-            
-            # Create grade with coefficient from subject
-            grade = await prisma.note.create(
-                data={
-                    "valeur": grade_submission.valeur,
-                    "coefficient": subject.coefficient,  # Use coefficient from subject
-                    "type": grade_submission.type,
-                    "semestre": bulk_data.semestre,
-                    "annee_scolaire": bulk_data.annee_scolaire,
-                    "date_examen": grade_submission.date_examen,
-                    "observation": grade_submission.observation,
-                    "id_etudiant": grade_submission.id_etudiant,
-                    "id_matiere": bulk_data.id_matiere,
-                    "id_enseignant": current_user.enseignant_id
-                }
-            )
-            
-            created_grades.append(grade.id)
-            
-        except Exception as e:
-            errors.append({
-                "student_id": grade_submission.id_etudiant,
-                "error": str(e)
-            })
-    
-    # After bulk submission, notify department head(s) once summarizing
-    try:
-        # Fetch subject -> specialite -> departement
-        subject = await prisma.matiere.find_unique(
-            where={"id": bulk_data.id_matiere},
-            include={"specialite": {"include": {"departement": True}}}
+    # Notify department head(s) once, summarizing the batch
+    if batch.rows:
+        notification = (
+            subject,
+            "BULK_GRADES_SUBMITTED",
+            "Nouvelles notes soumises en masse",
+            f"{len(batch.rows)} notes ont été soumises pour la matière {subject.nom} (année {bulk_data.annee_scolaire}, {bulk_data.semestre.value}).",
+            ",".join(batch.created_ids)
         )
-
-        if subject and subject.specialite and subject.specialite.departement:
-            departement_id = subject.specialite.departement.id
-            chefs = await prisma.chefdepartement.find_many(
-                where={"id_departement": departement_id},
-                include={"utilisateur": True}
-            )
-
-            title = "Nouvelles notes soumises en masse"
-            message = f"{len(created_grades)} notes ont été soumises pour la matière {subject.nom} (année {bulk_data.annee_scolaire}, {bulk_data.semestre})."
-
-            for chef in chefs:
-                if chef and chef.utilisateur:
-                    if background_tasks is not None:
-                        background_tasks.add_task(
-                            create_notification,
-                            prisma,
-                            chef.utilisateur.id,
-                            "BULK_GRADES_SUBMITTED",
-                            title,
-                            message,
-                            ",".join(created_grades) if created_grades else None
-                        )
-                    else:
-                        await create_notification(
-                            prisma,
-                            chef.utilisateur.id,
-                            "BULK_GRADES_SUBMITTED",
-                            title,
-                            message,
-                            ",".join(created_grades) if created_grades else None
-                        )
-    except Exception:
-        pass
-
+        if background_tasks is not None:
+            background_tasks.add_task(service.notify_department_heads, *notification)
+        else:
+            try:
+                await service.notify_department_heads(*notification)
+            except Exception:
+                # Don't fail the submission on notification failure
+                pass
+    
     return {
         "success": True,
-        "created_count": len(created_grades),
+        "created_count": len(batch.rows),
         "total_submitted": len(bulk_data.grades),
-        "errors": errors
+        "results": batch.results,
+        "errors": batch.errors
     }
 
 
@@ -610,10 +734,12 @@ async def update_grade(
     update_dict["updatedAt"] = datetime.now()
     
     # Update grade
-    updated_grade = await prisma.note.update(
-        where={"id": grade_id},
-        data=update_dict
-    )
+    async with prisma.tx() as tx:
+        updated_grade = await tx.note.update(
+            where={"id": grade_id},
+            data=update_dict
+        )
+        await AverageMaintainer(prisma).grades_changed(before=[grade], after=[updated_grade], tx=tx)
     
     return {
         "success": True,
@@ -657,9 +783,11 @@ async def delete_grade(
         )
     
     # Delete grade
-    await prisma.note.delete(
-        where={"id": grade_id}
-    )
+    async with prisma.tx() as tx:
+        await tx.note.delete(
+            where={"id": grade_id}
+        )
+        await AverageMaintainer(prisma).grades_changed(before=[grade], tx=tx)
     
     return {
         "success": True,
@@ -1,10 +1,13 @@
 from fastapi import APIRouter, HTTPException, Depends, status, UploadFile, File
 from typing import Optional, List
-from datetime import datetime, date, time
+from datetime import datetime, date
 from prisma import Prisma
 from app.db.prisma_client import get_prisma
 from app.core.deps import get_current_user, require_teacher
 from app.services.cloudinary_service_mock import CloudinaryService
+from app.services.timetable_cache import WeeklyTimetableCache, SCOPE_TEACHER
+from app.services.schedule_series import find_occurrences, find_schedule, teaching_assignments
+from app.core.http_cache import conditional_get, TIMETABLE_TABLES
 from app.schemas.teacher import DepartmentUpdateRequest, TeacherImageUpload, TeacherProfileUpdate
 from app.schemas.absence import TeacherGroupInfo, TeacherGroupDetails, StudentAbsenceInfo, MarkAbsenceRequest, TeacherAbsenceResponse
 from app.services.enhanced_notification_service import (
@@ -160,14 +163,11 @@ async def get_teacher_timetable(
         end_dt = datetime.combine(sunday, datetime.max.time())  # End of week (Sunday)
     
     # Get teacher's schedules
-    schedules = await prisma.emploitemps.find_many(
-        where={
-            "id_enseignant": teacher.id,
-            "date": {
-                "gte": start_dt,
-                "lte": end_dt
-            }
-        },
+    schedules = await find_occurrences(
+        prisma,
+        start=start_dt,
+        end=end_dt,
+        teacher_id=teacher.id,
         include={
             "matiere": True,
             "salle": True,
@@ -180,11 +180,7 @@ async def get_teacher_timetable(
                     }
                 }
             }
-        },
-        order=[
-            {"date": "asc"},
-            {"heure_debut": "asc"}
-        ]
+        }
     )
     
     return {
@@ -562,6 +558,27 @@ async def update_teacher_info(
 # ABSENCE MANAGEMENT ENDPOINTS
 # ============================================================================
 
+async def taught_groups(prisma: Prisma, teacher_id: str, group_include: dict):
+    """(group, subject) pairs a teacher teaches, from stored sessions and series"""
+    assignments = await teaching_assignments(prisma, teacher_id=teacher_id)
+    if not assignments:
+        return []
+    groups = await prisma.groupe.find_many(
+        where={"id": {"in": list({a["id_groupe"] for a in assignments})}},
+        include=group_include
+    )
+    subjects = await prisma.matiere.find_many(
+        where={"id": {"in": list({a["id_matiere"] for a in assignments})}}
+    )
+    groups_by_id = {g.id: g for g in groups}
+    subjects_by_id = {m.id: m for m in subjects}
+    return [
+        (groups_by_id[a["id_groupe"]], subjects_by_id[a["id_matiere"]])
+        for a in assignments
+        if a["id_groupe"] in groups_by_id and a["id_matiere"] in subjects_by_id
+    ]
+
+
 @router.get("/groups")
 async def get_teacher_groups(
     prisma: Prisma = Depends(get_prisma),
@@ -587,31 +604,26 @@ async def get_teacher_groups(
         )
     
     # Get groups through schedule (more reliable approach)
-    schedules = await prisma.emploitemps.find_many(
-        where={"id_enseignant": teacher.id},
-        include={
-            "groupe": {
+    taught = await taught_groups(
+        prisma,
+        teacher.id,
+        {
+            "niveau": {
                 "include": {
-                    "niveau": {
+                    "specialite": {
                         "include": {
-                            "specialite": {
-                                "include": {
-                                    "departement": True
-                                }
-                            }
+                            "departement": True
                         }
-                    },
-                    "etudiants": True
+                    }
                 }
             },
-            "matiere": True
+            "etudiants": True
         }
     )
     
     # Extract unique groups
     groups_map = {}
-    for schedule in schedules:
-        group = schedule.groupe
+    for group, subject in taught:
         if group.id not in groups_map:
             # Direct relationship: niveau has one specialite
             specialty_info = None
@@ -635,11 +647,11 @@ async def get_teacher_groups(
             }
         
         # Add subject if not already added
-        subject_exists = any(s["id"] == schedule.matiere.id for s in groups_map[group.id]["subjects"])
+        subject_exists = any(s["id"] == subject.id for s in groups_map[group.id]["subjects"])
         if not subject_exists:
             groups_map[group.id]["subjects"].append({
-                "id": schedule.matiere.id,
-                "nom": schedule.matiere.nom
+                "id": subject.id,
+                "nom": subject.nom
             })
     
     return list(groups_map.values())
@@ -662,11 +674,8 @@ async def get_group_students(
         )
     
     # Check if teacher teaches this group by checking through schedules
-    teacher_schedules = await prisma.emploitemps.find_many(
-        where={
-            "id_enseignant": current_user.enseignant_id,
-            "id_groupe": group_id
-        }
+    teacher_schedules = await teaching_assignments(
+        prisma, teacher_id=current_user.enseignant_id, group_id=group_id
     )
     
     if not teacher_schedules:
@@ -694,6 +703,12 @@ async def get_group_students(
             detail="Group not found"
         )
     
+    # Absences hang off stored rows; an occurrence never marked has none
+    if schedule_id:
+        schedule = await find_schedule(prisma, schedule_id)
+        if schedule:
+            schedule_id = schedule.id
+    
     # Get student absence information
     students_info = []
     for student in group.etudiants:
@@ -757,9 +772,11 @@ async def mark_student_absence(
             detail="No teacher record found for this user"
         )
     
-    # Check if the schedule belongs to this teacher
-    schedule = await prisma.emploitemps.find_unique(
-        where={"id": absence_request.schedule_id},
+    # Check if the schedule belongs to this teacher (a series occurrence gets a row)
+    schedule = await find_schedule(
+        prisma,
+        absence_request.schedule_id,
+        materialize=True,
         include={
             "matiere": True,
             "groupe": True
@@ -787,7 +804,7 @@ async def mark_student_absence(
     existing_absence = await prisma.absence.find_first(
         where={
             "id_etudiant": absence_request.student_id,
-            "id_emploitemps": absence_request.schedule_id
+            "id_emploitemps": schedule.id
         }
     )
     
@@ -829,7 +846,7 @@ async def mark_student_absence(
             new_absence = await prisma.absence.create(
                 data={
                     "id_etudiant": absence_request.student_id,
-                    "id_emploitemps": absence_request.schedule_id,
+                    "id_emploitemps": schedule.id,
                     "motif": absence_request.motif or "Marked absent by teacher",
                     "statut": "unjustified"
                 }
@@ -875,7 +892,7 @@ async def mark_student_absence(
             )
 
 
-@router.get("/schedule")
+@router.get("/schedule", dependencies=[Depends(conditional_get(*TIMETABLE_TABLES, private=True, daily=True))])
 async def get_teacher_schedule(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -923,56 +940,36 @@ async def get_teacher_schedule(
             detail="Teacher profile not found"
         )
     
-    # Get schedule for date range
-    schedules = await prisma.emploitemps.find_many(
-        where={
-            "id_enseignant": current_user.enseignant_id,
-            "date": {
-                "gte": start_dt,
-                "lte": end_dt
-            }
-        },
-        include={
-            "matiere": True,
-            "groupe": {
-                "include": {
-                    "niveau": {
-                        "include": {
-                            "specialite": True
-                        }
-                    }
-                }
-            },
-            "salle": True
-        },
-
+    # Get schedule for date range from the materialized weekly views
+    schedules = await WeeklyTimetableCache(prisma).get_range(
+        SCOPE_TEACHER, current_user.enseignant_id, start_dt, end_dt
     )
     
     # Format response
     formatted_schedules = []
     for schedule in schedules:
-        specialty_name = schedule.groupe.niveau.specialite.nom if schedule.groupe.niveau.specialite else "N/A"
+        groupe = schedule["groupe"]
         
         formatted_schedules.append({
-            "id": schedule.id,
-            "date": schedule.date.isoformat(),
-            "heure_debut": schedule.heure_debut.isoformat(),
-            "heure_fin": schedule.heure_fin.isoformat(),
-            "status": schedule.status,
+            "id": schedule["id"],
+            "date": schedule["date"],
+            "heure_debut": schedule["heure_debut"],
+            "heure_fin": schedule["heure_fin"],
+            "status": schedule["status"],
             "matiere": {
-                "id": schedule.matiere.id,
-                "nom": schedule.matiere.nom
+                "id": schedule["matiere"]["id"],
+                "nom": schedule["matiere"]["nom"]
             },
             "groupe": {
-                "id": schedule.groupe.id,
-                "nom": schedule.groupe.nom,
-                "niveau": schedule.groupe.niveau.nom,
-                "specialite": specialty_name
+                "id": groupe["id"],
+                "nom": groupe["nom"],
+                "niveau": groupe["niveau"],
+                "specialite": groupe["specialite"] or "N/A"
             },
             "salle": {
-                "id": schedule.salle.id,
-                "code": schedule.salle.code,
-                "type": schedule.salle.type
+                "id": schedule["salle"]["id"],
+                "code": schedule["salle"]["code"],
+                "type": schedule["salle"]["type"]
             }
         })
     
@@ -1004,22 +1001,17 @@ async def get_today_schedule(
             detail="No teacher record found for this user"
         )
     
-    from datetime import datetime, time
+    from datetime import datetime
     
     # Get today's date
     today = datetime.now().date()
-    start_of_day = datetime.combine(today, time.min)
-    end_of_day = datetime.combine(today, time.max)
     
     # Get today's schedule
-    schedules = await prisma.emploitemps.find_many(
-        where={
-            "id_enseignant": current_user.enseignant_id,
-            "date": {
-                "gte": start_of_day,
-                "lte": end_of_day
-            }
-        },
+    schedules = await find_occurrences(
+        prisma,
+        start=today,
+        end=today,
+        teacher_id=current_user.enseignant_id,
         include={
             "matiere": True,
             "groupe": {
@@ -1032,8 +1024,7 @@ async def get_today_schedule(
                 }
             },
             "salle": True
-        },
-
+        }
     )
     
     result = []
@@ -1081,19 +1072,11 @@ async def get_teacher_stats(
     
     # Get today's date in local timezone
     today = datetime.now().date()
-    start_of_day = datetime.combine(today, datetime.min.time())
-    end_of_day = datetime.combine(today, datetime.max.time())
     
     # Count today's classes
-    today_classes = await prisma.emploitemps.count(
-        where={
-            "id_enseignant": current_user.enseignant_id,
-            "date": {
-                "gte": start_of_day,
-                "lte": end_of_day
-            }
-        }
-    )
+    today_classes = len(await find_occurrences(
+        prisma, start=today, end=today, teacher_id=current_user.enseignant_id
+    ))
     
     # Count pending absences (this would require an absence management system)
     # For now, return mock data - in a real system, you'd query absence records
@@ -1127,39 +1110,33 @@ async def get_teacher_groups_detailed(
         )
     
     # Get all groups the teacher teaches with detailed information
-    groups_data = await prisma.emploitemps.find_many(
-        where={
-            "id_enseignant": current_user.enseignant_id
-        },
-        include={
-            "groupe": {
+    taught = await taught_groups(
+        prisma,
+        current_user.enseignant_id,
+        {
+            "niveau": {
                 "include": {
-                    "niveau": {
-                        "include": {
-                            "specialite": {
-                                "include": {
-                                    "departement": True
-                                }
-                            }
-                        }
-                    },
-                    "etudiants": {
+                    "specialite": {
                         "include": {
-                            "utilisateur": True
+                            "departement": True
                         }
                     }
                 }
             },
-            "matiere": True
+            "etudiants": {
+                "include": {
+                    "utilisateur": True
+                }
+            }
         }
     )
     
     # Group the data by group and subject
     groups_map = {}
     
-    for schedule in groups_data:
-        group_id = schedule.groupe.id
-        subject_id = schedule.matiere.id
+    for group, subject in taught:
+        group_id = group.id
+        subject_id = subject.id
         
         if group_id not in groups_map:
             # Filter out students without user accounts
@@ -1171,17 +1148,17 @@ async def get_teacher_groups_detailed(
                     "prenom": student.prenom,
                     "email": student.email,
                     "user_id": student.utilisateur.id if student.utilisateur else None
-                } for student in schedule.groupe.etudiants
+                } for student in group.etudiants
             ]
             
             # Get specialty and department directly from niveau
-            specialty_name = schedule.groupe.niveau.specialite.nom if schedule.groupe.niveau.specialite else "N/A"
-            department_name = schedule.groupe.niveau.specialite.departement.nom if schedule.groupe.niveau.specialite and schedule.groupe.niveau.specialite.departement else "N/A"
+            specialty_name = group.niveau.specialite.nom if group.niveau.specialite else "N/A"
+            department_name = group.niveau.specialite.departement.nom if group.niveau.specialite and group.niveau.specialite.departement else "N/A"
             
             groups_map[group_id] = {
-                "id": schedule.groupe.id,
-                "nom": schedule.groupe.nom,
-                "level": schedule.groupe.niveau.nom,
+                "id": group.id,
+                "nom": group.nom,
+                "level": group.niveau.nom,
                 "specialty": specialty_name,
                 "department": department_name,
                 "student_count": len(valid_students),
@@ -1193,8 +1170,8 @@ async def get_teacher_groups_detailed(
         subject_exists = any(s["id"] == subject_id for s in groups_map[group_id]["subjects"])
         if not subject_exists:
             groups_map[group_id]["subjects"].append({
-                "id": schedule.matiere.id,
-                "nom": schedule.matiere.nom
+                "id": subject.id,
+                "nom": subject.nom
             })
     
     return {
@@ -0,0 +1,276 @@
+"""
+Automatic Timetable Generation
+Chef de Département generates a draft semester timetable, reviews it and commits it
+
+Generation runs in the background: the draft is created in the GENERATING
+status and filled in (DRAFT, or FAILED with the error) when the solver is
+done; the client polls the draft.
+"""
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, status
+from typing import Dict, List, Optional
+from prisma import Prisma, Json
+from datetime import datetime
+import logging
+from pydantic import BaseModel, Field
+import time as clock
+
+from app.db.prisma_client import get_prisma
+from app.core.deps import require_department_head
+from app.routers.department_head_timetable import get_dept_head_department
+from app.routers.semester_timetable import (
+    RecurringScheduleSlot, SemesterTimetableCreate, write_semester_timetable, get_department_draft
+)
+from app.services.timetable_solver import (
+    SolverProblem, TimetableSolverService, solve_in_pool, MAX_SOLVER_WORKERS, MAX_SOLVER_SECONDS
+)
+from app.services.timetable_publisher import TimetablePublisher, DRAFT_STATUS
+
+router = APIRouter(prefix="/department-head/timetable-solver", tags=["Department Head - Timetable Solver"])
+
+logger = logging.getLogger(__name__)
+
+HH_MM = r"^([01]\d|2[0-3]):[0-5]\d$"
+
+GENERATING_STATUS = "GENERATING"
+FAILED_STATUS = "FAILED"
+
+class TeacherUnavailability(BaseModel):
+    """A weekly period when a teacher cannot teach (whole day if no times)"""
+    teacher_id: str
+    week_day: int = Field(..., ge=1, le=7)  # 1=Monday, ..., 6=Saturday
+    start_time: Optional[str] = Field(None, pattern=HH_MM, description="Format: HH:MM")
+    end_time: Optional[str] = Field(None, pattern=HH_MM, description="Format: HH:MM")
+
+
+class SolverRequest(BaseModel):
+    semester: str
+    start_date: str  # YYYY-MM-DD
+    end_date: str
+    exclude_dates: List[str] = []
+    group_ids: Optional[List[str]] = None  # Default: every group of the department
+    weekly_sessions: Dict[str, int] = {}  # subject_id -> sessions per week
+    teacher_unavailability: List[TeacherUnavailability] = []
+    time_limit_seconds: int = Field(20, ge=1, le=MAX_SOLVER_SECONDS)
+    workers: int = Field(MAX_SOLVER_WORKERS, ge=1, le=MAX_SOLVER_WORKERS)
+
+
+def _summary(draft) -> Dict:
+    payload = draft.payload
+    return {
+        "id": draft.id,
+        "semester": draft.semester,
+        "version": draft.version,
+        "status": draft.status,
+        "start_date": payload.get("start_date"),
+        "end_date": payload.get("end_date"),
+        "stats": payload.get("stats"),
+        "createdAt": draft.createdAt,
+        "updatedAt": draft.updatedAt
+    }
+
+
+async def _solve_draft(
+    prisma: Prisma,
+    draft_id: str,
+    problem: SolverProblem,
+    labels: Dict,
+    payload: Dict,
+    workers: int,
+    time_limit: int
+):
+    """
+    Background job: run the solver and fill in the draft
+
+    Only a draft still GENERATING is written, so one deleted meanwhile
+    is left alone.
+    """
+    where = {"id": draft_id, "status": GENERATING_STATUS}
+    started = clock.perf_counter()
+    try:
+        result = await solve_in_pool(problem, workers=workers, time_limit=time_limit)
+        schedules, unplaced = TimetableSolverService.to_schedules(problem, result, labels)
+    except Exception as e:
+        logger.exception("Timetable generation failed for draft %s", draft_id)
+        await prisma.timetabledraft.update_many(
+            where=where,
+            data={"status": FAILED_STATUS, "payload": Json({**payload, "error": str(e)})}
+        )
+        return
+
+    payload = {
+        **payload,
+        "schedules": schedules,
+        "unplaced": unplaced,
+        "stats": {
+            "sessions": len(problem.demands),
+            "placed": len(schedules),
+            "unplaced": len(unplaced),
+            "cost": result["cost"],
+            "seed": result["seed"],
+            "seconds": round(clock.perf_counter() - started, 2)
+        }
+    }
+    await prisma.timetabledraft.update_many(
+        where=where,
+        data={"status": DRAFT_STATUS, "payload": Json(payload)}
+    )
+
+
+@router.post("/drafts", status_code=status.HTTP_202_ACCEPTED)
+async def generate_draft(
+    request: SolverRequest,
+    background_tasks: BackgroundTasks,
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(require_department_head)
+):
+    """
+    Start generating a conflict-free draft timetable for the semester
+
+    Every group gets each subject of its level, taught by the subject's
+    teacher, in a room large enough for the group. Returns the draft in
+    the GENERATING status; poll GET /drafts/{id} until it is DRAFT (or
+    FAILED). Nothing is written to the timetable until the draft is
+    committed.
+    """
+    department = await get_dept_head_department(current_user, prisma)
+
+    try:
+        start_date = datetime.strptime(request.start_date, "%Y-%m-%d").date()
+        end_date = datetime.strptime(request.end_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Format de date invalide (YYYY-MM-DD attendu)"
+        )
+    if end_date < start_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="La date de fin doit être postérieure à la date de début"
+        )
+
+    service = TimetableSolverService(prisma)
+    problem, labels = await service.build_problem(
+        department.id,
+        start_date,
+        end_date,
+        group_ids=request.group_ids,
+        weekly_sessions=request.weekly_sessions,
+        teacher_unavailability=[u.dict() for u in request.teacher_unavailability]
+    )
+    if not problem.demands:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Aucune séance à planifier (groupes, matières ou enseignants manquants)"
+        )
+
+    payload = {
+        "semester": request.semester,
+        "start_date": request.start_date,
+        "end_date": request.end_date,
+        "exclude_dates": request.exclude_dates,
+        "schedules": [],
+        "unplaced": [],
+        "subjects_without_teacher": labels["subjects_without_teacher"],
+        "stats": None
+    }
+    draft = await TimetablePublisher(prisma).create_draft(
+        department.id, payload, created_by=current_user.id, status=GENERATING_STATUS
+    )
+    background_tasks.add_task(
+        _solve_draft, prisma, draft.id, problem, labels, payload,
+        request.workers, request.time_limit_seconds
+    )
+
+    return {"id": draft.id, "version": draft.version, "status": draft.status, **payload}
+
+
+@router.get("/drafts")
+async def list_drafts(
+    semester: Optional[str] = None,
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(require_department_head)
+):
+    """Drafts of the department, newest first"""
+    department = await get_dept_head_department(current_user, prisma)
+
+    where = {"id_departement": department.id}
+    if semester:
+        where["semester"] = semester
+
+    drafts = await prisma.timetabledraft.find_many(where=where, order={"createdAt": "desc"})
+    return {"total": len(drafts), "drafts": [_summary(d) for d in drafts]}
+
+
+@router.get("/drafts/{draft_id}")
+async def get_draft(
+    draft_id: str,
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(require_department_head)
+):
+    """Full draft for review"""
+    department = await get_dept_head_department(current_user, prisma)
+    draft = await get_department_draft(prisma, draft_id, department.id)
+    return {"id": draft.id, "version": draft.version, "status": draft.status, **draft.payload}
+
+
+@router.post("/drafts/{draft_id}/commit")
+async def commit_draft(
+    draft_id: str,
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(require_department_head)
+):
+    """Publish the draft's sessions as the new semester timetable version"""
+    department = await get_dept_head_department(current_user, prisma)
+    draft = await get_department_draft(prisma, draft_id, department.id)
+
+    if draft.status == GENERATING_STATUS:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Ce brouillon est encore en cours de génération"
+        )
+    if draft.status == FAILED_STATUS:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="La génération de ce brouillon a échoué"
+        )
+    if draft.status != DRAFT_STATUS:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Ce brouillon a déjà été appliqué"
+        )
+
+    payload = draft.payload
+    timetable_data = SemesterTimetableCreate(
+        semester=payload["semester"],
+        start_date=payload["start_date"],
+        end_date=payload["end_date"],
+        exclude_dates=payload.get("exclude_dates", []),
+        schedules=[RecurringScheduleSlot(**slot) for slot in payload["schedules"]]
+    )
+    result = await write_semester_timetable(
+        prisma, department, timetable_data, draft=draft, published_by=current_user.id
+    )
+
+    return {
+        "message": "Emploi du temps semestriel publié à partir du brouillon",
+        "semester": timetable_data.semester,
+        "unplaced": len(payload.get("unplaced", [])),
+        **result
+    }
+
+
+@router.delete("/drafts/{draft_id}")
+async def delete_draft(
+    draft_id: str,
+    prisma: Prisma = Depends(get_prisma),
+    current_user = Depends(require_department_head)
+):
+    department = await get_dept_head_department(current_user, prisma)
+    draft = await get_department_draft(prisma, draft_id, department.id)
+    if draft.status not in (DRAFT_STATUS, GENERATING_STATUS, FAILED_STATUS):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Une version publiée ne peut pas être supprimée"
+        )
+    await prisma.timetabledraft.delete(where={"id": draft.id})
+    return {"message": "Brouillon supprimé"}
@@ -0,0 +1,144 @@
+"""
+Averages Dashboard Summary
+
+Everything the department head's averages dashboard shows, from one
+grouped query: every student of the department (optionally one group or
+specialty) with their general average and rank, the number of subject
+averages and how many are validated. Cohort statistics (mean, median,
+quartiles, spread, pass rate, status counts and a histogram of general
+averages) are then computed on a NumPy array of the averages, so the cost
+no longer grows with one round trip per student.
+"""
+
+from typing import Dict, Optional
+import numpy as np
+from prisma import Prisma
+
+
+PASSING_AVERAGE = 10.0
+
+# Histogram of general averages: 2-point bins from 0 to 20 (20 falls in the last)
+HISTOGRAM_EDGES = np.arange(0, 22, 2)
+
+# Lower bound of each status, best first
+STATUS_THRESHOLDS = [("excellent", 16.0), ("good", 14.0), ("average", 10.0), ("needs_improvement", float("-inf"))]
+
+SUMMARY_SQL = """
+SELECT e."id" AS "student_id",
+       COALESCE(u."prenom", e."prenom") || ' ' || COALESCE(u."nom", e."nom") AS "student_name",
+       COALESCE(u."email", e."email") AS "student_email",
+       COALESCE(g."nom", 'N/A') AS "groupe",
+       COALESCE(l."nom", 'N/A') AS "niveau",
+       sp."nom" AS "specialite",
+       ga."moyenne_generale",
+       ga."rang",
+       COUNT(sa."id")::int AS "total_matieres",
+       (COUNT(sa."id") FILTER (WHERE sa."validee"))::int AS "matieres_validees"
+FROM "Student" e
+JOIN "Specialty" sp ON sp."id" = e."id_specialite"
+LEFT JOIN "Group" g ON g."id" = e."id_groupe"
+LEFT JOIN "Level" l ON l."id" = e."id_niveau"
+LEFT JOIN "User" u ON u."etudiant_id" = e."id"
+LEFT JOIN LATERAL (
+    SELECT a."moyenne_generale", a."rang"
+    FROM "averages" a
+    WHERE a."id_etudiant" = e."id"
+      AND a."id_matiere" IS NULL
+      AND a."annee_scolaire" = $2
+      AND ($3::text IS NULL OR a."semestre"::text = $3)
+    ORDER BY a."semestre" DESC
+    LIMIT 1
+) ga ON true
+LEFT JOIN "averages" sa ON sa."id_etudiant" = e."id"
+     AND sa."id_matiere" IS NOT NULL
+     AND sa."annee_scolaire" = $2
+     AND ($3::text IS NULL OR sa."semestre"::text = $3)
+WHERE sp."id_departement" = $1
+  AND ($4::text IS NULL OR e."id_groupe" = $4)
+  AND ($5::text IS NULL OR e."id_specialite" = $5)
+GROUP BY e."id", u."id", g."id", l."id", sp."id", ga."moyenne_generale", ga."rang"
+ORDER BY ga."moyenne_generale" DESC NULLS LAST, "student_name"
+"""
+
+
+def student_status(average: Optional[float]) -> str:
+    if not average:
+        return "no_grades"
+    return next(status for status, bound in STATUS_THRESHOLDS if average >= bound)
+
+
+def cohort_statistics(averages: np.ndarray, total_students: int) -> Dict:
+    """Distribution of general averages (students without one excluded)"""
+    graded = averages[~np.isnan(averages)]
+    # Status counts only cover non-zero averages, as a zero means not graded yet
+    ranked = graded[graded != 0]
+
+    statistics = {
+        "total_students": total_students,
+        "students_with_grades": int(graded.size),
+        "average_generale": 0,
+        "highest_average": 0,
+        "lowest_average": 0,
+        "median": None,
+        "first_quartile": None,
+        "third_quartile": None,
+        "standard_deviation": None,
+        "pass_rate": None,
+    }
+    for status, _ in STATUS_THRESHOLDS:
+        statistics[f"{status}_count"] = 0
+
+    counts, _ = np.histogram(graded, bins=HISTOGRAM_EDGES)
+    statistics["histogram"] = [
+        {"min": int(low), "max": int(high), "count": int(count)}
+        for low, high, count in zip(HISTOGRAM_EDGES[:-1], HISTOGRAM_EDGES[1:], counts)
+    ]
+    if not graded.size:
+        return statistics
+
+    q1, median, q3 = np.percentile(graded, [25, 50, 75])
+    statistics.update({
+        "average_generale": round(float(graded.mean()), 2),
+        "highest_average": float(graded.max()),
+        "lowest_average": float(graded.min()),
+        "median": round(float(median), 2),
+        "first_quartile": round(float(q1), 2),
+        "third_quartile": round(float(q3), 2),
+        "standard_deviation": round(float(graded.std()), 2),
+        "pass_rate": round(float((graded >= PASSING_AVERAGE).mean()) * 100, 2),
+    })
+
+    upper = np.inf
+    for status, bound in STATUS_THRESHOLDS:
+        statistics[f"{status}_count"] = int(((ranked >= bound) & (ranked < upper)).sum())
+        upper = bound
+    return statistics
+
+
+class AveragesSummaryService:
+    def __init__(self, prisma: Prisma):
+        self.prisma = prisma
+
+    async def get_summary(
+        self,
+        department_id: str,
+        annee_scolaire: str,
+        semestre: Optional[str] = None,
+        groupe_id: Optional[str] = None,
+        specialite_id: Optional[str] = None
+    ) -> Dict:
+        """Students (best general average first) and cohort statistics"""
+        rows = await self.prisma.query_raw(
+            SUMMARY_SQL, department_id, annee_scolaire, semestre, groupe_id, specialite_id
+        )
+
+        students = [{**row, "status": student_status(row["moyenne_generale"])} for row in rows]
+
+        averages = np.array(
+            [np.nan if row["moyenne_generale"] is None else row["moyenne_generale"] for row in rows],
+            dtype=np.float64
+        )
+        return {
+            "statistics": cohort_statistics(averages, len(rows)),
+            "students": students
+        }
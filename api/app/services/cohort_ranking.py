@@ -0,0 +1,89 @@
+"""
+Cohort Ranking
+
+General averages are ranked with window functions in a single UPDATE per
+(department, semester, year), whatever the size of the cohort: rank()
+over the whole department (rang) and within the student's specialty,
+level and group. Equal averages share a rank (ex aequo) and the next rank
+skips accordingly (1, 2, 2, 4); students without a general average come
+last. Students without a level or group get no rank within it.
+
+Only rows whose ranks change are written, and only those students' cached
+grade pages are dropped.
+"""
+
+from typing import Dict
+from prisma import Prisma
+
+from app.services.grade_book import invalidate_grade_books
+
+
+RANK_SQL = """
+UPDATE "averages" a
+SET "rang" = r."rang",
+    "rang_specialite" = r."rang_specialite",
+    "rang_niveau" = r."rang_niveau",
+    "rang_groupe" = r."rang_groupe",
+    "rang_obsolete" = false
+FROM (
+    SELECT ga."id",
+           rank() OVER (ORDER BY ga."moyenne_generale" DESC NULLS LAST) AS "rang",
+           rank() OVER (PARTITION BY e."id_specialite" ORDER BY ga."moyenne_generale" DESC NULLS LAST) AS "rang_specialite",
+           CASE WHEN e."id_niveau" IS NOT NULL THEN
+               rank() OVER (PARTITION BY e."id_niveau" ORDER BY ga."moyenne_generale" DESC NULLS LAST)
+           END AS "rang_niveau",
+           CASE WHEN e."id_groupe" IS NOT NULL THEN
+               rank() OVER (PARTITION BY e."id_groupe" ORDER BY ga."moyenne_generale" DESC NULLS LAST)
+           END AS "rang_groupe"
+    FROM "averages" ga
+    JOIN "Student" e ON e."id" = ga."id_etudiant"
+    JOIN "Specialty" sp ON sp."id" = e."id_specialite"
+    WHERE ga."id_matiere" IS NULL
+      AND ga."semestre" = $1::"SemesterType"
+      AND ga."annee_scolaire" = $2
+      AND sp."id_departement" = $3
+) r
+WHERE a."id" = r."id"
+  AND (a."rang_obsolete"
+       OR a."rang" IS DISTINCT FROM r."rang"
+       OR a."rang_specialite" IS DISTINCT FROM r."rang_specialite"
+       OR a."rang_niveau" IS DISTINCT FROM r."rang_niveau"
+       OR a."rang_groupe" IS DISTINCT FROM r."rang_groupe")
+RETURNING a."id_etudiant"
+"""
+
+
+def cohort_where(semestre, annee_scolaire: str, department_id: str) -> Dict:
+    """General averages ranked together"""
+    return {
+        "id_matiere": None,
+        "semestre": semestre,
+        "annee_scolaire": annee_scolaire,
+        "etudiant": {
+            "specialite": {
+                "id_departement": department_id
+            }
+        }
+    }
+
+
+async def calculate_ranks(prisma: Prisma, semestre, annee_scolaire: str, department_id: str) -> int:
+    """Rank the department's general averages; returns the number of rows whose ranks changed"""
+    semestre = getattr(semestre, "value", semestre)
+    rows = await prisma.query_raw(RANK_SQL, semestre, annee_scolaire, department_id)
+    await invalidate_grade_books(prisma, [row["id_etudiant"] for row in rows], semestre, annee_scolaire)
+    return len(rows)
+
+
+async def refresh_stale_ranks(prisma: Prisma, semestre, annee_scolaire: str, department_id: str):
+    """
+    Re-rank the cohort if a grade write changed one of its averages
+
+    Grade writes keep averages current but only flag ranks (rang_obsolete),
+    so ranking runs once per read after changes instead of once per grade.
+    """
+    stale = await prisma.moyenne.count(
+        where={**cohort_where(semestre, annee_scolaire, department_id), "rang_obsolete": True}
+    )
+    if stale:
+        await calculate_ranks(prisma, semestre, annee_scolaire, department_id)
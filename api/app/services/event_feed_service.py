@@ -0,0 +1,371 @@
+"""
+Event Feed Service
+
+Builds the events page in a fixed number of queries, whatever the number
+of events, comments or reactions:
+
+1. Events + creators (one find_many with include)
+2. Latest N comments per event (one window-function query)
+3. Current user's reactions (one find_many)
+
+Reaction counts per type are read from event_reaction_counts, loaded with
+the events. Comment and reaction totals come from the counter columns
+(nb_commentaires / nb_reactions). All counters are updated inside the
+write transaction, so reacting costs the same on a popular event.
+"""
+
+from typing import Dict, List, Optional
+from datetime import datetime
+from prisma import Prisma
+
+
+# Latest comments embedded per event in the feed
+DEFAULT_FEED_COMMENTS = 3
+
+FEED_INCLUDE = {"creator": True, "reactionCounts": True}
+
+LATEST_COMMENTS_SQL = """
+SELECT c."id", c."id_evenement", c."contenu", c."createdAt",
+       u."id" AS "user_id", u."nom", u."prenom", u."role"::text AS "role"
+FROM (
+    SELECT ec.*,
+           ROW_NUMBER() OVER (
+               PARTITION BY ec."id_evenement" ORDER BY ec."createdAt" DESC
+           ) AS rn
+    FROM "event_comments" ec
+    WHERE ec."id_evenement" = ANY($1)
+) c
+JOIN "User" u ON u."id" = c."id_utilisateur"
+WHERE c.rn <= $2
+ORDER BY c."id_evenement", c."createdAt" DESC
+"""
+
+
+def format_user_info(user) -> dict:
+    """Format user data for API response"""
+    return {
+        "id": user.id,
+        "nom": user.nom,
+        "prenom": user.prenom,
+        "role": user.role
+    }
+
+
+def _iso(value) -> Optional[str]:
+    """Raw query rows may carry datetimes as strings"""
+    if value is None:
+        return None
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+class EventFeedService:
+    """Constant-query loader for event payloads"""
+
+    def __init__(self, prisma: Prisma):
+        self.prisma = prisma
+
+    async def get_feed(
+        self,
+        current_user_id: str,
+        type: Optional[str] = None,
+        upcoming: Optional[bool] = None,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        comments_limit: Optional[int] = DEFAULT_FEED_COMMENTS
+    ) -> Dict:
+        """
+        Get one page of the feed, newest events first
+
+        The cursor is the id of the last event of the previous page.
+        """
+        where_clause = {}
+        if type:
+            where_clause["type"] = type
+        if upcoming:
+            where_clause["date"] = {"gte": datetime.now()}
+
+        query = {
+            "where": where_clause,
+            "take": limit + 1,
+            "order": [{"date": "desc"}, {"id": "desc"}],
+            "include": FEED_INCLUDE
+        }
+        if cursor:
+            query["cursor"] = {"id": cursor}
+            query["skip"] = 1
+
+        events = await self.prisma.evenement.find_many(**query)
+
+        has_more = len(events) > limit
+        events = events[:limit]
+
+        return {
+            "items": await self.build_payloads(events, current_user_id, comments_limit),
+            "nextCursor": events[-1].id if has_more and events else None,
+            "hasMore": has_more
+        }
+
+    async def get_event(
+        self,
+        event_id: str,
+        current_user_id: str,
+        comments_limit: Optional[int] = None
+    ) -> Optional[Dict]:
+        """Get a single event payload (all comments by default)"""
+        event = await self.prisma.evenement.find_unique(
+            where={"id": event_id},
+            include=FEED_INCLUDE
+        )
+        if not event:
+            return None
+
+        payloads = await self.build_payloads([event], current_user_id, comments_limit)
+        return payloads[0]
+
+    async def build_payloads(
+        self,
+        events: List,
+        current_user_id: str,
+        comments_limit: Optional[int] = DEFAULT_FEED_COMMENTS
+    ) -> List[Dict]:
+        """
+        Attach comments and reactions to already-loaded events
+
+        Events should be loaded with FEED_INCLUDE; missing creators or
+        reaction counters are fetched in one extra query each.
+        """
+        if not events:
+            return []
+
+        event_ids = [e.id for e in events]
+
+        creators = await self._load_missing_creators(events)
+        comments_by_event = await self._load_comments(event_ids, comments_limit)
+        counts_by_event = await self._load_reaction_counts(events)
+
+        user_reactions = await self.prisma.eventreaction.find_many(
+            where={
+                "id_utilisateur": current_user_id,
+                "id_evenement": {"in": event_ids}
+            }
+        )
+        user_reaction_by_event = {r.id_evenement: r.type for r in user_reactions}
+
+        result = []
+        for event in events:
+            creator = getattr(event, "creator", None) or creators.get(event.id_createur)
+            result.append({
+                "id": event.id,
+                "titre": event.titre,
+                "type": event.type,
+                "description": event.description,
+                "date": event.date.isoformat() if event.date else None,
+                "lieu": event.lieu,
+                "createdAt": event.createdAt.isoformat(),
+                "updatedAt": event.updatedAt.isoformat(),
+                "creator": format_user_info(creator) if creator else None,
+                "comments": comments_by_event.get(event.id, []),
+                "reactions": {
+                    "counts": counts_by_event.get(event.id, {}),
+                    "total": event.nb_reactions,
+                    "userReaction": user_reaction_by_event.get(event.id)
+                },
+                "stats": {
+                    "commentsCount": event.nb_commentaires,
+                    "reactionsCount": event.nb_reactions
+                }
+            })
+
+        return result
+
+    async def _load_missing_creators(self, events: List) -> Dict:
+        """Fetch creators for events loaded without the include"""
+        missing_ids = {
+            e.id_createur for e in events
+            if getattr(e, "creator", None) is None
+        }
+        if not missing_ids:
+            return {}
+
+        users = await self.prisma.utilisateur.find_many(
+            where={"id": {"in": list(missing_ids)}}
+        )
+        return {u.id: u for u in users}
+
+    async def _load_comments(
+        self,
+        event_ids: List[str],
+        comments_limit: Optional[int]
+    ) -> Dict[str, List[Dict]]:
+        """Latest comments per event, newest first"""
+        comments_by_event: Dict[str, List[Dict]] = {}
+
+        if comments_limit is None:
+            comments = await self.prisma.eventcomment.find_many(
+                where={"id_evenement": {"in": event_ids}},
+                include={"utilisateur": True},
+                order={"createdAt": "desc"}
+            )
+            for c in comments:
+                comments_by_event.setdefault(c.id_evenement, []).append({
+                    "id": c.id,
+                    "contenu": c.contenu,
+                    "createdAt": c.createdAt.isoformat(),
+                    "user": format_user_info(c.utilisateur)
+                })
+            return comments_by_event
+
+        if comments_limit <= 0:
+            return comments_by_event
+
+        rows = await self.prisma.query_raw(LATEST_COMMENTS_SQL, event_ids, comments_limit)
+        for row in rows:
+            comments_by_event.setdefault(row["id_evenement"], []).append({
+                "id": row["id"],
+                "contenu": row["contenu"],
+                "createdAt": _iso(row["createdAt"]),
+                "user": {
+                    "id": row["user_id"],
+                    "nom": row["nom"],
+                    "prenom": row["prenom"],
+                    "role": row["role"]
+                }
+            })
+        return comments_by_event
+
+    async def _load_reaction_counts(self, events: List) -> Dict[str, Dict[str, int]]:
+        """Reaction counts per event and type from the counters table"""
+        counters = []
+        missing_ids = []
+        for e in events:
+            if getattr(e, "reactionCounts", None) is None:
+                missing_ids.append(e.id)
+            else:
+                counters.extend(e.reactionCounts)
+
+        if missing_ids:
+            counters.extend(await self.prisma.eventreactioncount.find_many(
+                where={"id_evenement": {"in": missing_ids}}
+            ))
+
+        counts_by_event: Dict[str, Dict[str, int]] = {}
+        for c in counters:
+            if c.total > 0:
+                counts_by_event.setdefault(c.id_evenement, {})[c.type] = c.total
+        return counts_by_event
+
+    async def get_reaction_counts(self, event_id: str) -> Dict[str, int]:
+        """Current counts for one event (one row per reaction type)"""
+        counters = await self.prisma.eventreactioncount.find_many(
+            where={"id_evenement": event_id}
+        )
+        return {c.type: c.total for c in counters if c.total > 0}
+
+    async def add_comment(self, event_id: str, user_id: str, contenu: str):
+        """Create a comment and bump the event's comment counter"""
+        async with self.prisma.tx() as tx:
+            comment = await tx.eventcomment.create(
+                data={
+                    "id_evenement": event_id,
+                    "id_utilisateur": user_id,
+                    "contenu": contenu
+                },
+                include={"utilisateur": True}
+            )
+            await tx.evenement.update(
+                where={"id": event_id},
+                data={"nb_commentaires": {"increment": 1}}
+            )
+        return comment
+
+    async def delete_comment(self, comment):
+        """Delete a comment and decrement the event's comment counter"""
+        async with self.prisma.tx() as tx:
+            await tx.eventcomment.delete(where={"id": comment.id})
+            await tx.evenement.update(
+                where={"id": comment.id_evenement},
+                data={"nb_commentaires": {"decrement": 1}}
+            )
+
+    async def set_reaction(self, event_id: str, user_id: str, reaction_type: str):
+        """
+        Add or change the user's reaction
+
+        A new reaction bumps the event total and its type counter; a changed
+        reaction moves one unit from the old type counter to the new one.
+        """
+        async with self.prisma.tx() as tx:
+            existing = await tx.eventreaction.find_unique(
+                where={
+                    "id_evenement_id_utilisateur": {
+                        "id_evenement": event_id,
+                        "id_utilisateur": user_id
+                    }
+                }
+            )
+
+            if existing:
+                if existing.type == reaction_type:
+                    return existing
+                reaction = await tx.eventreaction.update(
+                    where={"id": existing.id},
+                    data={"type": reaction_type}
+                )
+                await _decrement_counter(tx, event_id, existing.type)
+            else:
+                reaction = await tx.eventreaction.create(
+                    data={
+                        "id_evenement": event_id,
+                        "id_utilisateur": user_id,
+                        "type": reaction_type
+                    }
+                )
+                await tx.evenement.update(
+                    where={"id": event_id},
+                    data={"nb_reactions": {"increment": 1}}
+                )
+
+            await _increment_counter(tx, event_id, reaction_type)
+        return reaction
+
+    async def remove_reaction(self, reaction):
+        """Delete a reaction and decrement the event's counters"""
+        async with self.prisma.tx() as tx:
+            await tx.eventreaction.delete(where={"id": reaction.id})
+            await tx.evenement.update(
+                where={"id": reaction.id_evenement},
+                data={"nb_reactions": {"decrement": 1}}
+            )
+            await _decrement_counter(tx, reaction.id_evenement, reaction.type)
+
+
+async def _increment_counter(tx, event_id: str, reaction_type: str):
+    """Atomic +1 on the (event, type) counter, creating it on first use"""
+    await tx.eventreactioncount.upsert(
+        where={
+            "id_evenement_type": {
+                "id_evenement": event_id,
+                "type": reaction_type
+            }
+        },
+        data={
+            "create": {
+                "id_evenement": event_id,
+                "type": reaction_type,
+                "total": 1
+            },
+            "update": {"total": {"increment": 1}}
+        }
+    )
+
+
+async def _decrement_counter(tx, event_id: str, reaction_type: str):
+    """Atomic -1 on the (event, type) counter"""
+    await tx.eventreactioncount.update_many(
+        where={
+            "id_evenement": event_id,
+            "type": reaction_type,
+            "total": {"gt": 0}
+        },
+        data={"total": {"decrement": 1}}
+    )
@@ -0,0 +1,235 @@
+"""
+Grade Analytics
+
+Distribution statistics of a department's grades: histogram, percentiles,
+mean and spread overall and per subject, teacher and group, and a
+year-over-year comparison.
+
+Grades are never loaded one by one. The database returns one row per
+(school year, subject, teacher, group, grade value) with the number of
+grades having that value; grades are on a 0-20 scale with two decimals,
+so this stays a few thousand rows whatever the number of grades. All
+statistics are then computed with vectorized NumPy over compact arrays
+(values, counts and integer codes per dimension), weighting each value by
+its count, and are exact.
+"""
+
+from typing import Dict, List, Optional, Sequence
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import numpy as np
+from prisma import Prisma
+
+from app.services.averages_summary import HISTOGRAM_EDGES, PASSING_AVERAGE
+
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+# Lower bound of each grade band of the overview, best first
+GRADE_BANDS = [("excellent", 16.0), ("good", 14.0), ("average", 10.0), ("poor", float("-inf"))]
+
+DIMENSIONS = ("subject", "teacher", "group", "year")
+
+GRADE_DISTRIBUTION_SQL = """
+SELECT n."annee_scolaire" AS "year",
+       n."id_matiere" AS "subject_id",
+       m."nom" AS "subject_name",
+       n."id_enseignant" AS "teacher_id",
+       COALESCE(tu."prenom", t."prenom") || ' ' || COALESCE(tu."nom", t."nom") AS "teacher_name",
+       e."id_groupe" AS "group_id",
+       COALESCE(g."nom", 'N/A') AS "group_name",
+       n."valeur" AS "value",
+       COUNT(*)::int AS "count"
+FROM "grades" n
+JOIN "Student" e ON e."id" = n."id_etudiant"
+JOIN "Specialty" sp ON sp."id" = e."id_specialite"
+JOIN "Subject" m ON m."id" = n."id_matiere"
+JOIN "Teacher" t ON t."id" = n."id_enseignant"
+LEFT JOIN "User" tu ON tu."enseignant_id" = t."id"
+LEFT JOIN "Group" g ON g."id" = e."id_groupe"
+WHERE sp."id_departement" = $1
+  AND ($2::timestamp IS NULL OR n."createdAt" >= $2::timestamp)
+  AND ($3::timestamp IS NULL OR n."createdAt" <= $3::timestamp)
+  AND ($4::text IS NULL OR n."annee_scolaire" = $4)
+GROUP BY n."annee_scolaire", n."id_matiere", m."nom", n."id_enseignant", t."id", tu."id",
+         e."id_groupe", g."nom", n."valeur"
+"""
+
+
+def _utc(moment: Optional[datetime]) -> Optional[str]:
+    """Bound for the timestamp columns, which hold naive UTC"""
+    if moment is None:
+        return None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.isoformat()
+
+
+def weighted_percentiles(values: np.ndarray, counts: np.ndarray, percentiles: Sequence[float]) -> np.ndarray:
+    """
+    Percentiles of values repeated counts times
+
+    Same result as np.percentile (linear interpolation) on the repeated
+    values, without materializing them. values must be sorted and unique.
+    """
+    cumulative = np.cumsum(counts)
+    positions = (cumulative[-1] - 1) * np.asarray(percentiles, dtype=np.float64) / 100
+    lower = np.floor(positions)
+    # Value at sorted position k: the first value whose cumulative count exceeds k
+    below = values[np.searchsorted(cumulative, lower, side="right")]
+    above = values[np.searchsorted(cumulative, np.minimum(lower + 1, cumulative[-1] - 1), side="right")]
+    return below + (above - below) * (positions - lower)
+
+
+def _describe(values: np.ndarray, counts: np.ndarray) -> Dict:
+    """Count, mean, spread and pass rate of a set of weighted values"""
+    total = int(counts.sum())
+    if not total:
+        return {"count": 0, "mean": None, "std": None, "min": None, "max": None, "pass_rate": None}
+    mean = float(np.average(values, weights=counts))
+    variance = float(np.average((values - mean) ** 2, weights=counts))
+    present = values[counts > 0]
+    return {
+        "count": total,
+        "mean": round(mean, 2),
+        "std": round(variance ** 0.5, 2),
+        "min": float(present.min()),
+        "max": float(present.max()),
+        "pass_rate": round(float(counts[values >= PASSING_AVERAGE].sum()) / total * 100, 2)
+    }
+
+
+@dataclass
+class GradeDistribution:
+    """Grade counts per (year, subject, teacher, group, value), as parallel arrays"""
+    values: np.ndarray
+    counts: np.ndarray
+    # Integer code of each row per dimension, and the (id, name) of each code
+    codes: Dict[str, np.ndarray]
+    labels: Dict[str, List[Dict]]
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict]) -> "GradeDistribution":
+        codes, labels = {}, {}
+        for dimension in DIMENSIONS:
+            key = "year" if dimension == "year" else f"{dimension}_id"
+            ids, inverse = np.unique(np.array([row[key] or "" for row in rows], dtype=object), return_inverse=True)
+            codes[dimension] = inverse.astype(np.int32)
+            names = {row[key] or "": row.get(f"{dimension}_name", row[key]) for row in rows}
+            labels[dimension] = [{"id": i or None, "name": names[i]} for i in ids]
+        return cls(
+            values=np.array([row["value"] for row in rows], dtype=np.float64),
+            counts=np.array([row["count"] for row in rows], dtype=np.int64),
+            codes=codes,
+            labels=labels
+        )
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+    def summary(self) -> Dict:
+        """Whole-distribution statistics, with the overview's grade bands"""
+        statistics = {
+            "average_grade": 0,
+            "total_grades": self.total,
+            "median": None,
+            "standard_deviation": None,
+            "pass_rate": None,
+            "percentiles": {f"p{p}": None for p in PERCENTILES}
+        }
+
+        histogram, _ = np.histogram(self.values, bins=HISTOGRAM_EDGES, weights=self.counts)
+        statistics["histogram"] = [
+            {"min": int(low), "max": int(high), "count": int(count)}
+            for low, high, count in zip(HISTOGRAM_EDGES[:-1], HISTOGRAM_EDGES[1:], histogram)
+        ]
+
+        upper = np.inf
+        for band, bound in GRADE_BANDS:
+            statistics[band] = int(self.counts[(self.values >= bound) & (self.values < upper)].sum())
+            upper = bound
+
+        if not self.total:
+            return statistics
+
+        # Collapse to one count per distinct value for the percentiles
+        unique, inverse = np.unique(self.values, return_inverse=True)
+        unique_counts = np.bincount(inverse, weights=self.counts)
+        percentiles = weighted_percentiles(unique, unique_counts, PERCENTILES)
+
+        described = _describe(self.values, self.counts)
+        statistics.update({
+            "average_grade": described["mean"],
+            "median": round(float(percentiles[PERCENTILES.index(50)]), 2),
+            "standard_deviation": described["std"],
+            "pass_rate": described["pass_rate"],
+            "lowest_grade": described["min"],
+            "highest_grade": described["max"],
+            "percentiles": {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, percentiles)}
+        })
+        return statistics
+
+    def by(self, dimension: str) -> List[Dict]:
+        """Count, mean, standard deviation and pass rate per subject, teacher, group or year"""
+        codes = self.codes[dimension]
+        size = len(self.labels[dimension])
+        weights = self.counts.astype(np.float64)
+
+        counts = np.bincount(codes, weights=weights, minlength=size)
+        sums = np.bincount(codes, weights=weights * self.values, minlength=size)
+        squares = np.bincount(codes, weights=weights * self.values ** 2, minlength=size)
+        passed = np.bincount(codes, weights=weights * (self.values >= PASSING_AVERAGE), minlength=size)
+
+        lowest = np.full(size, np.inf)
+        highest = np.full(size, -np.inf)
+        np.minimum.at(lowest, codes, self.values)
+        np.maximum.at(highest, codes, self.values)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+            stds = np.sqrt(np.maximum(squares / counts - means ** 2, 0))
+
+        groups = [
+            {
+                **self.labels[dimension][code],
+                "count": int(counts[code]),
+                "mean": round(float(means[code]), 2),
+                "std": round(float(stds[code]), 2),
+                "min": float(lowest[code]),
+                "max": float(highest[code]),
+                "pass_rate": round(float(passed[code] / counts[code]) * 100, 2)
+            }
+            for code in range(size) if counts[code]
+        ]
+        groups.sort(key=lambda g: g["mean"], reverse=True)
+        return groups
+
+    def year_over_year(self) -> List[Dict]:
+        """Statistics per school year, oldest first, with the change from the previous year"""
+        years = sorted(self.by("year"), key=lambda y: y["id"] or "")
+        previous = None
+        for year in years:
+            year["mean_change"] = round(year["mean"] - previous["mean"], 2) if previous else None
+            year["pass_rate_change"] = round(year["pass_rate"] - previous["pass_rate"], 2) if previous else None
+            year["count_change"] = year["count"] - previous["count"] if previous else None
+            previous = year
+        return years
+
+
+class GradeAnalyticsService:
+    def __init__(self, prisma: Prisma):
+        self.prisma = prisma
+
+    async def load(
+        self,
+        department_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        annee_scolaire: Optional[str] = None
+    ) -> GradeDistribution:
+        """Grades of the department created between start and end (one grouped query)"""
+        rows = await self.prisma.query_raw(
+            GRADE_DISTRIBUTION_SQL, department_id, _utc(start), _utc(end), annee_scolaire
+        )
+        return GradeDistribution.from_rows(rows)
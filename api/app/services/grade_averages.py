@@ -0,0 +1,177 @@
+"""
+Incremental Average Maintenance
+
+Every Moyenne row keeps the running sums its average is computed from:
+a subject average stores sum(valeur * coefficient) and sum(coefficient)
+over the student's grades, and a general average (id_matiere null) stores
+the same sums over the subject averages weighted by the subject
+coefficient. A grade write therefore only applies a delta: one upsert of
+the (student, subject, semester, year) subject average, then one update
+of that student's general average with the change of the rounded subject
+average. Nothing else is read or recomputed, whatever the size of the
+cohort.
+
+Ranks depend on the whole cohort, so a write only flags the student's
+general average (rang_obsolete); ranks are recomputed when they are next
+read. calculate_averages still recomputes everything from the grades and
+resets the sums. The written students' cached grade pages (grade_book) are
+dropped, even when no sum changed (e.g. only an observation was edited).
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+from dataclasses import dataclass
+from uuid import uuid4
+from prisma import Prisma
+
+from app.services.grade_book import invalidate_grade_books
+
+
+# Coefficient sums below 1e-9 are treated as empty (float residue of deltas)
+SUBJECT_AVERAGE_SQL = """
+WITH "previous" AS (
+    SELECT "moyenne_matiere" FROM "averages"
+    WHERE "id_etudiant" = $2 AND "id_matiere" = $3
+      AND "semestre" = $4::"SemesterType" AND "annee_scolaire" = $5
+)
+INSERT INTO "averages" ("id", "id_etudiant", "id_matiere", "semestre", "annee_scolaire",
+                        "somme_ponderee", "somme_coefficients", "moyenne_matiere", "updatedAt")
+VALUES ($1, $2, $3, $4::"SemesterType", $5, $6::float8, $7::float8,
+        CASE WHEN $7::float8 > 1e-9 THEN round(($6::float8 / $7::float8)::numeric, 2)::float8 END,
+        now())
+ON CONFLICT ("id_etudiant", "id_matiere", "semestre", "annee_scolaire") DO UPDATE
+SET "somme_ponderee" = "averages"."somme_ponderee" + EXCLUDED."somme_ponderee",
+    "somme_coefficients" = "averages"."somme_coefficients" + EXCLUDED."somme_coefficients",
+    "moyenne_matiere" = CASE
+        WHEN "averages"."somme_coefficients" + EXCLUDED."somme_coefficients" > 1e-9
+        THEN round((("averages"."somme_ponderee" + EXCLUDED."somme_ponderee")
+                    / ("averages"."somme_coefficients" + EXCLUDED."somme_coefficients"))::numeric, 2)::float8
+    END,
+    "updatedAt" = now()
+RETURNING (SELECT "moyenne_matiere" FROM "previous") AS "previous", "moyenne_matiere" AS "current"
+"""
+
+# The general average has a null subject: it is covered by the partial unique
+# index averages_general_key (migration add_general_average_unique_index),
+# so concurrent first writes for a student meet on one row
+GENERAL_AVERAGE_SQL = """
+INSERT INTO "averages" ("id", "id_etudiant", "id_matiere", "semestre", "annee_scolaire",
+                        "somme_ponderee", "somme_coefficients", "moyenne_generale",
+                        "rang_obsolete", "updatedAt")
+VALUES ($1, $2, NULL, $3::"SemesterType", $4, $5::float8, $6::float8,
+        CASE WHEN $6::float8 > 1e-9 THEN round(($5::float8 / $6::float8)::numeric, 2)::float8 END,
+        true, now())
+ON CONFLICT ("id_etudiant", "semestre", "annee_scolaire") WHERE "id_matiere" IS NULL DO UPDATE
+SET "somme_ponderee" = "averages"."somme_ponderee" + EXCLUDED."somme_ponderee",
+    "somme_coefficients" = "averages"."somme_coefficients" + EXCLUDED."somme_coefficients",
+    "moyenne_generale" = CASE
+        WHEN "averages"."somme_coefficients" + EXCLUDED."somme_coefficients" > 1e-9
+        THEN round((("averages"."somme_ponderee" + EXCLUDED."somme_ponderee")
+                    / ("averages"."somme_coefficients" + EXCLUDED."somme_coefficients"))::numeric, 2)::float8
+    END,
+    "rang_obsolete" = true,
+    "updatedAt" = now()
+"""
+
+
+def _value(field) -> str:
+    """Enum fields of Prisma models and request bodies as their database value"""
+    return getattr(field, "value", field)
+
+
+def _field(grade, name: str):
+    """Grades are Note models, or the dicts given to create_many"""
+    return grade[name] if isinstance(grade, dict) else getattr(grade, name)
+
+
+@dataclass(frozen=True)
+class AverageKey:
+    id_etudiant: str
+    id_matiere: str
+    semestre: str
+    annee_scolaire: str
+
+    @classmethod
+    def of(cls, grade) -> "AverageKey":
+        return cls(*(_value(_field(grade, name)) for name in ("id_etudiant", "id_matiere", "semestre", "annee_scolaire")))
+
+
+def grade_deltas(before: Iterable = (), after: Iterable = ()) -> Dict[AverageKey, Tuple[float, float]]:
+    """
+    Change of (weighted sum, coefficient sum) per subject average
+
+    before are grades as they were (deleted, or before an update), after
+    the grades as written. Keys whose sums do not change are dropped.
+    """
+    deltas: Dict[AverageKey, List[float]] = {}
+    for sign, grades in ((-1, before), (1, after)):
+        for grade in grades:
+            delta = deltas.setdefault(AverageKey.of(grade), [0.0, 0.0])
+            delta[0] += sign * _field(grade, "valeur") * _field(grade, "coefficient")
+            delta[1] += sign * _field(grade, "coefficient")
+    return {key: (w, c) for key, (w, c) in deltas.items() if w or c}
+
+
+def general_delta(previous: Optional[float], current: Optional[float], coefficient: float) -> Tuple[float, float]:
+    """Change of the general average sums when a subject average moves"""
+    return (
+        coefficient * ((current or 0.0) - (previous or 0.0)),
+        coefficient * float((current is not None) - (previous is not None))
+    )
+
+
+class AverageMaintainer:
+    def __init__(self, prisma: Prisma):
+        self.prisma = prisma
+
+    async def grades_changed(self, before: Iterable = (), after: Iterable = (), tx: Optional[Prisma] = None) -> int:
+        """
+        Apply grade writes to the averages they belong to
+
+        Call with the removed or previous grades in before and the created or
+        updated grades in after. Returns the number of subject averages
+        touched; their students' general averages are updated and flagged
+        for re-ranking in the same transaction.
+
+        Pass the transaction of the grade write as tx so the grades and
+        their averages are committed (or rolled back) together; without it
+        the averages are updated in a transaction of their own.
+        """
+        if tx is None:
+            async with self.prisma.tx() as tx:
+                return await self.grades_changed(before, after, tx=tx)
+
+        before, after = list(before), list(after)
+        deltas = grade_deltas(before, after)
+        if deltas:
+            await self._apply(tx, deltas)
+
+        periods: Dict[Tuple[str, str], set] = {}
+        for grade in before + after:
+            key = AverageKey.of(grade)
+            periods.setdefault((key.semestre, key.annee_scolaire), set()).add(key.id_etudiant)
+        for (semestre, annee_scolaire), student_ids in periods.items():
+            await invalidate_grade_books(tx, student_ids, semestre, annee_scolaire)
+        return len(deltas)
+
+    @staticmethod
+    async def _apply(tx: Prisma, deltas: Dict[AverageKey, Tuple[float, float]]):
+        subjects = await tx.matiere.find_many(
+            where={"id": {"in": list({key.id_matiere for key in deltas})}}
+        )
+        coefficients = {s.id: s.coefficient for s in subjects}
+
+        for key, (weighted, weight) in deltas.items():
+            rows = await tx.query_raw(
+                SUBJECT_AVERAGE_SQL,
+                uuid4().hex, key.id_etudiant, key.id_matiere, key.semestre, key.annee_scolaire,
+                weighted, weight
+            )
+            general = general_delta(
+                rows[0]["previous"], rows[0]["current"], coefficients.get(key.id_matiere, 1.0)
+            )
+            if general == (0.0, 0.0):
+                continue
+            await tx.execute_raw(
+                GENERAL_AVERAGE_SQL,
+                uuid4().hex, key.id_etudiant, key.semestre, key.annee_scolaire, *general
+            )
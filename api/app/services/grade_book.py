@@ -0,0 +1,207 @@
+"""
+Student Grade Book
+
+Everything the student grades page shows for one semester (the student,
+each subject with its grades and average, and the general average with the
+rank) is read with one joined query and assembled in a single pass keyed
+by subject. The assembled page is stored in the grade_book_cache table, so
+a repeated visit reads one cache row.
+
+Every code path that writes grades, averages or ranks must call
+invalidate_grade_books() with the affected students: AverageMaintainer does
+it for all grade writes, cohort_ranking for the students whose rank
+changed and validate_averages for the students it validates. A page whose
+rank is stale (rang_obsolete) is never cached; it is rebuilt after the
+cohort is re-ranked.
+"""
+
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from prisma import Prisma, Json
+
+
+# Safety net: a row older than this is rebuilt even without invalidation
+CACHE_TTL = timedelta(hours=6)
+
+GRADE_BOOK_SQL = """
+SELECT e."id" AS "student_id",
+       e."nom", e."prenom", e."email",
+       COALESCE(g."nom", 'N/A') AS "groupe",
+       COALESCE(l."nom", 'N/A') AS "niveau",
+       sp."nom" AS "specialite",
+       sp."id_departement",
+       ga."moyenne_generale",
+       ga."rang",
+       ga."rang_specialite",
+       ga."rang_niveau",
+       ga."rang_groupe",
+       COALESCE(ga."validee", false) AS "general_validee",
+       COALESCE(ga."rang_obsolete", false) AS "rang_obsolete",
+       m."id" AS "matiere_id",
+       m."nom" AS "matiere_nom",
+       m."coefficient" AS "matiere_coefficient",
+       sa."moyenne_matiere",
+       COALESCE(sa."validee", false) AS "matiere_validee",
+       n."id" AS "grade_id",
+       n."valeur",
+       n."type"::text AS "type",
+       n."coefficient",
+       to_char(n."date_examen", 'YYYY-MM-DD"T"HH24:MI:SS"+00:00"') AS "date_examen",
+       n."observation",
+       COALESCE(tu."prenom", t."prenom") || ' ' || COALESCE(tu."nom", t."nom") AS "enseignant"
+FROM "Student" e
+JOIN "Specialty" sp ON sp."id" = e."id_specialite"
+LEFT JOIN "Group" g ON g."id" = e."id_groupe"
+LEFT JOIN "Level" l ON l."id" = e."id_niveau"
+LEFT JOIN "averages" ga ON ga."id_etudiant" = e."id"
+     AND ga."id_matiere" IS NULL
+     AND ga."semestre" = $2::"SemesterType"
+     AND ga."annee_scolaire" = $3
+LEFT JOIN ("grades" n JOIN "Subject" m ON m."id" = n."id_matiere")
+     ON n."id_etudiant" = e."id"
+     AND m."id_specialite" = e."id_specialite"
+     AND n."semestre" = $2::"SemesterType"
+     AND n."annee_scolaire" = $3
+LEFT JOIN "averages" sa ON sa."id_etudiant" = e."id"
+     AND sa."id_matiere" = n."id_matiere"
+     AND sa."semestre" = $2::"SemesterType"
+     AND sa."annee_scolaire" = $3
+LEFT JOIN "Teacher" t ON t."id" = n."id_enseignant"
+LEFT JOIN "User" tu ON tu."enseignant_id" = t."id"
+WHERE e."email" = $1
+ORDER BY m."nom", m."id", n."date_examen" NULLS LAST, n."createdAt", n."id"
+"""
+
+
+def assemble(rows: List[Dict], semestre: str, annee_scolaire: str) -> Tuple[Dict, bool]:
+    """
+    Flat (student, grade) rows to the grade book page
+
+    Returns the page and whether its rank is stale. Subjects without grades
+    are left out.
+    """
+    first = rows[0]
+    subjects: Dict[str, Dict] = {}
+    for row in rows:
+        if row["grade_id"] is None:
+            continue
+        subject = subjects.get(row["matiere_id"])
+        if subject is None:
+            subject = subjects[row["matiere_id"]] = {
+                "matiere_id": row["matiere_id"],
+                "matiere_nom": row["matiere_nom"],
+                "coefficient": row["matiere_coefficient"],
+                "moyenne": row["moyenne_matiere"],
+                "validee": row["matiere_validee"],
+                "grades": []
+            }
+        subject["grades"].append({
+            "id": row["grade_id"],
+            "valeur": row["valeur"],
+            "type": row["type"],
+            "coefficient": row["coefficient"],
+            "date_examen": row["date_examen"],
+            "enseignant": row["enseignant"],
+            "observation": row["observation"]
+        })
+
+    page = {
+        "student": {
+            "id": first["student_id"],
+            "nom": first["nom"],
+            "prenom": first["prenom"],
+            "email": first["email"],
+            "groupe": first["groupe"],
+            "niveau": first["niveau"],
+            "specialite": first["specialite"]
+        },
+        "moyenne_generale": first["moyenne_generale"],
+        "rang": first["rang"],
+        "rang_specialite": first["rang_specialite"],
+        "rang_niveau": first["rang_niveau"],
+        "rang_groupe": first["rang_groupe"],
+        "validee": first["general_validee"],
+        "subjects": list(subjects.values()),
+        "semestre": semestre,
+        "annee_scolaire": annee_scolaire
+    }
+    return page, first["rang_obsolete"]
+
+
+class StudentGradeBook:
+    """Read-through cache of per-student, per-semester grade pages"""
+
+    def __init__(self, prisma: Prisma):
+        self.prisma = prisma
+
+    async def get(
+        self,
+        email: str,
+        semestre: str,
+        annee_scolaire: str,
+        refresh_ranks: Callable[[str], Awaitable[None]]
+    ) -> Optional[Dict]:
+        """
+        Grade page of the student with this email (None if there is none)
+
+        refresh_ranks(department_id) is awaited when the student's rank is
+        stale, before the page is rebuilt and cached.
+        """
+        cached = await self.prisma.gradebookcache.find_first(
+            where={
+                "etudiant": {"is": {"email": email}},
+                "semestre": semestre,
+                "annee_scolaire": annee_scolaire
+            }
+        )
+        if cached and datetime.now(timezone.utc) - cached.updatedAt < CACHE_TTL:
+            return cached.payload
+
+        rows = await self.prisma.query_raw(GRADE_BOOK_SQL, email, semestre, annee_scolaire)
+        if not rows:
+            return None
+        page, rank_stale = assemble(rows, semestre, annee_scolaire)
+        if rank_stale:
+            await refresh_ranks(rows[0]["id_departement"])
+            rows = await self.prisma.query_raw(GRADE_BOOK_SQL, email, semestre, annee_scolaire)
+            page, rank_stale = assemble(rows, semestre, annee_scolaire)
+            if rank_stale:
+                return page
+
+        await self.prisma.gradebookcache.upsert(
+            where={
+                "id_etudiant_semestre_annee_scolaire": {
+                    "id_etudiant": page["student"]["id"],
+                    "semestre": semestre,
+                    "annee_scolaire": annee_scolaire
+                }
+            },
+            data={
+                "create": {
+                    "id_etudiant": page["student"]["id"],
+                    "semestre": semestre,
+                    "annee_scolaire": annee_scolaire,
+                    "payload": Json(page)
+                },
+                "update": {"payload": Json(page)}
+            }
+        )
+        return page
+
+
+async def invalidate_grade_books(
+    prisma: Prisma,
+    student_ids: Iterable[str],
+    semestre: Optional[str] = None,
+    annee_scolaire: Optional[str] = None
+):
+    """Drop the cached grade pages of these students (of one period, when given)"""
+    student_ids = list({s for s in student_ids if s})
+    if not student_ids:
+        return
+    where = {"id_etudiant": {"in": student_ids}}
+    if semestre is not None:
+        where["semestre"] = getattr(semestre, "value", semestre)
+    if annee_scolaire is not None:
+        where["annee_scolaire"] = annee_scolaire
+    await prisma.gradebookcache.delete_many(where=where)
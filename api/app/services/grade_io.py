@@ -0,0 +1,374 @@
+"""
+Grade Import and Export
+
+Grades of one subject and period exchanged as spreadsheets (.xlsx or .csv),
+one grade per row:
+
+    id_note, id_etudiant, email, nom, prenom, groupe, type, valeur,
+    coefficient, date_examen, observation
+
+Import reads the upload row by row (openpyxl read-only mode, or the csv
+module) and writes it in chunks of CHUNK_ROWS, so large files are never
+loaded whole. Students are matched on id_etudiant or, when it is empty,
+on email. Rows without id_note are new grades and go through the bulk
+submission path (enrollment, ranges, coefficient, averages); rows with
+the id_note of one of the teacher's grades update it; optional columns
+left out of the file keep their stored values. An exported file can thus
+be edited and uploaded back.
+
+Export streams the grades group by group: CSV is written as it is read,
+XLSX is built with openpyxl's write-only mode in a temporary file and
+streamed from there.
+"""
+
+import csv
+import io
+import os
+import tempfile
+from typing import Any, AsyncIterator, BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+from datetime import date, datetime
+from openpyxl import Workbook, load_workbook
+from prisma import Prisma
+
+from app.services.grade_averages import AverageMaintainer
+from app.services.grade_submission import (
+    GradeSubmissionService, MIN_GRADE, MAX_GRADE, MIN_COEFFICIENT, MAX_COEFFICIENT
+)
+from app.services.grading_sheet import GRADE_TYPES
+
+
+COLUMNS = [
+    "id_note", "id_etudiant", "email", "nom", "prenom", "groupe",
+    "type", "valeur", "coefficient", "date_examen", "observation"
+]
+
+CHUNK_ROWS = 500
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Columns an imported row may change on an existing grade
+UPDATABLE_FIELDS = ("valeur", "coefficient", "type", "date_examen", "observation")
+
+EXPORT_SQL = """
+SELECT n."id" AS "id_note",
+       e."id" AS "id_etudiant",
+       COALESCE(u."email", e."email") AS "email",
+       COALESCE(u."nom", e."nom") AS "nom",
+       COALESCE(u."prenom", e."prenom") AS "prenom",
+       g."nom" AS "groupe",
+       n."type"::text AS "type",
+       n."valeur",
+       n."coefficient",
+       to_char(n."date_examen", 'YYYY-MM-DD') AS "date_examen",
+       n."observation"
+FROM "grades" n
+JOIN "Student" e ON e."id" = n."id_etudiant"
+JOIN "Group" g ON g."id" = e."id_groupe"
+LEFT JOIN "User" u ON u."etudiant_id" = e."id"
+WHERE n."id_matiere" = $1
+  AND n."semestre" = $2::"SemesterType"
+  AND n."annee_scolaire" = $3
+  AND e."id_groupe" = $4
+ORDER BY 4, 5, e."id", n."date_examen" NULLS LAST, n."createdAt", n."id"
+"""
+
+
+class GradeFileError(ValueError):
+    """The upload cannot be read as a grade file"""
+
+
+# ----------------------------------------------------------------------
+# Reading uploads
+# ----------------------------------------------------------------------
+
+def iter_upload_rows(filename: str, fileobj: BinaryIO) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    (line number, row by lower-cased header) for every non-empty row
+
+    The header is checked before returning, so GradeFileError is raised
+    here rather than while the rows are being imported.
+    """
+    if filename.lower().endswith(".csv"):
+        rows = _csv_rows(fileobj)
+    elif filename.lower().endswith(".xlsx"):
+        rows = _xlsx_rows(fileobj)
+    else:
+        raise GradeFileError("File must be an Excel (.xlsx) or CSV file")
+
+    header = next(rows, None)
+    if not header:
+        raise GradeFileError("The file is empty")
+    header = [str(h).strip().lower() if h is not None else "" for h in header]
+    if "valeur" not in header or "type" not in header:
+        raise GradeFileError("Missing required columns: type, valeur")
+    if "id_etudiant" not in header and "email" not in header:
+        raise GradeFileError("Missing student column: id_etudiant or email")
+    return _data_rows(header, rows)
+
+
+def _data_rows(header: List[str], rows: Iterator[List[Any]]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    for line, values in enumerate(rows, start=2):
+        if not any(v not in (None, "") for v in values):
+            continue
+        values = list(values) + [None] * (len(header) - len(values))
+        yield line, dict(zip(header, values))
+
+
+def _csv_rows(fileobj: BinaryIO) -> Iterator[List[Any]]:
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    first = text.readline()
+    # Spreadsheets saved with a French locale separate with semicolons
+    delimiter = ";" if first.count(";") > first.count(",") else ","
+    yield next(csv.reader([first], delimiter=delimiter), [])
+    yield from csv.reader(text, delimiter=delimiter)
+
+
+def _xlsx_rows(fileobj: BinaryIO) -> Iterator[List[Any]]:
+    try:
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    except Exception as e:
+        raise GradeFileError(f"Failed to read Excel file: {str(e)}")
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        workbook.close()
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = _text(value)
+    if text is None:
+        return None
+    return float(text.replace(",", "."))
+
+
+def _date(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    text = _text(value)
+    if text is None:
+        return None
+    for pattern in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(text[:10], pattern)
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid date: {text} (expected YYYY-MM-DD or DD/MM/YYYY)")
+
+
+def parse_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Typed grade fields of an uploaded row; raises ValueError with the reason"""
+    grade_type = (_text(row.get("type")) or "").upper()
+    if grade_type not in GRADE_TYPES:
+        raise ValueError(f"Invalid type: {row.get('type')} (expected one of {', '.join(GRADE_TYPES)})")
+    try:
+        valeur = _number(row.get("valeur"))
+        coefficient = _number(row.get("coefficient"))
+    except ValueError:
+        raise ValueError("valeur and coefficient must be numbers")
+    if valeur is None or not MIN_GRADE <= valeur <= MAX_GRADE:
+        raise ValueError(f"Grade must be between {MIN_GRADE:g} and {MAX_GRADE:g}")
+    if coefficient is not None and not MIN_COEFFICIENT <= coefficient <= MAX_COEFFICIENT:
+        raise ValueError(f"Coefficient must be between {MIN_COEFFICIENT:g} and {MAX_COEFFICIENT:g}")
+    return {
+        "id_note": _text(row.get("id_note")),
+        "id_etudiant": _text(row.get("id_etudiant")),
+        "email": (_text(row.get("email")) or "").lower() or None,
+        "type": grade_type,
+        "valeur": valeur,
+        "coefficient": coefficient,
+        "date_examen": _date(row.get("date_examen")),
+        "observation": _text(row.get("observation"))
+    }
+
+
+def _chunks(rows: Iterator, size: int) -> Iterator[List]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ----------------------------------------------------------------------
+# Import
+# ----------------------------------------------------------------------
+
+class GradeImporter:
+    def __init__(self, prisma: Prisma, subject, teacher_id: str, semestre: str, annee_scolaire: str):
+        self.prisma = prisma
+        self.subject = subject
+        self.teacher_id = teacher_id
+        self.semestre = semestre
+        self.annee_scolaire = annee_scolaire
+        self.submissions = GradeSubmissionService(prisma)
+
+    async def run(self, rows: Iterator[Tuple[int, Dict[str, Any]]]) -> Dict:
+        """Import every row; returns counts and one error per rejected line"""
+        summary = {"total_rows": 0, "created_count": 0, "updated_count": 0, "unchanged_count": 0, "errors": []}
+        for chunk in _chunks(rows, CHUNK_ROWS):
+            summary["total_rows"] += len(chunk)
+            await self._import_chunk(chunk, summary)
+        return summary
+
+    async def _import_chunk(self, chunk: List[Tuple[int, Dict]], summary: Dict):
+        parsed = []
+        for line, row in chunk:
+            try:
+                parsed.append((line, parse_row(row)))
+            except ValueError as e:
+                summary["errors"].append({"line": line, "error": str(e)})
+        # Fields an update may change: only those with a column in the file
+        columns = {f for f in UPDATABLE_FIELDS if f in chunk[0][1]}
+
+        students = await self._students(parsed)
+        creates, updates = [], []
+        for line, grade in parsed:
+            student_id = students.get(grade["id_etudiant"]) or students.get(grade["email"])
+            if student_id is None:
+                summary["errors"].append({"line": line, "error": "Student not found in this subject's specialty"})
+                continue
+            grade["id_etudiant"] = student_id
+            (updates if grade["id_note"] else creates).append((line, grade))
+
+        if creates:
+            batch = await self.submissions.submit(
+                self.subject, self.teacher_id, self.semestre, self.annee_scolaire,
+                [grade for _, grade in creates]
+            )
+            summary["created_count"] += len(batch.rows)
+            for error in batch.errors:
+                summary["errors"].append({"line": creates[error["index"]][0], "error": error["error"]})
+
+        if updates:
+            await self._update(updates, columns, summary)
+
+    async def _students(self, parsed: List[Tuple[int, Dict]]) -> Dict[str, str]:
+        """Student id by id and by email, for the students of the chunk (one query)"""
+        ids = list({g["id_etudiant"] for _, g in parsed if g["id_etudiant"]})
+        emails = list({g["email"] for _, g in parsed if g["email"] and not g["id_etudiant"]})
+        conditions = []
+        if ids:
+            conditions.append({"id": {"in": ids}})
+        if emails:
+            conditions.append({"email": {"in": emails, "mode": "insensitive"}})
+        if not conditions:
+            return {}
+        students = await self.prisma.etudiant.find_many(
+            where={"OR": conditions, "id_specialite": self.subject.id_specialite}
+        )
+        found = {}
+        for student in students:
+            found[student.id] = student.id
+            found[student.email.lower()] = student.id
+        return found
+
+    async def _update(self, updates: List[Tuple[int, Dict]], columns: Set[str], summary: Dict):
+        """
+        Apply rows carrying the id of one of the teacher's grades for this subject and period
+
+        Only the fields in columns (those present in the file) are compared
+        and written; an empty coefficient keeps the stored one.
+        """
+        existing = {
+            note.id: note for note in await self.prisma.note.find_many(
+                where={
+                    "id": {"in": [grade["id_note"] for _, grade in updates]},
+                    "id_enseignant": self.teacher_id,
+                    "id_matiere": self.subject.id,
+                    "semestre": self.semestre,
+                    "annee_scolaire": self.annee_scolaire
+                }
+            )
+        }
+        before, after, writes = [], [], []
+        for line, grade in updates:
+            note = existing.get(grade["id_note"])
+            if note is None or note.id_etudiant != grade["id_etudiant"]:
+                summary["errors"].append({"line": line, "error": "Grade not found among your grades for this subject"})
+                continue
+            new = {**grade, "coefficient": grade["coefficient"] or note.coefficient}
+            data = {f: new[f] for f in UPDATABLE_FIELDS if f in columns and _changed(getattr(note, f), new[f])}
+            if not data:
+                summary["unchanged_count"] += 1
+                continue
+            writes.append((note.id, data))
+            before.append(note)
+            after.append({
+                "id_etudiant": note.id_etudiant, "id_matiere": note.id_matiere,
+                "semestre": note.semestre, "annee_scolaire": note.annee_scolaire,
+                "valeur": new["valeur"], "coefficient": new["coefficient"]
+            })
+
+        if writes:
+            async with self.prisma.tx() as tx:
+                for note_id, data in writes:
+                    await tx.note.update(where={"id": note_id}, data=data)
+                await AverageMaintainer(self.prisma).grades_changed(before=before, after=after, tx=tx)
+        summary["updated_count"] += len(writes)
+
+
+def _changed(stored: Any, new: Any) -> bool:
+    stored = getattr(stored, "value", stored)
+    if isinstance(stored, datetime) and isinstance(new, datetime):
+        return stored.date() != new.date()
+    return stored != new
+
+
+# ----------------------------------------------------------------------
+# Export
+# ----------------------------------------------------------------------
+
+async def iter_export_rows(
+    prisma: Prisma, subject_id: str, semestre: str, annee_scolaire: str, group_ids: List[str]
+) -> AsyncIterator[List[Any]]:
+    """Grade rows in COLUMNS order, one query per group"""
+    for group_id in group_ids:
+        for row in await prisma.query_raw(EXPORT_SQL, subject_id, semestre, annee_scolaire, group_id):
+            yield [row[column] for column in COLUMNS]
+
+
+async def stream_csv(rows: AsyncIterator[List[Any]]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens accented names correctly
+    buffer.write("\ufeff")
+    writer.writerow(COLUMNS)
+    async for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= STREAM_CHUNK_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+async def stream_xlsx(rows: AsyncIterator[List[Any]]) -> AsyncIterator[bytes]:
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Notes")
+    sheet.append(COLUMNS)
+    async for row in rows:
+        sheet.append(row)
+
+    handle, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(handle)
+    try:
+        workbook.save(path)
+        with open(path, "rb") as f:
+            while chunk := f.read(STREAM_CHUNK_BYTES):
+                yield chunk
+    finally:
+        os.remove(path)
@@ -0,0 +1,341 @@
+"""
+Grade Report (Relevé de Notes) Batch Generation
+
+Generating the reports of a whole promotion is split in two steps:
+
+1. prepare (in the request): students, general averages, subject averages,
+   grades and the cohort size are each loaded once for the whole batch, and
+   all ReleveNotes rows are upserted with a single INSERT ... ON CONFLICT.
+2. render (background job): the per-student PDF transcripts are rendered
+   in a process pool from plain, picklable ReportData, written under
+   storage/releves, their URLs stored with one UPDATE, and the students
+   notified with one create_many.
+
+Documents hold grades and ranks, so they are kept out of the public
+/uploads mount: report_document() locates them for the authenticated
+download endpoint (student_grades), which is the stored URL.
+
+The transcripts of a whole group can also be downloaded as a ZIP archive,
+rendered and streamed a few documents at a time so the archive is never
+held in memory. Rendering only depends on ReportData (see
+transcript_pdf), so workers never touch the database.
+"""
+
+import asyncio
+import io
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from uuid import uuid4
+from prisma import Prisma
+
+from app.services.transcript_pdf import render_transcript, unsupported_characters
+
+
+REPORTS_DIR = Path(__file__).parent.parent.parent / "storage" / "releves"
+REPORT_URL = "/student/grade-reports/{report_id}/pdf"
+
+RENDER_WORKERS = min(4, os.cpu_count() or 1)
+
+# Transcripts rendered before each write of the streamed archive
+ARCHIVE_CHUNK = RENDER_WORKERS * 4
+
+UNSAFE_FILENAME = re.compile(r"[^\w.-]+")
+
+# Archive entry listing the students whose transcript was left out
+SKIPPED_FILENAME = "non_generes.txt"
+
+UPSERT_REPORTS_SQL = """
+INSERT INTO "grade_reports" ("id", "id_etudiant", "semestre", "annee_scolaire", "moyenne_generale",
+                             "rang", "total_etudiants", "appreciation", "genere_par", "envoye",
+                             "date_generation", "updatedAt")
+SELECT r."id", r."id_etudiant", $1::"SemesterType", $2, r."moyenne_generale",
+       r."rang", $3, r."appreciation", $4, false, now(), now()
+FROM unnest($5::text[], $6::text[], $7::float8[], $8::int[], $9::text[])
+     AS r("id", "id_etudiant", "moyenne_generale", "rang", "appreciation")
+ON CONFLICT ("id_etudiant", "semestre", "annee_scolaire") DO UPDATE
+SET "moyenne_generale" = EXCLUDED."moyenne_generale",
+    "rang" = EXCLUDED."rang",
+    "total_etudiants" = EXCLUDED."total_etudiants",
+    "appreciation" = EXCLUDED."appreciation",
+    "genere_par" = EXCLUDED."genere_par",
+    "date_generation" = now(),
+    "updatedAt" = now()
+RETURNING "id", "id_etudiant"
+"""
+
+SET_DOCUMENT_URLS_SQL = """
+UPDATE "grade_reports" r
+SET "pdf_url" = d."url", "updatedAt" = now()
+FROM unnest($1::text[], $2::text[]) AS d("id", "url")
+WHERE r."id" = d."id"
+"""
+
+
+def report_document(student_id: str, semestre: str, annee_scolaire: str) -> Path:
+    """Where the PDF of a student's report for a period is stored"""
+    period = f"{getattr(semestre, 'value', semestre)}_{annee_scolaire}".replace("/", "-")
+    return REPORTS_DIR / period / f"{student_id}.pdf"
+
+
+def document_filename(nom: str, prenom: str, path: Path) -> str:
+    """Download name of a stored transcript: the student and the period"""
+    name = UNSAFE_FILENAME.sub("_", f"releve_{nom}_{prenom}_{path.parent.name}").strip("_")
+    return f"{name}.pdf"
+
+
+def get_appreciation(moyenne: float) -> str:
+    """Get appreciation text based on average"""
+    if moyenne >= 16:
+        return "Très bien"
+    elif moyenne >= 14:
+        return "Bien"
+    elif moyenne >= 12:
+        return "Assez bien"
+    elif moyenne >= 10:
+        return "Passable"
+    else:
+        return "Insuffisant"
+
+
+@dataclass
+class ReportData:
+    """Everything a student's report shows (sent to render workers)"""
+    student_id: str
+    user_id: Optional[str]
+    nom: str
+    prenom: str
+    email: str
+    groupe: str
+    departement: str
+    semestre: str
+    annee_scolaire: str
+    moyenne_generale: float
+    rang: Optional[int]
+    total_etudiants: int
+    appreciation: str
+    report_id: Optional[str] = None
+    # (subject, coefficient, average, grades), by subject name
+    subjects: List[Tuple[str, float, Optional[float], List[float]]] = field(default_factory=list)
+
+    @property
+    def archive_name(self) -> str:
+        name = UNSAFE_FILENAME.sub("_", f"{self.nom}_{self.prenom}").strip("_")
+        return f"{name}_{self.student_id}.pdf"
+
+
+def _render_to_file(data: ReportData) -> str:
+    """Worker: render one report under REPORTS_DIR and return its URL"""
+    path = report_document(data.student_id, data.semestre, data.annee_scolaire)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(render_transcript(data))
+    return REPORT_URL.format(report_id=data.report_id)
+
+
+class GradeReportBatch:
+    def __init__(self, prisma: Prisma):
+        self.prisma = prisma
+
+    async def collect(
+        self,
+        department,
+        student_ids: List[str],
+        semestre: str,
+        annee_scolaire: str
+    ) -> Tuple[List[ReportData], List[Dict]]:
+        """Report data of the students of the batch, and per-student errors"""
+        student_ids = list(dict.fromkeys(student_ids))
+        students = await self.prisma.etudiant.find_many(
+            where={"id": {"in": student_ids}, "specialite": {"id_departement": department.id}},
+            include={"utilisateur": True, "groupe": True}
+        )
+        averages = await self.prisma.moyenne.find_many(
+            where={
+                "id_etudiant": {"in": student_ids},
+                "semestre": semestre,
+                "annee_scolaire": annee_scolaire
+            },
+            include={"matiere": True}
+        )
+        notes = await self.prisma.note.find_many(
+            where={
+                "id_etudiant": {"in": student_ids},
+                "semestre": semestre,
+                "annee_scolaire": annee_scolaire
+            },
+            order={"createdAt": "asc"}
+        )
+        total_students = await self.prisma.etudiant.count(
+            where={"specialite": {"id_departement": department.id}}
+        )
+
+        grades: Dict[Tuple[str, str], List[float]] = {}
+        for note in notes:
+            grades.setdefault((note.id_etudiant, note.id_matiere), []).append(note.valeur)
+
+        general = {a.id_etudiant: a for a in averages if a.id_matiere is None}
+        subjects: Dict[str, List] = {}
+        for average in averages:
+            if average.id_matiere is not None and average.matiere:
+                subjects.setdefault(average.id_etudiant, []).append((
+                    average.matiere.nom,
+                    average.matiere.coefficient,
+                    average.moyenne_matiere,
+                    grades.get((average.id_etudiant, average.id_matiere), [])
+                ))
+
+        by_id = {s.id: s for s in students}
+        reports, errors = [], []
+        for student_id in student_ids:
+            student = by_id.get(student_id)
+            if student is None:
+                errors.append({"student_id": student_id, "error": "Student not found or not in your department"})
+                continue
+            user = student.utilisateur
+            nom, prenom = (user.nom, user.prenom) if user else (student.nom, student.prenom)
+            moyenne = general.get(student_id)
+            if not moyenne or not moyenne.moyenne_generale:
+                errors.append({"student_id": student_id, "student_name": f"{prenom} {nom}", "error": "No average calculated"})
+                continue
+            report = ReportData(
+                student_id=student_id,
+                user_id=user.id if user else None,
+                nom=nom,
+                prenom=prenom,
+                email=user.email if user else student.email,
+                groupe=student.groupe.nom if student.groupe else "N/A",
+                departement=department.nom,
+                semestre=semestre,
+                annee_scolaire=annee_scolaire,
+                moyenne_generale=moyenne.moyenne_generale,
+                rang=moyenne.rang,
+                total_etudiants=total_students,
+                appreciation=get_appreciation(moyenne.moyenne_generale),
+                subjects=sorted(subjects.get(student_id, []))
+            )
+            unsupported = unsupported_characters(report)
+            if unsupported:
+                errors.append({
+                    "student_id": student_id,
+                    "student_name": f"{prenom} {nom}",
+                    "error": f"Transcript cannot print these characters: {unsupported}"
+                })
+                continue
+            reports.append(report)
+        return reports, errors
+
+    async def collect_group(
+        self, department, group_id: str, semestre: str, annee_scolaire: str
+    ) -> Tuple[List[ReportData], List[Dict]]:
+        """Report data of the students of a group who have a general average, by name, and per-student errors"""
+        students = await self.prisma.etudiant.find_many(
+            where={"id_groupe": group_id, "specialite": {"id_departement": department.id}}
+        )
+        reports, errors = await self.collect(department, [s.id for s in students], semestre, annee_scolaire)
+        return sorted(reports, key=lambda r: (r.nom, r.prenom, r.student_id)), errors
+
+    async def prepare(
+        self,
+        department,
+        student_ids: List[str],
+        semestre: str,
+        annee_scolaire: str,
+        generated_by: str
+    ) -> Tuple[List[ReportData], List[Dict]]:
+        """Upsert the reports of the batch; returns their data and per-student errors"""
+        reports, errors = await self.collect(department, student_ids, semestre, annee_scolaire)
+        if reports:
+            rows = await self.prisma.query_raw(
+                UPSERT_REPORTS_SQL,
+                semestre, annee_scolaire, reports[0].total_etudiants, generated_by,
+                [uuid4().hex for _ in reports],
+                [r.student_id for r in reports],
+                [r.moyenne_generale for r in reports],
+                [r.rang for r in reports],
+                [r.appreciation for r in reports]
+            )
+            report_ids = {row["id_etudiant"]: row["id"] for row in rows}
+            for report in reports:
+                report.report_id = report_ids[report.student_id]
+        return reports, errors
+
+    async def render(self, reports: List[ReportData], notify: bool = True) -> int:
+        """Render the documents in a process pool, store their URLs and notify the students"""
+        if not reports:
+            return 0
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(max_workers=RENDER_WORKERS) as pool:
+            urls = await asyncio.gather(*[
+                loop.run_in_executor(pool, _render_to_file, report) for report in reports
+            ])
+
+        await self.prisma.execute_raw(
+            SET_DOCUMENT_URLS_SQL, [r.report_id for r in reports], list(urls)
+        )
+
+        recipients = [r for r in reports if r.user_id]
+        if notify and recipients:
+            await self.prisma.notification.create_many(
+                data=[
+                    {
+                        "userId": report.user_id,
+                        "type": "GRADE_REPORT_AVAILABLE",
+                        "title": "Relevé de Notes Disponible",
+                        "message": f"Votre relevé de notes pour le {report.semestre} ({report.annee_scolaire}) est maintenant disponible.",
+                        "relatedId": report.report_id
+                    }
+                    for report in recipients
+                ]
+            )
+        return len(reports)
+
+
+class _ArchiveSink(io.RawIOBase):
+    """Write-only, unseekable buffer: zipfile then streams entries with data descriptors"""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+async def stream_archive(reports: List[ReportData], skipped: List[Dict] = ()) -> AsyncIterator[bytes]:
+    """
+    ZIP archive of the reports' transcripts, yielded as it is written
+
+    Transcripts are rendered ARCHIVE_CHUNK at a time in a process pool, so
+    at most one chunk of documents is in memory whatever the group size.
+    Students left out (skipped: errors from collect) are listed in
+    SKIPPED_FILENAME.
+    """
+    sink = _ArchiveSink()
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=RENDER_WORKERS) as pool:
+        with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for start in range(0, len(reports), ARCHIVE_CHUNK):
+                chunk = reports[start:start + ARCHIVE_CHUNK]
+                documents = await asyncio.gather(*[
+                    loop.run_in_executor(pool, render_transcript, report) for report in chunk
+                ])
+                for report, document in zip(chunk, documents):
+                    archive.writestr(report.archive_name, document)
+                yield sink.drain()
+            if skipped:
+                archive.writestr(SKIPPED_FILENAME, "\n".join(
+                    f"{e.get('student_name', e['student_id'])}: {e['error']}" for e in skipped
+                ) + "\n")
+    yield sink.drain()
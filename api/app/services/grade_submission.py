@@ -0,0 +1,163 @@
+"""
+Bulk Grade Submission
+
+Writes a batch of grades for one subject as a set instead of row by row:
+
+- enrollment of every student of the batch is checked with one query
+  (a student may be graded if their specialty has the subject);
+- accepted grades are inserted with one create_many, with ids generated
+  here so each row can be reported back, and averages are maintained from
+  the written rows (see grade_averages) in the same transaction;
+- department heads of the subject get one summary notification each,
+  written with one create_many.
+
+Each entry gets a result (created with its grade id, or rejected with the
+reason); rejected entries do not prevent the others from being written.
+"""
+
+from typing import Dict, Iterable, List, Optional, Set
+from dataclasses import dataclass, field
+from uuid import uuid4
+from prisma import Prisma
+
+from app.services.grade_averages import AverageMaintainer
+
+
+CREATED = "created"
+REJECTED = "rejected"
+
+MIN_GRADE = 0.0
+MAX_GRADE = 20.0
+
+# Range of a coefficient given explicitly instead of the subject's
+MIN_COEFFICIENT = 0.1
+MAX_COEFFICIENT = 10.0
+
+
+@dataclass
+class GradeBatch:
+    """Outcome of a submission: one result per entry, in entry order"""
+    results: List[Dict] = field(default_factory=list)
+    # Note rows written with create_many
+    rows: List[Dict] = field(default_factory=list)
+
+    @property
+    def created_ids(self) -> List[str]:
+        return [row["id"] for row in self.rows]
+
+    @property
+    def errors(self) -> List[Dict]:
+        return [
+            {"index": r["index"], "student_id": r["student_id"], "error": r["error"]}
+            for r in self.results if r["status"] == REJECTED
+        ]
+
+
+class GradeSubmissionService:
+    def __init__(self, prisma: Prisma):
+        self.prisma = prisma
+
+    async def enrolled_students(self, subject, student_ids: Iterable[str]) -> Set[str]:
+        """Students of the batch whose specialty has the subject"""
+        student_ids = list(set(student_ids))
+        if not student_ids:
+            return set()
+        students = await self.prisma.etudiant.find_many(
+            where={"id": {"in": student_ids}, "id_specialite": subject.id_specialite}
+        )
+        return {s.id for s in students}
+
+    async def submit(
+        self,
+        subject,
+        teacher_id: str,
+        semestre: str,
+        annee_scolaire: str,
+        entries: List[Dict]
+    ) -> GradeBatch:
+        """
+        Validate and write grades for a subject
+
+        entries are dicts with id_etudiant, valeur, type and optionally
+        date_examen, observation and coefficient (the subject's when
+        missing).
+        """
+        batch = GradeBatch()
+        enrolled = await self.enrolled_students(subject, (e["id_etudiant"] for e in entries))
+
+        for index, entry in enumerate(entries):
+            error = self._validate(entry, enrolled)
+            if error:
+                batch.results.append({
+                    "index": index, "student_id": entry.get("id_etudiant"), "status": REJECTED, "error": error
+                })
+                continue
+            row = {
+                "id": uuid4().hex,
+                "valeur": float(entry["valeur"]),
+                "coefficient": float(entry.get("coefficient") or subject.coefficient),
+                "type": entry["type"],
+                "semestre": semestre,
+                "annee_scolaire": annee_scolaire,
+                "date_examen": entry.get("date_examen"),
+                "observation": entry.get("observation"),
+                "id_etudiant": entry["id_etudiant"],
+                "id_matiere": subject.id,
+                "id_enseignant": teacher_id
+            }
+            batch.rows.append(row)
+            batch.results.append({
+                "index": index, "student_id": row["id_etudiant"], "status": CREATED, "grade_id": row["id"]
+            })
+
+        if batch.rows:
+            async with self.prisma.tx() as tx:
+                await tx.note.create_many(data=batch.rows)
+                await AverageMaintainer(self.prisma).grades_changed(after=batch.rows, tx=tx)
+        return batch
+
+    @staticmethod
+    def _validate(entry: Dict, enrolled: Set[str]) -> Optional[str]:
+        if entry.get("id_etudiant") not in enrolled:
+            return "Student not enrolled in this subject"
+        try:
+            value = float(entry.get("valeur"))
+        except (TypeError, ValueError):
+            return "Grade must be a number"
+        if not MIN_GRADE <= value <= MAX_GRADE:
+            return f"Grade must be between {MIN_GRADE:g} and {MAX_GRADE:g}"
+        if entry.get("coefficient") is not None:
+            try:
+                coefficient = float(entry["coefficient"])
+            except (TypeError, ValueError):
+                return "Coefficient must be a number"
+            if not MIN_COEFFICIENT <= coefficient <= MAX_COEFFICIENT:
+                return f"Coefficient must be between {MIN_COEFFICIENT:g} and {MAX_COEFFICIENT:g}"
+        return None
+
+    async def notify_department_heads(
+        self,
+        subject,
+        notification_type: str,
+        title: str,
+        message: str,
+        related_id: Optional[str] = None
+    ) -> int:
+        """One notification per head of the subject's department (through its specialty)"""
+        chefs = await self.prisma.chefdepartement.find_many(
+            where={"departement": {"is": {"specialites": {"some": {"id": subject.id_specialite}}}}}
+        )
+        if not chefs:
+            return 0
+        return await self.prisma.notification.create_many(
+            data=[
+                {
+                    "userId": chef.id_utilisateur,
+                    "type": notification_type,
+                    "title": title,
+                    "message": message,
+                    "relatedId": related_id
+                }
+                for chef in chefs
+            ]
+        )
@@ -0,0 +1,232 @@
+"""
+Grading Sheet
+
+The grades of one (subject, group, semester, year) as a grid: one row per
+student of the group, one column per grade type and occurrence (EXAM,
+EXAM 2, CONTINUOUS, ...). The students and all their grades for the
+subject come from a single query, whatever the size of the group.
+
+The same grid is exported as a spreadsheet and can be read back: filled
+cells without a grade become new grades, cells whose value differs from
+the stored grade update it, and emptied cells are left alone (grades are
+only deleted one by one).
+"""
+
+import io
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+import pandas as pd
+from prisma import Prisma
+
+
+GRADE_TYPES = ("EXAM", "CONTINUOUS", "PRACTICAL", "PROJECT", "ORAL")
+
+# Identity columns of the spreadsheet, before the grade columns
+STUDENT_COLUMNS = ["id_etudiant", "email", "nom", "prenom"]
+
+MIN_GRADE = 0.0
+MAX_GRADE = 20.0
+
+GRADE_COLUMN = re.compile(r"^(%s)(?: (\d+))?$" % "|".join(GRADE_TYPES))
+
+GRADING_SHEET_SQL = """
+SELECT e."id" AS "student_id",
+       COALESCE(u."nom", e."nom") AS "nom",
+       COALESCE(u."prenom", e."prenom") AS "prenom",
+       COALESCE(u."email", e."email") AS "email",
+       n."id" AS "grade_id",
+       n."valeur",
+       n."coefficient",
+       n."type"::text AS "type",
+       to_char(n."date_examen", 'YYYY-MM-DD"T"HH24:MI:SS"+00:00"') AS "date_examen",
+       n."observation",
+       to_char(n."createdAt", 'YYYY-MM-DD"T"HH24:MI:SS"+00:00"') AS "createdAt"
+FROM "Student" e
+LEFT JOIN "User" u ON u."etudiant_id" = e."id"
+LEFT JOIN "grades" n ON n."id_etudiant" = e."id"
+     AND n."id_matiere" = $2
+     AND n."semestre" = $3::"SemesterType"
+     AND n."annee_scolaire" = $4
+WHERE e."id_groupe" = $1
+ORDER BY 2, 3, e."id", n."date_examen" NULLS LAST, n."createdAt", n."id"
+"""
+
+
+def column_name(grade_type: str, occurrence: int) -> str:
+    """Spreadsheet column of the n-th grade (from 1) of a type"""
+    return grade_type if occurrence == 1 else f"{grade_type} {occurrence}"
+
+
+@dataclass
+class SheetChanges:
+    """What importing a spreadsheet would write"""
+    # Note rows for create_many (without teacher, subject or coefficient)
+    created: List[Dict] = field(default_factory=list)
+    # (stored grade with its student, subject and period, new value)
+    updated: List[Tuple[Dict, float]] = field(default_factory=list)
+    errors: List[Dict] = field(default_factory=list)
+
+
+@dataclass
+class GradingSheet:
+    subject_id: str
+    group_id: str
+    semestre: str
+    annee_scolaire: str
+    # Students ordered by name, each with grades and grades_by_type
+    students: List[Dict]
+
+    @classmethod
+    async def load(cls, prisma: Prisma, subject_id: str, group_id: str, semestre: str, annee_scolaire: str) -> "GradingSheet":
+        rows = await prisma.query_raw(GRADING_SHEET_SQL, group_id, subject_id, semestre, annee_scolaire)
+        return cls(subject_id, group_id, semestre, annee_scolaire, cls.pivot(rows))
+
+    @staticmethod
+    def pivot(rows: List[Dict]) -> List[Dict]:
+        """Flat (student, grade) rows to one entry per student, grades grouped by type"""
+        students: Dict[str, Dict] = {}
+        for row in rows:
+            student = students.get(row["student_id"])
+            if student is None:
+                student = students[row["student_id"]] = {
+                    "id": row["student_id"],
+                    "nom": row["nom"],
+                    "prenom": row["prenom"],
+                    "email": row["email"],
+                    "grades": [],
+                    "grades_by_type": {}
+                }
+            if row["grade_id"] is None:
+                continue
+            grade = {
+                "id": row["grade_id"],
+                "valeur": row["valeur"],
+                "coefficient": row["coefficient"],
+                "type": row["type"],
+                "date_examen": row["date_examen"],
+                "observation": row["observation"],
+                "createdAt": row["createdAt"]
+            }
+            student["grades"].append(grade)
+            student["grades_by_type"].setdefault(grade["type"], []).append(grade)
+        return list(students.values())
+
+    @property
+    def grade_columns(self) -> List[Tuple[str, int]]:
+        """(type, occurrence) of every grade column, in type order"""
+        counts = {t: 0 for t in GRADE_TYPES}
+        for student in self.students:
+            for grade_type, grades in student["grades_by_type"].items():
+                counts[grade_type] = max(counts.get(grade_type, 0), len(grades))
+        return [(t, n) for t in counts for n in range(1, counts[t] + 1)]
+
+    def _note(self, grade: Dict, student_id: str) -> Dict:
+        return {
+            **grade,
+            "id_etudiant": student_id,
+            "id_matiere": self.subject_id,
+            "semestre": self.semestre,
+            "annee_scolaire": self.annee_scolaire
+        }
+
+    # ------------------------------------------------------------------
+    # Spreadsheet
+    # ------------------------------------------------------------------
+
+    def to_frame(self) -> pd.DataFrame:
+        columns = self.grade_columns
+        records = []
+        for student in self.students:
+            record = {
+                "id_etudiant": student["id"],
+                "email": student["email"],
+                "nom": student["nom"],
+                "prenom": student["prenom"]
+            }
+            for grade_type, occurrence in columns:
+                grades = student["grades_by_type"].get(grade_type, [])
+                record[column_name(grade_type, occurrence)] = (
+                    grades[occurrence - 1]["valeur"] if occurrence <= len(grades) else None
+                )
+            records.append(record)
+        return pd.DataFrame(
+            records,
+            columns=STUDENT_COLUMNS + [column_name(t, n) for t, n in columns]
+        )
+
+    def to_excel(self) -> io.BytesIO:
+        output = io.BytesIO()
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            self.to_frame().to_excel(writer, index=False, sheet_name='Notes')
+        output.seek(0)
+        return output
+
+    def changes_from_frame(self, df: pd.DataFrame) -> SheetChanges:
+        """
+        Compare an edited sheet with the stored grades
+
+        Rows are matched on id_etudiant; columns other than the identity
+        and grade columns are ignored. Values must be numbers from 0 to 20.
+        """
+        changes = SheetChanges()
+        if "id_etudiant" not in df.columns:
+            changes.errors.append({"error": "Colonne id_etudiant manquante"})
+            return changes
+
+        grade_columns = []
+        for column in df.columns:
+            match = GRADE_COLUMN.match(str(column).strip())
+            if match:
+                grade_columns.append((column, match.group(1), int(match.group(2) or 1)))
+
+        students = {s["id"]: s for s in self.students}
+        for index, row in df.iterrows():
+            student_id = str(row["id_etudiant"]).strip() if pd.notna(row["id_etudiant"]) else ""
+            student = students.get(student_id)
+            if student is None:
+                changes.errors.append({"row": index + 2, "student_id": student_id, "error": "Étudiant absent de ce groupe"})
+                continue
+
+            for column, grade_type, occurrence in grade_columns:
+                value = row[column]
+                if pd.isna(value) or value == "":
+                    continue
+                parsed = _parse_grade(value)
+                if parsed is None:
+                    changes.errors.append({
+                        "row": index + 2, "student_id": student_id, "column": column,
+                        "error": f"Note invalide : {value} (attendu un nombre de {MIN_GRADE:g} à {MAX_GRADE:g})"
+                    })
+                    continue
+
+                stored = student["grades_by_type"].get(grade_type, [])
+                if occurrence <= len(stored):
+                    if stored[occurrence - 1]["valeur"] != parsed:
+                        changes.updated.append((self._note(stored[occurrence - 1], student_id), parsed))
+                else:
+                    changes.created.append({
+                        "id_etudiant": student_id,
+                        "valeur": parsed,
+                        "type": grade_type,
+                        "semestre": self.semestre,
+                        "annee_scolaire": self.annee_scolaire
+                    })
+        return changes
+
+
+def _parse_grade(value: Any) -> Optional[float]:
+    try:
+        parsed = float(str(value).replace(",", ".")) if isinstance(value, str) else float(value)
+    except (TypeError, ValueError):
+        return None
+    if not MIN_GRADE <= parsed <= MAX_GRADE:
+        return None
+    return round(parsed, 2)
+
+
+def read_sheet(filename: str, contents: bytes) -> pd.DataFrame:
+    """An uploaded grading sheet (.xlsx, .xls or .csv) as a DataFrame"""
+    if filename.lower().endswith(".csv"):
+        return pd.read_csv(io.BytesIO(contents), dtype={"id_etudiant": str})
+    return pd.read_excel(io.BytesIO(contents), dtype={"id_etudiant": str})
@@ -0,0 +1,282 @@
+"""
+iCalendar Feeds
+
+Per-group and per-teacher .ics feeds generated from EmploiTemps rows and
+recurring series occurrences, so calendar apps subscribe once instead of polling the schedule endpoints.
+
+Recurring sessions (is_recurring rows sharing series, subject, teacher,
+room, group, weekday and hours) are compressed into one VEVENT with a
+weekly RRULE; missing or cancelled weeks become EXDATEs. The UID of a
+series event is the series id, so it stays the same as the feed window
+slides; occurrences changed individually are emitted apart from their
+series. One-off sessions are emitted as plain VEVENTs.
+
+The rendered feed is stored in calendar_feeds and dropped by
+invalidate_schedule_cache() whenever the owner's schedule changes.
+"""
+
+from typing import Dict, Iterator, List, Tuple
+from datetime import datetime, date, timedelta, timezone
+from prisma import Prisma
+
+from app.services.timetable_cache import SCOPE_GROUP, CACHE_TTL
+from app.services.schedule_series import find_occurrences
+
+
+PRODID = "-//University Platform//Timetable//FR"
+UID_DOMAIN = "university-platform"
+
+# Past sessions kept in the feed
+FEED_HISTORY = timedelta(weeks=4)
+
+# Streamed response chunk size (bytes)
+CHUNK_SIZE = 64 * 1024
+
+FEED_INCLUDE = {
+    "matiere": True,
+    "enseignant": True,
+    "salle": True,
+    "groupe": True
+}
+
+ICS_WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+
+
+def _escape(text) -> str:
+    """Escape a TEXT property value (RFC 5545 3.3.11)"""
+    return (
+        str(text or "")
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """Fold a content line at 75 octets without splitting UTF-8 characters"""
+    if len(line.encode("utf-8")) <= 75:
+        return line
+
+    parts = []
+    current, size, limit = "", 0, 75
+    for char in line:
+        char_size = len(char.encode("utf-8"))
+        if size + char_size > limit:
+            parts.append(current)
+            current, size, limit = "", 0, 74  # continuation lines start with a space
+        current += char
+        size += char_size
+    parts.append(current)
+    return "\r\n ".join(parts)
+
+
+def _local(value: datetime) -> str:
+    """Floating local time, as stored in EmploiTemps"""
+    return value.strftime("%Y%m%dT%H%M%S")
+
+
+def _utc(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _occurrence(schedule) -> Tuple[datetime, datetime]:
+    """Start and end of a session on its own date"""
+    day = schedule.date.date() if isinstance(schedule.date, datetime) else schedule.date
+    start = datetime.combine(day, schedule.heure_debut.time())
+    end = datetime.combine(day, schedule.heure_fin.time())
+    return start, end
+
+
+def _series_key(schedule) -> Tuple:
+    start, end = _occurrence(schedule)
+    return (
+        getattr(schedule, "id_series", None),
+        schedule.id_matiere,
+        schedule.id_enseignant,
+        schedule.id_salle,
+        schedule.id_groupe,
+        start.weekday(),
+        start.time(),
+        end.time()
+    )
+
+
+def _is_cancelled(schedule) -> bool:
+    return schedule.status == "CANCELED"
+
+
+def _describe(schedule) -> Dict[str, str]:
+    matiere = schedule.matiere
+    enseignant = schedule.enseignant
+    groupe = schedule.groupe
+
+    description = []
+    if enseignant:
+        description.append(f"Enseignant: {enseignant.prenom} {enseignant.nom}")
+    if groupe:
+        description.append(f"Groupe: {groupe.nom}")
+
+    return {
+        "summary": matiere.nom if matiere else "Séance",
+        "location": schedule.salle.code if schedule.salle else "",
+        "description": "\n".join(description)
+    }
+
+
+def _event_lines(uid: str, schedule, start: datetime, end: datetime, stamp: str) -> List[str]:
+    details = _describe(schedule)
+    return [
+        "BEGIN:VEVENT",
+        f"UID:{uid}",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART:{_local(start)}",
+        f"DTEND:{_local(end)}",
+        f"SUMMARY:{_escape(details['summary'])}",
+        f"LOCATION:{_escape(details['location'])}",
+        f"DESCRIPTION:{_escape(details['description'])}",
+    ]
+
+
+def _single_event(schedule, stamp: str) -> List[str]:
+    start, end = _occurrence(schedule)
+    lines = _event_lines(f"{schedule.id}@{UID_DOMAIN}", schedule, start, end, stamp)
+    lines.append("STATUS:CANCELLED" if _is_cancelled(schedule) else "STATUS:CONFIRMED")
+    lines.append("END:VEVENT")
+    return lines
+
+
+def _series_event(occurrences: List, stamp: str) -> List[str]:
+    """
+    One weekly VEVENT for a run of recurring sessions
+
+    occurrences are sorted by date and share weekday and hours; every
+    week between the first and last active one that has no active
+    session is excluded.
+    """
+    active = [s for s in occurrences if not _is_cancelled(s)]
+    first, last = active[0], active[-1]
+    first_start, first_end = _occurrence(first)
+    last_start, _ = _occurrence(last)
+
+    active_starts = {_occurrence(s)[0] for s in active}
+    exdates = []
+    current = first_start
+    while current < last_start:
+        current += timedelta(weeks=1)
+        if current not in active_starts:
+            exdates.append(current)
+
+    # Rows recurring without a series are all stored, so their ids are stable
+    series_id = getattr(first, "id_series", None) or first.id
+    lines = _event_lines(f"series-{series_id}@{UID_DOMAIN}", first, first_start, first_end, stamp)
+    lines.append(
+        f"RRULE:FREQ=WEEKLY;BYDAY={ICS_WEEKDAYS[first_start.weekday()]};UNTIL={_local(last_start)}"
+    )
+    if exdates:
+        lines.append("EXDATE:" + ",".join(_local(d) for d in exdates))
+    lines.append("STATUS:CONFIRMED")
+    lines.append("END:VEVENT")
+    return lines
+
+
+def build_calendar(name: str, schedules: List) -> str:
+    """Render sessions (loaded with FEED_INCLUDE) as an iCalendar document"""
+    stamp = _utc(datetime.now(timezone.utc))
+
+    single = []
+    series: Dict[Tuple, List] = {}
+    for schedule in schedules:
+        if not schedule.heure_debut or not schedule.heure_fin or not schedule.date:
+            continue
+        if schedule.is_recurring:
+            series.setdefault(_series_key(schedule), []).append(schedule)
+        else:
+            single.append(schedule)
+
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_escape(name)}",
+    ]
+
+    # A series' own event is its largest run; runs of occurrences changed
+    # individually (other teacher, room...) are emitted as single events
+    main_runs: Dict[str, Tuple] = {}
+    for key, occurrences in series.items():
+        series_id = key[0]
+        if series_id and (series_id not in main_runs or len(occurrences) > len(series[main_runs[series_id]])):
+            main_runs[series_id] = key
+
+    for key, occurrences in series.items():
+        occurrences.sort(key=lambda s: _occurrence(s)[0])
+        active = [s for s in occurrences if not _is_cancelled(s)]
+        if len(active) > 1 and (key[0] is None or main_runs[key[0]] == key):
+            lines.extend(_series_event(occurrences, stamp))
+        else:
+            # Nothing to compress: keep cancellations visible as such
+            single.extend(occurrences)
+
+    for schedule in sorted(single, key=lambda s: _occurrence(s)[0]):
+        lines.extend(_single_event(schedule, stamp))
+
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(_fold(line) for line in lines) + "\r\n"
+
+
+def iter_chunks(content: str) -> Iterator[bytes]:
+    """Stream a rendered feed in fixed-size chunks"""
+    data = content.encode("utf-8")
+    for offset in range(0, len(data), CHUNK_SIZE):
+        yield data[offset:offset + CHUNK_SIZE]
+
+
+class CalendarFeedService:
+    """Read-through cache of rendered group and teacher feeds"""
+
+    def __init__(self, prisma: Prisma):
+        self.prisma = prisma
+
+    async def get_owner_name(self, scope: str, owner_id: str):
+        """Display name of the feed owner (None if it does not exist)"""
+        if scope == SCOPE_GROUP:
+            groupe = await self.prisma.groupe.find_unique(where={"id": owner_id})
+            return f"Emploi du temps - {groupe.nom}" if groupe else None
+
+        enseignant = await self.prisma.enseignant.find_unique(where={"id": owner_id})
+        if not enseignant:
+            return None
+        return f"Emploi du temps - {enseignant.prenom} {enseignant.nom}"
+
+    async def get_calendar(self, scope: str, owner_id: str, name: str) -> str:
+        """Cached feed content (rendered on miss or when expired)"""
+        cached = await self.prisma.calendarfeed.find_unique(
+            where={"scope_owner_id": {"scope": scope, "owner_id": owner_id}}
+        )
+        if cached and datetime.now(timezone.utc) - cached.updatedAt < CACHE_TTL:
+            return cached.content
+
+        owner = {"group_id": owner_id} if scope == SCOPE_GROUP else {"teacher_id": owner_id}
+
+        schedules = await find_occurrences(
+            self.prisma,
+            start=date.today() - FEED_HISTORY,
+            include=FEED_INCLUDE,
+            **owner
+        )
+
+        content = build_calendar(name, schedules)
+
+        await self.prisma.calendarfeed.upsert(
+            where={"scope_owner_id": {"scope": scope, "owner_id": owner_id}},
+            data={
+                "create": {"scope": scope, "owner_id": owner_id, "content": content},
+                "update": {"content": content}
+            }
+        )
+
+        return content
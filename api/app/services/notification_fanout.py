@@ -0,0 +1,194 @@
+"""
+Schedule Change Notification Fan-out
+
+Turns a batch of timetable changes into in-app notifications. The users
+concerned (the teachers of the changed sessions and the students of their
+groups) are resolved in one query, every change reaching the same user is
+coalesced into a single digest, and the digests are written with one
+create_many. Republishing a semester timetable therefore produces one
+notification per affected user instead of one insert per session and
+student.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+from dataclasses import dataclass
+from prisma import Prisma
+
+
+CREATED = "CREATED"
+UPDATED = "UPDATED"
+CANCELLED = "CANCELLED"
+
+ACTION_LABELS = {
+    CREATED: "Ajout",
+    UPDATED: "Modification",
+    CANCELLED: "Annulation",
+}
+
+DAY_NAMES = ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"]
+
+# Lines listed in one digest before the rest is summarized as a count
+DIGEST_LINES = 8
+
+
+@dataclass(frozen=True)
+class ScheduleChange:
+    """One changed session or series, as it appears in a digest"""
+    action: str
+    description: str
+    group_id: Optional[str] = None
+    # Teachers before and after the change (a reassigned session concerns both)
+    teacher_ids: Tuple[str, ...] = ()
+
+    @property
+    def line(self) -> str:
+        return f"- {ACTION_LABELS.get(self.action, self.action)} : {self.description}"
+
+
+def digest_message(intro: str, changes: List[ScheduleChange]) -> str:
+    """Intro followed by the first changes and a count of the others"""
+    lines = [intro] + [change.line for change in changes[:DIGEST_LINES]]
+    hidden = len(changes) - DIGEST_LINES
+    if hidden > 0:
+        lines.append(f"... et {hidden} autre(s) changement(s)")
+    return "\n".join(lines)
+
+
+class ScheduleNotificationFanout:
+    def __init__(self, prisma: Prisma):
+        self.prisma = prisma
+
+    async def recipients(self, changes: Iterable[ScheduleChange]) -> Dict[str, List[ScheduleChange]]:
+        """
+        Changes concerning each user, keyed by user id
+
+        Teachers and students are loaded in a single query; a user reached
+        through several changes (or twice by the same one) gets each change
+        once, in the order the changes were given.
+        """
+        by_group: Dict[str, List[ScheduleChange]] = {}
+        by_teacher: Dict[str, List[ScheduleChange]] = {}
+        for change in changes:
+            if change.group_id:
+                by_group.setdefault(change.group_id, []).append(change)
+            for teacher_id in set(change.teacher_ids):
+                by_teacher.setdefault(teacher_id, []).append(change)
+
+        conditions = []
+        if by_teacher:
+            conditions.append({"enseignant_id": {"in": list(by_teacher)}})
+        if by_group:
+            conditions.append({"etudiant": {"is": {"id_groupe": {"in": list(by_group)}}}})
+        if not conditions:
+            return {}
+
+        users = await self.prisma.utilisateur.find_many(
+            where={"OR": conditions},
+            include={"etudiant": True}
+        )
+
+        recipients = {}
+        for user in users:
+            concerned = list(by_teacher.get(user.enseignant_id, [])) if user.enseignant_id else []
+            if user.etudiant:
+                concerned += by_group.get(user.etudiant.id_groupe, [])
+            if concerned:
+                recipients[user.id] = list(dict.fromkeys(concerned))
+        return recipients
+
+    async def notify(
+        self,
+        changes: Iterable[ScheduleChange],
+        title: str,
+        intro: str,
+        related_id: Optional[str] = None,
+        notification_type: str = "SCHEDULE_UPDATED"
+    ) -> int:
+        """Write one digest notification per affected user; returns how many"""
+        recipients = await self.recipients(changes)
+        if not recipients:
+            return 0
+        return await self.prisma.notification.create_many(
+            data=[
+                {
+                    "userId": user_id,
+                    "type": notification_type,
+                    "title": title,
+                    "message": digest_message(intro, user_changes),
+                    "relatedId": related_id,
+                }
+                for user_id, user_changes in recipients.items()
+            ]
+        )
+
+    # ------------------------------------------------------------------
+    # Building changes
+    # ------------------------------------------------------------------
+
+    async def _labels(self, subject_ids: Iterable[str], room_ids: Iterable[str]) -> Tuple[Dict, Dict]:
+        """Subject names and room codes for the descriptions"""
+        subject_ids, room_ids = list(set(subject_ids)), list(set(room_ids))
+        subjects = await self.prisma.matiere.find_many(where={"id": {"in": subject_ids}}) if subject_ids else []
+        rooms = await self.prisma.salle.find_many(where={"id": {"in": room_ids}}) if room_ids else []
+        return {s.id: s.nom for s in subjects}, {r.id: r.code for r in rooms}
+
+    async def session_changes(self, sessions: Iterable[Dict], action: str) -> List[ScheduleChange]:
+        """Changes for dated EmploiTemps rows (as written with create_many)"""
+        sessions = list(sessions)
+        subjects, rooms = await self._labels(
+            (s["id_matiere"] for s in sessions), (s["id_salle"] for s in sessions)
+        )
+        return [
+            ScheduleChange(
+                action=action,
+                description=(
+                    f"{subjects.get(s['id_matiere'], 'Séance')}, "
+                    f"{s['heure_debut']:%d/%m/%Y %H:%M}-{s['heure_fin']:%H:%M} "
+                    f"(salle {rooms.get(s['id_salle'], '?')})"
+                ),
+                group_id=s["id_groupe"],
+                teacher_ids=(s["id_enseignant"],)
+            )
+            for s in sessions
+        ]
+
+    async def slot_changes(self, published: Dict) -> List[ScheduleChange]:
+        """
+        Changes for a timetable publish summary (its "changes" entry)
+
+        Slots are weekly: they are described by weekday and time. An
+        updated slot also concerns its previous teacher.
+        """
+        updated = published.get("updated", [])
+        entries = (
+            [(CREATED, slot, {}) for slot in published.get("inserted", [])]
+            + [(UPDATED, u["slot"], u.get("columns", {})) for u in updated]
+            + [(CANCELLED, c["slot"], {}) for c in published.get("cancelled", [])]
+        )
+        previous_rooms = [u["columns"]["id_salle"]["from"] for u in updated if "id_salle" in u.get("columns", {})]
+        subjects, rooms = await self._labels(
+            (slot["subject_id"] for _, slot, _ in entries),
+            [slot["room_id"] for _, slot, _ in entries] + previous_rooms
+        )
+
+        changes = []
+        for action, slot, columns in entries:
+            description = (
+                f"{subjects.get(slot['subject_id'], 'Séance')}, "
+                f"{DAY_NAMES[slot['week_day'] - 1]} {slot['start_time']}-{slot['end_time']} "
+                f"(salle {rooms.get(slot['room_id'], '?')})"
+            )
+            if "id_salle" in columns:
+                description += f", auparavant en salle {rooms.get(columns['id_salle']['from'], '?')}"
+            if "id_enseignant" in columns:
+                description += ", changement d'enseignant"
+            teachers = [slot["teacher_id"]]
+            if "id_enseignant" in columns:
+                teachers.append(columns["id_enseignant"]["from"])
+            changes.append(ScheduleChange(
+                action=action,
+                description=description,
+                group_id=slot["group_id"],
+                teacher_ids=tuple(t for t in teachers if t)
+            ))
+        return changes
@@ -0,0 +1,153 @@
+"""
+Room Occupancy Engine
+
+Builds the campus-wide (room x day x slot) occupancy grid for a week:
+
+1. Rooms (one find_many, no includes)
+2. Sessions of the week as flat (room, day, start minute, subject,
+   teacher, group, status) tuples (one raw query)
+
+Each tuple is mapped to its slot through MINUTE_TO_SLOT, a precomputed
+minute-of-day -> slot index table, so the grid is filled in a single
+pass with no per-session string formatting or slot scans.
+"""
+
+import logging
+from typing import Dict, List, Optional
+from datetime import datetime
+from prisma import Prisma
+
+
+logger = logging.getLogger(__name__)
+
+OCCUPANCY_TIME_SLOTS = [
+    {"id": "slot1", "start": "08:10", "end": "09:50"},
+    {"id": "slot2", "start": "10:00", "end": "11:40"},
+    {"id": "slot3", "start": "11:50", "end": "13:30"},
+    {"id": "slot4", "start": "14:30", "end": "16:10"},
+    {"id": "slot5", "start": "16:10", "end": "17:50"}
+]
+
+OCCUPANCY_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+
+DEFAULT_BUILDING = "Bâtiment Principal"
+
+WEEK_SESSIONS_SQL = """
+SELECT s."id_salle" AS "room_id",
+       (EXTRACT(ISODOW FROM s."heure_debut")::int - 1) AS "day_index",
+       (EXTRACT(HOUR FROM s."heure_debut") * 60 + EXTRACT(MINUTE FROM s."heure_debut"))::int AS "start_minute",
+       s."status"::text AS "status",
+       m."nom" AS "subject",
+       COALESCE(u."prenom" || ' ' || u."nom", t."prenom" || ' ' || t."nom") AS "teacher",
+       g."nom" AS "group_name"
+FROM "schedule_occurrences" s
+JOIN "Room" r ON r."id" = s."id_salle"
+LEFT JOIN "Subject" m ON m."id" = s."id_matiere"
+LEFT JOIN "Teacher" t ON t."id" = s."id_enseignant"
+LEFT JOIN "User" u ON u."enseignant_id" = t."id"
+LEFT JOIN "Group" g ON g."id" = s."id_groupe"
+WHERE s."date" >= $1::timestamp
+  AND s."date" <= $2::timestamp
+  AND ($3::text IS NULL OR r."type"::text = $3::text)
+ORDER BY s."heure_debut"
+"""
+
+
+def _to_minutes(hhmm: str) -> int:
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def build_minute_to_slot(time_slots: List[Dict]) -> List[int]:
+    """
+    Slot index for every minute of the day (-1 outside all slots)
+
+    A minute belongs to the first slot with start <= minute < end, which
+    also resolves sessions starting exactly on a slot boundary.
+    """
+    lookup = [-1] * (24 * 60)
+    for index, slot in enumerate(time_slots):
+        for minute in range(_to_minutes(slot["start"]), _to_minutes(slot["end"])):
+            if lookup[minute] == -1:
+                lookup[minute] = index
+    return lookup
+
+
+MINUTE_TO_SLOT = build_minute_to_slot(OCCUPANCY_TIME_SLOTS)
+SLOT_IDS = [slot["id"] for slot in OCCUPANCY_TIME_SLOTS]
+
+
+def empty_occupancies() -> Dict[str, Dict[str, Dict]]:
+    return {
+        day: {slot_id: {"isOccupied": False} for slot_id in SLOT_IDS}
+        for day in OCCUPANCY_DAYS
+    }
+
+
+def build_occupancy_grid(rooms: List, rows: List[Dict]) -> List[Dict]:
+    """Fill the grid of every room from flat session tuples in one pass"""
+    grid = {room.id: empty_occupancies() for room in rooms}
+    day_count = len(OCCUPANCY_DAYS)
+    unmatched = 0
+
+    for row in rows:
+        occupancies = grid.get(row["room_id"])
+        day_index = row["day_index"]
+        slot_index = MINUTE_TO_SLOT[row["start_minute"]]
+        if occupancies is None or day_index >= day_count or slot_index < 0:
+            unmatched += 1
+            continue
+
+        occupancies[OCCUPANCY_DAYS[day_index]][SLOT_IDS[slot_index]] = {
+            "isOccupied": True,
+            "course": {
+                "subject": row["subject"] or "Non spécifié",
+                "teacher": row["teacher"] or "Non assigné",
+                "group": row["group_name"] or "Non spécifié",
+                "status": row["status"]
+            }
+        }
+
+    if unmatched:
+        logger.debug(f"{unmatched} sessions outside the occupancy grid")
+
+    return [
+        {
+            "roomId": room.id,
+            "roomName": room.code,
+            "capacity": room.capacite,
+            "type": room.type,
+            "building": DEFAULT_BUILDING,
+            "occupancies": grid[room.id]
+        }
+        for room in rooms
+    ]
+
+
+class RoomOccupancyService:
+    """Weekly occupancy grid for all rooms in two queries"""
+
+    def __init__(self, prisma: Prisma):
+        self.prisma = prisma
+
+    async def get_week_grid(
+        self,
+        start: datetime,
+        end: datetime,
+        room_type: Optional[str] = None
+    ) -> List[Dict]:
+        room_where = {}
+        if room_type:
+            room_where["type"] = room_type
+
+        rooms = await self.prisma.salle.find_many(
+            where=room_where,
+            order={"code": "asc"}
+        )
+        if not rooms:
+            return []
+
+        rows = await self.prisma.query_raw(
+            WEEK_SESSIONS_SQL, start.isoformat(), end.isoformat(), room_type
+        )
+        return build_occupancy_grid(rooms, rows)
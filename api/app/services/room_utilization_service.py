@@ -0,0 +1,271 @@
+"""
+Room Utilization Analytics
+
+Utilization of every room over an arbitrary date range, computed on a
+boolean occupancy matrix of shape (rooms, days, 15-minute buckets)
+covering the opening hours of each teaching day.
+
+Sessions are loaded as flat (room, day offset, start/end minute, group
+size) rows in one query and written into the matrix with difference
+arrays (np.add.at + cumsum), so there is no per-session Python loop over
+buckets. From the matrix we derive:
+
+- per-room and per-building utilization (time and seats)
+- per-slot utilization for the standard occupancy slots
+- a weekday x bucket heatmap of the share of rooms in use
+- an idle-capacity report (underused and oversized rooms)
+"""
+
+import re
+from typing import Dict, List, Optional
+from datetime import date, timedelta
+import numpy as np
+from prisma import Prisma
+
+from app.services.room_occupancy_service import OCCUPANCY_TIME_SLOTS, OCCUPANCY_DAYS, DEFAULT_BUILDING
+
+
+BUCKET_MINUTES = 15
+OPENING_MINUTE = 8 * 60
+CLOSING_MINUTE = 18 * 60
+BUCKETS_PER_DAY = (CLOSING_MINUTE - OPENING_MINUTE) // BUCKET_MINUTES
+
+# Teaching days (Monday..Saturday, Python weekday numbers)
+TEACHING_WEEKDAYS = range(len(OCCUPANCY_DAYS))
+
+MAX_RANGE_DAYS = 366
+
+# Idle-capacity thresholds
+UNDERUSED_RATE = 0.25
+OVERSIZED_FILL_RATE = 0.5
+
+RANGE_SESSIONS_SQL = """
+SELECT s."id_salle" AS "room_id",
+       (s."date"::date - $1::date) AS "day_offset",
+       (EXTRACT(HOUR FROM s."heure_debut") * 60 + EXTRACT(MINUTE FROM s."heure_debut"))::int AS "start_minute",
+       (EXTRACT(HOUR FROM s."heure_fin") * 60 + EXTRACT(MINUTE FROM s."heure_fin"))::int AS "end_minute",
+       COALESCE(gs."size", 0)::int AS "group_size"
+FROM "schedule_occurrences" s
+LEFT JOIN (
+    SELECT st."id_groupe", COUNT(*) AS "size"
+    FROM "Student" st
+    GROUP BY st."id_groupe"
+) gs ON gs."id_groupe" = s."id_groupe"
+WHERE s."date" >= $1::timestamp
+  AND s."date" < ($2::date + 1)::timestamp
+  AND s."status"::text <> 'CANCELED'
+  AND s."id_salle" = ANY($3)
+"""
+
+_BUILDING_PREFIX = re.compile(r"^([A-Za-z]+)[\s\-_]*\d")
+
+
+def room_building(code: str) -> str:
+    """Building of a room, read from its code prefix (A101 -> Bâtiment A)"""
+    match = _BUILDING_PREFIX.match(code or "")
+    if not match:
+        return DEFAULT_BUILDING
+    return f"Bâtiment {match.group(1).upper()}"
+
+
+def bucket_labels() -> List[str]:
+    return [
+        f"{minute // 60:02d}:{minute % 60:02d}"
+        for minute in range(OPENING_MINUTE, CLOSING_MINUTE, BUCKET_MINUTES)
+    ]
+
+
+def _slot_buckets(slot: Dict) -> slice:
+    """Buckets overlapping a standard slot"""
+    start_h, start_m = map(int, slot["start"].split(":"))
+    end_h, end_m = map(int, slot["end"].split(":"))
+    first = (start_h * 60 + start_m - OPENING_MINUTE) // BUCKET_MINUTES
+    last = -(-(end_h * 60 + end_m - OPENING_MINUTE) // BUCKET_MINUTES)
+    return slice(max(first, 0), min(last, BUCKETS_PER_DAY))
+
+
+def build_occupancy_matrix(rows: List[Dict], room_index: Dict[str, int], day_count: int):
+    """
+    Occupancy and seats-in-use matrices of shape (rooms, days, buckets)
+
+    Overlapping sessions in a room count once for occupancy and add up
+    for seats.
+    """
+    shape = (len(room_index), day_count, BUCKETS_PER_DAY + 1)
+    sessions = np.zeros(shape, dtype=np.int32)
+    seats = np.zeros(shape, dtype=np.int64)
+    if not rows:
+        return sessions[..., :-1] > 0, seats[..., :-1]
+
+    rooms = np.fromiter((room_index[r["room_id"]] for r in rows), dtype=np.int64, count=len(rows))
+    days = np.fromiter((r["day_offset"] for r in rows), dtype=np.int64, count=len(rows))
+    starts = np.fromiter((r["start_minute"] for r in rows), dtype=np.int64, count=len(rows))
+    ends = np.fromiter((r["end_minute"] for r in rows), dtype=np.int64, count=len(rows))
+    sizes = np.fromiter((r["group_size"] for r in rows), dtype=np.int64, count=len(rows))
+
+    # Clip to opening hours; a session touching a bucket occupies it
+    first = np.clip((starts - OPENING_MINUTE) // BUCKET_MINUTES, 0, BUCKETS_PER_DAY)
+    last = np.clip(-(-(ends - OPENING_MINUTE) // BUCKET_MINUTES), 0, BUCKETS_PER_DAY)
+    valid = (last > first) & (days >= 0) & (days < day_count)
+    rooms, days, first, last, sizes = rooms[valid], days[valid], first[valid], last[valid], sizes[valid]
+
+    np.add.at(sessions, (rooms, days, first), 1)
+    np.add.at(sessions, (rooms, days, last), -1)
+    np.add.at(seats, (rooms, days, first), sizes)
+    np.add.at(seats, (rooms, days, last), -sizes)
+
+    occupied = np.cumsum(sessions, axis=2)[..., :-1] > 0
+    seats_used = np.cumsum(seats, axis=2)[..., :-1]
+    return occupied, seats_used
+
+
+def _rate(numerator, denominator) -> float:
+    return round(float(numerator) / float(denominator), 4) if denominator else 0.0
+
+
+class RoomUtilizationService:
+    """Utilization statistics for rooms over a date range"""
+
+    def __init__(self, prisma: Prisma):
+        self.prisma = prisma
+
+    async def get_utilization(
+        self,
+        start_date: date,
+        end_date: date,
+        room_type: Optional[str] = None,
+        building: Optional[str] = None
+    ) -> Dict:
+        room_where = {}
+        if room_type:
+            room_where["type"] = room_type
+
+        rooms = await self.prisma.salle.find_many(where=room_where, order={"code": "asc"})
+        if building:
+            rooms = [r for r in rooms if room_building(r.code) == building]
+
+        day_count = (end_date - start_date).days + 1
+        room_index = {room.id: i for i, room in enumerate(rooms)}
+
+        rows = []
+        if rooms:
+            rows = await self.prisma.query_raw(
+                RANGE_SESSIONS_SQL,
+                start_date.isoformat(),
+                end_date.isoformat(),
+                list(room_index)
+            )
+
+        occupied, seats_used = build_occupancy_matrix(rows, room_index, day_count)
+
+        # Only teaching days count towards the available time
+        weekdays = np.array([(start_date + timedelta(days=d)).weekday() for d in range(day_count)])
+        teaching = np.isin(weekdays, list(TEACHING_WEEKDAYS))
+        occupied = occupied[:, teaching, :]
+        seats_used = seats_used[:, teaching, :]
+        weekdays = weekdays[teaching]
+
+        capacities = np.array([max(room.capacite or 0, 0) for room in rooms], dtype=np.int64)
+        available_buckets = int(teaching.sum()) * BUCKETS_PER_DAY
+
+        occupied_buckets = occupied.sum(axis=(1, 2))
+        seat_buckets = np.minimum(seats_used, capacities[:, None, None]).sum(axis=(1, 2))
+        hours_per_bucket = BUCKET_MINUTES / 60
+
+        room_stats = []
+        for i, room in enumerate(rooms):
+            seat_capacity = capacities[i] * available_buckets
+            occupied_seat_capacity = capacities[i] * occupied_buckets[i]
+            room_stats.append({
+                "roomId": room.id,
+                "roomName": room.code,
+                "type": room.type,
+                "building": room_building(room.code),
+                "capacity": int(capacities[i]),
+                "occupiedHours": round(float(occupied_buckets[i]) * hours_per_bucket, 2),
+                "idleHours": round(float(available_buckets - occupied_buckets[i]) * hours_per_bucket, 2),
+                "utilizationRate": _rate(occupied_buckets[i], available_buckets),
+                "seatUtilizationRate": _rate(seat_buckets[i], seat_capacity),
+                "seatFillRate": _rate(seat_buckets[i], occupied_seat_capacity)
+            })
+
+        return {
+            "range": {
+                "start_date": start_date.isoformat(),
+                "end_date": end_date.isoformat(),
+                "teaching_days": int(teaching.sum()),
+                "bucket_minutes": BUCKET_MINUTES,
+                "opening_hours": [bucket_labels()[0], f"{CLOSING_MINUTE // 60:02d}:00"]
+            },
+            "summary": {
+                "rooms": len(rooms),
+                "utilizationRate": _rate(occupied_buckets.sum(), available_buckets * len(rooms)),
+                "seatUtilizationRate": _rate(seat_buckets.sum(), int(capacities.sum()) * available_buckets)
+            },
+            "rooms": room_stats,
+            "buildings": self._building_stats(room_stats, occupied_buckets, seat_buckets, capacities, available_buckets),
+            "slots": self._slot_stats(occupied),
+            "heatmap": self._heatmap(occupied, weekdays),
+            "idleCapacity": self._idle_capacity(room_stats)
+        }
+
+    def _building_stats(self, room_stats, occupied_buckets, seat_buckets, capacities, available_buckets) -> List[Dict]:
+        buildings = sorted({stats["building"] for stats in room_stats})
+        labels = np.array([stats["building"] for stats in room_stats])
+
+        result = []
+        for name in buildings:
+            mask = labels == name
+            result.append({
+                "building": name,
+                "rooms": int(mask.sum()),
+                "utilizationRate": _rate(occupied_buckets[mask].sum(), available_buckets * mask.sum()),
+                "seatUtilizationRate": _rate(seat_buckets[mask].sum(), capacities[mask].sum() * available_buckets)
+            })
+        return result
+
+    def _slot_stats(self, occupied) -> List[Dict]:
+        """Share of (room, day) pairs in use during each standard slot"""
+        result = []
+        for slot in OCCUPANCY_TIME_SLOTS:
+            in_slot = occupied[:, :, _slot_buckets(slot)]
+            busy = in_slot.any(axis=2) if in_slot.size else np.zeros(occupied.shape[:2], dtype=bool)
+            result.append({
+                "slot": slot["id"],
+                "start": slot["start"],
+                "end": slot["end"],
+                "utilizationRate": round(float(busy.mean()), 4) if busy.size else 0.0
+            })
+        return result
+
+    def _heatmap(self, occupied, weekdays) -> Dict:
+        """Average share of rooms in use per teaching weekday and bucket"""
+        values = []
+        for weekday in TEACHING_WEEKDAYS:
+            day_mask = weekdays == weekday
+            if not day_mask.any() or occupied.shape[0] == 0:
+                values.append([0.0] * BUCKETS_PER_DAY)
+                continue
+            values.append(np.round(occupied[:, day_mask, :].mean(axis=(0, 1)), 4).tolist())
+
+        return {
+            "days": OCCUPANCY_DAYS,
+            "buckets": bucket_labels(),
+            "values": values
+        }
+
+    def _idle_capacity(self, room_stats: List[Dict]) -> Dict:
+        underused = [
+            s for s in room_stats if s["utilizationRate"] < UNDERUSED_RATE
+        ]
+        oversized = [
+            s for s in room_stats
+            if s["occupiedHours"] > 0 and s["seatFillRate"] < OVERSIZED_FILL_RATE
+        ]
+        return {
+            "underusedThreshold": UNDERUSED_RATE,
+            "oversizedThreshold": OVERSIZED_FILL_RATE,
+            "totalIdleHours": round(sum(s["idleHours"] for s in room_stats), 2),
+            "underused": sorted(underused, key=lambda s: s["utilizationRate"]),
+            "oversized": sorted(oversized, key=lambda s: s["seatFillRate"])
+        }
@@ -0,0 +1,122 @@
+"""
+Schedule Availability
+
+Busy intervals of rooms, teachers and groups per day, loaded in a
+single query (plus one for recurring series) and indexed by resource, so
+conflict checks and alternative suggestions are answered in memory
+instead of with one emploitemps query per candidate or per session.
+"""
+
+from typing import Dict, Iterable, List, Optional
+from datetime import datetime, date
+from prisma import Prisma
+
+from app.services.schedule_series import find_occurrences, naive
+
+
+ROOM = "id_salle"
+TEACHER = "id_enseignant"
+GROUP = "id_groupe"
+
+RESOURCE_FIELDS = (ROOM, TEACHER, GROUP)
+
+DAY_INCLUDE = {
+    "matiere": True,
+    "groupe": True,
+    "enseignant": True,
+    "salle": True
+}
+
+
+def overlaps(start_a: datetime, end_a: datetime, start_b: datetime, end_b: datetime) -> bool:
+    """Half-open interval overlap (back-to-back sessions do not clash)"""
+    return naive(start_a) < naive(end_b) and naive(start_b) < naive(end_a)
+
+
+class DayAvailability:
+    """Non-cancelled sessions of one day, indexed by room, teacher and group"""
+
+    def __init__(self, day: date, sessions: List):
+        self.day = day
+        self.sessions = sessions
+        self._by_resource: Dict[str, Dict[str, List]] = {field: {} for field in RESOURCE_FIELDS}
+        for session in sessions:
+            self.add(session)
+
+    @classmethod
+    async def load(
+        cls,
+        prisma: Prisma,
+        day: date,
+        exclude_ids: Iterable[Optional[str]] = (),
+        include: Optional[Dict] = DAY_INCLUDE
+    ) -> "DayAvailability":
+        """Every session of the day (minus exclude_ids)"""
+        days = await cls.load_many(prisma, [day], exclude_ids, include)
+        return next(iter(days.values()))
+
+    @classmethod
+    async def load_many(
+        cls,
+        prisma: Prisma,
+        days: Iterable[date],
+        exclude_ids: Iterable[Optional[str]] = (),
+        include: Optional[Dict] = DAY_INCLUDE
+    ) -> Dict[date, "DayAvailability"]:
+        """
+        Snapshots for several days from one range query
+
+        Pass include=None to load bare rows (ids and times only).
+        """
+        days = sorted({d.date() if isinstance(d, datetime) else d for d in days})
+
+        sessions_by_day: Dict[date, List] = {d: [] for d in days}
+        if days:
+            sessions = await find_occurrences(
+                prisma,
+                start=days[0],
+                end=days[-1],
+                include_cancelled=False,
+                exclude_ids=exclude_ids,
+                include=include
+            )
+            for session in sessions:
+                day = naive(session.date).date()
+                if day in sessions_by_day:
+                    sessions_by_day[day].append(session)
+
+        return {d: cls(d, sessions) for d, sessions in sessions_by_day.items()}
+
+    def add(self, session):
+        """Index a session (also used for sessions not yet written)"""
+        for field in RESOURCE_FIELDS:
+            owner = _get(session, field)
+            if owner:
+                self._by_resource[field].setdefault(owner, []).append(session)
+
+    def overlapping(self, field: str, owner_id: str, start: datetime, end: datetime) -> List:
+        """Sessions of a resource overlapping [start, end)"""
+        return [
+            s for s in self._by_resource[field].get(owner_id, [])
+            if overlaps(_get(s, "heure_debut"), _get(s, "heure_fin"), start, end)
+        ]
+
+    def is_free(self, field: str, owner_id: str, start: datetime, end: datetime) -> bool:
+        return not self.overlapping(field, owner_id, start, end)
+
+    def busy_owners(self, field: str, start: datetime, end: datetime) -> set:
+        """Resources of one kind that are busy at some point in [start, end)"""
+        return {
+            owner for owner, sessions in self._by_resource[field].items()
+            if any(overlaps(_get(s, "heure_debut"), _get(s, "heure_fin"), start, end) for s in sessions)
+        }
+
+    def load_of(self, field: str, owner_id: str) -> int:
+        """Number of sessions of a resource that day"""
+        return len(self._by_resource[field].get(owner_id, []))
+
+
+def _get(session, field):
+    if isinstance(session, dict):
+        return session.get(field)
+    return getattr(session, field, None)
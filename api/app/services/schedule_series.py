@@ -0,0 +1,460 @@
+"""
+Recurring Schedule Series
+
+A semester timetable is stored as one ScheduleSeries row per weekly slot
+(subject, group, teacher, room, weekday, times and date range) plus
+exceptions for dates without a session (holidays, removed occurrences),
+instead of one EmploiTemps row per week. Occurrences are expanded on read:
+
+- find_occurrences() merges stored EmploiTemps rows with the occurrences
+  of the series over a date range, as objects with the same fields and
+  relations, so readers do not care where a session comes from
+- the schedule_occurrences SQL view does the same for raw queries
+
+An occurrence is materialized as an EmploiTemps row (linked by id_series
+and date) only when something attaches to it or changes it: absences,
+makeup sessions, cancellation, edits. From then on the row replaces the
+occurrence in both read paths. Occurrences that are not materialized have
+ids of the form "<series id>:<YYYY-MM-DD>"; find_schedule() accepts both
+kinds of id.
+"""
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, field
+from datetime import datetime, date, time, timedelta
+from prisma import Prisma
+
+
+OCCURRENCE_SEPARATOR = ":"
+
+# Relations shared by EmploiTemps and ScheduleSeries (other includes only apply to rows)
+SERIES_RELATIONS = ("matiere", "enseignant", "salle", "groupe")
+
+OWNER_FIELDS = ("id_groupe", "id_enseignant", "id_salle", "id_matiere")
+
+# Filters of a paged occurrence listing; every parameter is optional (NULL)
+OCCURRENCE_FILTER_SQL = """
+FROM "schedule_occurrences" s
+LEFT JOIN "Teacher" t ON t."id" = s."id_enseignant"
+LEFT JOIN "Subject" m ON m."id" = s."id_matiere"
+WHERE ($1::timestamp IS NULL OR s."date" >= $1::timestamp)
+  AND ($2::timestamp IS NULL OR s."date" <= $2::timestamp)
+  AND ($3::text IS NULL OR s."id_groupe" = $3)
+  AND ($4::text IS NULL OR s."id_enseignant" = $4)
+  AND ($5::text IS NULL OR s."id_salle" = $5)
+  AND ($6::text IS NULL OR s."id_matiere" = $6)
+  AND ($7::text IS NULL OR s."status"::text = $7)
+  AND ($8::text IS NULL OR t."id_departement" = $8)
+  AND ($9::text IS NULL OR m."id_specialite" = $9)
+"""
+
+OCCURRENCE_PAGE_SQL = """
+SELECT s."id"
+""" + OCCURRENCE_FILTER_SQL + """
+ORDER BY s."heure_debut" {order}, s."id" {order}
+LIMIT $10 OFFSET $11
+"""
+
+OCCURRENCE_COUNT_SQL = """
+SELECT COUNT(*)::int AS "total"
+""" + OCCURRENCE_FILTER_SQL
+
+
+def naive(value: datetime) -> datetime:
+    """Schedule times are local wall-clock times; Prisma returns them as UTC-aware"""
+    return value.replace(tzinfo=None) if value.tzinfo else value
+
+
+def _day(value) -> date:
+    return naive(value).date() if isinstance(value, datetime) else value
+
+
+def occurrence_id(series_id: str, day: date) -> str:
+    return f"{series_id}{OCCURRENCE_SEPARATOR}{day.isoformat()}"
+
+
+def parse_occurrence_id(schedule_id: str) -> Optional[Tuple[str, date]]:
+    """(series id, date) of a virtual occurrence id, None for a stored row id"""
+    series_id, separator, day = (schedule_id or "").rpartition(OCCURRENCE_SEPARATOR)
+    if not separator or not series_id:
+        return None
+    try:
+        return series_id, date.fromisoformat(day)
+    except ValueError:
+        return None
+
+
+def series_dates(series, start: Optional[date] = None, end: Optional[date] = None) -> Iterator[date]:
+    """Dates of a series (its weekday within its range), optionally clipped"""
+    first = _day(series.start_date)
+    last = _day(series.end_date)
+    if start:
+        first = max(first, start)
+    if end:
+        last = min(last, end)
+
+    current = first + timedelta(days=(series.week_day - first.isoweekday()) % 7)
+    while current <= last:
+        yield current
+        current += timedelta(days=7)
+
+
+@dataclass
+class SeriesOccurrence:
+    """One occurrence of a series, shaped like an EmploiTemps row"""
+    id: str
+    date: datetime
+    heure_debut: datetime
+    heure_fin: datetime
+    id_salle: str
+    id_matiere: str
+    id_groupe: str
+    id_enseignant: str
+    semester: Optional[str]
+    week_day: int
+    id_series: str
+    createdAt: datetime
+    updatedAt: datetime
+    status: str = "PLANNED"
+    is_recurring: bool = True
+    matiere: Any = None
+    enseignant: Any = None
+    salle: Any = None
+    groupe: Any = None
+    absences: List = field(default_factory=list)
+    makeupSessions: List = field(default_factory=list)
+
+
+def _at(day: date, hhmm: str) -> datetime:
+    return datetime.combine(day, datetime.strptime(hhmm, "%H:%M").time())
+
+
+def occurrence_of(series, day: date) -> SeriesOccurrence:
+    return SeriesOccurrence(
+        id=occurrence_id(series.id, day),
+        date=datetime.combine(day, time.min),
+        heure_debut=_at(day, series.start_time),
+        heure_fin=_at(day, series.end_time),
+        id_salle=series.id_salle,
+        id_matiere=series.id_matiere,
+        id_groupe=series.id_groupe,
+        id_enseignant=series.id_enseignant,
+        semester=series.semester,
+        week_day=series.week_day,
+        id_series=series.id,
+        createdAt=series.createdAt,
+        updatedAt=series.updatedAt,
+        matiere=getattr(series, "matiere", None),
+        enseignant=getattr(series, "enseignant", None),
+        salle=getattr(series, "salle", None),
+        groupe=getattr(series, "groupe", None)
+    )
+
+
+def occurrence_data(series, day: date) -> Dict:
+    """EmploiTemps create data materializing one occurrence"""
+    return {
+        "date": datetime.combine(day, time.min),
+        "heure_debut": _at(day, series.start_time),
+        "heure_fin": _at(day, series.end_time),
+        "id_salle": series.id_salle,
+        "id_matiere": series.id_matiere,
+        "id_groupe": series.id_groupe,
+        "id_enseignant": series.id_enseignant,
+        "semester": series.semester,
+        "week_day": series.week_day,
+        "is_recurring": True,
+        "status": "PLANNED",
+        "id_series": series.id
+    }
+
+
+def expand_series(series_list: Iterable, start: Optional[date] = None, end: Optional[date] = None) -> List[SeriesOccurrence]:
+    """
+    Occurrences of series loaded with their exceptions and occurrences
+    (materialized rows) over the range; both kinds of date are skipped
+    """
+    result = []
+    for series in series_list:
+        skipped = {_day(e.date) for e in (series.exceptions or [])}
+        skipped |= {_day(row.date) for row in (series.occurrences or [])}
+        for day in series_dates(series, start, end):
+            if day not in skipped:
+                result.append(occurrence_of(series, day))
+    return result
+
+
+def _series_include(include: Optional[Dict]) -> Dict:
+    return {key: value for key, value in (include or {}).items() if key in SERIES_RELATIONS}
+
+
+def _department_filter(department_id: str) -> Dict:
+    return {"niveau": {"specialite": {"id_departement": department_id}}}
+
+
+async def find_occurrences(
+    prisma: Prisma,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    group_id: Optional[str] = None,
+    teacher_id: Optional[str] = None,
+    room_id: Optional[str] = None,
+    subject_id: Optional[str] = None,
+    semester: Optional[str] = None,
+    department_id: Optional[str] = None,
+    status: Optional[str] = None,
+    include_cancelled: bool = True,
+    exclude_ids: Iterable[Optional[str]] = (),
+    include: Optional[Dict] = None,
+    where: Optional[Dict] = None
+) -> List:
+    """
+    Sessions (stored rows and series occurrences) matching the filters,
+    sorted by start time. Two queries whatever the range.
+
+    where adds conditions valid on both models (id_* fields, semester,
+    or the matiere/enseignant/salle/groupe relations).
+    """
+    start, end = (_day(start) if start else None), (_day(end) if end else None)
+    owners = dict(zip(OWNER_FIELDS, (group_id, teacher_id, room_id, subject_id)))
+    owners = {key: value for key, value in owners.items() if value}
+    exclude_ids = {i for i in exclude_ids if i}
+
+    row_where: Dict[str, Any] = {**(where or {}), **owners}
+    series_where: Dict[str, Any] = {**(where or {}), **owners}
+    if start or end:
+        date_range = {}
+        if start:
+            date_range["gte"] = datetime.combine(start, time.min)
+            series_where["end_date"] = {"gte": datetime.combine(start, time.min)}
+        if end:
+            date_range["lte"] = datetime.combine(end, time.max)
+            series_where["start_date"] = {"lte": datetime.combine(end, time.max)}
+        row_where["date"] = date_range
+    if semester:
+        row_where["semester"] = semester
+        series_where["semester"] = semester
+    if department_id:
+        row_where["groupe"] = _department_filter(department_id)
+        series_where["groupe"] = _department_filter(department_id)
+    if status:
+        row_where["status"] = status
+    elif not include_cancelled:
+        row_where["status"] = {"not": "CANCELED"}
+    stored_ids = [i for i in exclude_ids if not parse_occurrence_id(i)]
+    if stored_ids:
+        row_where["id"] = {"not_in": stored_ids}
+
+    query = {"where": row_where}
+    if include:
+        query["include"] = include
+    sessions = list(await prisma.emploitemps.find_many(**query))
+
+    # Series only produce planned occurrences
+    if status in (None, "PLANNED"):
+        dated = {}
+        if start or end:
+            dated = {"date": {k: v for k, v in row_where["date"].items()}}
+        series = await prisma.scheduleseries.find_many(
+            where=series_where,
+            include={
+                **_series_include(include),
+                "exceptions": {"where": dated},
+                "occurrences": {"where": dated}
+            }
+        )
+        sessions.extend(
+            occurrence for occurrence in expand_series(series, start, end)
+            if occurrence.id not in exclude_ids
+        )
+
+    sessions.sort(key=lambda s: (naive(s.heure_debut), s.id))
+    return sessions
+
+
+async def find_occurrence_page(
+    prisma: Prisma,
+    skip: int,
+    take: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    group_id: Optional[str] = None,
+    teacher_id: Optional[str] = None,
+    room_id: Optional[str] = None,
+    subject_id: Optional[str] = None,
+    status: Optional[str] = None,
+    teacher_department_id: Optional[str] = None,
+    specialty_id: Optional[str] = None,
+    newest_first: bool = False,
+    include: Optional[Dict] = None
+) -> Tuple[List, int]:
+    """
+    One page of sessions (stored rows and series occurrences) sorted by
+    start time, and the number of matching sessions
+
+    The page is cut in the database (schedule_occurrences view), then only
+    its rows and series are loaded.
+    """
+    params = (
+        datetime.combine(_day(start), time.min).isoformat() if start else None,
+        datetime.combine(_day(end), time.max).isoformat() if end else None,
+        group_id, teacher_id, room_id, subject_id, status, teacher_department_id, specialty_id
+    )
+    order = "DESC" if newest_first else "ASC"
+    rows = await prisma.query_raw(OCCURRENCE_PAGE_SQL.format(order=order), *params, take, skip)
+    counted = await prisma.query_raw(OCCURRENCE_COUNT_SQL, *params)
+    return await _load_sessions(prisma, [row["id"] for row in rows], include), counted[0]["total"]
+
+
+async def _load_sessions(prisma: Prisma, ids: List[str], include: Optional[Dict] = None) -> List:
+    """Sessions by stored or virtual id, in the order of ids"""
+    stored = [i for i in ids if not parse_occurrence_id(i)]
+    virtual = [parsed for parsed in map(parse_occurrence_id, ids) if parsed]
+
+    found = {}
+    if stored:
+        query = {"where": {"id": {"in": stored}}}
+        if include:
+            query["include"] = include
+        found.update({row.id: row for row in await prisma.emploitemps.find_many(**query)})
+    if virtual:
+        query = {"where": {"id": {"in": list({series_id for series_id, _ in virtual})}}}
+        if _series_include(include):
+            query["include"] = _series_include(include)
+        series = {s.id: s for s in await prisma.scheduleseries.find_many(**query)}
+        for series_id, day in virtual:
+            if series_id in series:
+                occurrence = occurrence_of(series[series_id], day)
+                found[occurrence.id] = occurrence
+    return [found[i] for i in ids if i in found]
+
+
+async def find_schedule(
+    prisma: Prisma,
+    schedule_id: str,
+    include: Optional[Dict] = None,
+    materialize: bool = False
+):
+    """
+    A session by stored or virtual id (None if it does not exist)
+
+    A virtual id resolves to its materialized row when there is one. With
+    materialize=True an occurrence without row gets one, so absences,
+    makeup sessions or edits can reference it; the returned row's id is
+    then the stored id.
+    """
+    parsed = parse_occurrence_id(schedule_id)
+    if not parsed:
+        return await prisma.emploitemps.find_unique(where={"id": schedule_id}, include=include)
+
+    series_id, day = parsed
+    key = {"id_series_date": {"id_series": series_id, "date": datetime.combine(day, time.min)}}
+
+    row = await prisma.emploitemps.find_unique(where=key, include=include)
+    if row:
+        return row
+
+    series = await prisma.scheduleseries.find_unique(
+        where={"id": series_id},
+        include={
+            **_series_include(include),
+            "exceptions": {"where": {"date": datetime.combine(day, time.min)}}
+        }
+    )
+    if not series or series.exceptions or day not in series_dates(series, day, day):
+        return None
+
+    if not materialize:
+        return occurrence_of(series, day)
+
+    return await prisma.emploitemps.upsert(
+        where=key,
+        data={"create": occurrence_data(series, day), "update": {}},
+        include=include
+    )
+
+
+async def create_series(prisma: Prisma, data: Dict, skip_dates: Iterable[date] = (), reason: Optional[str] = None):
+    """Create a series and its exceptions in one transaction"""
+    async with prisma.tx() as tx:
+        series = await tx.scheduleseries.create(data=data)
+        skipped = [
+            {"id_series": series.id, "date": datetime.combine(day, time.min), "reason": reason}
+            for day in sorted(set(skip_dates))
+        ]
+        if skipped:
+            await tx.scheduleseriesexception.create_many(data=skipped)
+    return series
+
+
+def prepare_update(schedule, data: Dict) -> Dict:
+    """
+    Update data for a materialized occurrence
+
+    A row moved to another date leaves its series (it would otherwise
+    collide with, or stand in for, a different occurrence); callers must
+    then skip the original date with skip_occurrence().
+    """
+    if getattr(schedule, "id_series", None) and "date" in data and _day(data["date"]) != _day(schedule.date):
+        return {**data, "id_series": None}
+    return data
+
+
+async def release_occurrence(prisma: Prisma, schedule, updated_data: Optional[Dict] = None):
+    """
+    Keep a series from re-creating an occurrence whose row is deleted or
+    moved away (pass the update data for moves)
+    """
+    if not getattr(schedule, "id_series", None):
+        return
+    if updated_data is None or "id_series" in updated_data:
+        await skip_occurrence(prisma, schedule.id_series, _day(schedule.date))
+
+
+async def delete_schedule(prisma: Prisma, schedule):
+    """Delete a stored row or remove a series occurrence"""
+    await release_occurrence(prisma, schedule)
+    if not isinstance(schedule, SeriesOccurrence):
+        await prisma.emploitemps.delete(where={"id": schedule.id})
+
+
+async def skip_occurrence(prisma: Prisma, series_id: str, day: date, reason: Optional[str] = None):
+    """Remove one occurrence of a series (exception row)"""
+    when = datetime.combine(day, time.min)
+    await prisma.scheduleseriesexception.upsert(
+        where={"id_series_date": {"id_series": series_id, "date": when}},
+        data={
+            "create": {"id_series": series_id, "date": when, "reason": reason},
+            "update": {"reason": reason}
+        }
+    )
+
+
+async def count_schedules(prisma: Prisma, where: Dict) -> int:
+    """Stored rows plus series matching a filter valid on both models"""
+    return await prisma.emploitemps.count(where=where) + await prisma.scheduleseries.count(where=where)
+
+
+async def teaching_assignments(
+    prisma: Prisma,
+    teacher_id: Optional[str] = None,
+    group_id: Optional[str] = None,
+    subject_id: Optional[str] = None
+) -> List[Dict]:
+    """Distinct (id_enseignant, id_matiere, id_groupe) taught, from rows and series"""
+    owners = {"id_enseignant": teacher_id, "id_groupe": group_id, "id_matiere": subject_id}
+    where = {key: value for key, value in owners.items() if value}
+    by = ["id_enseignant", "id_matiere", "id_groupe"]
+
+    seen = set()
+    result = []
+    for rows in (
+        await prisma.emploitemps.group_by(by=by, where=where),
+        await prisma.scheduleseries.group_by(by=by, where=where)
+    ):
+        for row in rows:
+            key = (row["id_enseignant"], row["id_matiere"], row["id_groupe"])
+            if key not in seen:
+                seen.add(key)
+                result.append({"id_enseignant": key[0], "id_matiere": key[1], "id_groupe": key[2]})
+    return result
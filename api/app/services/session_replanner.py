@@ -0,0 +1,241 @@
+"""
+Session Re-planner
+
+Proposes replacement slots for one cancelled or moved session: dates
+around the original one, on the standard slots, where the group and the
+teacher are both free and a room large enough is available.
+
+Everything is answered from one availability snapshot of the search
+window (sessions plus pending/approved makeup sessions), so a request
+costs a handful of queries whatever the number of candidates. Options
+are ranked by a score (lower is better) combining distance from the
+original date, Saturdays, room changes and the resulting day load.
+"""
+
+from typing import Dict, List, Optional
+from datetime import datetime, date, timedelta
+from prisma import Prisma
+
+from app.services.timetable_cache import UNIVERSITY_TIME_SLOTS
+from app.services.schedule_availability import DayAvailability, ROOM, TEACHER, GROUP, naive
+from app.services.schedule_series import find_schedule
+
+
+DEFAULT_RADIUS_DAYS = 7
+MAX_RADIUS_DAYS = 30
+
+# Makeup sessions that already hold their proposed slot
+ACTIVE_MAKEUP_STATUSES = ["PENDING", "APPROVED", "SCHEDULED"]
+
+# Score weights (lower is better)
+DAY_DISTANCE = 2
+SATURDAY = 3
+ROOM_CHANGE = 1
+ROOM_TYPE_CHANGE = 2
+ROOM_WASTE = 1
+GROUP_DAY_OVERLOAD = 2
+TEACHER_DAY_OVERLOAD = 2
+ADJACENT_BONUS = -1
+
+MAX_GROUP_SESSIONS_PER_DAY = 3
+MAX_TEACHER_SESSIONS_PER_DAY = 4
+
+
+def _at(day: date, hhmm: str) -> datetime:
+    return datetime.combine(day, datetime.strptime(hhmm, "%H:%M").time())
+
+
+class SessionReplanner:
+    """Ranked replacement slots for a session"""
+
+    def __init__(self, prisma: Prisma):
+        self.prisma = prisma
+
+    async def propose(
+        self,
+        schedule_id: str,
+        radius_days: int = DEFAULT_RADIUS_DAYS,
+        limit: int = 10,
+        today: Optional[date] = None
+    ) -> Dict:
+        """
+        Replacement options for a session within radius_days of its date
+
+        Past dates are never proposed. Each option carries a "makeup"
+        payload with the fields expected by POST /makeup-sessions (the
+        caller only adds the reason).
+        """
+        session = await find_schedule(
+            self.prisma,
+            schedule_id,
+            include={"salle": True, "matiere": True, "groupe": True}
+        )
+        if not session:
+            raise ValueError(f"Schedule {schedule_id} not found")
+
+        radius_days = max(1, min(radius_days, MAX_RADIUS_DAYS))
+        today = today or date.today()
+        original_day = naive(session.date).date()
+        original_start = naive(session.heure_debut)
+        duration = naive(session.heure_fin) - original_start
+
+        first_day = max(today, original_day - timedelta(days=radius_days))
+        last_day = original_day + timedelta(days=radius_days)
+        days = [
+            first_day + timedelta(days=i)
+            for i in range((last_day - first_day).days + 1)
+            if (first_day + timedelta(days=i)).isoweekday() != 7
+        ]
+
+        availability = await DayAvailability.load_many(self.prisma, days, [session.id], include=None)
+        await self._add_makeup_sessions(availability, days)
+
+        group_size = await self.prisma.etudiant.count(where={"id_groupe": session.id_groupe})
+        rooms = [
+            room for room in await self.prisma.salle.find_many(order={"code": "asc"})
+            if (room.capacite or 0) >= group_size
+        ]
+        rooms.sort(key=lambda r: (r.capacite, r.code))
+
+        options = []
+        for day in days:
+            snapshot = availability[day]
+            for slot in UNIVERSITY_TIME_SLOTS:
+                start = _at(day, slot["start"])
+                end = start + duration
+                if start == original_start:
+                    continue
+                if start.date() == today and start <= datetime.now():
+                    continue
+                if not snapshot.is_free(GROUP, session.id_groupe, start, end):
+                    continue
+                if not snapshot.is_free(TEACHER, session.id_enseignant, start, end):
+                    continue
+
+                busy_rooms = snapshot.busy_owners(ROOM, start, end)
+                room = self._pick_room(session, rooms, busy_rooms)
+                if not room:
+                    continue
+
+                score, reasons = self._score(session, snapshot, day, original_day, start, end, room, group_size)
+                options.append((score, start, room, reasons))
+
+        options.sort(key=lambda o: (o[0], o[1]))
+        return {
+            "session": {
+                "id": session.id,
+                "subject": session.matiere.nom if session.matiere else None,
+                "group": session.groupe.nom if session.groupe else None,
+                "date": original_day.isoformat(),
+                "start_time": original_start.strftime("%H:%M"),
+                "end_time": naive(session.heure_fin).strftime("%H:%M"),
+                "status": session.status
+            },
+            "window": {"start_date": first_day.isoformat(), "end_date": last_day.isoformat()},
+            "total": len(options),
+            "options": [
+                self._format_option(session, score, start, start + duration, room, reasons)
+                for score, start, room, reasons in options[:limit]
+            ]
+        }
+
+    async def _add_makeup_sessions(self, availability: Dict[date, DayAvailability], days: List[date]):
+        """Makeup sessions are stored with HH:MM strings; index them like sessions"""
+        if not days:
+            return
+        makeups = await self.prisma.sessionrattrapage.find_many(
+            where={
+                "statut": {"in": ACTIVE_MAKEUP_STATUSES},
+                "date_proposee": {
+                    "gte": datetime.combine(days[0], datetime.min.time()),
+                    "lt": datetime.combine(days[-1] + timedelta(days=1), datetime.min.time())
+                }
+            }
+        )
+        for makeup in makeups:
+            day = naive(makeup.date_proposee).date()
+            if day not in availability:
+                continue
+            availability[day].add({
+                ROOM: makeup.id_salle,
+                TEACHER: makeup.id_enseignant,
+                GROUP: makeup.id_groupe,
+                "heure_debut": _at(day, makeup.heure_debut_proposee),
+                "heure_fin": _at(day, makeup.heure_fin_proposee)
+            })
+
+    @staticmethod
+    def _pick_room(session, rooms: List, busy_rooms: set):
+        """Keep the original room when free, else the smallest fitting room of the same type"""
+        free = [room for room in rooms if room.id not in busy_rooms]
+        if not free:
+            return None
+        for room in free:
+            if room.id == session.id_salle:
+                return room
+        original_type = session.salle.type if session.salle else None
+        same_type = [room for room in free if room.type == original_type]
+        return (same_type or free)[0]
+
+    @staticmethod
+    def _score(session, snapshot: DayAvailability, day: date, original_day: date,
+               start: datetime, end: datetime, room, group_size: int):
+        reasons = []
+        distance = abs((day - original_day).days)
+        score = DAY_DISTANCE * distance
+
+        if day.isoweekday() == 6:
+            score += SATURDAY
+            reasons.append("Samedi")
+
+        if room.id != session.id_salle:
+            score += ROOM_CHANGE
+            reasons.append("Changement de salle")
+            if session.salle and room.type != session.salle.type:
+                score += ROOM_TYPE_CHANGE
+                reasons.append("Type de salle différent")
+        if room.capacite:
+            score += ROOM_WASTE * (room.capacite - group_size) / room.capacite
+
+        group_load = snapshot.load_of(GROUP, session.id_groupe) + 1
+        if group_load > MAX_GROUP_SESSIONS_PER_DAY:
+            score += GROUP_DAY_OVERLOAD * (group_load - MAX_GROUP_SESSIONS_PER_DAY)
+            reasons.append("Journée chargée pour le groupe")
+
+        teacher_load = snapshot.load_of(TEACHER, session.id_enseignant) + 1
+        if teacher_load > MAX_TEACHER_SESSIONS_PER_DAY:
+            score += TEACHER_DAY_OVERLOAD * (teacher_load - MAX_TEACHER_SESSIONS_PER_DAY)
+            reasons.append("Journée chargée pour l'enseignant")
+
+        # Sessions ending or starting within the 10-20 minute breaks count as adjacent
+        around = snapshot.overlapping(GROUP, session.id_groupe, start - timedelta(minutes=20), end + timedelta(minutes=20))
+        if around:
+            score += ADJACENT_BONUS
+            reasons.append("Enchaîne avec une autre séance du groupe")
+
+        return round(score, 2), reasons
+
+    @staticmethod
+    def _format_option(session, score: float, start: datetime, end: datetime, room, reasons: List[str]) -> Dict:
+        day = start.date().isoformat()
+        return {
+            "date": day,
+            "start_time": start.strftime("%H:%M"),
+            "end_time": end.strftime("%H:%M"),
+            "room": {"id": room.id, "code": room.code, "capacite": room.capacite, "type": room.type},
+            "score": score,
+            "reasons": reasons,
+            "makeup": {
+                "id_emploitemps_origin": session.id,
+                "id_matiere": session.id_matiere,
+                "id_enseignant": session.id_enseignant,
+                "id_groupe": session.id_groupe,
+                "id_salle": room.id,
+                "date_originale": naive(session.date).date().isoformat(),
+                "heure_debut_origin": naive(session.heure_debut).strftime("%H:%M"),
+                "heure_fin_origin": naive(session.heure_fin).strftime("%H:%M"),
+                "date_proposee": day,
+                "heure_debut_proposee": start.strftime("%H:%M"),
+                "heure_fin_proposee": end.strftime("%H:%M")
+            }
+        }
@@ -0,0 +1,315 @@
+"""
+Materialized Weekly Timetables
+
+Each (group, week) and (teacher, week) timetable is built once from
+EmploiTemps rows and recurring series occurrences, serialized as a day grid plus a slot grid, and stored in
+the timetable_cache table. Timetable pages then read one cache row per
+week instead of re-querying emploitemps with deep includes.
+
+Every code path that creates, updates, cancels or deletes an EmploiTemps
+row or a ScheduleSeries must call invalidate_schedule_cache() with the affected sessions (or
+owners) so the next read rebuilds the week. The same call drops the
+owners' rendered iCalendar feeds (calendar_feeds).
+
+Each row also stores the change counters of the tables the week is built
+from (TIMETABLE_TABLES, read before the build) and is only served while
+they are unchanged. A week built concurrently with a write is therefore
+rebuilt on the next read even if it was stored after the invalidation, and
+renamed subjects, teachers or rooms show up without an explicit
+invalidation.
+"""
+
+from typing import Dict, Iterable, List, Optional
+from datetime import datetime, date, time, timedelta, timezone
+from prisma import Prisma, Json
+
+from app.core.http_cache import get_table_versions, TIMETABLE_TABLES
+from app.services.schedule_series import find_occurrences
+
+
+SCOPE_GROUP = "GROUP"
+SCOPE_TEACHER = "TEACHER"
+
+# Safety net: a row older than this is rebuilt even without invalidation
+CACHE_TTL = timedelta(hours=6)
+
+DAY_KEYS = ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"]
+
+# Standard university time slots
+UNIVERSITY_TIME_SLOTS = [
+    {"id": "slot1", "start": "08:30", "end": "10:00", "label": "8h30 à 10h00"},
+    {"id": "slot2", "start": "10:10", "end": "11:40", "label": "10h10 à 11h40"},
+    {"id": "slot3", "start": "11:50", "end": "13:20", "label": "11h50 à 13h20"},
+    {"id": "slot4", "start": "14:30", "end": "16:00", "label": "14h30 à 16h00"},
+    {"id": "slot5", "start": "16:10", "end": "17:40", "label": "16h10 à 17h40"}
+]
+
+SESSION_INCLUDE = {
+    "matiere": True,
+    "enseignant": True,
+    "salle": True,
+    "groupe": {
+        "include": {
+            "niveau": {
+                "include": {
+                    "specialite": True
+                }
+            }
+        }
+    }
+}
+
+
+def week_start_of(day) -> date:
+    """Monday of the week containing day"""
+    if isinstance(day, datetime):
+        day = day.date()
+    return day - timedelta(days=day.weekday())
+
+
+def _week_key(week_start: date) -> datetime:
+    return datetime.combine(week_start, time.min)
+
+
+def serialize_session(schedule) -> Dict:
+    """Flatten an EmploiTemps row loaded with SESSION_INCLUDE"""
+    schedule_date = schedule.date.date() if hasattr(schedule.date, "date") else schedule.date
+    groupe = schedule.groupe
+    niveau = groupe.niveau if groupe else None
+
+    return {
+        "id": schedule.id,
+        "date": schedule.date.isoformat(),
+        "day": schedule_date.weekday(),
+        "heure_debut": schedule.heure_debut.isoformat(),
+        "heure_fin": schedule.heure_fin.isoformat(),
+        "start_time": schedule.heure_debut.strftime("%H:%M"),
+        "end_time": schedule.heure_fin.strftime("%H:%M"),
+        "duration_minutes": int((schedule.heure_fin - schedule.heure_debut).total_seconds() // 60),
+        "status": schedule.status,
+        "is_recurring": schedule.is_recurring,
+        "semester": schedule.semester,
+        "matiere": {
+            "id": schedule.matiere.id,
+            "nom": schedule.matiere.nom
+        } if schedule.matiere else None,
+        "enseignant": {
+            "id": schedule.enseignant.id,
+            "nom": schedule.enseignant.nom,
+            "prenom": schedule.enseignant.prenom,
+            "email": schedule.enseignant.email
+        } if schedule.enseignant else None,
+        "salle": {
+            "id": schedule.salle.id,
+            "code": schedule.salle.code,
+            "type": schedule.salle.type,
+            "capacite": schedule.salle.capacite
+        } if schedule.salle else None,
+        "groupe": {
+            "id": groupe.id,
+            "nom": groupe.nom,
+            "niveau": niveau.nom if niveau else None,
+            "specialite": niveau.specialite.nom if niveau and niveau.specialite else None
+        } if groupe else None
+    }
+
+
+def _match_slot(start_time: str, end_time: str) -> Optional[str]:
+    """First standard slot overlapping the session (HH:MM strings compare lexically)"""
+    for slot in UNIVERSITY_TIME_SLOTS:
+        if (slot["start"] <= start_time < slot["end"]) or (slot["start"] < end_time <= slot["end"]):
+            return slot["id"]
+    return None
+
+
+def build_week_payload(week_start: date, schedules: List) -> Dict:
+    """Serialize a week of sessions into day and slot grids"""
+    days = {key: [] for key in DAY_KEYS}
+    slots = {slot["id"]: {key: None for key in DAY_KEYS[:6]} for slot in UNIVERSITY_TIME_SLOTS}
+
+    for schedule in schedules:
+        if not schedule.heure_debut or not schedule.date:
+            continue
+        session = serialize_session(schedule)
+        day_key = DAY_KEYS[session["day"]]
+        days[day_key].append(session)
+
+        slot_id = _match_slot(session["start_time"], session["end_time"])
+        if slot_id and day_key in slots[slot_id]:
+            slots[slot_id][day_key] = session["id"]
+
+    return {
+        "week_start": week_start.isoformat(),
+        "week_end": (week_start + timedelta(days=6)).isoformat(),
+        "days": days,
+        "slots": slots,
+        "built_at": datetime.now().isoformat()
+    }
+
+
+def iter_sessions(payload: Dict) -> Iterable[Dict]:
+    """All sessions of a cached week in chronological order"""
+    for key in DAY_KEYS:
+        for session in payload["days"].get(key, []):
+            yield session
+
+
+class WeeklyTimetableCache:
+    """Read-through cache of per-group and per-teacher weekly timetables"""
+
+    def __init__(self, prisma: Prisma):
+        self.prisma = prisma
+
+    async def get_week(self, scope: str, owner_id: str, week_start: date) -> Dict:
+        """Cached payload for one week (built on miss)"""
+        weeks = await self.get_weeks(scope, owner_id, [week_start_of(week_start)])
+        return weeks[week_start_of(week_start)]
+
+    async def get_weeks(self, scope: str, owner_id: str, week_starts: List[date]) -> Dict[date, Dict]:
+        """Cached payloads for several weeks, fetched in one lookup"""
+        week_starts = sorted({week_start_of(w) for w in week_starts})
+
+        rows = await self.prisma.timetablecache.find_many(
+            where={
+                "scope": scope,
+                "owner_id": owner_id,
+                "week_start": {"in": [_week_key(w) for w in week_starts]}
+            }
+        )
+
+        stamp = await self._stamp()
+        now = datetime.now(timezone.utc)
+        payloads = {}
+        for row in rows:
+            if row.stamp == stamp and now - row.updatedAt < CACHE_TTL:
+                payloads[row.week_start.date()] = row.payload
+
+        for week_start in week_starts:
+            if week_start not in payloads:
+                payloads[week_start] = await self._build_week(scope, owner_id, week_start, stamp)
+
+        return payloads
+
+    async def get_range(self, scope: str, owner_id: str, start: date, end: date) -> List[Dict]:
+        """Sessions between start and end (inclusive), from the covering weeks"""
+        if isinstance(start, datetime):
+            start = start.date()
+        if isinstance(end, datetime):
+            end = end.date()
+        if end < start:
+            return []
+
+        week_starts = []
+        current = week_start_of(start)
+        while current <= end:
+            week_starts.append(current)
+            current += timedelta(weeks=1)
+
+        payloads = await self.get_weeks(scope, owner_id, week_starts)
+
+        start_iso, end_iso = start.isoformat(), end.isoformat()
+        sessions = []
+        for week_start in week_starts:
+            for session in iter_sessions(payloads[week_start]):
+                if start_iso <= session["date"][:10] <= end_iso:
+                    sessions.append(session)
+        return sessions
+
+    async def _stamp(self) -> str:
+        """Change counters of the tables a week is built from"""
+        versions = await get_table_versions(self.prisma, TIMETABLE_TABLES)
+        return ",".join(f"{table}:{version}" for table, version in sorted(versions.items()))
+
+    async def _build_week(self, scope: str, owner_id: str, week_start: date, stamp: str) -> Dict:
+        owner = {"group_id": owner_id} if scope == SCOPE_GROUP else {"teacher_id": owner_id}
+
+        schedules = await find_occurrences(
+            self.prisma,
+            start=week_start,
+            end=week_start + timedelta(days=6),
+            include=SESSION_INCLUDE,
+            **owner
+        )
+
+        payload = build_week_payload(week_start, schedules)
+
+        await self.prisma.timetablecache.upsert(
+            where={
+                "scope_owner_id_week_start": {
+                    "scope": scope,
+                    "owner_id": owner_id,
+                    "week_start": _week_key(week_start)
+                }
+            },
+            data={
+                "create": {
+                    "scope": scope,
+                    "owner_id": owner_id,
+                    "week_start": _week_key(week_start),
+                    "payload": Json(payload),
+                    "stamp": stamp
+                },
+                "update": {"payload": Json(payload), "stamp": stamp}
+            }
+        )
+
+        return payload
+
+
+async def invalidate_schedule_cache(
+    prisma: Prisma,
+    sessions: Iterable = (),
+    group_ids: Iterable[str] = (),
+    teacher_ids: Iterable[str] = ()
+):
+    """
+    Drop cached weeks affected by a schedule change
+
+    sessions: EmploiTemps rows (or dicts) that were created, changed or
+    removed; only their group/teacher weeks are dropped. For updates pass
+    both the old and the new row.
+    group_ids / teacher_ids: drop every cached week of these owners (used
+    for bulk deletes where the individual rows are not loaded).
+    """
+    keys = set()
+    for session in sessions:
+        if session is None:
+            continue
+        get = session.get if isinstance(session, dict) else lambda f: getattr(session, f, None)
+        session_date = get("date")
+        if session_date is None:
+            continue
+        week = _week_key(week_start_of(session_date))
+        if get("id_groupe"):
+            keys.add((SCOPE_GROUP, get("id_groupe"), week))
+        if get("id_enseignant"):
+            keys.add((SCOPE_TEACHER, get("id_enseignant"), week))
+
+    conditions = [
+        {"scope": scope, "owner_id": owner_id, "week_start": week}
+        for scope, owner_id, week in keys
+    ]
+
+    group_ids = {g for g in group_ids if g}
+    teacher_ids = {t for t in teacher_ids if t}
+
+    # Feeds span every week, so they go whenever any week of the owner does
+    feed_groups = group_ids | {owner for scope, owner, _ in keys if scope == SCOPE_GROUP}
+    feed_teachers = teacher_ids | {owner for scope, owner, _ in keys if scope == SCOPE_TEACHER}
+
+    if group_ids:
+        conditions.append({"scope": SCOPE_GROUP, "owner_id": {"in": list(group_ids)}})
+    if teacher_ids:
+        conditions.append({"scope": SCOPE_TEACHER, "owner_id": {"in": list(teacher_ids)}})
+
+    if not conditions:
+        return
+
+    await prisma.timetablecache.delete_many(where={"OR": conditions})
+
+    feed_conditions = []
+    if feed_groups:
+        feed_conditions.append({"scope": SCOPE_GROUP, "owner_id": {"in": list(feed_groups)}})
+    if feed_teachers:
+        feed_conditions.append({"scope": SCOPE_TEACHER, "owner_id": {"in": list(feed_teachers)}})
+    await prisma.calendarfeed.delete_many(where={"OR": feed_conditions})
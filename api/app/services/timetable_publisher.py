@@ -0,0 +1,535 @@
+"""
+Timetable Versions and Diff Publishing
+
+A semester timetable is edited as a draft (TimetableDraft: the recurring
+slots, semester dates and excluded dates) and published against the live
+series of the department. Publishing computes a minimal diff instead of
+replacing everything:
+
+- a slot identical to a live series is left alone;
+- a slot matching a live series on group, subject, weekday and start time
+  updates it (teacher, room, end time, dates, excluded dates);
+- remaining live series are cancelled and remaining slots inserted.
+
+Changes apply from the effective date (today, or the semester start if
+later): past occurrences are never rewritten. A series that already ran
+is split at the effective date, and its stored rows from then on follow
+the new series, so ids and the absences or makeup sessions linked to them
+survive. Cancelled sessions that have a stored row are marked CANCELED
+rather than deleted.
+
+Every publish is recorded as a numbered version; a draft based on an
+older version than the live one is refused. Publishes of one department
+and semester take a transaction-level advisory lock, so the live version,
+the live series and the draft status are read and written by one publish
+at a time.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from prisma import Prisma, Json
+
+from app.services.schedule_series import naive, series_dates
+from app.services.timetable_cache import invalidate_schedule_cache
+
+
+DRAFT_STATUS = "DRAFT"
+PUBLISHED_STATUS = "PUBLISHED"
+
+# Reason of the exceptions created for the semester's excluded dates
+EXCLUDED_DATE_REASON = "Date exclue"
+
+# Slot field -> series column
+SLOT_COLUMNS = {
+    "week_day": "week_day",
+    "start_time": "start_time",
+    "end_time": "end_time",
+    "subject_id": "id_matiere",
+    "group_id": "id_groupe",
+    "teacher_id": "id_enseignant",
+    "room_id": "id_salle",
+}
+
+# A slot and a live series with the same key are the same course moved around
+MATCH_FIELDS = ("group_id", "subject_id", "week_day", "start_time")
+
+# Columns an update may change (the others are part of the match key)
+UPDATABLE_COLUMNS = ("id_enseignant", "id_salle", "end_time")
+
+# Serializes publishes of one (department, semester) until the transaction ends
+PUBLISH_LOCK_SQL = """
+SELECT 1 AS "locked" FROM pg_advisory_xact_lock(hashtext($1), hashtext($2))
+"""
+
+
+class StaleDraftError(ValueError):
+    """The draft was based on a version that is no longer the live one"""
+
+
+def _day(value: datetime) -> date:
+    return naive(value).date()
+
+
+def _midnight(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def _parse_day(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def series_slot(series) -> Dict:
+    """A live series in the draft slot format"""
+    return {slot_field: getattr(series, column) for slot_field, column in SLOT_COLUMNS.items()}
+
+
+def department_series_where(department_id: str, semester: str) -> Dict:
+    """
+    Series of the department's semester timetable
+
+    Series created without a semester (single department head additions
+    made before they carried one) count as part of any semester they run
+    in; publishing assigns them the semester it updates.
+    """
+    return {
+        "OR": [{"semester": semester}, {"semester": None}],
+        "groupe": {"niveau": {"specialite": {"id_departement": department_id}}}
+    }
+
+
+@dataclass
+class SemesterPlan:
+    """The part of a draft payload that publishing compares"""
+    semester: str
+    start: date
+    end: date
+    excluded: Set[date]
+    slots: List[Dict]
+
+    @classmethod
+    def from_payload(cls, payload: Dict) -> "SemesterPlan":
+        return cls(
+            semester=payload["semester"],
+            start=_parse_day(payload["start_date"]),
+            end=_parse_day(payload["end_date"]),
+            excluded={_parse_day(d) for d in payload.get("exclude_dates", [])},
+            slots=[{f: slot[f] for f in SLOT_COLUMNS} for slot in payload.get("schedules", [])]
+        )
+
+    def excluded_for(self, week_day: int, start: date) -> Set[date]:
+        """Excluded dates a series on this weekday skips from start on"""
+        return {d for d in self.excluded if d.isoweekday() == week_day and start <= d <= self.end}
+
+
+@dataclass
+class SeriesUpdate:
+    series: Any
+    slot: Dict
+    # column -> (live value, draft value)
+    columns: Dict[str, Tuple[Any, Any]] = field(default_factory=dict)
+
+
+@dataclass
+class TimetableDiff:
+    effective: date
+    inserted: List[Dict] = field(default_factory=list)
+    updated: List[SeriesUpdate] = field(default_factory=list)
+    cancelled: List[Any] = field(default_factory=list)
+    unchanged: int = 0
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.inserted or self.updated or self.cancelled)
+
+    def summary(self) -> Dict:
+        return {
+            "effective_date": self.effective.isoformat(),
+            "inserted": len(self.inserted),
+            "updated": len(self.updated),
+            "cancelled": len(self.cancelled),
+            "unchanged": self.unchanged,
+            "changes": {
+                "inserted": self.inserted,
+                "updated": [
+                    {
+                        "series_id": u.series.id,
+                        "slot": u.slot,
+                        "columns": {c: {"from": old, "to": new} for c, (old, new) in u.columns.items()}
+                    }
+                    for u in self.updated
+                ],
+                "cancelled": [{"series_id": s.id, "slot": series_slot(s)} for s in self.cancelled]
+            }
+        }
+
+    def owners(self) -> Tuple[Set[str], Set[str]]:
+        """Groups and teachers whose timetable changes"""
+        groups, teachers = set(), set()
+        for slot in self.inserted:
+            groups.add(slot["group_id"])
+            teachers.add(slot["teacher_id"])
+        for update in self.updated:
+            groups.add(update.series.id_groupe)
+            teachers.update({update.series.id_enseignant, update.slot["teacher_id"]})
+        for series in self.cancelled:
+            groups.add(series.id_groupe)
+            teachers.add(series.id_enseignant)
+        return groups, teachers
+
+
+def _dates_change(series, plan: SemesterPlan, effective: date) -> bool:
+    """Whether a live series needs new dates, excluded dates or its semester from effective on"""
+    if series.semester != plan.semester or _day(series.end_date) != plan.end:
+        return True
+    if _day(series.start_date) >= effective and _day(series.start_date) != max(plan.start, effective):
+        return True
+    excluded = {
+        _day(e.date) for e in series.exceptions
+        if e.reason == EXCLUDED_DATE_REASON and _day(e.date) >= effective
+    }
+    return excluded != plan.excluded_for(series.week_day, effective)
+
+
+def diff_timetable(live_series: Iterable, plan: SemesterPlan, effective: date) -> TimetableDiff:
+    """Minimal set of series inserts, updates and cancellations turning live into plan"""
+    diff = TimetableDiff(effective=effective)
+    remaining = list(live_series)
+    unmatched = []
+
+    # Identical slots first, so a moved teacher or room does not steal another slot's series
+    for slot in plan.slots:
+        exact = next((s for s in remaining if series_slot(s) == slot), None)
+        if exact is None:
+            unmatched.append(slot)
+            continue
+        remaining.remove(exact)
+        if _dates_change(exact, plan, effective):
+            diff.updated.append(SeriesUpdate(series=exact, slot=slot))
+        else:
+            diff.unchanged += 1
+
+    for slot in unmatched:
+        key = tuple(slot[f] for f in MATCH_FIELDS)
+        match = next((s for s in remaining if tuple(series_slot(s)[f] for f in MATCH_FIELDS) == key), None)
+        if match is None:
+            diff.inserted.append(slot)
+            continue
+        remaining.remove(match)
+        columns = {
+            column: (getattr(match, column), slot[slot_field])
+            for slot_field, column in SLOT_COLUMNS.items()
+            if column in UPDATABLE_COLUMNS and getattr(match, column) != slot[slot_field]
+        }
+        diff.updated.append(SeriesUpdate(series=match, slot=slot, columns=columns))
+
+    diff.cancelled = remaining
+    return diff
+
+
+class TimetablePublisher:
+    """Drafts, versions and diff publishing of a department's semester timetable"""
+
+    def __init__(self, prisma: Prisma):
+        self.prisma = prisma
+
+    # ------------------------------------------------------------------
+    # Versions
+    # ------------------------------------------------------------------
+
+    async def live_version(self, department_id: str, semester: str, tx: Optional[Prisma] = None) -> int:
+        """Version number of the published timetable (0 before the first publish)"""
+        latest = await (tx or self.prisma).timetabledraft.find_first(
+            where={"id_departement": department_id, "semester": semester, "status": PUBLISHED_STATUS},
+            order={"version": "desc"}
+        )
+        return latest.version if latest else 0
+
+    async def next_version(self, department_id: str, semester: str, tx: Optional[Prisma] = None) -> int:
+        latest = await (tx or self.prisma).timetabledraft.find_first(
+            where={"id_departement": department_id, "semester": semester},
+            order={"version": "desc"}
+        )
+        return latest.version + 1 if latest else 1
+
+    async def create_draft(
+        self, department_id: str, payload: Dict, created_by: Optional[str] = None, status: str = DRAFT_STATUS
+    ):
+        """New draft version based on the live one"""
+        semester = payload["semester"]
+        return await self.prisma.timetabledraft.create(
+            data={
+                "id_departement": department_id,
+                "semester": semester,
+                "status": status,
+                "version": await self.next_version(department_id, semester),
+                "base_version": await self.live_version(department_id, semester),
+                "payload": Json(payload),
+                "created_by": created_by
+            }
+        )
+
+    async def snapshot(self, department_id: str, semester: str, effective: Optional[date] = None) -> Dict:
+        """Draft payload reproducing the live timetable (series still running at effective)"""
+        effective = effective or date.today()
+        live = await self._live_series(department_id, semester, effective)
+        if not live:
+            return {"semester": semester, "start_date": None, "end_date": None, "exclude_dates": [], "schedules": []}
+
+        excluded = sorted({
+            _day(e.date) for s in live for e in s.exceptions if e.reason == EXCLUDED_DATE_REASON
+        })
+        slots = sorted(
+            (series_slot(s) for s in live),
+            key=lambda slot: (slot["group_id"], slot["week_day"], slot["start_time"])
+        )
+        return {
+            "semester": semester,
+            "start_date": min(_day(s.start_date) for s in live).isoformat(),
+            "end_date": max(_day(s.end_date) for s in live).isoformat(),
+            "exclude_dates": [d.isoformat() for d in excluded],
+            "schedules": slots
+        }
+
+    # ------------------------------------------------------------------
+    # Diff and publish
+    # ------------------------------------------------------------------
+
+    async def _live_series(
+        self, department_id: str, semester: str, effective: date, tx: Optional[Prisma] = None
+    ) -> List:
+        where = department_series_where(department_id, semester)
+        where["end_date"] = {"gte": _midnight(effective)}
+        return await (tx or self.prisma).scheduleseries.find_many(
+            where=where,
+            include={"exceptions": True},
+            order={"createdAt": "asc"}
+        )
+
+    @staticmethod
+    def effective_date(plan: SemesterPlan, today: Optional[date] = None) -> date:
+        return max(today or date.today(), plan.start)
+
+    async def diff(self, department_id: str, payload: Dict, today: Optional[date] = None) -> TimetableDiff:
+        plan = SemesterPlan.from_payload(payload)
+        effective = self.effective_date(plan, today)
+        live = await self._live_series(department_id, plan.semester, effective)
+        return diff_timetable(live, plan, effective)
+
+    async def publish(
+        self,
+        department_id: str,
+        payload: Dict,
+        draft=None,
+        published_by: Optional[str] = None,
+        today: Optional[date] = None
+    ) -> Dict:
+        """
+        Apply a timetable to the live series and record it as the new version
+
+        Returns the diff summary, the version number and the teachers whose
+        sessions changed (for notifications). With a draft, the draft itself
+        becomes the published version and is refused if another version was
+        published since it was created or was itself published meanwhile.
+        Raises ValueError when the semester is already over.
+        """
+        plan = SemesterPlan.from_payload(payload)
+        effective = self.effective_date(plan, today)
+        if effective > plan.end:
+            raise ValueError("Le semestre est terminé : aucune séance à publier")
+
+        async with self.prisma.tx() as tx:
+            await tx.query_raw(PUBLISH_LOCK_SQL, department_id, plan.semester)
+
+            live_version = await self.live_version(department_id, plan.semester, tx=tx)
+            if draft is not None:
+                current = await tx.timetabledraft.find_unique(where={"id": draft.id})
+                if current is None or current.status != DRAFT_STATUS:
+                    raise StaleDraftError("Ce brouillon a déjà été appliqué")
+                if (current.base_version or 0) != live_version:
+                    raise StaleDraftError(
+                        f"Ce brouillon est basé sur la version {current.base_version or 0}, "
+                        f"la version publiée est désormais la {live_version}"
+                    )
+
+            live = await self._live_series(department_id, plan.semester, effective, tx=tx)
+            diff = diff_timetable(live, plan, effective)
+            summary = diff.summary()
+
+            for series in diff.cancelled:
+                await self._cancel(tx, series, effective)
+            for update in diff.updated:
+                await self._update(tx, update, plan, effective)
+            for slot in diff.inserted:
+                await self._insert(tx, slot, plan, effective)
+
+            version_data = {
+                "status": PUBLISHED_STATUS,
+                "publishedAt": datetime.now(),
+                "payload": Json({**payload, "published_diff": summary})
+            }
+            if draft is not None:
+                version = await tx.timetabledraft.update(where={"id": draft.id}, data=version_data)
+            else:
+                version = await tx.timetabledraft.create(
+                    data={
+                        **version_data,
+                        "id_departement": department_id,
+                        "semester": plan.semester,
+                        "version": await self.next_version(department_id, plan.semester, tx=tx),
+                        "base_version": live_version,
+                        "created_by": published_by
+                    }
+                )
+
+        group_ids, teacher_ids = diff.owners()
+        if not diff.is_empty:
+            await invalidate_schedule_cache(self.prisma, group_ids=group_ids, teacher_ids=teacher_ids)
+
+        return {
+            "version": version.version,
+            "draft_id": version.id,
+            "affected_teachers": sorted(teacher_ids),
+            **summary
+        }
+
+    # ------------------------------------------------------------------
+    # Apply steps (inside the publish transaction)
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    async def _cancel(tx, series, effective: date):
+        """Stop a series at the effective date; its stored future rows become CANCELED"""
+        await tx.emploitemps.update_many(
+            where={"id_series": series.id, "date": {"gte": _midnight(effective)}},
+            data={"status": "CANCELED"}
+        )
+        if _day(series.start_date) < effective:
+            await tx.scheduleseriesexception.delete_many(
+                where={"id_series": series.id, "date": {"gte": _midnight(effective)}}
+            )
+            await tx.scheduleseries.update(
+                where={"id": series.id},
+                data={"end_date": _midnight(effective - timedelta(days=1))}
+            )
+        else:
+            await tx.scheduleseries.delete(where={"id": series.id})
+
+    async def _update(self, tx, update: SeriesUpdate, plan: SemesterPlan, effective: date):
+        series = update.series
+        new_columns = {column: new for column, (_, new) in update.columns.items()}
+        start = _day(series.start_date)
+
+        if new_columns and start < effective:
+            # The past stays on the old series; rows and skips from effective on move over
+            target = await tx.scheduleseries.create(
+                data={
+                    **self._series_data(update.slot, plan.semester),
+                    "start_date": _midnight(effective),
+                    "end_date": _midnight(plan.end)
+                }
+            )
+            await tx.scheduleseries.update(
+                where={"id": series.id},
+                data={"end_date": _midnight(effective - timedelta(days=1))}
+            )
+            moved = {"id_series": series.id, "date": {"gte": _midnight(effective)}}
+            await tx.emploitemps.update_many(where=moved, data={"id_series": target.id})
+            await tx.scheduleseriesexception.update_many(where=moved, data={"id_series": target.id})
+            target_id = target.id
+        else:
+            data = {**new_columns, "end_date": _midnight(plan.end), "semester": plan.semester}
+            if start >= effective:
+                data["start_date"] = _midnight(max(plan.start, effective))
+            await tx.scheduleseries.update(where={"id": series.id}, data=data)
+            target_id = series.id
+
+        await self._propagate(tx, target_id, update.columns, effective)
+        await self._sync_excluded(tx, target_id, series, plan, effective)
+
+    @staticmethod
+    async def _propagate(tx, series_id: str, columns: Dict[str, Tuple[Any, Any]], effective: date):
+        """Stored future rows follow the series unless they were changed individually"""
+        since = _midnight(effective)
+        for column, (old, new) in columns.items():
+            if column == "end_time":
+                await tx.execute_raw(
+                    """
+                    UPDATE "Schedule"
+                    SET "heure_fin" = date_trunc('day', "date") + $1::interval, "updatedAt" = now()
+                    WHERE "id_series" = $2 AND "date" >= $3::timestamp AND to_char("heure_fin", 'HH24:MI') = $4
+                    """,
+                    new, series_id, since.isoformat(), old
+                )
+            else:
+                await tx.emploitemps.update_many(
+                    where={"id_series": series_id, "date": {"gte": since}, column: old},
+                    data={column: new}
+                )
+
+    @staticmethod
+    async def _sync_excluded(tx, series_id: str, series, plan: SemesterPlan, effective: date):
+        """Excluded-date exceptions and rows from effective on match the plan"""
+        since = _midnight(effective)
+        wanted = plan.excluded_for(series.week_day, effective)
+        current = {
+            _day(e.date) for e in series.exceptions
+            if e.reason == EXCLUDED_DATE_REASON and _day(e.date) >= effective
+        }
+
+        dropped = current - wanted
+        if dropped:
+            await tx.scheduleseriesexception.delete_many(
+                where={
+                    "id_series": series_id,
+                    "reason": EXCLUDED_DATE_REASON,
+                    "date": {"in": [_midnight(d) for d in dropped]}
+                }
+            )
+        added = wanted - current
+        if added:
+            await tx.scheduleseriesexception.create_many(
+                data=[
+                    {"id_series": series_id, "date": _midnight(d), "reason": EXCLUDED_DATE_REASON}
+                    for d in sorted(added)
+                ],
+                skip_duplicates=True
+            )
+
+        # Stored rows on newly excluded dates or past the new end are off
+        await tx.emploitemps.update_many(
+            where={
+                "id_series": series_id,
+                "date": {"gte": since},
+                "OR": [
+                    {"date": {"in": [_midnight(d) for d in added]}},
+                    {"date": {"gt": _midnight(plan.end)}}
+                ]
+            },
+            data={"status": "CANCELED"}
+        )
+
+    async def _insert(self, tx, slot: Dict, plan: SemesterPlan, effective: date):
+        start = max(plan.start, effective)
+        series = await tx.scheduleseries.create(
+            data={
+                **self._series_data(slot, plan.semester),
+                "start_date": _midnight(start),
+                "end_date": _midnight(plan.end)
+            }
+        )
+        excluded = [d for d in series_dates(series) if d in plan.excluded]
+        if excluded:
+            await tx.scheduleseriesexception.create_many(
+                data=[
+                    {"id_series": series.id, "date": _midnight(d), "reason": EXCLUDED_DATE_REASON}
+                    for d in excluded
+                ]
+            )
+
+    @staticmethod
+    def _series_data(slot: Dict, semester: str) -> Dict:
+        return {
+            **{column: slot[slot_field] for slot_field, column in SLOT_COLUMNS.items()},
+            "semester": semester
+        }
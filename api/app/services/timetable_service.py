@@ -19,6 +19,17 @@ from prisma import Prisma
 from dataclasses import dataclass
 from enum import Enum
 
+from app.services.timetable_cache import (
+    WeeklyTimetableCache,
+    SCOPE_GROUP,
+    SCOPE_TEACHER,
+    iter_sessions,
+    invalidate_schedule_cache,
+)
+from app.services.session_replanner import SessionReplanner
+from app.services.schedule_availability import DayAvailability, ROOM, TEACHER, GROUP
+from app.services.schedule_series import find_schedule, prepare_update, release_occurrence
+
 
 class DayOfWeek(str, Enum):
     """Days of the week for recurring schedules"""
@@ -92,23 +103,16 @@ class TimetableConflictChecker:
         """
         conflicts = []
         
-        # Build time overlap query
-        overlap_query = self._build_overlap_query(
-            schedule_date, start_time, end_time, exclude_schedule_id
+        # Stored sessions and series occurrences of the day
+        day = await DayAvailability.load(
+            self.prisma,
+            schedule_date.date(),
+            exclude_ids=[exclude_schedule_id],
+            include={"matiere": True, "groupe": True, "enseignant": True, "salle": True}
         )
         
         # Check room conflicts
-        room_conflicts = await self.prisma.emploitemps.find_many(
-            where={**overlap_query, "id_salle": salle_id},
-            include={
-                "matiere": True,
-                "groupe": True,
-                "enseignant": True,
-                "salle": True
-            }
-        )
-        
-        for conflict in room_conflicts:
+        for conflict in day.overlapping(ROOM, salle_id, start_time, end_time):
             conflicts.append(ConflictInfo(
                 type="room",
                 message=f"Salle {conflict.salle.nom} est déjà réservée de {conflict.heure_debut.strftime('%H:%M')} à {conflict.heure_fin.strftime('%H:%M')}",
@@ -117,17 +121,7 @@ class TimetableConflictChecker:
             ))
         
         # Check teacher conflicts
-        teacher_conflicts = await self.prisma.emploitemps.find_many(
-            where={**overlap_query, "id_enseignant": enseignant_id},
-            include={
-                "matiere": True,
-                "groupe": True,
-                "enseignant": True,
-                "salle": True
-            }
-        )
-        
-        for conflict in teacher_conflicts:
+        for conflict in day.overlapping(TEACHER, enseignant_id, start_time, end_time):
             conflicts.append(ConflictInfo(
                 type="teacher",
                 message=f"Enseignant déjà occupé de {conflict.heure_debut.strftime('%H:%M')} à {conflict.heure_fin.strftime('%H:%M')} avec le groupe {conflict.groupe.nom}",
@@ -136,17 +130,7 @@ class TimetableConflictChecker:
             ))
         
         # Check group conflicts
-        group_conflicts = await self.prisma.emploitemps.find_many(
-            where={**overlap_query, "id_groupe": groupe_id},
-            include={
-                "matiere": True,
-                "groupe": True,
-                "enseignant": True,
-                "salle": True
-            }
-        )
-        
-        for conflict in group_conflicts:
+        for conflict in day.overlapping(GROUP, groupe_id, start_time, end_time):
             conflicts.append(ConflictInfo(
                 type="group",
                 message=f"Groupe {conflict.groupe.nom} a déjà cours de {conflict.heure_debut.strftime('%H:%M')} à {conflict.heure_fin.strftime('%H:%M')}",
@@ -155,45 +139,6 @@ class TimetableConflictChecker:
             ))
         
         return conflicts
-    
-    def _build_overlap_query(
-        self,
-        schedule_date: datetime,
-        start_time: datetime,
-        end_time: datetime,
-        exclude_id: Optional[str] = None
-    ) -> dict:
-        """Build query to find overlapping schedules"""
-        # Same day
-        day_start = datetime.combine(schedule_date.date(), time.min)
-        day_end = datetime.combine(schedule_date.date(), time.max)
-        
-        query = {
-            "date": {"gte": day_start, "lte": day_end},
-            "status": {"not": "CANCELED"},
-            "OR": [
-                # New schedule starts during existing schedule
-                {"AND": [
-                    {"heure_debut": {"lte": start_time}},
-                    {"heure_fin": {"gt": start_time}}
-                ]},
-                # New schedule ends during existing schedule
-                {"AND": [
-                    {"heure_debut": {"lt": end_time}},
-                    {"heure_fin": {"gte": end_time}}
-                ]},
-                # New schedule completely contains existing schedule
-                {"AND": [
-                    {"heure_debut": {"gte": start_time}},
-                    {"heure_fin": {"lte": end_time}}
-                ]}
-            ]
-        }
-        
-        if exclude_id:
-            query["NOT"] = {"id": exclude_id}
-        
-        return query
 
 
 class TimetableGenerator:
@@ -219,6 +164,7 @@ class TimetableGenerator:
             (list of created schedule IDs, list of conflicts encountered)
         """
         created_ids = []
+        created = []
         all_conflicts = []
         
         # Get all dates for this day of week in the semester
@@ -265,9 +211,12 @@ class TimetableGenerator:
                     }
                 )
                 created_ids.append(schedule.id)
+                created.append(schedule)
             except Exception as e:
                 print(f"Error creating schedule for {schedule_date}: {e}")
         
+        await invalidate_schedule_cache(self.prisma, sessions=created)
+        
         return created_ids, all_conflicts
     
     def _get_recurring_dates(
@@ -381,34 +330,7 @@ class TimetableService:
         
         week_end = week_start + timedelta(days=6)
         
-        schedules = await self.prisma.emploitemps.find_many(
-            where={
-                "id_groupe": groupe_id,
-                "date": {
-                    "gte": datetime.combine(week_start, time.min),
-                    "lte": datetime.combine(week_end, time.max)
-                },
-                "status": {"not": "CANCELED"}
-            },
-            include={
-                "matiere": True,
-                "enseignant": True,
-                "salle": True,
-                "groupe": {
-                    "include": {
-                        "niveau": {
-                            "include": {
-                                "specialite": True
-                            }
-                        }
-                    }
-                }
-            },
-            order=[
-                {"date": "asc"},
-                {"heure_debut": "asc"}
-            ]
-        )
+        schedules = await self._get_cached_week(SCOPE_GROUP, groupe_id, week_start)
         
         # Organize by day of week
         timetable = self._organize_by_day(schedules)
@@ -436,34 +358,7 @@ class TimetableService:
         
         week_end = week_start + timedelta(days=6)
         
-        schedules = await self.prisma.emploitemps.find_many(
-            where={
-                "id_enseignant": enseignant_id,
-                "date": {
-                    "gte": datetime.combine(week_start, time.min),
-                    "lte": datetime.combine(week_end, time.max)
-                },
-                "status": {"not": "CANCELED"}
-            },
-            include={
-                "matiere": True,
-                "groupe": {
-                    "include": {
-                        "niveau": {
-                            "include": {
-                                "specialite": True
-                            }
-                        }
-                    }
-                },
-                "salle": True,
-                "enseignant": True
-            },
-            order=[
-                {"date": "asc"},
-                {"heure_debut": "asc"}
-            ]
-        )
+        schedules = await self._get_cached_week(SCOPE_TEACHER, enseignant_id, week_start)
         
         # Organize by day of week
         timetable = self._organize_by_day(schedules)
@@ -488,8 +383,10 @@ class TimetableService:
         Only allowed for chef de département
         """
         # Get existing schedule
-        existing = await self.prisma.emploitemps.find_unique(
-            where={"id": schedule_id},
+        existing = await find_schedule(
+            self.prisma,
+            schedule_id,
+            materialize=True,
             include={
                 "matiere": {
                     "include": {
@@ -508,11 +405,16 @@ class TimetableService:
         if existing.matiere.specialite.id_departement != department_id:
             raise PermissionError("Not authorized to modify this schedule")
         
-        # Apply updates
+        # Apply updates (a session of a series is stored on first edit)
+        updates = prepare_update(existing, updates)
         updated = await self.prisma.emploitemps.update(
-            where={"id": schedule_id},
+            where={"id": existing.id},
             data=updates
         )
+        await release_occurrence(self.prisma, existing, updates)
+        
+        # Drop the cached weeks of both the old and the new placement
+        await invalidate_schedule_cache(self.prisma, sessions=[existing, updated])
         
         return {"success": True, "schedule": updated}
     
@@ -520,7 +422,8 @@ class TimetableService:
         self,
         schedule_id: str,
         department_id: str,
-        reason: str = None
+        reason: str = None,
+        suggest_replacements: bool = False
     ) -> Dict:
         """
         Cancel a schedule (mark as CANCELED, don't delete)
@@ -533,10 +436,26 @@ class TimetableService:
             department_id
         )
         
-        return {
+        result = {
             "success": True,
             "message": "Séance annulée avec succès"
         }
+        if suggest_replacements:
+            result["replacements"] = await self.suggest_replacements(schedule_id)
+        return result
+    
+    async def suggest_replacements(
+        self,
+        schedule_id: str,
+        radius_days: int = 7,
+        limit: int = 10
+    ) -> Dict:
+        """
+        Ranked free slots (group + teacher + room) around a cancelled or moved session
+        
+        Options can be submitted as makeup sessions as-is.
+        """
+        return await SessionReplanner(self.prisma).propose(schedule_id, radius_days, limit)
     
     async def _validate_department_ownership(
         self,
@@ -578,8 +497,13 @@ class TimetableService:
         if not enseignant or enseignant.id_departement != department_id:
             raise PermissionError("Enseignant n'appartient pas à votre département")
     
-    def _organize_by_day(self, schedules) -> Dict:
-        """Organize schedules by day of week"""
+    async def _get_cached_week(self, scope: str, owner_id: str, week_start: date) -> List[Dict]:
+        """Non-cancelled sessions of a week from the materialized view"""
+        week = await WeeklyTimetableCache(self.prisma).get_week(scope, owner_id, week_start)
+        return [s for s in iter_sessions(week) if s["status"] != "CANCELED"]
+    
+    def _organize_by_day(self, schedules: List[Dict]) -> Dict:
+        """Organize serialized sessions by day of week"""
         days = {
             0: "lundi",
             1: "mardi",
@@ -592,48 +516,18 @@ class TimetableService:
         timetable = {day_name: [] for day_name in days.values()}
         
         for schedule in schedules:
-            day_num = schedule.date.weekday()
-            if day_num in days:
-                day_name = days[day_num]
-                timetable[day_name].append({
-                    "id": schedule.id,
-                    "date": schedule.date.isoformat(),
-                    "start_time": schedule.heure_debut.strftime("%H:%M"),
-                    "end_time": schedule.heure_fin.strftime("%H:%M"),
-                    "status": schedule.status,
-                    "matiere": {
-                        "id": schedule.matiere.id,
-                        "nom": schedule.matiere.nom,
-                        "code": schedule.matiere.code if hasattr(schedule.matiere, 'code') else None
-                    },
-                    "enseignant": {
-                        "id": schedule.enseignant.id,
-                        "nom": schedule.enseignant.nom,
-                        "prenom": schedule.enseignant.prenom,
-                        "email": schedule.enseignant.email if hasattr(schedule.enseignant, 'email') else None
-                    },
-                    "salle": {
-                        "id": schedule.salle.id,
-                        "code": schedule.salle.code,
-                        "type": schedule.salle.type,
-                        "capacite": schedule.salle.capacite
-                    },
-                    "groupe": {
-                        "id": schedule.groupe.id,
-                        "nom": schedule.groupe.nom,
-                        "niveau": schedule.groupe.niveau.nom if schedule.groupe.niveau else None,
-                        "specialite": schedule.groupe.niveau.specialite.nom if schedule.groupe.niveau and schedule.groupe.niveau.specialite else None
-                    }
+            if schedule["day"] in days:
+                timetable[days[schedule["day"]]].append({
+                    key: schedule[key]
+                    for key in ("id", "date", "start_time", "end_time", "status",
+                                "matiere", "enseignant", "salle", "groupe")
                 })
         
         return timetable
     
-    def _calculate_total_hours(self, schedules) -> str:
-        """Calculate total hours from schedules"""
-        total_minutes = sum(
-            (s.heure_fin - s.heure_debut).total_seconds() / 60
-            for s in schedules
-        )
+    def _calculate_total_hours(self, schedules: List[Dict]) -> str:
+        """Calculate total hours from serialized sessions"""
+        total_minutes = sum(s["duration_minutes"] for s in schedules)
         hours = int(total_minutes // 60)
         minutes = int(total_minutes % 60)
         return f"{hours}h{minutes:02d}"
@@ -0,0 +1,520 @@
+"""
+Automatic Timetable Solver
+
+Builds a weekly timetable template for a department (which subject each
+group has, when, where and with whom), to be expanded over the semester
+like a hand-made semester timetable.
+
+Hard constraints (never violated):
+- a group, a teacher and a room hold at most one session per slot
+- the room is large enough for the group (Salle.capacite)
+- teachers are not scheduled when unavailable, nor when already teaching
+  for another department; rooms used by other departments stay blocked
+
+Soft constraints (minimized): the same subject twice a day for a group,
+overloaded days, gaps in a group's day, Saturday sessions, teacher day
+load and oversized rooms.
+
+The search is a greedy construction (hardest sessions first, best-fit
+room) followed by a repair pass (relocating one blocking session to fit
+an unplaced one) and a local search that moves sessions while some move
+lowers the cost (moves that keep it equal are taken to cross plateaus)
+and stops at the first pass without an improving move. Several seeds run
+in one process pool shared by all requests and the best result wins.
+Problems are plain picklable data, independent of Prisma.
+"""
+
+import asyncio
+import os
+import random
+import time as clock
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, List, Optional, Set, Tuple
+from prisma import Prisma
+
+from app.services.timetable_cache import UNIVERSITY_TIME_SLOTS
+
+
+# Soft constraint weights
+SAME_SUBJECT_SAME_DAY = 10
+GROUP_DAY_OVERLOAD = 4
+GROUP_GAP = 2
+SATURDAY_SESSION = 1
+TEACHER_DAY_OVERLOAD = 3
+ROOM_WASTE = 1
+
+MAX_GROUP_SESSIONS_PER_DAY = 3
+MAX_TEACHER_SESSIONS_PER_DAY = 4
+SATURDAY = 6
+
+SOLVER_DAYS = [1, 2, 3, 4, 5, SATURDAY]
+
+# Bounds of one run: searches side by side and seconds per search
+MAX_SOLVER_WORKERS = 4
+MAX_SOLVER_SECONDS = 30
+
+SOLVER_ROOM_TYPES = ["LECTURE", "LAB", "OTHER"]
+
+# Sessions of other departments over the semester, reduced to their weekly pattern
+OTHER_DEPARTMENTS_SQL = """
+SELECT DISTINCT s."id_salle" AS "room_id",
+       s."id_enseignant" AS "teacher_id",
+       EXTRACT(ISODOW FROM s."date")::int AS "week_day",
+       (EXTRACT(HOUR FROM s."heure_debut") * 60 + EXTRACT(MINUTE FROM s."heure_debut"))::int AS "start_minute",
+       (EXTRACT(HOUR FROM s."heure_fin") * 60 + EXTRACT(MINUTE FROM s."heure_fin"))::int AS "end_minute"
+FROM "schedule_occurrences" s
+JOIN "Group" g ON g."id" = s."id_groupe"
+JOIN "Level" l ON l."id" = g."id_niveau"
+JOIN "Specialty" sp ON sp."id" = l."id_specialite"
+WHERE sp."id_departement" <> $1
+  AND s."status"::text <> 'CANCELED'
+  AND s."date" >= $2::timestamp
+  AND s."date" <= $3::timestamp
+"""
+
+
+@dataclass
+class Demand:
+    """One weekly session to place"""
+    group_id: str
+    subject_id: str
+    teacher_id: str
+    group_size: int
+
+
+@dataclass
+class SolverProblem:
+    demands: List[Demand]
+    rooms: List[Tuple[str, int]]                      # (room_id, capacity)
+    days: List[int]                                   # ISO week days (1=Monday)
+    slot_count: int                                   # slots per day
+    blocked_teachers: Set[Tuple[str, int, int]] = field(default_factory=set)  # (teacher, day, slot)
+    blocked_rooms: Set[Tuple[str, int, int]] = field(default_factory=set)     # (room, day, slot)
+
+
+# A placement is (day, slot index, room_id)
+Placement = Tuple[int, int, str]
+
+
+class _State:
+    """Current assignment with occupancy indexes for O(1) feasibility checks"""
+
+    def __init__(self, problem: SolverProblem):
+        self.problem = problem
+        self.placements: List[Optional[Placement]] = [None] * len(problem.demands)
+        self.group_slots: Dict[Tuple[str, int, int], int] = {}
+        self.teacher_slots: Dict[Tuple[str, int, int], int] = {}
+        self.room_slots: Dict[Tuple[str, int, int], int] = {}
+        self.capacity = dict(problem.rooms)
+        # Rooms sorted by capacity, for best-fit search
+        self.rooms_by_size = sorted(problem.rooms, key=lambda r: (r[1], r[0]))
+
+    # -- occupancy -------------------------------------------------------
+
+    def place(self, index: int, placement: Placement):
+        demand = self.problem.demands[index]
+        day, slot, room = placement
+        self.placements[index] = placement
+        self.group_slots[(demand.group_id, day, slot)] = index
+        self.teacher_slots[(demand.teacher_id, day, slot)] = index
+        self.room_slots[(room, day, slot)] = index
+
+    def remove(self, index: int) -> Placement:
+        demand = self.problem.demands[index]
+        placement = self.placements[index]
+        day, slot, room = placement
+        del self.group_slots[(demand.group_id, day, slot)]
+        del self.teacher_slots[(demand.teacher_id, day, slot)]
+        del self.room_slots[(room, day, slot)]
+        self.placements[index] = None
+        return placement
+
+    def time_free(self, demand: Demand, day: int, slot: int) -> bool:
+        return (
+            (demand.group_id, day, slot) not in self.group_slots
+            and (demand.teacher_id, day, slot) not in self.teacher_slots
+            and (demand.teacher_id, day, slot) not in self.problem.blocked_teachers
+        )
+
+    def room_free(self, room: str, day: int, slot: int) -> bool:
+        return (room, day, slot) not in self.room_slots and (room, day, slot) not in self.problem.blocked_rooms
+
+    def best_room(self, demand: Demand, day: int, slot: int) -> Optional[str]:
+        """Smallest free room that fits the group"""
+        for room, capacity in self.rooms_by_size:
+            if capacity >= demand.group_size and self.room_free(room, day, slot):
+                return room
+        return None
+
+    def candidates(self, index: int) -> List[Placement]:
+        demand = self.problem.demands[index]
+        result = []
+        for day in self.problem.days:
+            for slot in range(self.problem.slot_count):
+                if self.time_free(demand, day, slot):
+                    room = self.best_room(demand, day, slot)
+                    if room:
+                        result.append((day, slot, room))
+        return result
+
+    # -- cost --------------------------------------------------------------
+
+    def group_day_cost(self, group_id: str, day: int) -> int:
+        indexes = [
+            self.group_slots[(group_id, day, slot)]
+            for slot in range(self.problem.slot_count)
+            if (group_id, day, slot) in self.group_slots
+        ]
+        if not indexes:
+            return 0
+
+        cost = 0
+        subjects = [self.problem.demands[i].subject_id for i in indexes]
+        cost += SAME_SUBJECT_SAME_DAY * (len(subjects) - len(set(subjects)))
+        cost += GROUP_DAY_OVERLOAD * max(0, len(indexes) - MAX_GROUP_SESSIONS_PER_DAY)
+
+        used = [self.placements[i][1] for i in indexes]
+        cost += GROUP_GAP * ((max(used) - min(used) + 1) - len(used))
+
+        if day == SATURDAY:
+            cost += SATURDAY_SESSION * len(indexes)
+        return cost
+
+    def teacher_day_cost(self, teacher_id: str, day: int) -> int:
+        load = sum(
+            1 for slot in range(self.problem.slot_count)
+            if (teacher_id, day, slot) in self.teacher_slots
+        )
+        return TEACHER_DAY_OVERLOAD * max(0, load - MAX_TEACHER_SESSIONS_PER_DAY)
+
+    def room_cost(self, index: int) -> float:
+        placement = self.placements[index]
+        if not placement:
+            return 0.0
+        capacity = self.capacity[placement[2]]
+        size = self.problem.demands[index].group_size
+        return ROOM_WASTE * (capacity - size) / capacity if capacity else 0.0
+
+    def local_cost(self, index: int, days: Set[int]) -> float:
+        demand = self.problem.demands[index]
+        return (
+            sum(self.group_day_cost(demand.group_id, d) for d in days)
+            + sum(self.teacher_day_cost(demand.teacher_id, d) for d in days)
+            + self.room_cost(index)
+        )
+
+    def total_cost(self) -> float:
+        groups = {d.group_id for d in self.problem.demands}
+        teachers = {d.teacher_id for d in self.problem.demands}
+        return (
+            sum(self.group_day_cost(g, day) for g in groups for day in self.problem.days)
+            + sum(self.teacher_day_cost(t, day) for t in teachers for day in self.problem.days)
+            + sum(self.room_cost(i) for i in range(len(self.placements)))
+        )
+
+    def placement_delta(self, index: int, placement: Placement) -> float:
+        """Cost change of placing an unplaced demand"""
+        days = {placement[0]}
+        before = self.local_cost(index, days)
+        self.place(index, placement)
+        after = self.local_cost(index, days)
+        self.remove(index)
+        return after - before
+
+
+def _greedy(state: _State, rng: random.Random):
+    problem = state.problem
+
+    def difficulty(index: int):
+        demand = problem.demands[index]
+        fitting_rooms = sum(1 for _, capacity in problem.rooms if capacity >= demand.group_size)
+        teacher_load = sum(1 for d in problem.demands if d.teacher_id == demand.teacher_id)
+        return (fitting_rooms, -teacher_load, rng.random())
+
+    for index in sorted(range(len(problem.demands)), key=difficulty):
+        options = state.candidates(index)
+        if not options:
+            continue
+        best = min(options, key=lambda p: (state.placement_delta(index, p), rng.random()))
+        state.place(index, best)
+
+
+def _repair(state: _State, rng: random.Random):
+    """Fit unplaced demands by moving one blocking session elsewhere"""
+    problem = state.problem
+    for index in [i for i, p in enumerate(state.placements) if p is None]:
+        demand = problem.demands[index]
+        slots = [(day, slot) for day in problem.days for slot in range(problem.slot_count)]
+        rng.shuffle(slots)
+
+        for day, slot in slots:
+            if (demand.teacher_id, day, slot) in problem.blocked_teachers:
+                continue
+            blockers = {
+                state.group_slots.get((demand.group_id, day, slot)),
+                state.teacher_slots.get((demand.teacher_id, day, slot))
+            } - {None}
+            if len(blockers) != 1:
+                continue
+
+            blocker = blockers.pop()
+            previous = state.remove(blocker)
+            room = state.best_room(demand, day, slot) if state.time_free(demand, day, slot) else None
+            if room:
+                state.place(index, (day, slot, room))
+                moves = [p for p in state.candidates(blocker) if p[:2] != (day, slot)]
+                if moves:
+                    state.place(blocker, rng.choice(moves))
+                    break
+                state.remove(index)
+            state.place(blocker, previous)
+
+
+def _move(state: _State, index: int, target: Placement) -> float:
+    """Move a placed demand to target; returns the cost change"""
+    current = state.placements[index]
+    days = {current[0], target[0]}
+    before = state.local_cost(index, days)
+    state.remove(index)
+    state.place(index, target)
+    return state.local_cost(index, days) - before
+
+
+def _local_search(state: _State, rng: random.Random, deadline: float):
+    """
+    Passes over the placed sessions, each taking its first improving move
+
+    A session without one takes a random equal-cost move instead. The search
+    ends at the deadline or after a pass in which no move lowered the cost.
+    """
+    placed = [i for i, p in enumerate(state.placements) if p is not None]
+
+    improved = True
+    while improved:
+        improved = False
+        rng.shuffle(placed)
+        for index in placed:
+            if clock.monotonic() >= deadline:
+                return
+            current = state.placements[index]
+            options = [p for p in state.candidates(index) if p != current]
+            rng.shuffle(options)
+
+            sideways = None
+            for target in options:
+                delta = _move(state, index, target)
+                if delta < 0:
+                    improved = True
+                    break
+                if delta == 0 and sideways is None:
+                    sideways = target
+                state.remove(index)
+                state.place(index, current)
+            else:
+                if sideways is not None:
+                    _move(state, index, sideways)
+
+
+def solve(problem: SolverProblem, seed: int = 0, time_limit: float = 10.0) -> Dict:
+    """
+    Run one greedy + repair + local search pass
+
+    Returns {"placements": [(day, slot, room) | None per demand],
+    "unplaced": count, "cost": soft cost, "seed": seed}.
+    """
+    deadline = clock.monotonic() + time_limit
+    rng = random.Random(seed)
+
+    state = _State(problem)
+    _greedy(state, rng)
+    _repair(state, rng)
+    _local_search(state, rng, deadline)
+
+    return {
+        "placements": state.placements,
+        "unplaced": sum(1 for p in state.placements if p is None),
+        "cost": round(state.total_cost(), 3),
+        "seed": seed
+    }
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def solver_pool() -> ProcessPoolExecutor:
+    """Process pool shared by all solver runs, started on first use"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=min(MAX_SOLVER_WORKERS, os.cpu_count() or 1))
+    return _pool
+
+
+async def solve_in_pool(problem: SolverProblem, workers: int = 4, time_limit: float = 10.0) -> Dict:
+    """
+    Run one search per worker with different seeds and keep the best
+
+    Workers and time_limit are capped (MAX_SOLVER_WORKERS, MAX_SOLVER_SECONDS);
+    concurrent runs queue on the shared pool.
+    """
+    workers = max(1, min(workers, MAX_SOLVER_WORKERS))
+    time_limit = min(time_limit, MAX_SOLVER_SECONDS)
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*[
+        loop.run_in_executor(solver_pool(), solve, problem, seed, time_limit)
+        for seed in range(workers)
+    ])
+    return min(results, key=lambda r: (r["unplaced"], r["cost"]))
+
+
+def _to_minutes(hhmm: str) -> int:
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+SLOT_MINUTES = [(_to_minutes(slot["start"]), _to_minutes(slot["end"])) for slot in UNIVERSITY_TIME_SLOTS]
+
+
+def overlapping_slots(start_minute: int, end_minute: int) -> List[int]:
+    """Indexes of the standard slots overlapping [start, end)"""
+    return [
+        index for index, (slot_start, slot_end) in enumerate(SLOT_MINUTES)
+        if start_minute < slot_end and slot_start < end_minute
+    ]
+
+
+def default_weekly_sessions(subject) -> int:
+    """Matiere has no weekly hours: one 1h30 session per coefficient point"""
+    return max(1, round(subject.coefficient or 1))
+
+
+class TimetableSolverService:
+    """Builds solver problems from the database and turns results into drafts"""
+
+    def __init__(self, prisma: Prisma):
+        self.prisma = prisma
+
+    async def build_problem(
+        self,
+        department_id: str,
+        start_date: date,
+        end_date: date,
+        group_ids: Optional[List[str]] = None,
+        weekly_sessions: Optional[Dict[str, int]] = None,
+        teacher_unavailability: Optional[List[Dict]] = None
+    ) -> Tuple[SolverProblem, Dict]:
+        """
+        Demands, rooms and blocked slots of a department
+
+        weekly_sessions overrides the number of weekly sessions per
+        subject id (0 leaves the subject out). Returns the problem and the
+        display labels / issues needed to present the result.
+        """
+        weekly_sessions = weekly_sessions or {}
+
+        group_where = {"niveau": {"specialite": {"id_departement": department_id}}}
+        if group_ids:
+            group_where["id"] = {"in": group_ids}
+        groups = await self.prisma.groupe.find_many(where=group_where, order={"nom": "asc"})
+        level_ids = list({g.id_niveau for g in groups})
+
+        subjects = await self.prisma.matiere.find_many(
+            where={"id_niveau": {"in": level_ids}},
+            include={"enseignant": True}
+        ) if level_ids else []
+
+        sizes = await self.prisma.etudiant.group_by(
+            by=["id_groupe"],
+            where={"id_groupe": {"in": [g.id for g in groups]}},
+            count={"_all": True}
+        ) if groups else []
+        group_size = {row["id_groupe"]: row["_count"]["_all"] for row in sizes}
+
+        rooms = await self.prisma.salle.find_many(
+            where={"type": {"in": SOLVER_ROOM_TYPES}},
+            order={"code": "asc"}
+        )
+
+        subjects_by_level: Dict[str, List] = {}
+        for subject in subjects:
+            subjects_by_level.setdefault(subject.id_niveau, []).append(subject)
+
+        demands = []
+        without_teacher = []
+        for group in groups:
+            for subject in subjects_by_level.get(group.id_niveau, []):
+                if not subject.id_enseignant:
+                    without_teacher.append({"subject_id": subject.id, "subject": subject.nom})
+                    continue
+                count = weekly_sessions.get(subject.id, default_weekly_sessions(subject))
+                for _ in range(max(0, count)):
+                    demands.append(Demand(
+                        group_id=group.id,
+                        subject_id=subject.id,
+                        teacher_id=subject.id_enseignant,
+                        group_size=group_size.get(group.id, 0)
+                    ))
+
+        problem = SolverProblem(
+            demands=demands,
+            rooms=[(room.id, room.capacite) for room in rooms],
+            days=SOLVER_DAYS,
+            slot_count=len(UNIVERSITY_TIME_SLOTS)
+        )
+
+        for row in await self.prisma.query_raw(
+            OTHER_DEPARTMENTS_SQL, department_id, start_date.isoformat(), end_date.isoformat()
+        ):
+            for slot in overlapping_slots(row["start_minute"], row["end_minute"]):
+                if row["room_id"]:
+                    problem.blocked_rooms.add((row["room_id"], row["week_day"], slot))
+                if row["teacher_id"]:
+                    problem.blocked_teachers.add((row["teacher_id"], row["week_day"], slot))
+
+        for item in teacher_unavailability or []:
+            start = _to_minutes(item.get("start_time") or "00:00")
+            end = _to_minutes(item.get("end_time") or "23:59")
+            for slot in overlapping_slots(start, end):
+                problem.blocked_teachers.add((item["teacher_id"], item["week_day"], slot))
+
+        teachers = {s.id_enseignant: s.enseignant for s in subjects if s.enseignant}
+        labels = {
+            "groups": {g.id: g.nom for g in groups},
+            "subjects": {s.id: s.nom for s in subjects},
+            "teachers": {t_id: f"{t.prenom} {t.nom}" for t_id, t in teachers.items()},
+            "rooms": {room.id: room.code for room in rooms},
+            "subjects_without_teacher": without_teacher
+        }
+        return problem, labels
+
+    @staticmethod
+    def to_schedules(problem: SolverProblem, result: Dict, labels: Dict) -> Tuple[List[Dict], List[Dict]]:
+        """Recurring slots (semester timetable format) and unplaced sessions"""
+        schedules = []
+        unplaced = []
+        for demand, placement in zip(problem.demands, result["placements"]):
+            entry = {
+                "subject_id": demand.subject_id,
+                "group_id": demand.group_id,
+                "teacher_id": demand.teacher_id,
+                "subject": labels["subjects"].get(demand.subject_id),
+                "group": labels["groups"].get(demand.group_id),
+                "teacher": labels["teachers"].get(demand.teacher_id)
+            }
+            if placement is None:
+                unplaced.append(entry)
+                continue
+
+            day, slot, room_id = placement
+            entry.update({
+                "week_day": day,
+                "start_time": UNIVERSITY_TIME_SLOTS[slot]["start"],
+                "end_time": UNIVERSITY_TIME_SLOTS[slot]["end"],
+                "room_id": room_id,
+                "room": labels["rooms"].get(room_id)
+            })
+            schedules.append(entry)
+
+        schedules.sort(key=lambda e: (e["group"] or "", e["week_day"], e["start_time"]))
+        return schedules, unplaced
@@ -0,0 +1,213 @@
+"""
+Transcript (Relevé de Notes) PDF Rendering
+
+A small PDF 1.4 writer dedicated to transcripts, so rendering needs no
+third-party library: text uses the standard Helvetica fonts (no embedding,
+WinAnsi encoding for French accents) and the page frame is drawn with plain
+path operators. Text outside WinAnsi (e.g. Arabic names) cannot be shown
+with these fonts: unsupported_characters() finds it so callers can refuse
+the document, and rendering raises UnencodableTextError rather than
+printing placeholders on an official transcript.
+
+Everything that does not depend on the student is built once per process
+and reused for every document: the catalog and font objects, and the page
+layout (title, rules, footer) as a form XObject that each page paints
+with a single Do operator. Only the student's text is laid out per
+document, so rendering a transcript is a few string joins.
+"""
+
+from functools import lru_cache
+from typing import Iterable, List, Sequence, Tuple
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+MARGIN = 50
+
+# Subject table: first row baseline, row height and the lowest baseline
+# before continuing on a new page
+TABLE_TOP = 640
+ROW_HEIGHT = 16
+TABLE_BOTTOM = 140
+ROWS_PER_PAGE = (TABLE_TOP - TABLE_BOTTOM) // ROW_HEIGHT
+
+# Column x positions: subject, coefficient, grades, average
+COLUMNS = (MARGIN, 290, 340, 500)
+MAX_SUBJECT_CHARS = 40
+MAX_GRADES_CHARS = 32
+
+# Objects shared by every document
+CATALOG, PAGES, FONT_REGULAR, FONT_BOLD, LAYOUT = 1, 2, 3, 4, 5
+FIRST_PAGE_OBJECT = 6
+
+
+class UnencodableTextError(ValueError):
+    """Text the standard fonts cannot show (outside WinAnsi)"""
+
+
+def _text(value) -> bytes:
+    """A PDF string literal in WinAnsi encoding"""
+    try:
+        raw = str(value).encode("cp1252")
+    except UnicodeEncodeError as e:
+        raise UnencodableTextError(f"Unsupported characters in transcript text: {value}") from e
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def unsupported_characters(data) -> str:
+    """Characters of a ReportData's text that the transcript cannot show (empty if none)"""
+    texts = [
+        data.nom, data.prenom, data.email, data.groupe, data.departement,
+        data.semestre, data.annee_scolaire, data.appreciation
+    ] + [subject[0] for subject in data.subjects]
+    unsupported = set()
+    for text in texts:
+        for char in str(text):
+            try:
+                char.encode("cp1252")
+            except UnicodeEncodeError:
+                unsupported.add(char)
+    return "".join(sorted(unsupported))
+
+
+def _shorten(value: str, limit: int) -> str:
+    return value if len(value) <= limit else value[:limit - 1] + "…"
+
+
+def _show(x: float, y: float, value, size: float = 10, bold: bool = False) -> bytes:
+    font = b"/F2" if bold else b"/F1"
+    return b"BT %s %g Tf %g %g Td %s Tj ET\n" % (font, size, x, y, _text(value))
+
+
+def _stream(dictionary: bytes, content: bytes) -> bytes:
+    return b"<< %s /Length %d >>\nstream\n%s\nendstream" % (dictionary, len(content), content)
+
+
+@lru_cache(maxsize=1)
+def _layout_content() -> bytes:
+    """Page frame shared by all pages: title, rules and footer"""
+    return b"".join([
+        b"0.15 0.25 0.45 rg\n",
+        b"%d %d %d 56 re f\n" % (0, PAGE_HEIGHT - 56, PAGE_WIDTH),
+        b"1 1 1 rg\n",
+        _show(MARGIN, PAGE_HEIGHT - 36, "RELEVÉ DE NOTES", size=18, bold=True),
+        b"0 0 0 rg 0.5 w\n",
+        b"%d %d m %d %d l S\n" % (MARGIN, 70, PAGE_WIDTH - MARGIN, 70),
+        _show(MARGIN, 55, "Document généré automatiquement - ne nécessite pas de signature", size=8),
+    ])
+
+
+@lru_cache(maxsize=1)
+def _shared_objects() -> Tuple[Tuple[int, bytes], ...]:
+    """Catalog, fonts and layout form, identical in every document"""
+    fonts = b"/Font << /F1 %d 0 R /F2 %d 0 R >>" % (FONT_REGULAR, FONT_BOLD)
+    return (
+        (CATALOG, b"<< /Type /Catalog /Pages %d 0 R >>" % PAGES),
+        (FONT_REGULAR, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"),
+        (FONT_BOLD, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>"),
+        (LAYOUT, _stream(
+            b"/Type /XObject /Subtype /Form /BBox [0 0 %d %d] /Resources << %s >>" % (PAGE_WIDTH, PAGE_HEIGHT, fonts),
+            _layout_content()
+        )),
+    )
+
+
+@lru_cache(maxsize=1)
+def _page_resources() -> bytes:
+    return b"<< /Font << /F1 %d 0 R /F2 %d 0 R >> /XObject << /Layout %d 0 R >> >>" % (
+        FONT_REGULAR, FONT_BOLD, LAYOUT
+    )
+
+
+def _format_average(value) -> str:
+    return "-" if value is None else f"{value:.2f}"
+
+
+def _subject_rows(subjects: Iterable[Sequence]) -> List[bytes]:
+    """One table row per (name, coefficient, average, grades) subject"""
+    rows = []
+    for name, coefficient, average, grades in subjects:
+        rows.append(b"".join([
+            _show(COLUMNS[0], 0, _shorten(name, MAX_SUBJECT_CHARS)),
+            _show(COLUMNS[1], 0, f"{coefficient:g}"),
+            _show(COLUMNS[2], 0, _shorten(" ; ".join(f"{g:g}" for g in grades), MAX_GRADES_CHARS)),
+            _show(COLUMNS[3], 0, _format_average(average), bold=True),
+        ]))
+    return rows
+
+
+def _page_content(data, rows: List[bytes], page: int, pages: int) -> bytes:
+    parts = [b"q /Layout Do Q\n"]
+    parts.append(b"1 1 1 rg\n" + _show(PAGE_WIDTH - MARGIN - 60, PAGE_HEIGHT - 36, f"Page {page}/{pages}", size=9) + b"0 0 0 rg\n")
+    parts.append(_show(MARGIN, 750, f"{data.departement} - {data.semestre} {data.annee_scolaire}", size=11))
+    parts.append(_show(MARGIN, 725, "Étudiant :"))
+    parts.append(_show(130, 725, f"{data.prenom} {data.nom}", bold=True))
+    parts.append(_show(MARGIN, 710, "Email :"))
+    parts.append(_show(130, 710, data.email))
+    parts.append(_show(MARGIN, 695, "Groupe :"))
+    parts.append(_show(130, 695, data.groupe))
+
+    header_y = TABLE_TOP + ROW_HEIGHT + 4
+    for x, title in zip(COLUMNS, ("Matière", "Coef.", "Notes", "Moyenne")):
+        parts.append(_show(x, header_y, title, bold=True))
+    parts.append(b"%d %d m %d %d l S\n" % (MARGIN, header_y - 5, PAGE_WIDTH - MARGIN, header_y - 5))
+
+    # Rows are laid out at y=0; each is moved to its line with a text matrix offset
+    y = TABLE_TOP
+    for row in rows:
+        parts.append(b"q 1 0 0 1 0 %d cm\n%sQ\n" % (y, row))
+        y -= ROW_HEIGHT
+
+    if page == pages:
+        y -= ROW_HEIGHT
+        parts.append(b"%d %d m %d %d l S\n" % (MARGIN, y + ROW_HEIGHT - 4, PAGE_WIDTH - MARGIN, y + ROW_HEIGHT - 4))
+        rank = f"{data.rang} / {data.total_etudiants}" if data.rang else "-"
+        for label, value in (
+            ("Moyenne générale", f"{data.moyenne_generale:.2f} / 20"),
+            ("Rang", rank),
+            ("Appréciation", data.appreciation),
+        ):
+            parts.append(_show(MARGIN, y, label))
+            parts.append(_show(COLUMNS[2], y, value, bold=True))
+            y -= ROW_HEIGHT
+    return b"".join(parts)
+
+
+def render_transcript(data) -> bytes:
+    """
+    The transcript of one student as a PDF document
+
+    data is a ReportData (see grade_reports): subjects are
+    (name, coefficient, average, grades) tuples in display order.
+    """
+    rows = _subject_rows(data.subjects)
+    chunks = [rows[i:i + ROWS_PER_PAGE] for i in range(0, len(rows), ROWS_PER_PAGE)] or [[]]
+
+    objects = list(_shared_objects())
+    kids = []
+    for page, chunk in enumerate(chunks, start=1):
+        page_id = FIRST_PAGE_OBJECT + 2 * (page - 1)
+        kids.append(page_id)
+        objects.append((page_id, b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources %s /Contents %d 0 R >>" % (
+            PAGES, PAGE_WIDTH, PAGE_HEIGHT, _page_resources(), page_id + 1
+        )))
+        objects.append((page_id + 1, _stream(b"", _page_content(data, chunk, page, len(chunks)))))
+    objects.append((PAGES, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)
+    )))
+    objects.sort()
+
+    output = [b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"]
+    offsets = []
+    position = len(output[0])
+    for number, body in objects:
+        chunk = b"%d 0 obj\n%s\nendobj\n" % (number, body)
+        offsets.append(position)
+        output.append(chunk)
+        position += len(chunk)
+
+    output.append(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    output.extend(b"%010d 00000 n \n" % offset for offset in offsets)
+    output.append(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, CATALOG, position
+    ))
+    return b"".join(output)
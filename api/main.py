@@ -29,6 +29,8 @@ from app.routers import classroom_ai  # AI assistant, plagiarism, feedback, summ
 from app.routers import admin_global_crud  # Admin global CRUD operations
 from app.routers import admin_timetable_supervision  # Admin timetable supervision with conflict detection
 from app.routers import makeup_sessions  # Makeup sessions (rattrapage) management
+from app.routers import calendar_feeds  # iCalendar feeds per group and teacher
+from app.routers import timetable_solver  # Automatic timetable drafts
 
 # Create FastAPI app
 app = FastAPI(
@@ -45,6 +47,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 # Mount uploads directory for serving files
@@ -97,6 +100,8 @@ app.include_router(classroom_ai.router)  # NEW: AI features
 app.include_router(admin_global_crud.router)  # NEW: Admin global CRUD operations
 app.include_router(admin_timetable_supervision.router)  # NEW: Admin timetable supervision
 app.include_router(makeup_sessions.router)  # NEW: Makeup sessions management
+app.include_router(calendar_feeds.router)  # iCalendar subscription feeds
+app.include_router(timetable_solver.router)  # Automatic timetable drafts
 
 
 @app.get("/")
@@ -0,0 +1,14 @@
+-- AlterTable
+ALTER TABLE "events" ADD COLUMN     "nb_commentaires" INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN     "nb_reactions" INTEGER NOT NULL DEFAULT 0;
+
+-- Backfill counters from existing rows
+UPDATE "events" e SET
+    "nb_commentaires" = (SELECT COUNT(*) FROM "event_comments" c WHERE c."id_evenement" = e."id"),
+    "nb_reactions" = (SELECT COUNT(*) FROM "event_reactions" r WHERE r."id_evenement" = e."id");
+
+-- CreateIndex
+CREATE INDEX "events_date_id_idx" ON "events"("date", "id");
+
+-- CreateIndex
+CREATE INDEX "event_comments_id_evenement_createdAt_idx" ON "event_comments"("id_evenement", "createdAt");
@@ -0,0 +1,18 @@
+-- CreateTable
+CREATE TABLE "event_reaction_counts" (
+    "id_evenement" TEXT NOT NULL,
+    "type" TEXT NOT NULL,
+    "total" INTEGER NOT NULL DEFAULT 0,
+    "updatedAt" TIMESTAMP(3) NOT NULL,
+
+    CONSTRAINT "event_reaction_counts_pkey" PRIMARY KEY ("id_evenement","type")
+);
+
+-- AddForeignKey
+ALTER TABLE "event_reaction_counts" ADD CONSTRAINT "event_reaction_counts_id_evenement_fkey" FOREIGN KEY ("id_evenement") REFERENCES "events"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- Backfill counters from existing reactions
+INSERT INTO "event_reaction_counts" ("id_evenement", "type", "total", "updatedAt")
+SELECT "id_evenement", "type", COUNT(*), CURRENT_TIMESTAMP
+FROM "event_reactions"
+GROUP BY "id_evenement", "type";
@@ -0,0 +1,18 @@
+-- CreateTable
+CREATE TABLE "timetable_cache" (
+    "id" TEXT NOT NULL,
+    "scope" TEXT NOT NULL,
+    "owner_id" TEXT NOT NULL,
+    "week_start" TIMESTAMP(3) NOT NULL,
+    "payload" JSONB NOT NULL,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "updatedAt" TIMESTAMP(3) NOT NULL,
+
+    CONSTRAINT "timetable_cache_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateIndex
+CREATE INDEX "timetable_cache_owner_id_idx" ON "timetable_cache"("owner_id");
+
+-- CreateIndex
+CREATE UNIQUE INDEX "timetable_cache_scope_owner_id_week_start_key" ON "timetable_cache"("scope", "owner_id", "week_start");
@@ -0,0 +1,42 @@
+-- CreateTable
+CREATE TABLE "table_versions" (
+    "table_name" TEXT NOT NULL,
+    "version" INTEGER NOT NULL DEFAULT 0,
+    "updatedAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "table_versions_pkey" PRIMARY KEY ("table_name")
+);
+
+-- Change counter bumped once per writing statement (used for HTTP ETags)
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO "table_versions" ("table_name", "version", "updatedAt")
+    VALUES (TG_TABLE_NAME, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT ("table_name") DO UPDATE
+    SET "version" = "table_versions"."version" + 1,
+        "updatedAt" = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- CreateTrigger
+CREATE TRIGGER "Department_version" AFTER INSERT OR UPDATE OR DELETE ON "Department"
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+CREATE TRIGGER "Specialty_version" AFTER INSERT OR UPDATE OR DELETE ON "Specialty"
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+CREATE TRIGGER "Level_version" AFTER INSERT OR UPDATE OR DELETE ON "Level"
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+CREATE TRIGGER "Group_version" AFTER INSERT OR UPDATE OR DELETE ON "Group"
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+CREATE TRIGGER "Room_version" AFTER INSERT OR UPDATE OR DELETE ON "Room"
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+CREATE TRIGGER "Subject_version" AFTER INSERT OR UPDATE OR DELETE ON "Subject"
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+CREATE TRIGGER "Teacher_version" AFTER INSERT OR UPDATE OR DELETE ON "Teacher"
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+CREATE TRIGGER "Student_version" AFTER INSERT OR UPDATE OR DELETE ON "Student"
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+CREATE TRIGGER "Schedule_version" AFTER INSERT OR UPDATE OR DELETE ON "Schedule"
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+CREATE TRIGGER "Absence_version" AFTER INSERT OR UPDATE OR DELETE ON "Absence"
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
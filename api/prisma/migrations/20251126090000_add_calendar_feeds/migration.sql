@@ -0,0 +1,14 @@
+-- CreateTable
+CREATE TABLE "calendar_feeds" (
+    "id" TEXT NOT NULL,
+    "scope" TEXT NOT NULL,
+    "owner_id" TEXT NOT NULL,
+    "content" TEXT NOT NULL,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "updatedAt" TIMESTAMP(3) NOT NULL,
+
+    CONSTRAINT "calendar_feeds_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateIndex
+CREATE UNIQUE INDEX "calendar_feeds_scope_owner_id_key" ON "calendar_feeds"("scope", "owner_id");
@@ -0,0 +1,16 @@
+-- CreateTable
+CREATE TABLE "timetable_drafts" (
+    "id" TEXT NOT NULL,
+    "id_departement" TEXT NOT NULL,
+    "semester" TEXT NOT NULL,
+    "status" TEXT NOT NULL DEFAULT 'DRAFT',
+    "payload" JSONB NOT NULL,
+    "created_by" TEXT,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "updatedAt" TIMESTAMP(3) NOT NULL,
+
+    CONSTRAINT "timetable_drafts_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateIndex
+CREATE INDEX "timetable_drafts_id_departement_semester_idx" ON "timetable_drafts"("id_departement", "semester");
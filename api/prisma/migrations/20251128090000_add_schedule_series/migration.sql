@@ -0,0 +1,109 @@
+-- AlterTable
+ALTER TABLE "Schedule" ADD COLUMN     "id_series" TEXT;
+
+-- CreateTable
+CREATE TABLE "schedule_series" (
+    "id" TEXT NOT NULL,
+    "id_salle" TEXT NOT NULL,
+    "id_matiere" TEXT NOT NULL,
+    "id_groupe" TEXT NOT NULL,
+    "id_enseignant" TEXT NOT NULL,
+    "semester" TEXT,
+    "week_day" INTEGER NOT NULL,
+    "start_time" TEXT NOT NULL,
+    "end_time" TEXT NOT NULL,
+    "start_date" TIMESTAMP(3) NOT NULL,
+    "end_date" TIMESTAMP(3) NOT NULL,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "updatedAt" TIMESTAMP(3) NOT NULL,
+
+    CONSTRAINT "schedule_series_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateTable
+CREATE TABLE "schedule_series_exceptions" (
+    "id" TEXT NOT NULL,
+    "id_series" TEXT NOT NULL,
+    "date" TIMESTAMP(3) NOT NULL,
+    "reason" TEXT,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "schedule_series_exceptions_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateIndex
+CREATE UNIQUE INDEX "Schedule_id_series_date_key" ON "Schedule"("id_series", "date");
+
+-- CreateIndex
+CREATE INDEX "schedule_series_id_salle_idx" ON "schedule_series"("id_salle");
+
+-- CreateIndex
+CREATE INDEX "schedule_series_id_enseignant_idx" ON "schedule_series"("id_enseignant");
+
+-- CreateIndex
+CREATE INDEX "schedule_series_id_groupe_idx" ON "schedule_series"("id_groupe");
+
+-- CreateIndex
+CREATE INDEX "schedule_series_semester_idx" ON "schedule_series"("semester");
+
+-- CreateIndex
+CREATE INDEX "schedule_series_start_date_end_date_idx" ON "schedule_series"("start_date", "end_date");
+
+-- CreateIndex
+CREATE UNIQUE INDEX "schedule_series_exceptions_id_series_date_key" ON "schedule_series_exceptions"("id_series", "date");
+
+-- AddForeignKey
+ALTER TABLE "Schedule" ADD CONSTRAINT "Schedule_id_series_fkey" FOREIGN KEY ("id_series") REFERENCES "schedule_series"("id") ON DELETE SET NULL ON UPDATE CASCADE;
+
+-- AddForeignKey
+ALTER TABLE "schedule_series" ADD CONSTRAINT "schedule_series_id_enseignant_fkey" FOREIGN KEY ("id_enseignant") REFERENCES "Teacher"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- AddForeignKey
+ALTER TABLE "schedule_series" ADD CONSTRAINT "schedule_series_id_groupe_fkey" FOREIGN KEY ("id_groupe") REFERENCES "Group"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- AddForeignKey
+ALTER TABLE "schedule_series" ADD CONSTRAINT "schedule_series_id_matiere_fkey" FOREIGN KEY ("id_matiere") REFERENCES "Subject"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- AddForeignKey
+ALTER TABLE "schedule_series" ADD CONSTRAINT "schedule_series_id_salle_fkey" FOREIGN KEY ("id_salle") REFERENCES "Room"("id") ON DELETE RESTRICT ON UPDATE CASCADE;
+
+-- AddForeignKey
+ALTER TABLE "schedule_series_exceptions" ADD CONSTRAINT "schedule_series_exceptions_id_series_fkey" FOREIGN KEY ("id_series") REFERENCES "schedule_series"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- CreateTrigger
+CREATE TRIGGER "schedule_series_version" AFTER INSERT OR UPDATE OR DELETE ON "schedule_series"
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+CREATE TRIGGER "schedule_series_exceptions_version" AFTER INSERT OR UPDATE OR DELETE ON "schedule_series_exceptions"
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+-- CreateView
+-- Every session occurrence: stored rows plus the expanded weekly series.
+-- A series date is skipped when it has an exception or a materialized row
+-- (the row, which may have been moved, cancelled or carry absences, wins).
+-- Virtual occurrence ids are "<series id>:<YYYY-MM-DD>".
+CREATE VIEW "schedule_occurrences" AS
+SELECT s."id", s."date", s."heure_debut", s."heure_fin",
+       s."id_salle", s."id_matiere", s."id_groupe", s."id_enseignant",
+       s."status", s."semester", s."week_day", s."is_recurring", s."id_series"
+FROM "Schedule" s
+UNION ALL
+SELECT ss."id" || ':' || to_char(d."date", 'YYYY-MM-DD'),
+       d."date",
+       d."date" + ss."start_time"::time,
+       d."date" + ss."end_time"::time,
+       ss."id_salle", ss."id_matiere", ss."id_groupe", ss."id_enseignant",
+       'PLANNED'::"ScheduleStatus", ss."semester", ss."week_day", true, ss."id"
+FROM "schedule_series" ss
+CROSS JOIN LATERAL generate_series(
+    ss."start_date" + ((ss."week_day" - EXTRACT(ISODOW FROM ss."start_date")::int + 7) % 7) * INTERVAL '1 day',
+    ss."end_date",
+    INTERVAL '7 days'
+) AS d("date")
+WHERE NOT EXISTS (
+        SELECT 1 FROM "schedule_series_exceptions" e
+        WHERE e."id_series" = ss."id" AND e."date" = d."date"
+    )
+  AND NOT EXISTS (
+        SELECT 1 FROM "Schedule" m
+        WHERE m."id_series" = ss."id" AND m."date" = d."date"
+    );
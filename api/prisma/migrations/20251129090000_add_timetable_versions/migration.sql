@@ -0,0 +1,63 @@
+-- AlterTable
+ALTER TABLE "timetable_drafts" ADD COLUMN "version" INTEGER NOT NULL DEFAULT 1,
+ADD COLUMN "base_version" INTEGER,
+ADD COLUMN "publishedAt" TIMESTAMP(3);
+
+-- Number existing drafts per department and semester; committed drafts are the published versions
+UPDATE "timetable_drafts" d
+SET "version" = v."version",
+    "status" = CASE WHEN d."status" = 'COMMITTED' THEN 'PUBLISHED' ELSE d."status" END,
+    "publishedAt" = CASE WHEN d."status" = 'COMMITTED' THEN d."updatedAt" END
+FROM (
+    SELECT "id", row_number() OVER (PARTITION BY "id_departement", "semester" ORDER BY "createdAt", "id") AS "version"
+    FROM "timetable_drafts"
+) v
+WHERE d."id" = v."id";
+
+-- CreateIndex
+CREATE UNIQUE INDEX "timetable_drafts_id_departement_semester_version_key" ON "timetable_drafts"("id_departement", "semester", "version");
+
+-- Weekly rows written before schedule series existed become series, so
+-- publishing diffs against them instead of duplicating them. The rows stay
+-- as the stored occurrences of their series (ids, absences and makeup
+-- sessions unchanged); weeks without a row become exceptions.
+CREATE TEMP TABLE "legacy_weekly_rows" AS
+SELECT s."id",
+       date_trunc('day', s."date") AS "day",
+       s."createdAt",
+       md5(concat_ws('|', s."semester", s."id_groupe", s."id_matiere", s."id_enseignant", s."id_salle",
+                     EXTRACT(ISODOW FROM s."date"), to_char(s."heure_debut", 'HH24:MI'),
+                     to_char(s."heure_fin", 'HH24:MI'))) AS "id_series",
+       s."semester", s."id_groupe", s."id_matiere", s."id_enseignant", s."id_salle",
+       EXTRACT(ISODOW FROM s."date")::INTEGER AS "week_day",
+       to_char(s."heure_debut", 'HH24:MI') AS "start_time",
+       to_char(s."heure_fin", 'HH24:MI') AS "end_time"
+FROM "Schedule" s
+WHERE s."is_recurring" AND s."semester" IS NOT NULL AND s."id_series" IS NULL;
+
+INSERT INTO "schedule_series" ("id", "id_salle", "id_matiere", "id_groupe", "id_enseignant", "semester",
+                               "week_day", "start_time", "end_time", "start_date", "end_date", "createdAt", "updatedAt")
+SELECT "id_series", "id_salle", "id_matiere", "id_groupe", "id_enseignant", "semester",
+       "week_day", "start_time", "end_time", min("day"), max("day"), min("createdAt"), CURRENT_TIMESTAMP
+FROM "legacy_weekly_rows"
+GROUP BY "id_series", "id_salle", "id_matiere", "id_groupe", "id_enseignant", "semester",
+         "week_day", "start_time", "end_time";
+
+-- One row per series and date can be its occurrence; duplicates stay standalone
+UPDATE "Schedule" s
+SET "id_series" = l."id_series", "date" = l."day"
+FROM (
+    SELECT "id", "id_series", "day",
+           row_number() OVER (PARTITION BY "id_series", "day" ORDER BY "createdAt", "id") AS "n"
+    FROM "legacy_weekly_rows"
+) l
+WHERE s."id" = l."id" AND l."n" = 1;
+
+INSERT INTO "schedule_series_exceptions" ("id", "id_series", "date", "createdAt")
+SELECT md5(ss."id" || d."day"::TEXT), ss."id", d."day", CURRENT_TIMESTAMP
+FROM "schedule_series" ss
+CROSS JOIN LATERAL generate_series(ss."start_date", ss."end_date", INTERVAL '7 days') AS d("day")
+WHERE ss."id" IN (SELECT DISTINCT "id_series" FROM "legacy_weekly_rows")
+  AND NOT EXISTS (SELECT 1 FROM "Schedule" s WHERE s."id_series" = ss."id" AND s."date" = d."day");
+
+DROP TABLE "legacy_weekly_rows";
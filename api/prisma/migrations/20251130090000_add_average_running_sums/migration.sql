@@ -0,0 +1,41 @@
+-- AlterTable
+ALTER TABLE "averages" ADD COLUMN "somme_ponderee" DOUBLE PRECISION NOT NULL DEFAULT 0,
+ADD COLUMN "somme_coefficients" DOUBLE PRECISION NOT NULL DEFAULT 0,
+ADD COLUMN "rang_obsolete" BOOLEAN NOT NULL DEFAULT false;
+
+-- CreateIndex
+CREATE INDEX "averages_semestre_annee_scolaire_rang_obsolete_idx" ON "averages"("semestre", "annee_scolaire", "rang_obsolete");
+
+-- Subject averages: sums over the student's grades in the subject
+UPDATE "averages" a
+SET "somme_ponderee" = g."weighted",
+    "somme_coefficients" = g."weight"
+FROM (
+    SELECT "id_etudiant", "id_matiere", "semestre", "annee_scolaire",
+           SUM("valeur" * "coefficient") AS "weighted",
+           SUM("coefficient") AS "weight"
+    FROM "grades"
+    GROUP BY "id_etudiant", "id_matiere", "semestre", "annee_scolaire"
+) g
+WHERE a."id_etudiant" = g."id_etudiant"
+  AND a."id_matiere" = g."id_matiere"
+  AND a."semestre" = g."semestre"
+  AND a."annee_scolaire" = g."annee_scolaire";
+
+-- General averages: sums over the stored subject averages, weighted by subject coefficient
+UPDATE "averages" a
+SET "somme_ponderee" = s."weighted",
+    "somme_coefficients" = s."weight"
+FROM (
+    SELECT sa."id_etudiant", sa."semestre", sa."annee_scolaire",
+           SUM(sa."moyenne_matiere" * m."coefficient") AS "weighted",
+           SUM(m."coefficient") AS "weight"
+    FROM "averages" sa
+    JOIN "Subject" m ON m."id" = sa."id_matiere"
+    WHERE sa."moyenne_matiere" IS NOT NULL
+    GROUP BY sa."id_etudiant", sa."semestre", sa."annee_scolaire"
+) s
+WHERE a."id_matiere" IS NULL
+  AND a."id_etudiant" = s."id_etudiant"
+  AND a."semestre" = s."semestre"
+  AND a."annee_scolaire" = s."annee_scolaire";
@@ -0,0 +1,18 @@
+-- CreateTable
+CREATE TABLE "grade_book_cache" (
+    "id" TEXT NOT NULL,
+    "id_etudiant" TEXT NOT NULL,
+    "semestre" "SemesterType" NOT NULL,
+    "annee_scolaire" TEXT NOT NULL,
+    "payload" JSONB NOT NULL,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "updatedAt" TIMESTAMP(3) NOT NULL,
+
+    CONSTRAINT "grade_book_cache_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateIndex
+CREATE UNIQUE INDEX "grade_book_cache_id_etudiant_semestre_annee_scolaire_key" ON "grade_book_cache"("id_etudiant", "semestre", "annee_scolaire");
+
+-- AddForeignKey
+ALTER TABLE "grade_book_cache" ADD CONSTRAINT "grade_book_cache_id_etudiant_fkey" FOREIGN KEY ("id_etudiant") REFERENCES "Student"("id") ON DELETE CASCADE ON UPDATE CASCADE;
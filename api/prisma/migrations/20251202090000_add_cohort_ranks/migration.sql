@@ -0,0 +1,7 @@
+-- AlterTable
+ALTER TABLE "averages" ADD COLUMN "rang_specialite" INTEGER,
+ADD COLUMN "rang_niveau" INTEGER,
+ADD COLUMN "rang_groupe" INTEGER;
+
+-- Rank every cohort again so the new columns are filled
+UPDATE "averages" SET "rang_obsolete" = true WHERE "id_matiere" IS NULL;
@@ -0,0 +1,17 @@
+-- Keep one general average (null subject) per student and period: the most
+-- recently updated. Its sums may be partial, so the cohort is flagged for
+-- re-ranking; calculate_averages recomputes the sums from the grades.
+DELETE FROM "averages" a
+USING "averages" b
+WHERE a."id_matiere" IS NULL
+  AND b."id_matiere" IS NULL
+  AND a."id_etudiant" = b."id_etudiant"
+  AND a."semestre" = b."semestre"
+  AND a."annee_scolaire" = b."annee_scolaire"
+  AND (a."updatedAt", a."id") < (b."updatedAt", b."id");
+
+UPDATE "averages" SET "rang_obsolete" = true WHERE "id_matiere" IS NULL;
+
+-- CreateIndex (partial: the unique index on (id_etudiant, id_matiere, ...)
+-- does not cover the general average, whose id_matiere is null)
+CREATE UNIQUE INDEX "averages_general_key" ON "averages"("id_etudiant", "semestre", "annee_scolaire") WHERE "id_matiere" IS NULL;
@@ -0,0 +1,9 @@
+-- CreateTable
+CREATE TABLE "calendar_tokens" (
+    "scope" TEXT NOT NULL,
+    "owner_id" TEXT NOT NULL,
+    "version" INTEGER NOT NULL DEFAULT 1,
+    "updatedAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "calendar_tokens_pkey" PRIMARY KEY ("scope","owner_id")
+);
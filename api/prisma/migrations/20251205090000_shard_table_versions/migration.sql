@@ -0,0 +1,17 @@
+-- Spread each table's change counter over 16 rows so concurrent writers
+-- rarely wait on the same row lock; a table's version is the sum of its shards
+ALTER TABLE "table_versions" ADD COLUMN "shard" INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE "table_versions" DROP CONSTRAINT "table_versions_pkey",
+ADD CONSTRAINT "table_versions_pkey" PRIMARY KEY ("table_name", "shard");
+
+-- Each connection bumps the shard of its backend
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO "table_versions" ("table_name", "shard", "version", "updatedAt")
+    VALUES (TG_TABLE_NAME, pg_backend_pid() % 16, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT ("table_name", "shard") DO UPDATE
+    SET "version" = "table_versions"."version" + 1,
+        "updatedAt" = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,2 @@
+-- AlterTable: table versions the cached week was built from; rows without one are rebuilt
+ALTER TABLE "timetable_cache" ADD COLUMN "stamp" TEXT;
@@ -132,6 +132,17 @@ export default function EventsPage() {
     }
   };
 
+  const handleOpenEvent = async (event: Event) => {
+    // The list only embeds the latest comments, load the full thread
+    setSelectedEvent(event);
+    try {
+      const full = await eventsApi.getEvent(event.id);
+      setSelectedEvent(full);
+    } catch (error: any) {
+      console.error('Failed to load event:', error);
+    }
+  };
+
   const filteredEvents = events.filter(event =>
     event.titre.toLowerCase().includes(searchTerm.toLowerCase()) ||
     event.description?.toLowerCase().includes(searchTerm.toLowerCase())
@@ -212,7 +223,7 @@ export default function EventsPage() {
           <Card
             key={event.id}
             className="cursor-pointer hover:shadow-lg transition-shadow"
-            onClick={() => setSelectedEvent(event)}
+            onClick={() => handleOpenEvent(event)}
           >
             <CardHeader>
               <div className="flex items-start justify-between mb-2">